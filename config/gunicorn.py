@@ -1,7 +1,27 @@
 # -*- coding: utf-8 -*-
+import os
 
 bind = '0.0.0.0:8000'
 accesslog = '-'
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" in %(D)sµs'
 # loglevel = 'debug'
-workers = 1
\ No newline at end of file
+workers = 1
+
+
+def on_starting(server):
+    """Remove the metrics of a previous run and let the workers know how many
+    of them there are."""
+    os.environ['ENSIMPL_WORKERS'] = str(server.cfg.workers)
+
+    directory = os.environ.get('ENSIMPL_METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        from ensimpl.metrics import clear_directory
+        clear_directory(directory)
+
+
+def child_exit(server, worker):
+    """Remove the gauges of an exited worker."""
+    directory = os.environ.get('ENSIMPL_METRICS_DIR')
+    if directory:
+        from ensimpl.metrics import mark_process_dead
+        mark_process_dead(worker.pid, directory)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 
 # host to listen on, 0.0.0.0 means allow anyone to connect
 HOST = '0.0.0.0'
@@ -15,6 +16,25 @@ DEBUG = False
 # secret key, probably just leave alone
 SECRET_KEY = 'ENSIMPL-SECRET'
 
+# add a Server-Timing header with per stage timings to every API response,
+# pass debug=1 to a request to get the timings in the response body as well
+SERVER_TIMING = False
+
+# keep the last SLOW_QUERY_LOG_SIZE SQL statements that took at least
+# SLOW_QUERY_MS milliseconds, None disables the slow query log
+SLOW_QUERY_MS = None
+SLOW_QUERY_LOG_SIZE = 100
+
+# expose Prometheus metrics at /metrics (unauthenticated, and every SQL
+# statement is timed), set METRICS_DIR (or the ENSIMPL_METRICS_DIR
+# environment variable) to a directory shared by the gunicorn workers so the
+# metrics of all workers are reported
+METRICS = False
+METRICS_DIR = os.environ.get('ENSIMPL_METRICS_DIR')
+
+# token needed to view /api/_debug/slow_queries, None disables the endpoint
+DEBUG_TOKEN = None
+
 LOG_LEVEL = 'DEBUG' # CRITICAL / ERROR / WARNING / INFO / DEBUG
 #SERVER_NAME = '127.0.0.1:8000'
 JSONIFY_PRETTYPRINT_REGULAR = False
@@ -8,11 +8,14 @@ from flask import url_for
 
 
 import ensimpl.db_config as db_config
+import ensimpl.fetch.querylog as querylog
+import ensimpl.metrics as ensimpl_metrics
 
 #from ensimpl.extensions import debug_toolbar
 #from ensimpl.extensions import Swagger
 from ensimpl.extensions import compress
 from ensimpl.modules.api.views import api
+from ensimpl.modules.metrics.views import metrics
 from ensimpl.modules.page.views import page
 from ensimpl.utils import ReverseProxied
 
@@ -45,9 +48,26 @@ def create_app(settings_override=None):
 
     app.logger.setLevel(app.config['LOG_LEVEL'])
 
+    querylog.configure(app.config.get('SLOW_QUERY_MS'),
+                       app.config.get('SLOW_QUERY_LOG_SIZE',
+                                      querylog.DEFAULT_SIZE))
+
+    if app.config.get('METRICS', False):
+        metrics_dir = app.config.get('METRICS_DIR')
+
+        if not metrics_dir and int(os.environ.get('ENSIMPL_WORKERS', 1)) > 1:
+            app.logger.warning('METRICS is on with multiple workers but no '
+                               'METRICS_DIR, /metrics will only report the '
+                               'worker that answers it')
+
+        ensimpl_metrics.configure(metrics_dir)
+
     middleware(app)
 
     app.register_blueprint(api)
+
+    if app.config.get('METRICS', False):
+        app.register_blueprint(metrics)
     app.register_blueprint(page)
 
     extensions(app)
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+# defaults live here so the command line can use them without importing
+# the benchmark modules
+
+DEFAULT_SEED = 20191001
+
+DEFAULT_ITERATIONS = 20
+
+DEFAULT_THRESHOLD = 0.10
+
+DEFAULT_BUILD_GENES = 20000
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""Reproducible benchmark suite for the fetch layer and the API.
+
+The workload is fixed: the identifiers, symbols and regions used are sampled
+from the database with a seeded random generator, so two runs against the
+same database file exercise exactly the same queries.
+"""
+from collections import OrderedDict
+from collections import namedtuple
+
+import json
+import math
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import ensimpl.db_config as db_config
+import ensimpl.utils as utils
+
+from ensimpl.fetch import genes as genes_ensimpl
+from ensimpl.fetch import history as genes_history
+from ensimpl.fetch import search as search_ensimpl
+from ensimpl.fetch import utils as fetch_utils
+
+from ensimpl.bench import DEFAULT_ITERATIONS, DEFAULT_SEED, DEFAULT_THRESHOLD
+
+LOG = utils.get_logger()
+
+Workload = namedtuple('Workload', ['name', 'func', 'weight'])
+'''A named benchmark callable; `weight` scales the number of iterations.'''
+
+SQL_SAMPLE_GENES = '''
+SELECT ensembl_id, symbol, chromosome, start_position, end_position
+  FROM ensembl_genes
+ ORDER BY ensembl_id
+'''
+
+
+class Sample:
+    """The fixed set of inputs used by the workloads.
+
+    Attributes:
+        ids (list): Ensembl gene identifiers, in sampled order.
+        symbols (list): Gene symbols.
+        regions (list): Region strings, 'chromosome:start-end'.
+    """
+    def __init__(self, ids=None, symbols=None, regions=None):
+        """Initialization."""
+        self.ids = ids or []
+        self.symbols = symbols or []
+        self.regions = regions or []
+
+    def get_ids(self, num):
+        """Get the first `num` identifiers, fewer if the database does not
+        have that many genes.
+
+        Args:
+            num (int): The number of identifiers.
+
+        Returns:
+            list: A ``list`` of Ensembl gene identifiers.
+        """
+        return self.ids[:num]
+
+
+def get_sample(release, species, seed=DEFAULT_SEED, size=10000):
+    """Sample the database for the benchmark inputs.
+
+    Args:
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        seed (int, optional): The random seed.
+        size (int, optional): The maximum number of genes to sample.
+
+    Returns:
+        Sample: The benchmark inputs.
+    """
+    conn = fetch_utils.connect_to_database(release, species)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    rows = list(cursor.execute(SQL_SAMPLE_GENES))
+    cursor.close()
+    conn.close()
+
+    rnd = random.Random(seed)
+    rnd.shuffle(rows)
+    rows = rows[:size]
+
+    sample = Sample()
+
+    for row in rows:
+        sample.ids.append(row['ensembl_id'])
+        if row['symbol']:
+            sample.symbols.append(row['symbol'])
+        sample.regions.append('{}:{}-{}'.format(row['chromosome'],
+                                                row['start_position'],
+                                                row['end_position'] + 100000))
+
+    return sample
+
+
+def percentile(values, pct):
+    """Calculate the nearest-rank percentile.
+
+    Args:
+        values (list): Sorted numeric values.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile value or ``None`` if `values` is empty.
+    """
+    if not values:
+        return None
+    # pct * len first, 7 / 100.0 * 100 is not a whole number
+    rank = math.ceil(pct * len(values) / 100.0)
+    rank = min(max(rank, 1), len(values))
+    return values[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """Summarize a list of latencies.
+
+    Args:
+        latencies (list): The latency of each operation, in seconds.
+        elapsed (float): The total elapsed time, in seconds.
+
+    Returns:
+        dict: A ``dict`` with the count, mean, p50, p95, p99, max (all in
+            milliseconds) and the throughput in operations per second.
+    """
+    values = sorted(latencies)
+    ms = 1000.0
+
+    if not values:
+        return {'count': 0}
+
+    return OrderedDict([
+        ('count', len(values)),
+        ('mean_ms', sum(values) / len(values) * ms),
+        ('p50_ms', percentile(values, 50) * ms),
+        ('p95_ms', percentile(values, 95) * ms),
+        ('p99_ms', percentile(values, 99) * ms),
+        ('max_ms', values[-1] * ms),
+        ('throughput', len(values) / elapsed if elapsed else None),
+    ])
+
+
+def get_fetch_workloads(release, species, sample):
+    """Build the fetch layer workloads.
+
+    Args:
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        sample (Sample): The benchmark inputs.
+
+    Returns:
+        list: A ``list`` of :class:`Workload`.
+    """
+    symbols = sample.symbols or sample.ids
+    prefixes = [s[:3] for s in symbols]
+
+    def cycle(values):
+        """Endless, deterministic iteration over `values`."""
+        while True:
+            for value in values:
+                yield value
+
+    exact_terms = cycle(symbols)
+    prefix_terms = cycle(prefixes)
+    id_terms = cycle(sample.ids)
+    region_terms = cycle(sample.regions)
+
+    ids_1 = sample.get_ids(1)
+    ids_100 = sample.get_ids(100)
+    ids_10k = sample.get_ids(10000)
+    history_id = ids_1[0] if ids_1 else None
+
+    def search(terms, exact):
+        return lambda: search_ensimpl.search(next(terms), release, species,
+                                             exact=exact)
+
+    def genes_get(ids, details):
+        return lambda: genes_ensimpl.get(ids, release, species,
+                                         details=details)
+
+    return [
+        Workload('search_exact', search(exact_terms, True), 1.0),
+        Workload('search_prefix', search(prefix_terms, False), 1.0),
+        Workload('search_id', search(id_terms, True), 1.0),
+        Workload('search_region', search(region_terms, True), 1.0),
+        Workload('genes_1', genes_get(ids_1, False), 1.0),
+        Workload('genes_1_details', genes_get(ids_1, True), 1.0),
+        Workload('genes_100', genes_get(ids_100, False), 0.5),
+        Workload('genes_100_details', genes_get(ids_100, True), 0.5),
+        Workload('genes_10000', genes_get(ids_10k, False), 0.1),
+        Workload('genes_10000_details', genes_get(ids_10k, True), 0.1),
+        Workload('get_ids',
+                 lambda: genes_ensimpl.get_ids(ids_100, release, species),
+                 0.5),
+        Workload('get_homology',
+                 lambda: genes_ensimpl.get_homology(ids_100, release,
+                                                    species),
+                 0.5),
+        Workload('history',
+                 lambda: genes_history.get_history(history_id,
+                                                   species=species),
+                 0.2),
+    ]
+
+
+def get_api_workloads(release, species, sample):
+    """Build the API workloads, run through the Flask test client.
+
+    Args:
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        sample (Sample): The benchmark inputs.
+
+    Returns:
+        list: A ``list`` of :class:`Workload`.
+    """
+    from ensimpl.app import create_app
+
+    app = create_app({'LOG_LEVEL': 'ERROR'})
+    client = app.test_client(use_cookies=False)
+
+    symbol = (sample.symbols or sample.ids)[0]
+    ids_100 = sample.get_ids(100)
+    params = {'release': release, 'species': species}
+
+    def get(url, query):
+        def _get():
+            response = client.get(url, query_string=query)
+            if response.status_code != 200:
+                raise ValueError(f'{url} returned {response.status_code}')
+            return response
+        return _get
+
+    def post(url, body):
+        def _post():
+            response = client.post(url, json=body)
+            if response.status_code != 200:
+                raise ValueError(f'{url} returned {response.status_code}')
+            return response
+        return _post
+
+    return [
+        Workload('api_releases', get('/api/releases', {}), 1.0),
+        Workload('api_search',
+                 get('/api/search', dict(params, term=symbol)), 1.0),
+        Workload('api_gene',
+                 get(f'/api/gene/{ids_100[0]}', dict(params, details=1)),
+                 1.0),
+        Workload('api_genes_100',
+                 post('/api/genes', dict(params, **{'ids[]': ids_100})),
+                 0.5),
+        Workload('api_genes_100_details',
+                 post('/api/genes', dict(params, details=True,
+                                         **{'ids[]': ids_100})),
+                 0.5),
+        Workload('api_external_ids',
+                 post('/api/external_ids', dict(params, **{'ids[]': ids_100,
+                                                          'source_db':
+                                                              'Ensembl'})),
+                 0.5),
+    ]
+
+
+def run_workload(workload, iterations, warmup=1):
+    """Run a single workload.
+
+    Latency is measured without memory tracing; peak memory is measured on a
+    separate traced run so that tracing does not skew the latencies.
+
+    Args:
+        workload (Workload): The workload to run.
+        iterations (int): The number of timed iterations.
+        warmup (int, optional): The number of untimed iterations.
+
+    Returns:
+        dict: The summary, see :func:`summarize`, plus ``peak_memory_kb``.
+    """
+    for _ in range(warmup):
+        workload.func()
+
+    latencies = []
+    start = time.perf_counter()
+
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        workload.func()
+        latencies.append(time.perf_counter() - t0)
+
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    workload.func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize(latencies, elapsed)
+    summary['peak_memory_kb'] = peak / 1024.0
+
+    return summary
+
+
+def run(release=None, species=None, iterations=DEFAULT_ITERATIONS,
+        seed=DEFAULT_SEED, names=None, api=True):
+    """Run the benchmark suite.
+
+    Args:
+        release (str, optional): The Ensembl release, ``None`` for latest.
+        species (str, optional): The Ensembl species identifier.
+        iterations (int, optional): The base number of timed iterations.
+        seed (int, optional): The random seed used to sample inputs.
+        names (list, optional): Only run the workloads with these names.
+        api (bool, optional): ``True`` to include the Flask endpoints.
+
+    Returns:
+        dict: A ``dict`` with ``meta`` and ``results`` elements.
+    """
+    species = fetch_utils.nvl(species, 'Mm')
+
+    if release is None:
+        release = max(db['release'] for db in db_config.ENSIMPL_DBS)
+
+    release = str(release)
+
+    LOG.info(f'Sampling ensimpl.{release}.{species}.db3 (seed={seed})')
+    sample = get_sample(release, species, seed)
+
+    workloads = get_fetch_workloads(release, species, sample)
+
+    if api:
+        workloads.extend(get_api_workloads(release, species, sample))
+
+    if names:
+        workloads = [w for w in workloads if w.name in names]
+
+    results = OrderedDict()
+
+    for workload in sorted(workloads, key=lambda w: w.name):
+        num = max(3, int(iterations * workload.weight))
+        LOG.info(f'Running {workload.name} x {num}...')
+        results[workload.name] = run_workload(workload, num)
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    meta = OrderedDict([
+        ('release', release),
+        ('species', species),
+        ('seed', seed),
+        ('iterations', iterations),
+        ('num_genes_sampled', len(sample.ids)),
+        ('python', platform.python_version()),
+        ('sqlite', sqlite3.sqlite_version),
+        ('platform', platform.platform()),
+        ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('peak_rss_kb', max_rss if sys.platform != 'darwin' else max_rss / 1024),
+    ])
+
+    return OrderedDict([('meta', meta), ('results', results)])
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare benchmark results against a baseline.
+
+    A workload regresses when its p50, p95 or p99 latency grows, or its
+    throughput drops, by more than `threshold`.
+
+    Args:
+        current (dict): Results from :func:`run`.
+        baseline (dict): Results from a previous :func:`run`.
+        threshold (float, optional): The allowed relative change.
+
+    Returns:
+        dict: Keyed by workload name, each value having the ``ratio`` of the
+            current to the baseline value for every metric and a
+            ``regression`` flag.
+    """
+    comparison = OrderedDict()
+    base_results = baseline.get('results', {})
+
+    for name, result in current.get('results', {}).items():
+        base = base_results.get(name)
+
+        if not base:
+            continue
+
+        ratios = OrderedDict()
+        regression = False
+
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput',
+                       'peak_memory_kb'):
+            if not base.get(metric) or result.get(metric) is None:
+                continue
+
+            ratio = result[metric] / base[metric]
+            ratios[metric] = round(ratio, 3)
+
+            if metric == 'throughput':
+                regression |= ratio < 1.0 - threshold
+            elif metric != 'peak_memory_kb':
+                regression |= ratio > 1.0 + threshold
+
+        comparison[name] = {'ratio': ratios, 'regression': regression}
+
+    return comparison
+
+
+def load(file_name):
+    """Load saved benchmark results.
+
+    Args:
+        file_name (str): The JSON file.
+
+    Returns:
+        dict: The results.
+    """
+    with open(file_name) as fd:
+        return json.load(fd)
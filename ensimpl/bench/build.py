@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the database build, with and without bulk load mode.
+
+The same synthetic genes are inserted through the
+:mod:`ensimpl.create.ensimpl_db` functions once for each mode, in the order a
+real build inserts them, and every phase is timed.  No Ensembl server is
+needed.
+"""
+from collections import OrderedDict
+
+import os
+import platform
+import random
+import sqlite3
+import time
+
+import ensimpl.utils as utils
+import ensimpl.create.ensimpl_db as ensimpl_db
+import ensimpl.create.synthetic as synthetic
+
+from ensimpl.bench import DEFAULT_BUILD_GENES, DEFAULT_SEED
+
+LOG = utils.get_logger()
+
+MODES = ['default', 'bulk_load']
+
+INSERT_PHASES = ['chromosomes', 'homologs', 'genes', 'gtpe']
+
+
+def generate(species='Mm', num_genes=DEFAULT_BUILD_GENES, seed=DEFAULT_SEED):
+    """Generate the synthetic data inserted by every mode.
+
+    Args:
+        species (str, optional): 'Mm' or 'Hs'.
+        num_genes (int, optional): The number of genes.
+        seed (int, optional): The random seed.
+
+    Returns:
+        tuple: The reference, the chromosomes and a ``list`` of the
+            (genes, synonyms, gtpe, homologs) chunks from
+            :func:`ensimpl.create.synthetic.generate_chunk`.
+    """
+    spec = synthetic.get_spec(species, num_genes=num_genes)
+    ref = synthetic.get_reference(species=species)
+    rnd = random.Random(seed)
+
+    chromosomes = synthetic.generate_chromosomes(species, rnd)
+    counters = {'transcript': 0, 'protein': 0, 'exon': 0, 'xref': 0}
+    chunks = []
+
+    for first in range(0, spec.num_genes, synthetic.CHUNK_SIZE):
+        last = min(first + synthetic.CHUNK_SIZE, spec.num_genes)
+        chunks.append(synthetic.generate_chunk(spec, ref, rnd, first, last,
+                                               counters))
+
+    return ref, chromosomes, chunks
+
+
+def build(ensimpl_file, ref, chromosomes, chunks, bulk_load=False):
+    """Build a database from the generated data and time each phase.
+
+    Args:
+        ensimpl_file (str): The database file, deleted first.
+        ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`): The
+            synthetic reference.
+        chromosomes (list): The chromosomes.
+        chunks (list): The gene chunks.
+        bulk_load (bool, optional): ``True`` for bulk load mode.
+
+    Returns:
+        collections.OrderedDict: Seconds by phase, plus ``inserts`` for the
+            insert phases and ``total``.
+    """
+    utils.delete_file(ensimpl_file)
+
+    timings = OrderedDict()
+    conn = ensimpl_db.connect(ensimpl_file, True) if bulk_load else None
+    db = conn or ensimpl_file
+
+    def timed(phase, func, *args):
+        t0 = time.perf_counter()
+        func(*args)
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - t0
+
+    timed('initialize', ensimpl_db.initialize, db)
+    timed('chromosomes', ensimpl_db.insert_chromosomes_karyotypes, db, ref,
+          chromosomes)
+
+    for _, _, _, homologs in chunks:
+        timed('homologs', ensimpl_db.insert_homologs, db, ref, homologs)
+
+    for genes, synonyms, _, homologs in chunks:
+        timed('genes', ensimpl_db.insert_genes, db, ref, genes, synonyms,
+              homologs)
+
+    for _, _, gtpe, _ in chunks:
+        timed('gtpe', ensimpl_db.insert_gtpe, db, ref, gtpe)
+
+    timed('finalize', ensimpl_db.finalize, db, ref)
+
+    if conn:
+        conn.close()
+
+    timings['inserts'] = sum(timings[phase] for phase in INSERT_PHASES)
+    timings['total'] = sum(v for k, v in timings.items() if k != 'inserts')
+
+    return timings
+
+
+def run(directory, species='Mm', num_genes=DEFAULT_BUILD_GENES,
+        seed=DEFAULT_SEED, modes=None, keep=False):
+    """Run the build benchmark.
+
+    Args:
+        directory (str): Where the databases are built.
+        species (str, optional): 'Mm' or 'Hs'.
+        num_genes (int, optional): The number of genes.
+        seed (int, optional): The random seed.
+        modes (list, optional): The modes to run, ``None`` for all
+            :data:`MODES`.
+        keep (bool, optional): ``True`` to keep the databases.
+
+    Returns:
+        dict: A ``dict`` with ``meta``, ``results`` (seconds by phase for
+            each mode) and, when both modes ran, the ``speedup`` of bulk load
+            mode for each phase.
+    """
+    modes = modes or MODES
+
+    LOG.info(f'Generating {num_genes:,} synthetic genes (seed={seed})')
+    ref, chromosomes, chunks = generate(species, num_genes, seed)
+
+    results = OrderedDict()
+
+    for mode in modes:
+        ensimpl_file = os.path.join(directory,
+                                    f'ensimpl.bench.{species}.{mode}.db3')
+        LOG.info(f'Building {ensimpl_file}...')
+        results[mode] = build(ensimpl_file, ref, chromosomes, chunks,
+                              mode == 'bulk_load')
+
+        if not keep:
+            utils.delete_file(ensimpl_file)
+
+    meta = OrderedDict([
+        ('species', species),
+        ('num_genes', num_genes),
+        ('seed', seed),
+        ('python', platform.python_version()),
+        ('sqlite', sqlite3.sqlite_version),
+        ('platform', platform.platform()),
+        ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+    ])
+
+    output = OrderedDict([('meta', meta), ('results', results)])
+
+    if 'default' in results and 'bulk_load' in results:
+        default, bulk_load = results['default'], results['bulk_load']
+        output['speedup'] = OrderedDict(
+            (phase, round(default[phase] / bulk_load[phase], 2))
+            for phase in default if bulk_load.get(phase))
+
+    return output
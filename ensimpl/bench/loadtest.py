@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""Load testing of the API by replaying an access log or a synthesized mix
+of queries.
+
+The access log is expected in the format configured in ``config/gunicorn.py``::
+
+    %(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" in %(D)sµs
+
+Requests can be sent to a running server over HTTP or directly to the
+application's WSGI callable.
+"""
+from collections import OrderedDict
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request as UrlRequest
+from urllib.request import urlopen
+
+import json
+import random
+import re
+import threading
+import time
+
+import ensimpl.utils as utils
+
+from ensimpl.bench.benchmark import DEFAULT_SEED, get_sample, percentile
+from ensimpl.bench.benchmark import summarize
+
+LOG = utils.get_logger()
+
+REGEX_ACCESS_LOG = re.compile(
+    r'^(?P<host>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+) [^"]*" (?P<status>\d{3}) \S+'
+    r'(?: "[^"]*" "[^"]*")?(?: in (?P<duration>\d+)\S*)?'
+)
+
+REGEX_ID_SEGMENT = re.compile(r'/[^/]*\d[^/]*$')
+
+Request = namedtuple('Request', ['method', 'path', 'body', 'endpoint',
+                                 'logged_ms'])
+'''A request to replay; `body` is a ``dict`` sent as JSON for POSTs.'''
+
+SYNTHETIC_MIX = [
+    ('search', 40),
+    ('search_prefix', 15),
+    ('gene', 20),
+    ('genes', 10),
+    ('genes_details', 5),
+    ('external_ids', 5),
+    ('releases', 5),
+]
+'''Default endpoint weights for synthesized traffic.'''
+
+
+def get_endpoint(path):
+    """Normalize a request path into an endpoint name.
+
+    The query string is dropped and a trailing path segment containing digits
+    (an identifier) is replaced by ``<id>``.
+
+    Args:
+        path (str): The request path.
+
+    Returns:
+        str: The endpoint.
+    """
+    path = path.split('?', 1)[0]
+    return REGEX_ID_SEGMENT.sub('/<id>', path)
+
+
+def parse_access_log(file_name, bodies=None):
+    """Parse an access log into requests.
+
+    POST bodies are not logged, so for POST requests `bodies` is consulted
+    by endpoint; POST requests without a body are skipped.
+
+    Args:
+        file_name (str): The access log, may be gzipped.
+        bodies (dict, optional): JSON bodies keyed by endpoint.
+
+    Yields:
+        Request: The requests in log order.
+    """
+    bodies = bodies or {}
+    skipped = 0
+
+    with utils.open_resource(file_name, 'rt') as fd:
+        for line in fd:
+            match = REGEX_ACCESS_LOG.match(line)
+
+            if not match:
+                skipped += 1
+                continue
+
+            method = match.group('method')
+            path = match.group('path')
+            endpoint = get_endpoint(path)
+            duration = match.group('duration')
+            logged_ms = int(duration) / 1000.0 if duration else None
+            body = None
+
+            if method == 'POST':
+                body = bodies.get(endpoint)
+                if body is None:
+                    skipped += 1
+                    continue
+
+            yield Request(method, path, body, endpoint, logged_ms)
+
+    if skipped:
+        LOG.info(f'{skipped:,} log lines skipped')
+
+
+def synthesize_requests(num, release=None, species=None, seed=DEFAULT_SEED,
+                        mix=None):
+    """Synthesize a query mix from identifiers sampled from the database.
+
+    Args:
+        num (int): The number of requests.
+        release (str, optional): The Ensembl release, ``None`` for latest.
+        species (str, optional): The Ensembl species identifier.
+        seed (int, optional): The random seed.
+        mix (list, optional): (name, weight) tuples, see
+            :data:`SYNTHETIC_MIX`.
+
+    Returns:
+        list: A ``list`` of :class:`Request`.
+    """
+    mix = mix or SYNTHETIC_MIX
+    rnd = random.Random(seed)
+    sample = get_sample(release, species, seed)
+    symbols = sample.symbols or sample.ids
+
+    params = []
+    if release:
+        params.append(f'release={release}')
+    if species:
+        params.append(f'species={species}')
+    query = '&'.join(params)
+    base = {'release': release, 'species': species}
+
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    requests = []
+
+    for name in rnd.choices(names, weights, k=num):
+        ids = rnd.sample(sample.ids, min(len(sample.ids),
+                                         rnd.randint(1, 200)))
+
+        if name == 'search':
+            path = f'/api/search?term={quote(rnd.choice(symbols))}&{query}'
+            requests.append(Request('GET', path, None, '/api/search', None))
+        elif name == 'search_prefix':
+            term = quote(rnd.choice(symbols)[:3])
+            path = f'/api/search?term={term}&{query}'
+            requests.append(Request('GET', path, None, '/api/search', None))
+        elif name == 'gene':
+            path = f'/api/gene/{rnd.choice(sample.ids)}?details=1&{query}'
+            requests.append(Request('GET', path, None, '/api/gene/<id>', None))
+        elif name in ('genes', 'genes_details'):
+            body = dict(base, details=(name == 'genes_details'))
+            body['ids[]'] = ids
+            requests.append(Request('POST', '/api/genes', body,
+                                    '/api/genes', None))
+        elif name == 'external_ids':
+            body = dict(base, source_db='Ensembl')
+            body['ids[]'] = ids
+            requests.append(Request('POST', '/api/external_ids', body,
+                                    '/api/external_ids', None))
+        else:
+            requests.append(Request('GET', '/api/releases', None,
+                                    '/api/releases', None))
+
+    return requests
+
+
+def get_post_bodies(release=None, species=None, seed=DEFAULT_SEED, num=100):
+    """Get JSON bodies for the POST endpoints, used when replaying an access
+    log since POST bodies are not logged.
+
+    Args:
+        release (str, optional): The Ensembl release, ``None`` for latest.
+        species (str, optional): The Ensembl species identifier.
+        seed (int, optional): The random seed.
+        num (int, optional): The number of ids in each body.
+
+    Returns:
+        dict: JSON bodies keyed by endpoint.
+    """
+    ids = get_sample(release, species, seed).get_ids(num)
+    base = {'release': release, 'species': species, 'ids[]': ids}
+
+    return {'/api/genes': base,
+            '/api/external_ids': dict(base, source_db='Ensembl')}
+
+
+class UrlTarget:
+    """Send requests to a running server over HTTP."""
+    def __init__(self, url, timeout=60):
+        """Constructor.
+
+        Args:
+            url (str): The base url of the server, 'http://host:port'.
+            timeout (int, optional): Timeout in seconds.
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, request):
+        """Send the `request`.
+
+        Args:
+            request (Request): The request.
+
+        Returns:
+            tuple: (status code, response size in bytes)
+        """
+        data = None
+        headers = {}
+
+        if request.body is not None:
+            data = json.dumps(request.body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        url_request = UrlRequest(self.url + request.path, data=data,
+                                 headers=headers, method=request.method)
+
+        try:
+            with urlopen(url_request, timeout=self.timeout) as response:
+                return response.status, len(response.read())
+        except HTTPError as e:
+            return e.code, 0
+
+
+class WsgiTarget:
+    """Send requests directly to a WSGI application, one test client per
+    thread."""
+    def __init__(self, app):
+        """Constructor.
+
+        Args:
+            app (flask.Flask): The application.
+        """
+        self.app = app
+        self.local = threading.local()
+
+    def __call__(self, request):
+        """Send the `request`.
+
+        Args:
+            request (Request): The request.
+
+        Returns:
+            tuple: (status code, response size in bytes)
+        """
+        client = getattr(self.local, 'client', None)
+
+        if client is None:
+            client = self.app.test_client(use_cookies=False)
+            self.local.client = client
+
+        response = client.open(request.path, method=request.method,
+                               json=request.body)
+
+        return response.status_code, len(response.get_data())
+
+
+def run(requests, target, concurrency=1, rate=None):
+    """Send all `requests` to `target`.
+
+    With a `rate` the requests are scheduled at a fixed rate (open loop) and
+    latency is measured from the scheduled time, so it includes the time a
+    request waits for a free worker as well as any queueing inside the
+    server.  That wait is also reported on its own as the late start.
+    Without a `rate` each worker sends its next request as soon as the
+    previous one finishes, which measures saturation throughput for the
+    given `concurrency`.
+
+    Args:
+        requests (list): A ``list`` of :class:`Request`.
+        target: A callable such as :class:`UrlTarget` or :class:`WsgiTarget`.
+        concurrency (int, optional): Number of concurrent workers.
+        rate (float, optional): Requests per second, ``None`` for no limit.
+
+    Returns:
+        dict: A ``dict`` with ``overall`` and ``endpoints`` summaries.
+    """
+    records = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def send(index, request):
+        t0 = time.perf_counter()
+        late = None
+
+        if rate:
+            # a request waiting for a free worker is already late, timing it
+            # from when it is sent would leave out that wait
+            scheduled = start + index / rate
+            late = max(t0 - scheduled, 0.0)
+
+            if t0 < scheduled:
+                time.sleep(scheduled - t0)
+
+            t0 = scheduled
+
+        try:
+            status, size = target(request)
+            error = status >= 400
+        except Exception as e:
+            LOG.debug(f'{request.path}: {e}')
+            status, size, error = None, 0, True
+
+        elapsed = time.perf_counter() - t0
+
+        with lock:
+            records.append((request.endpoint, elapsed, status, size, error,
+                            request.logged_ms, late))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, request in enumerate(requests):
+            executor.submit(send, index, request)
+
+    elapsed = time.perf_counter() - start
+
+    return summarize_records(records, elapsed, concurrency, rate)
+
+
+def summarize_records(records, elapsed, concurrency, rate):
+    """Summarize the recorded requests overall and by endpoint.
+
+    Args:
+        records (list): (endpoint, seconds, status, size, error, logged_ms,
+            late start in seconds or ``None`` without a rate)
+        elapsed (float): Total run time in seconds.
+        concurrency (int): Number of concurrent workers.
+        rate (float): Requests per second or ``None``.
+
+    Returns:
+        dict: The summary.
+    """
+    by_endpoint = OrderedDict()
+
+    for record in sorted(records, key=lambda r: r[0]):
+        by_endpoint.setdefault(record[0], []).append(record)
+
+    def describe(recs):
+        summary = summarize([r[1] for r in recs], elapsed)
+        errors = sum(1 for r in recs if r[4])
+        summary['errors'] = errors
+        summary['error_rate'] = errors / len(recs) if recs else 0.0
+        summary['mean_bytes'] = (sum(r[3] for r in recs) / len(recs)
+                                 if recs else 0)
+        logged = sorted(r[5] for r in recs if r[5] is not None)
+        if logged:
+            summary['logged_p50_ms'] = logged[len(logged) // 2]
+        late = sorted(r[6] for r in recs if r[6] is not None)
+        if late:
+            summary['late_start_p50_ms'] = percentile(late, 50) * 1000.0
+            summary['late_start_p99_ms'] = percentile(late, 99) * 1000.0
+            summary['late_start_max_ms'] = late[-1] * 1000.0
+        return summary
+
+    return OrderedDict([
+        ('concurrency', concurrency),
+        ('rate', rate),
+        ('elapsed_s', elapsed),
+        ('overall', describe(records)),
+        ('endpoints', OrderedDict((k, describe(v))
+                                  for k, v in by_endpoint.items())),
+    ])
+
+
+def ramp(requests, target, levels):
+    """Find the saturation throughput by running the same `requests` at
+    increasing concurrency levels without a rate limit.
+
+    Args:
+        requests (list): A ``list`` of :class:`Request`.
+        target: A callable such as :class:`UrlTarget` or :class:`WsgiTarget`.
+        levels (list): Concurrency levels, e.g. [1, 2, 4, 8].
+
+    Returns:
+        dict: A ``dict`` with a ``levels`` ``list`` of run summaries and the
+            ``saturation_throughput`` and ``saturation_concurrency``.
+    """
+    results = []
+
+    for level in levels:
+        LOG.info(f'Running {len(requests):,} requests at concurrency {level}')
+        results.append(run(requests, target, level))
+
+    best = max(results, key=lambda r: r['overall'].get('throughput') or 0)
+
+    return OrderedDict([
+        ('levels', results),
+        ('saturation_throughput', best['overall'].get('throughput')),
+        ('saturation_concurrency', best['concurrency']),
+    ])
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import importlib
 import os
 
 import click
@@ -33,15 +34,15 @@ class CLI(click.MultiCommand):
         :param name: Command name
         :return: Module's cli function
         """
-        ns = {}
-
         filename = os.path.join(cmd_folder, cmd_prefix + name + '.py')
 
-        with open(filename) as f:
-            code = compile(f.read(), filename, 'exec')
-            eval(code, ns, ns)
+        if not os.path.exists(filename):
+            return None
+
+        module = importlib.import_module(
+            f'ensimpl.cli.commands.{cmd_prefix}{name}')
 
-        return ns['cli']
+        return module.cli
 
 
 @click.command(cls=CLI)
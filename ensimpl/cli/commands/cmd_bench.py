@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+import sys
+
+import click
+
+import ensimpl.db_config as db_config
+
+from ensimpl.bench import DEFAULT_ITERATIONS, DEFAULT_SEED, DEFAULT_THRESHOLD
+from ensimpl.utils import configure_logging, get_logger
+
+
+@click.command('bench', options_metavar='<options>',
+               short_help='benchmark the fetch layer and API')
+@click.option('-b', '--baseline', metavar='<baseline>',
+              type=click.Path(exists=True, resolve_path=True,
+                              dir_okay=False))
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-i', '--iterations', default=DEFAULT_ITERATIONS)
+@click.option('-o', '--output', metavar='<output>',
+              type=click.Path(resolve_path=True, dir_okay=False))
+@click.option('-s', '--species', default='Mm')
+@click.option('-t', '--threshold', default=DEFAULT_THRESHOLD)
+@click.option('-w', '--workload', multiple=True)
+@click.option('--no-api', is_flag=True)
+@click.option('--seed', default=DEFAULT_SEED)
+@click.option('--ver', default=None)
+@click.option('-v', '--verbose', count=True)
+def cli(baseline, directory, iterations, output, species, threshold, workload,
+        no_api, seed, ver, verbose):
+    """
+    Run a fixed benchmark workload against the ensimpl databases.
+
+    Results are written as JSON to <output> (or stdout).  When <baseline> is
+    specified the results are compared against it and the exit code is 1 if
+    any workload regressed by more than <threshold>.
+    """
+    import ensimpl.bench.benchmark as benchmark
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    if directory:
+        db_config.init(directory)
+
+    results = benchmark.run(ver, species, iterations, seed,
+                            list(workload) or None, not no_api)
+
+    regressed = []
+
+    if baseline:
+        comparison = benchmark.compare(results, benchmark.load(baseline),
+                                       threshold)
+        results['comparison'] = comparison
+        regressed = [k for k, v in comparison.items() if v['regression']]
+
+    if output:
+        with open(output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+        LOG.info(f'Results written to: {output}')
+    else:
+        print(json.dumps(results, indent=2))
+
+    if regressed:
+        LOG.error(f'Regressions: {", ".join(regressed)}')
+        sys.exit(1)
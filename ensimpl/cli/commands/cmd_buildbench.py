@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import json
+import tempfile
+
+import click
+
+from ensimpl.bench import DEFAULT_BUILD_GENES, DEFAULT_SEED
+from ensimpl.utils import configure_logging, get_logger
+
+
+@click.command('buildbench', options_metavar='<options>',
+               short_help='benchmark building a database')
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-g', '--genes', 'num_genes', default=DEFAULT_BUILD_GENES)
+@click.option('-k', '--keep', is_flag=True)
+@click.option('-m', '--mode', multiple=True,
+              type=click.Choice(['default', 'bulk_load']))
+@click.option('-o', '--output', metavar='<output>',
+              type=click.Path(resolve_path=True, dir_okay=False))
+@click.option('-s', '--species', default='Mm',
+              type=click.Choice(['Hs', 'Mm']))
+@click.option('--seed', default=DEFAULT_SEED)
+@click.option('--ver', default=None)
+@click.option('-v', '--verbose', count=True)
+def cli(directory, num_genes, keep, mode, output, species, seed, ver,
+        verbose):
+    """
+    Time building a synthetic database with and without bulk load mode.
+
+    <genes> synthetic genes are generated once and inserted in each <mode>
+    into a database in <directory> (a temporary directory by default).
+    Seconds per phase and the speedup of bulk load mode are written as JSON
+    to <output> (or stdout).
+    """
+    import ensimpl.bench.build as build
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        results = build.run(directory or tmp_directory, species, num_genes,
+                            seed, list(mode) or None,
+                            keep and directory is not None)
+
+    if output:
+        with open(output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+        LOG.info(f'Results written to: {output}')
+    else:
+        print(json.dumps(results, indent=2))
+
+    for phase, speedup in results.get('speedup', {}).items():
+        LOG.warning(f'{phase}: {speedup}x')
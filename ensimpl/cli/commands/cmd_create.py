@@ -3,27 +3,80 @@ import time
 
 import click
 
-import ensimpl.create.create_ensimpl as create_ensimpl
-
 from ensimpl.utils import configure_logging, format_time, get_logger
 
 
 @click.command('create', options_metavar='<options>',
                short_help='create an annotation database')
+@click.option('-b', '--bulk-load', is_flag=True)
+@click.option('-c', '--cache', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('--compact', is_flag=True)
 @click.option('-d', '--directory', default='.',
               type=click.Path(file_okay=False, exists=True,
                               resolve_path=True, dir_okay=True))
-@click.option('-r', '--resource', default=create_ensimpl.DEFAULT_CONFIG)
+@click.option('--dumps', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-j', '--jobs', default=1)
+@click.option('--max-connections', default=10)
+@click.option('-p', '--profile-report', metavar='<report>',
+              type=click.Path(resolve_path=True, dir_okay=False))
+@click.option('-r', '--resource', default=None)
+@click.option('--reuse-cache', is_flag=True)
 @click.option('-s', '--species', multiple=True)
+@click.option('-w', '--workers', default=5)
 @click.option('--ver', multiple=True)
 @click.option('-v', '--verbose', count=True)
-def cli(directory, resource, species, ver, verbose):
+def cli(bulk_load, cache, compact, directory, dumps, jobs, max_connections,
+        profile_report, resource, reuse_cache, species, workers, ver, verbose):
     """
     Creates a new ensimpl database <filename> using Ensembl <version>.
+
+    Chromosomes, synonyms, homologs, genes and transcripts are extracted
+    from Ensembl concurrently, at most <workers> at a time, and spooled to
+    files in <directory> until they are inserted.
+
+    Up to <jobs> databases are built at once in separate processes, each
+    logging to ensimpl.<version>.<species>.log in <directory>, with at most
+    <max-connections> Ensembl connections open in total.  A summary of the
+    timings and failures is logged at the end.
+
+    With <dumps> the Ensembl MySQL dump files (<database>.sql.gz and
+    <table>.txt.gz) in <dumps>/<database> are read instead of connecting to
+    the Ensembl server.
+
+    With <cache> the extractions are kept in <cache> as compressed files
+    keyed by release, species and query, and each completed build phase is
+    checkpointed.  With --reuse-cache the cached extractions are used
+    instead of querying Ensembl and an interrupted build resumes from its
+    last completed phase.
+
+    With --bulk-load each database is written on one connection without
+    journaling to disk, syncing or sharing the file until it is finalized.
+    This is faster, but a build that is killed has to start again, even
+    with --reuse-cache, although the cached extractions are still used.
+
+    With --compact the Ensembl IDs and other repeated values are stored
+    once and referred to by integer keys, and the tables are read through
+    views, which makes the databases and their indices smaller.
+
+    With <report> the wall time, CPU time, rows, rows/sec and peak RSS of
+    every extraction, insert and finalize statement, and the size of every
+    table and index, are written to <report> as JSON.  Use 'ensimpl
+    profdiff' to compare two reports.
     """
+    import ensimpl.create.create_ensimpl as create_ensimpl
+
     configure_logging(verbose)
     LOG = get_logger()
 
+    resource = resource or create_ensimpl.DEFAULT_CONFIG
+
+    if reuse_cache and not cache:
+        raise click.UsageError('--reuse-cache requires --cache')
+
     if ver:
         ensembl_versions = list(ver)
     else:
@@ -37,7 +90,9 @@ def cli(directory, resource, species, ver, verbose):
     LOG.info("Creating database...")
 
     tstart = time.time()
-    create_ensimpl.create(ensembl_versions, ensembl_species, directory, resource)
+    create_ensimpl.create(ensembl_versions, ensembl_species, directory, resource,
+                          workers, jobs, max_connections, dumps, cache,
+                          reuse_cache, bulk_load, profile_report, compact)
     tend = time.time()
 
     LOG.info("Creation time: {}".format(format_time(tstart, tend)))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+import click
+
+import ensimpl.db_config as db_config
+
+from ensimpl.utils import configure_logging, format_time, get_logger
+
+
+@click.command('diff', options_metavar='<options>',
+               short_help='precompute the changes between two releases')
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-f', '--from', 'release_from', required=True)
+@click.option('-s', '--species', multiple=True)
+@click.option('-t', '--to', 'release_to', required=True)
+@click.option('-v', '--verbose', count=True)
+def cli(directory, release_from, species, release_to, verbose):
+    """
+    Compare the ensimpl databases of releases <from> and <to>.
+
+    The added, removed, version bumped, moved and renamed genes and
+    transcripts are written to ensimpl.<from>.<to>.<species>.diff next to
+    the databases, and served by /api/diff.  All species that have both
+    releases are compared unless <species> is specified.
+    """
+    import ensimpl.create.diff as diff
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    if directory:
+        db_config.init(directory)
+
+    if not species:
+        species = sorted({db['species'] for db in db_config.ENSIMPL_DBS
+                          if str(db['release']) in (release_from,
+                                                    release_to)})
+
+    tstart = time.time()
+
+    for species_id in species:
+        try:
+            diff_file = diff.create_release_diff(release_from, release_to,
+                                                 species_id)
+        except ValueError as ve:
+            raise click.ClickException(str(ve))
+
+        LOG.warning(f'Created {diff_file}')
+
+    LOG.info(f'Diff time: {format_time(tstart, time.time())}')
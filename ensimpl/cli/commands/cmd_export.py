@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import click
+
+from ensimpl.utils import configure_logging, get_logger
+
+TABLES = ['ensembl_genes', 'ensembl_gtpe', 'ensembl_gene_ids',
+          'ensembl_homologs']
+
+
+@click.command('export', options_metavar='<options>',
+               short_help='export tables to Parquet or Arrow')
+@click.option('-c', '--by-chromosome', is_flag=True)
+@click.option('-d', '--directory', default='.',
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-f', '--format', 'file_format', default='parquet',
+              type=click.Choice(['parquet', 'arrow']))
+@click.option('-r', '--row-group-size', default=100000)
+@click.option('-s', '--species', default='Mm')
+@click.option('-t', '--table', 'tables', multiple=True,
+              type=click.Choice(TABLES))
+@click.option('-w', '--workers', default=1)
+@click.option('--ver', default=None)
+@click.option('-v', '--verbose', count=True)
+def cli(by_chromosome, directory, file_format, row_group_size, species,
+        tables, workers, ver, verbose):
+    """
+    Export ensimpl tables as columnar Parquet or Arrow IPC files.
+
+    One file is written per table in <directory>, or one file per table and
+    chromosome with --by-chromosome.  Rows are read <row-group-size> at a
+    time and <workers> files are written in parallel.  Requires pyarrow.
+    """
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    from ensimpl.fetch import export
+
+    try:
+        counts = export.export(directory, ver, species, list(tables) or None,
+                               file_format, by_chromosome, row_group_size,
+                               workers)
+    except ImportError as ie:
+        raise click.ClickException(str(ie))
+
+    for file_name, count in counts.items():
+        LOG.info(f'{file_name}: {count:,} rows')
@@ -1,27 +1,91 @@
 # -*- coding: utf-8 -*-
 import click
+import csv
+import itertools
 import json
+import sys
 import time
 
-from tabulate import tabulate
-
 from ensimpl.utils import configure_logging, format_time, get_logger
-from ensimpl.fetch import genes as get_genes
+
+CHUNK_SIZE = 10000
+
+HEADERS = ['ID', 'VERSION', 'SPECIES', 'SYMBOL', 'NAME', 'SYNONYMS',
+           'EXTERNAL_IDS', 'CHR', 'START', 'END', 'STRAND']
+
+
+def read_ids(file_name, chunk_size=CHUNK_SIZE):
+    """Read the ids (first column) from `file_name` in chunks.
+
+    Args:
+        file_name (str): The file, one id per line.
+        chunk_size (int, optional): Number of ids per chunk.
+
+    Yields:
+        list: A ``list`` of at most `chunk_size` ids.
+    """
+    with open(file_name) as fd:
+        ids = (row.strip().split()[0] for row in fd if row.strip())
+
+        while True:
+            chunk = list(itertools.islice(ids, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+
+def get_line(gene):
+    """Convert a gene to a row of output.
+
+    Args:
+        gene (dict): The gene.
+
+    Returns:
+        list: The values for :data:`HEADERS`.
+    """
+    external_ids = gene.get('external_ids', [])
+    external_ids_str = ''
+    if external_ids:
+        ext_ids_tmp = []
+        for ext in external_ids:
+            ext_ids_tmp.append('{}/{}'.format(ext['db'], ext['db_id']))
+        external_ids_str = '||'.join(ext_ids_tmp)
+
+    return [gene['id'],
+            gene.get('ensembl_version', ''),
+            gene['species_id'],
+            gene.get('symbol', ''),
+            gene.get('name', ''),
+            '||'.join(gene.get('synonyms', [])),
+            external_ids_str,
+            gene['chromosome'],
+            gene['start'],
+            gene['end'],
+            gene['strand']]
 
 
 @click.command('genes', short_help='get all genes')
 @click.option('-f', '--format', 'display', default='pretty',
-              type=click.Choice(['tab', 'csv', 'json', 'pretty']))
+              type=click.Choice(['tab', 'csv', 'json', 'jsonl', 'pretty']))
 @click.option('-i', '--ids', metavar='<ensembl_ids>',
               type=click.Path(exists=True, resolve_path=True,
                               dir_okay=False, writable=False))
+@click.option('-o', '--order', default='id',
+              type=click.Choice(['id', 'position']))
 @click.option('-s', '--species', type=click.Choice(['Mm', 'Hs']))
 @click.option('--ver', default=None)
 @click.option('-v', '--verbose', count=True)
-def cli(display, ids, species, ver, verbose):
+def cli(display, ids, order, species, ver, verbose):
     """
     Get gene information from annotation database.
+
+    Genes are written as they are read from the database, <ensembl_ids> is
+    read 10,000 ids at a time and each chunk is ordered by <order>.  The
+    json and jsonl formats include transcripts, exons and proteins.  The
+    pretty format has to hold all genes in memory to align the columns.
     """
+    from ensimpl.fetch import genes as get_genes
+
     configure_logging(verbose)
     LOG = get_logger()
     LOG.debug("Ensimpl Version: {}".format(ver))
@@ -29,70 +93,54 @@ def cli(display, ids, species, ver, verbose):
     LOG.debug("Format: {}".format(display))
     LOG.debug("Ids: {}".format(ids))
 
-    ensembl_ids = None
+    details = display in ('json', 'jsonl')
 
     if ids:
-        ensembl_ids = []
-        with open(ids) as fd:
-            for row in fd:
-                row = row.strip()
-                if row:
-                    ensembl_ids.append(row.strip().split()[0])
-
-    tstart = time.time()
+        chunks = read_ids(ids)
+    else:
+        chunks = [None]
 
-    result = get_genes.get(ensembl_ids, species, ver, True)
-    tend = time.time()
+    genes = (gene
+             for chunk in chunks
+             for _, gene in get_genes.iter_genes(chunk, ver, species,
+                                                 order, details))
 
-    headers = ['ID', 'VERSION', 'SPECIES', 'SYMBOL', 'NAME', 'SYNONYMS',
-               'EXTERNAL_IDS', 'CHR', 'START', 'END', 'STRAND']
+    tstart = time.time()
 
+    writer = None
     tbl = []
 
-    delim = '"\t"' if display == 'tab' else '","'
-
     if display in ('tab', 'csv'):
-        print('"{}"'.format(delim.join(headers)))
-
-    for i in result:
-        r = result[i]
-        line = list()
-        line.append(r['id'])
-        line.append(r.get('ensembl_version', ''))
-        line.append(r['species_id'])
-        line.append(r.get('symbol', ''))
-        line.append(r.get('name', ''))
-        line.append('||'.join(r.get('synonyms', [])))
-
-        external_ids = r.get('external_ids', [])
-        external_ids_str = ''
-        if external_ids:
-            ext_ids_tmp = []
-            for ext in external_ids:
-                ext_ids_tmp.append('{}/{}'.format(ext['db'], ext['db_id']))
-            external_ids_str = '||'.join(ext_ids_tmp)
-        line.append(external_ids_str)
-
-        line.append(r['chromosome'])
-        line.append(r['start'])
-        line.append(r['end'])
-        line.append(r['strand'])
-
-        if display in ('tab', 'csv'):
-            print('"{}"'.format(delim.join(map(str, line))))
+        delim = '\t' if display == 'tab' else ','
+        writer = csv.writer(sys.stdout, delimiter=delim,
+                            quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(HEADERS)
+    elif display == 'json':
+        sys.stdout.write('{"data": [')
+
+    count = 0
+
+    for gene in genes:
+        if writer:
+            writer.writerow(get_line(gene))
         elif display == 'json':
-            tbl.append(r)
+            sys.stdout.write(',\n' if count else '\n')
+            sys.stdout.write(json.dumps(gene))
+        elif display == 'jsonl':
+            sys.stdout.write(json.dumps(gene))
+            sys.stdout.write('\n')
         else:
-            tbl.append(line)
+            tbl.append(get_line(gene))
 
-    if display in ('tab', 'csv'):
-        pass
-    elif display == 'json':
-        print(json.dumps({'data': tbl}, indent=2))
-    else:
-        print(tabulate(tbl, headers))
-    pass
+        count += 1
 
-    LOG.info("Search time: {}".format(format_time(tstart, tend)))
+    if display == 'json':
+        sys.stdout.write('\n]}\n')
+    elif display == 'pretty':
+        from tabulate import tabulate
+        print(tabulate(tbl, HEADERS))
 
+    tend = time.time()
 
+    LOG.info("{:,} genes".format(count))
+    LOG.info("Search time: {}".format(format_time(tstart, tend)))
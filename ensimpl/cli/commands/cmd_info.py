@@ -1,9 +1,7 @@
 # -*- coding: utf-8 -*-
 import click
-from tabulate import tabulate
 
 from ensimpl.utils import configure_logging, get_logger
-from ensimpl.fetch import get
 
 
 @click.command('info', short_help='stats on database')
@@ -14,6 +12,8 @@ def cli(version, species, verbose):
     """
     Stats annotation database <filename> for <term>
     """
+    from ensimpl.fetch import get
+
     configure_logging(verbose)
     LOG = get_logger()
     LOG.debug("Stats database...")
@@ -25,6 +25,8 @@ def cli(version, species, verbose):
     arr = []
     for stat in sorted(statistics['stats']):
         arr.append([stat, statistics['stats'][stat]])
+
+    from tabulate import tabulate
     print(tabulate(arr))
 
 
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import itertools
+import json
+
+import click
+
+import ensimpl.db_config as db_config
+
+from ensimpl.bench import DEFAULT_SEED
+from ensimpl.utils import configure_logging, get_logger
+
+
+@click.command('loadtest', options_metavar='<options>',
+               short_help='replay traffic against the API')
+@click.option('-c', '--concurrency', default=4)
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-l', '--log', 'access_log', metavar='<access_log>',
+              type=click.Path(exists=True, resolve_path=True,
+                              dir_okay=False))
+@click.option('-n', '--num', default=1000)
+@click.option('-o', '--output', metavar='<output>',
+              type=click.Path(resolve_path=True, dir_okay=False))
+@click.option('-r', '--rate', default=None, type=float)
+@click.option('-s', '--species', default=None)
+@click.option('-u', '--url', default=None)
+@click.option('--ramp', default=None)
+@click.option('--seed', default=DEFAULT_SEED)
+@click.option('--ver', default=None)
+@click.option('-v', '--verbose', count=True)
+def cli(concurrency, directory, access_log, num, output, rate, species, url,
+        ramp, seed, ver, verbose):
+    """
+    Replay an access log, or a synthesized query mix, against a server.
+
+    Requests go to <url> when specified, otherwise directly to the
+    application's WSGI callable.  At most <num> requests are sent.
+
+    <ramp> is a comma separated list of concurrency levels, for example
+    1,2,4,8,16, used to find the saturation throughput.
+    """
+    import ensimpl.bench.loadtest as loadtest
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    if directory:
+        db_config.init(directory)
+
+    if access_log:
+        bodies = loadtest.get_post_bodies(ver, species, seed)
+        requests = list(itertools.islice(
+            loadtest.parse_access_log(access_log, bodies), num))
+    else:
+        requests = loadtest.synthesize_requests(num, ver, species, seed)
+
+    LOG.info(f'{len(requests):,} requests to send')
+
+    if url:
+        target = loadtest.UrlTarget(url)
+    else:
+        from ensimpl.app import create_app
+        target = loadtest.WsgiTarget(create_app({'LOG_LEVEL': 'ERROR'}))
+
+    if ramp:
+        levels = [int(level) for level in ramp.split(',')]
+        results = loadtest.ramp(requests, target, levels)
+    else:
+        results = loadtest.run(requests, target, concurrency, rate)
+
+    if output:
+        with open(output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+        LOG.info(f'Results written to: {output}')
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import click
+
+import ensimpl.db_config as db_config
+
+from ensimpl.utils import configure_logging, format_time, get_logger
+
+
+@click.command('optimize', options_metavar='<options>',
+               short_help='upgrade existing databases in place')
+@click.argument('files', metavar='<files>', nargs=-1,
+                type=click.Path(exists=True, resolve_path=True,
+                                dir_okay=False))
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-j', '--jobs', default=1)
+@click.option('-o', '--output', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-p', '--page-size', default='4096',
+              type=click.Choice(['512', '1024', '2048', '4096', '8192',
+                                 '16384', '32768', '65536']))
+@click.option('-r', '--release', 'releases', multiple=True)
+@click.option('-s', '--species', multiple=True)
+@click.option('--sample', default=50)
+@click.option('-v', '--verbose', count=True)
+def cli(files, directory, jobs, output, page_size, releases, species, sample,
+        verbose):
+    """
+    Upgrade ensimpl databases built by older versions, without extracting
+    them from Ensembl again.
+
+    Each database gets the current indices, full text index, stored lookup
+    counts and query planner statistics and is rewritten with <page-size>
+    pages.  A database is replaced only once its optimized copy is
+    complete, or the copy is written to the <output> directory.  <jobs>
+    databases are optimized at a time.
+
+    The databases are <files> or, without <files>, all databases in the
+    database directory of <release> and <species>.  The size and the mean
+    latency of the main queries, on <sample> sampled genes, are reported
+    before and after, <sample> 0 to skip measuring.
+    """
+    from tabulate import tabulate
+
+    import ensimpl.create.optimize as optimize
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    if not files:
+        if directory:
+            db_config.init(directory)
+
+        files = [db['db'] for db in db_config.ENSIMPL_DBS
+                 if not db.get('store') and
+                 (not releases or str(db['release']) in releases) and
+                 (not species or db['species'] in species)]
+
+    if not files:
+        raise click.ClickException('No databases to optimize')
+
+    tstart = time.time()
+
+    results = optimize.optimize_files(list(files), output, int(page_size),
+                                      sample, jobs)
+
+    failed = [result for result in results if result.error]
+
+    for result in results:
+        name = os.path.basename(result.ensimpl_file)
+
+        if result.error:
+            LOG.warning(f'{name}: FAILED ({result.error})')
+            continue
+
+        LOG.warning(f'{name}: OK in {format_time(0, result.seconds)}')
+
+        for change in result.changes:
+            LOG.info(f'  {change}')
+
+        rows = [['size (MB)', result.size_before / 1048576.0,
+                 result.size_after / 1048576.0]]
+
+        if result.latency_before:
+            for query, before in result.latency_before.items():
+                rows.append([f'{query} (ms)', before,
+                             result.latency_after[query]])
+
+        for row in rows:
+            row.append(row[2] / row[1] if row[1] else None)
+
+        print(tabulate(rows, [name, 'BEFORE', 'AFTER', 'RATIO'],
+                       floatfmt='.3f'))
+
+    LOG.warning(f'Optimized {len(results) - len(failed)} of {len(results)} '
+                f'database(s) in {format_time(tstart, time.time())}')
+
+    if failed:
+        raise click.ClickException('Unable to optimize: ' + ', '.join(
+            os.path.basename(result.ensimpl_file) for result in failed))
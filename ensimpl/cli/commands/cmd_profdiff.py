@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import click
+
+from ensimpl.utils import configure_logging
+
+
+@click.command('profdiff', options_metavar='<options>',
+               short_help='compare two build profile reports')
+@click.argument('baseline', metavar='<baseline>',
+                type=click.Path(exists=True, resolve_path=True,
+                                dir_okay=False))
+@click.argument('report', metavar='<report>',
+                type=click.Path(exists=True, resolve_path=True,
+                                dir_okay=False))
+@click.option('-t', '--threshold', default=0.0)
+@click.option('-v', '--verbose', count=True)
+def cli(baseline, report, threshold, verbose):
+    """
+    Compare the build profile <report> against <baseline>, both written by
+    'ensimpl create --profile-report'.
+
+    The wall seconds of every phase and the bytes of every table and index
+    are listed side by side, matched by species and name, with the ratio of
+    <report> to <baseline>.  Only changes larger than <threshold> (0.1 for
+    10%) are listed.
+    """
+    from tabulate import tabulate
+
+    import ensimpl.create.profiling as profiling
+
+    configure_logging(verbose)
+
+    rows = profiling.compare(profiling.load(report), profiling.load(baseline))
+
+    if threshold:
+        rows = [row for row in rows
+                if row[4] is None or abs(row[4] - 1.0) > threshold]
+
+    print(tabulate(rows, ['SPECIES', 'PHASE', 'BASELINE', 'REPORT',
+                          'RATIO']))
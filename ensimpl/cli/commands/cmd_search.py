@@ -1,34 +1,137 @@
 # -*- coding: utf-8 -*-
+import csv
 import sys
 import time
 
 import click
 import json
-from tabulate import tabulate
 
 from ensimpl.utils import configure_logging, format_time, get_logger
-from ensimpl.fetch import search as search_ensimpl
+
+
+BATCH_HEADERS = ['TERM', 'ID', 'SYMBOL', 'POSITION', 'MATCH_REASON',
+                 'MATCH_VALUE', 'SCORE']
+
+
+def read_terms(fd):
+    """Read one search term per line, skipping blank lines.
+
+    Args:
+        fd: The open file.
+
+    Yields:
+        str: The terms.
+    """
+    for line in fd:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def search_batch(fd, ver, species, exact, display, maximum, workers):
+    """Search for every term in `fd` and write the matches as they are
+    found, one row per match (or one row with just the term if nothing
+    matched).
+
+    Args:
+        fd: The open file of terms.
+        ver (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        exact (bool): ``True`` for exact matches.
+        display (str): 'tab', 'csv' or 'jsonl'.
+        maximum (int): Maximum matches per term, ``None`` for all.
+        workers (int): Number of threads.
+    """
+    from ensimpl.fetch import search as search_ensimpl
+
+    LOG = get_logger()
+
+    writer = None
+    if display != 'jsonl':
+        delim = '\t' if display == 'tab' else ','
+        writer = csv.writer(sys.stdout, delimiter=delim, lineterminator='\n')
+        writer.writerow(BATCH_HEADERS)
+
+    num_terms = 0
+    num_found = 0
+
+    results = search_ensimpl.search_batch(read_terms(fd), ver, species,
+                                          exact, maximum, workers)
+
+    for term, result in results:
+        num_terms += 1
+        rows = []
+
+        for match in (result.matches if result else []):
+            rows.append([term, match.ensembl_gene_id, match.symbol,
+                         f'{match.chromosome}:{match.position_start}-'
+                         f'{match.position_end}',
+                         match.match_reason, match.match_value, match.score])
+
+        if rows:
+            num_found += 1
+        else:
+            rows.append([term, '', '', '', '', '', ''])
+
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                print(json.dumps(dict(zip(BATCH_HEADERS, row))))
+
+    LOG.info(f'{num_found:,} of {num_terms:,} terms matched')
 
 
 @click.command('search', short_help='search for data')
-@click.argument('term', metavar='<term>')
+@click.argument('term', metavar='<term>', required=False)
+@click.option('-b', '--batch', metavar='<file>', type=click.File('r'))
 @click.option('-e', '--exact', is_flag=True)
 @click.option('-f', '--format', 'display', default='pretty',
-              type=click.Choice(['tab', 'csv', 'json', 'pretty']))
+              type=click.Choice(['tab', 'csv', 'json', 'jsonl', 'pretty']))
 @click.option('-m', '--max', default=-1)
 @click.option('-s', '--species', type=click.Choice(['mm', 'hs']))
+@click.option('-w', '--workers', default=1)
 @click.option('--ver', default=None)
 @click.option('-v', '--verbose', count=True)
-def cli(term, ver, exact, display, max, species, verbose):
+def cli(term, batch, ver, exact, display, max, species, workers, verbose):
     """
     Search ensimpl database <filename> for <term>
+
+    With --batch every line of <file> ('-' for stdin) is a term, all terms
+    are searched over one database connection per worker and the matches
+    are written as they are found in tab (default), csv or jsonl format.
     """
+    from ensimpl.fetch import search as search_ensimpl
+
     configure_logging(verbose)
     LOG = get_logger()
     LOG.info("Search database...")
 
     maximum = max if max >= 0 else None
 
+    if batch:
+        if display == 'pretty':
+            display = 'tab'
+        elif display == 'json':
+            display = 'jsonl'
+
+        tstart = time.time()
+
+        try:
+            search_batch(batch, ver, species, exact, display, maximum,
+                         workers)
+        except Exception as e:
+            LOG.error('Error: {}'.format(e))
+            sys.exit(1)
+
+        tend = time.time()
+
+        LOG.info("Search time: {}".format(format_time(tstart, tend)))
+        return
+
+    if not term:
+        raise click.UsageError('Specify <term> or --batch <file>')
+
     try:
         tstart = time.time()
         result = search_ensimpl.search(term, ver, species, exact=exact, limit=maximum)
@@ -84,6 +187,7 @@ def cli(term, ver, exact, display, max, species, verbose):
         elif display == 'json':
             print(json.dumps({'data': tbl}, indent=4))
         else:
+            from tabulate import tabulate
             print(tabulate(tbl, headers))
 
         LOG.info("Search time: {}".format(format_time(tstart, tend)))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+import click
+
+import ensimpl.db_config as db_config
+
+from ensimpl.utils import configure_logging, format_time, get_logger
+
+
+@click.command('store', options_metavar='<options>',
+               short_help='consolidate releases into a versioned store')
+@click.option('-d', '--directory', default=None,
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-r', '--release', 'releases', multiple=True)
+@click.option('-s', '--species', multiple=True)
+@click.option('-v', '--verbose', count=True)
+def cli(directory, releases, species, verbose):
+    """
+    Add the ensimpl databases of <species> to its consolidated store.
+
+    Rows that do not change between releases are kept once in
+    ensimpl.<species>.store, next to the databases.  Releases are added in
+    increasing order and releases already in the store are skipped.  All
+    releases of all species are added unless <release> or <species> is
+    specified.  Once added, a database file can be removed and its release
+    is served from the store.
+    """
+    import ensimpl.create.store as store
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    if directory:
+        db_config.init(directory)
+
+    if not species:
+        species = sorted({db['species'] for db in db_config.ENSIMPL_DBS
+                          if not db.get('store')})
+
+    tstart = time.time()
+
+    for species_id in species:
+        try:
+            store_file, added = store.create_species_store(species_id,
+                                                           releases or None)
+        except ValueError as ve:
+            raise click.ClickException(str(ve))
+
+        LOG.warning(f'Added {len(added)} release(s) to {store_file}')
+
+    LOG.info(f'Store time: {format_time(tstart, time.time())}')
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import time
+
+import click
+
+from ensimpl.utils import configure_logging, format_time, get_logger
+
+
+@click.command('synthetic', options_metavar='<options>',
+               short_help='generate a synthetic annotation database')
+@click.option('-d', '--directory', default='.',
+              type=click.Path(file_okay=False, exists=True,
+                              resolve_path=True, dir_okay=True))
+@click.option('-g', '--genes', 'num_genes', default=None, type=int)
+@click.option('-s', '--species', default='Mm',
+              type=click.Choice(['Hs', 'Mm']))
+@click.option('-x', '--scale', default=1.0)
+@click.option('--transcripts', default=2.6)
+@click.option('--exons', default=7.0)
+@click.option('--synonyms', default=1.2)
+@click.option('--external-ids', default=3.0)
+@click.option('--homologs', default=0.8)
+@click.option('--seed', default=1)
+@click.option('--ver', default=None)
+@click.option('-v', '--verbose', count=True)
+def cli(directory, num_genes, species, scale, transcripts, exons, synonyms,
+        external_ids, homologs, seed, ver, verbose):
+    """
+    Generates a synthetic ensimpl database for offline testing.
+
+    The number of genes is the real genome size times <scale> unless
+    <genes> is specified; the remaining options are per gene (or per
+    transcript for exons) means.
+    """
+    import ensimpl.create.synthetic as synthetic
+
+    configure_logging(verbose)
+    LOG = get_logger()
+
+    ver = ver or synthetic.SYNTHETIC_RELEASE
+
+    spec = synthetic.get_spec(species, scale, num_genes, transcripts, exons,
+                              synonyms, external_ids, homologs)
+
+    tstart = time.time()
+    db = synthetic.generate(directory, ver, species, spec, seed)
+    tend = time.time()
+
+    LOG.warning(f'Generated {db} in {format_time(tstart, tend)}')
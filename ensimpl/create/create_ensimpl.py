@@ -1,13 +1,26 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import io
+import json
+import logging
 import os
+import shutil
+import tempfile
+import threading
 import time
 
 from collections import namedtuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 
 import ensimpl.utils as utils
 import ensimpl.create.ensembl_db as ensembl_db
+import ensimpl.create.ensembl_dump as ensembl_dump
 import ensimpl.create.ensimpl_db as ensimpl_db
+import ensimpl.create.profiling as profiling
+import ensimpl.create.spool as spool
 
 DEFAULT_CONFIG = 'ftp://ftp.jax.org/churchill-lab/ensimpl/ensimpl.ensembl.conf'
 
@@ -17,8 +30,51 @@ ENSEMBL_FIELDS = ['release', 'release_date', 'assembly', 'assembly_patch',
 
 EnsemblReference = namedtuple('EnsemblReference', ENSEMBL_FIELDS)
 
+BuildResult = namedtuple('BuildResult', ['ensimpl_file', 'seconds', 'error',
+                                         'profile'])
+
 LOG = utils.get_logger()
 
+DEFAULT_WORKERS = 5
+
+DEFAULT_MAX_CONNECTIONS = 10
+'''Default maximum of concurrent Ensembl connections across all jobs.'''
+
+EXTRACTIONS = OrderedDict([
+    ('chromosomes', lambda ref: ensembl_db.stream_rows(
+        ref, ensembl_db.SQL_ENSEMBL_SELECT_CHROMOSOME)),
+    ('synonyms', lambda ref: ensembl_db.stream_rows(
+        ref, ensembl_db.SQL_ENSEMBL_SELECT_SYNONYMS)),
+    ('homologs', ensembl_db.iter_ensembl_homologs),
+    ('genes', ensembl_db.iter_ensembl_genes),
+    ('gtpe', ensembl_db.iter_ensembl_gtpe),
+])
+'''The independent Ensembl extractions, each on its own connection.'''
+
+DUMP_EXTRACTIONS = OrderedDict([
+    ('chromosomes', ensembl_dump.iter_chromosomes_karyotypes),
+    ('synonyms', ensembl_dump.iter_synonyms),
+    ('homologs', ensembl_dump.iter_ensembl_homologs),
+    ('genes', ensembl_dump.iter_ensembl_genes),
+    ('gtpe', ensembl_dump.iter_ensembl_gtpe),
+])
+'''The same extractions from Ensembl MySQL dump files.'''
+
+PHASES = OrderedDict([
+    ('chromosomes', (['chromosomes'], ['chromosomes_tmp', 'karyotypes_tmp'])),
+    ('homologs', (['homologs'], ['ensembl_homologs_tmp'])),
+    ('genes', (['synonyms', 'genes'], ['ensembl_genes_tmp',
+                                       'ensembl_gene_ids_tmp',
+                                       'ensembl_genes_lookup_tmp'])),
+    ('gtpe', (['gtpe'], ['ensembl_gtpe'])),
+    ('finalize', ([], [])),
+])
+'''The build phases after initializing the database, with the extractions
+each one inserts and the tables it fills.'''
+
+CACHE_VERSION = 1
+'''Change when the format of the cached extractions changes.'''
+
 
 def parse_config(resource_name):
     """Take a resource string (file name, url) and open it.  Parse the file.
@@ -68,17 +124,412 @@ def parse_config(resource_name):
     return all_releases
 
 
-def create(ensembl, species, directory, resource):
+def get_cache_file(ensembl_ref, name, dump_directory=None):
+    """Get the name of the cache file of an extraction.
+
+    The name is keyed by release, species and a hash of the source and the
+    query, so a changed query or server is never read from the cache.
+
+    Args:
+        ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference.
+        name (str): A key of :data:`EXTRACTIONS`.
+        dump_directory (str, optional): The Ensembl MySQL dump files.
+
+    Returns:
+        str: Such as ``ensimpl.96.Mm.genes.0123456789ab.spool.gz``.
+    """
+    if dump_directory:
+        source = [os.path.abspath(dump_directory), ensembl_ref.db,
+                  ensembl_ref.compara_db, name]
+    else:
+        source = [ensembl_ref.server, ensembl_ref.port, ensembl_ref.db,
+                  ensembl_ref.compara_db, ensembl_db.get_sql(ensembl_ref,
+                                                             name)]
+
+    digest = hashlib.sha1(json.dumps([CACHE_VERSION] + source)
+                          .encode('utf-8')).hexdigest()[:12]
+
+    return (f'ensimpl.{ensembl_ref.release}.{ensembl_ref.species_id}.'
+            f'{name}.{digest}.spool.gz')
+
+
+def read_checkpoint(checkpoint_file, key):
+    """Read the completed phases of an interrupted build.
+
+    Args:
+        checkpoint_file (str): The checkpoint file.
+        key (list): Identifies the build, the checkpoint is ignored if it was
+            written for a different key.
+
+    Returns:
+        list: The completed phases, empty if there is nothing to resume.
+    """
+    try:
+        with open(checkpoint_file) as fd:
+            checkpoint = json.load(fd)
+    except (IOError, ValueError):
+        return []
+
+    if checkpoint.get('key') != key:
+        return []
+
+    return checkpoint.get('phases', [])
+
+
+def write_checkpoint(checkpoint_file, key, phases):
+    """Record the completed phases of a build.
+
+    Args:
+        checkpoint_file (str): The checkpoint file.
+        key (list): Identifies the build.
+        phases (list): The completed phases.
+    """
+    tmp_file = f'{checkpoint_file}.tmp'
+
+    with open(tmp_file, 'w') as fd:
+        json.dump({'key': key, 'phases': phases}, fd)
+
+    os.replace(tmp_file, checkpoint_file)
+
+
+def extract(ensembl_ref, file_name, name, cancelled=None,
+            dump_directory=None, profile=None):
+    """Run extraction `name` and spool the rows to `file_name`.
+
+    Args:
+        ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference.
+        file_name (str): The spool file.
+        name (str): A key of :data:`EXTRACTIONS`.
+        cancelled (threading.Event, optional): Stops the extraction when set.
+        dump_directory (str, optional): Read the Ensembl MySQL dump files in
+            this directory instead of connecting to the server.
+        profile (:obj:`ensimpl.create.profiling.BuildProfile`, optional):
+            Time the extraction.
+
+    Returns:
+        str: The spool file.
+
+    Raises:
+        RuntimeError: If `cancelled` is set.
+    """
+    def rows():
+        if dump_directory:
+            source = DUMP_EXTRACTIONS[name](ensembl_ref, dump_directory)
+        else:
+            source = EXTRACTIONS[name](ensembl_ref)
+
+        for row in source:
+            if cancelled is not None and cancelled.is_set():
+                raise RuntimeError(f'Extraction of {name} cancelled')
+            yield row
+
+    start = time.time()
+
+    with profiling.phase(profile, f'extract_{name}') as record:
+        count = record['rows'] = spool.write(file_name, rows())
+
+    LOG.info(f'Extracted {count:,} {name} in '
+             f'{utils.format_time(start, time.time())}')
+
+    return file_name
+
+
+def build(ensembl_ref, ensimpl_file, workers=DEFAULT_WORKERS,
+          dump_directory=None, cache_directory=None, reuse_cache=False,
+          bulk_load=False, profile=None, compact=False):
+    """Build one Ensimpl database.
+
+    The Ensembl extractions run concurrently, at most `workers` at a time on
+    their own connections, and spool their rows to files next to
+    `ensimpl_file`, or to `cache_directory`.  Each spool file is inserted as
+    soon as it, and the ones it depends on, are complete, so inserts overlap
+    the slower extractions.
+
+    The database is built as ``<ensimpl_file>.tmp`` and renamed when it is
+    finalized, so `ensimpl_file` is never seen incomplete.  Each completed
+    phase of :data:`PHASES` is recorded in ``<ensimpl_file>.checkpoint``.
+    With `reuse_cache` the cached extractions are used instead of querying
+    Ensembl and an interrupted build resumes after its last completed phase.
+
+    With `bulk_load` the database is written on one connection in the bulk
+    load mode of :func:`ensimpl.create.ensimpl_db.connect`.  A killed bulk
+    load can leave ``<ensimpl_file>.tmp`` corrupt, so it is never resumed
+    and is rebuilt from the cached extractions instead.  With `compact`
+    it is encoded by :func:`ensimpl.create.ensimpl_db.compact_db`.
+
+    Args:
+        ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference.
+        ensimpl_file (str): The database file to create.
+        workers (int, optional): Maximum concurrent extractions.
+        dump_directory (str, optional): Read the Ensembl MySQL dump files in
+            this directory instead of connecting to the server.
+        cache_directory (str, optional): Keep the extractions in this
+            directory, ``None`` to delete them after the build.
+        reuse_cache (bool, optional): Use the cached extractions and resume
+            an interrupted build.
+        bulk_load (bool, optional): ``True`` for bulk load mode.
+        profile (:obj:`ensimpl.create.profiling.BuildProfile`, optional):
+            Time each phase of the build.
+        compact (bool, optional): ``True`` for the compact encoding.
+    """
+    tmp_file = f'{ensimpl_file}.tmp'
+    checkpoint_file = f'{ensimpl_file}.checkpoint'
+    # the credentials are not part of the key, the file is plain text
+    key = [CACHE_VERSION, ensembl_ref.release, ensembl_ref.species_id,
+           ensembl_ref.db, ensembl_ref.compara_db, ensembl_ref.server,
+           ensembl_ref.port, dump_directory, bulk_load]
+    completed = []
+
+    if reuse_cache and not bulk_load and os.path.exists(tmp_file):
+        completed = read_checkpoint(checkpoint_file, key)
+
+    LOG.info(f'Creating: {ensimpl_file}')
+
+    if completed:
+        LOG.warning(f'Resuming {ensimpl_file} after: {", ".join(completed)}')
+    else:
+        utils.delete_file(tmp_file)
+
+    # the connection is opened before initializing to set the page size
+    conn = ensimpl_db.connect(tmp_file, True) if bulk_load else None
+
+    def checkpoint(phase):
+        completed.append(phase)
+        write_checkpoint(checkpoint_file, key, completed)
+
+    try:
+        if not completed:
+            with profiling.phase(profile, 'initialize'):
+                ensimpl_db.initialize(conn or tmp_file)
+            checkpoint('initialize')
+
+        _build(ensembl_ref, tmp_file, workers, dump_directory,
+               cache_directory, reuse_cache, completed, checkpoint, conn,
+               profile, compact)
+    except BaseException:
+        if conn:
+            conn.close()
+
+        # without a cache there is nothing to resume from
+        if not cache_directory:
+            utils.delete_file(tmp_file)
+            utils.delete_file(checkpoint_file)
+        raise
+
+    if conn:
+        conn.close()
+
+    os.replace(tmp_file, ensimpl_file)
+    utils.delete_file(checkpoint_file)
+
+
+def _build(ensembl_ref, ensimpl_file, workers, dump_directory,
+           cache_directory, reuse_cache, completed, checkpoint, conn=None,
+           profile=None, compact=False):
+    """Run the phases of :func:`build` that are not completed.
+
+    Args:
+        ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference.
+        ensimpl_file (str): The database file to create.
+        workers (int): Maximum concurrent extractions.
+        dump_directory (str): The Ensembl MySQL dump files or ``None``.
+        cache_directory (str): The extraction cache or ``None``.
+        reuse_cache (bool): Use the cached extractions.
+        completed (list): The completed phases.
+        checkpoint (function): Called with each phase when completed.
+        conn (sqlite3.Connection, optional): Write with this connection
+            instead of opening `ensimpl_file` for each phase.
+        profile (:obj:`ensimpl.create.profiling.BuildProfile`, optional):
+            Time each phase.
+        compact (bool, optional): ``True`` for the compact encoding.
+    """
+    db = conn or ensimpl_file
+    phases = [phase for phase in PHASES if phase not in completed]
+    names = [name for name in EXTRACTIONS
+             if any(name in PHASES[phase][0] for phase in phases)]
+
+    if cache_directory:
+        spool_directory = cache_directory
+    else:
+        spool_directory = tempfile.mkdtemp(
+            prefix=f'{os.path.basename(ensimpl_file)}.',
+            dir=os.path.dirname(ensimpl_file))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    cancelled = threading.Event()
+    spools = OrderedDict()
+
+    try:
+        for name in names:
+            file_name = os.path.join(
+                spool_directory,
+                get_cache_file(ensembl_ref, name, dump_directory))
+
+            if reuse_cache and os.path.exists(file_name):
+                LOG.info(f'Using cached {name}: {file_name}')
+                spools[name] = Future()
+                spools[name].set_result(file_name)
+            else:
+                LOG.info(f'Extracting {name}...')
+                spools[name] = executor.submit(extract, ensembl_ref,
+                                               file_name, name, cancelled,
+                                               dump_directory, profile)
+
+        for phase in phases:
+            extractions, tables = PHASES[phase]
+            files = [spools[name].result() for name in extractions]
+
+            ensimpl_db.clear_tables(db, tables)
+
+            name = 'finalize' if phase == 'finalize' else f'insert_{phase}'
+
+            with profiling.phase(profile, name) as record:
+                if phase == 'chromosomes':
+                    LOG.info('Inserting chromsomes...')
+                    record['rows'] = ensimpl_db.insert_chromosomes_karyotypes(
+                        db, ensembl_ref, list(spool.read(files[0])))
+                elif phase == 'homologs':
+                    # homologs go first so the genes can be merge joined
+                    LOG.info('Inserting homologs...')
+                    record['rows'] = ensimpl_db.insert_homologs(
+                        db, ensembl_ref, spool.read(files[0]))
+                elif phase == 'genes':
+                    LOG.info('Inserting genes...')
+                    synonyms = ensembl_db.group_synonyms(spool.read(files[0]))
+                    record['rows'] = ensimpl_db.insert_genes(
+                        db, ensembl_ref, spool.read(files[1]), synonyms)
+                    del synonyms
+                elif phase == 'gtpe':
+                    LOG.info('Inserting transcript, protein, and exons...')
+                    ensimpl_db.clear_gtpe_lookups(db)
+                    record['rows'] = ensimpl_db.insert_gtpe(
+                        db, ensembl_ref, spool.read(files[0]))
+                elif phase == 'finalize':
+                    LOG.info('Finalizing...')
+                    ensimpl_db.finalize(db, ensembl_ref, profile, compact)
+
+            checkpoint(phase)
+    finally:
+        cancelled.set()
+        for future in spools.values():
+            future.cancel()
+        executor.shutdown(wait=True)
+        if not cache_directory:
+            shutil.rmtree(spool_directory, ignore_errors=True)
+
+
+def build_job(ensembl_ref, ensimpl_file, workers=DEFAULT_WORKERS,
+              log_file=None, level=None, dump_directory=None,
+              cache_directory=None, reuse_cache=False, bulk_load=False,
+              profile=False, compact=False):
+    """Build one Ensimpl database and report how it went instead of raising.
+
+    Used for each job of :func:`create`, possibly in another process.
+
+    Args:
+        ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference.
+        ensimpl_file (str): The database file to create.
+        workers (int, optional): Maximum concurrent extractions.
+        log_file (str, optional): Log to this file only, instead of the
+            console.
+        level (int, optional): The logging level, ``None`` to leave as is.
+        dump_directory (str, optional): Read the Ensembl MySQL dump files in
+            this directory instead of connecting to the server.
+        cache_directory (str, optional): Keep the extractions in this
+            directory.
+        reuse_cache (bool, optional): Use the cached extractions and resume
+            an interrupted build.
+        bulk_load (bool, optional): ``True`` for bulk load mode.
+        profile (bool, optional): ``True`` to profile the build.
+        compact (bool, optional): ``True`` for the compact encoding.
+
+    Returns:
+        BuildResult: The file, the seconds taken, the error (``None`` on
+            success) and the profile report (``None`` when not profiling).
+    """
+    handler = None
+    propagate = LOG.propagate
+
+    if level is not None:
+        LOG.setLevel(level)
+
+    if log_file:
+        handler = logging.FileHandler(log_file, mode='w')
+        handler.setFormatter(logging.Formatter(utils.LOG_FORMAT,
+                                               utils.LOG_DATE_FORMAT))
+        LOG.addHandler(handler)
+        LOG.propagate = False
+
+    start = time.time()
+    error = None
+    build_profile = profiling.BuildProfile() if profile else None
+    report = None
+
+    try:
+        build(ensembl_ref, ensimpl_file, workers, dump_directory,
+              cache_directory, reuse_cache, bulk_load, build_profile,
+              compact)
+    except Exception as e:
+        LOG.exception(f'Unable to create {ensimpl_file}')
+        error = f'{type(e).__name__}: {e}'
+    finally:
+        if handler:
+            LOG.removeHandler(handler)
+            LOG.propagate = propagate
+            handler.close()
+
+    if build_profile:
+        report = build_profile.get_report(ensembl_ref,
+                                          None if error else ensimpl_file)
+        report['meta']['ensimpl_file'] = ensimpl_file
+        report['meta']['error'] = error
+
+    return BuildResult(ensimpl_file, time.time() - start, error, report)
+
+
+def create(ensembl, species, directory, resource, workers=DEFAULT_WORKERS,
+           jobs=1, max_connections=DEFAULT_MAX_CONNECTIONS,
+           dump_directory=None, cache_directory=None, reuse_cache=False,
+           bulk_load=False, profile_report=None, compact=False):
     """Create Ensimpl database(s).  Output database name will be:
 
     "ensembl. ``release`` . ``species`` .db3"
 
+    With more than one job, databases are built in a process pool and each
+    job logs to "ensimpl. ``release`` . ``species`` .log" in `directory`.
+    The jobs and the extraction workers per job are capped so that at most
+    `max_connections` Ensembl connections are open at once.
+
     Args:
         ensembl (list): A ``list`` of all Ensembl releases to create, ``None``
             for all.
         species (list): A ``list`` of all species to create, ``None`` for all.
         directory (str): Output directory.
         resource (str): Configuration file location to parse.
+        workers (int, optional): Maximum concurrent extractions per database.
+        jobs (int, optional): Maximum databases built at once.
+        max_connections (int, optional): Maximum concurrent Ensembl
+            connections across all jobs.
+        dump_directory (str, optional): Read the Ensembl MySQL dump files in
+            this directory, one sub directory per database, instead of
+            connecting to the server.
+        cache_directory (str, optional): Keep the extractions in this
+            directory, see :func:`build`.
+        reuse_cache (bool, optional): Use the cached extractions and resume
+            interrupted builds.
+        bulk_load (bool, optional): Write the databases in bulk load mode,
+            see :func:`ensimpl.create.ensimpl_db.connect`.
+        profile_report (str, optional): Profile each build and write the
+            reports to this JSON file, see :mod:`ensimpl.create.profiling`.
+        compact (bool, optional): Encode the databases compactly, see
+            :func:`ensimpl.create.ensimpl_db.compact_db`.
+
+    Returns:
+        list: A ``list`` of :obj:`BuildResult`.
+
+    Raises:
+        Exception: If the releases cannot be determined or any database
+            failed to build, after all jobs have finished.
     """
     if ensembl:
         LOG.debug('Ensembl Releases: {}'.format(','.join(ensembl)))
@@ -110,66 +561,72 @@ def create(ensembl, species, directory, resource):
             LOG.error(f'Found Ensembl releases: {", ".join(all_releases)}')
             raise Exception('Unable to create databases')
 
+    builds = []
+
     for release_ver, release_val in sorted(releases.items()):
         if ensembl and release_ver not in ensembl:
             continue
 
         for species_id, ensembl_ref in sorted(release_val.items()):
             if not species or (species_id in species):
-                LOG.warning('Generating ensimpl database for Ensembl '
-                            f'release: {release_ver}')
-
                 ensimpl_file = f'ensimpl.{release_ver}.{species_id}.db3'
-
                 ensimpl_file = os.path.join(directory, ensimpl_file)
-                utils.delete_file(ensimpl_file)
-
-                LOG.info(f'Creating: {ensimpl_file}')
-
-                ensimpl_db.initialize(ensimpl_file)
-
-                LOG.info('Extracting chromosomes...')
-                chromosomes_karyotypes = \
-                    ensembl_db.extract_chromosomes_karyotypes(ensembl_ref)
-    
-                LOG.info('Extracting genes...')
-                genes = ensembl_db.extract_ensembl_genes(ensembl_ref)
-    
-                LOG.info('Extracting synonyms...')
-                synonyms = ensembl_db.extract_synonyms(ensembl_ref)
-    
-                LOG.info('Extracting transcript, protein, and exons...')
-                gtep = ensembl_db.extract_ensembl_gtpe(ensembl_ref)
-    
-                LOG.info('Extracting homologs...')
-                homologs = ensembl_db.extract_ensembl_homologs(ensembl_ref)
-
-                LOG.info('Inserting chromsomes...')
-                ensimpl_db.insert_chromosomes_karyotypes(ensimpl_file,
-                                                         ensembl_ref,
-                                                         chromosomes_karyotypes)
-    
-                LOG.info('Inserting genes...')
-                ensimpl_db.insert_genes(ensimpl_file,
-                                        ensembl_ref,
-                                        genes,
-                                        synonyms,
-                                        homologs)
-    
-                LOG.info('Inserting transcript, protein, and exons...')
-                ensimpl_db.insert_gtpe(ensimpl_file,
-                                       ensembl_ref,
-                                       gtep)
-    
-                LOG.info('Inserting homologs...')
-                ensimpl_db.insert_homologs(ensimpl_file,
-                                           ensembl_ref,
-                                           homologs)
-
-                LOG.info('Finalizing...')
-                ensimpl_db.finalize(ensimpl_file,
-                                    ensembl_ref)
+                builds.append((ensembl_ref, ensimpl_file))
 
-    LOG.info('DONE')
+    jobs = max(1, min(jobs, len(builds), max_connections))
+    workers = max(1, min(workers, max_connections // jobs))
 
+    LOG.info(f'Building {len(builds)} database(s) with {jobs} job(s) and '
+             f'{workers} extraction worker(s) per job')
+
+    start = time.time()
+
+    if jobs == 1:
+        results = []
+        for ensembl_ref, ensimpl_file in builds:
+            LOG.warning('Generating ensimpl database for Ensembl '
+                        f'release: {ensembl_ref.release}')
+            results.append(build_job(ensembl_ref, ensimpl_file, workers,
+                                     dump_directory=dump_directory,
+                                     cache_directory=cache_directory,
+                                     reuse_cache=reuse_cache,
+                                     bulk_load=bulk_load,
+                                     profile=bool(profile_report),
+                                     compact=compact))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = []
+            for ensembl_ref, ensimpl_file in builds:
+                log_file = f'{os.path.splitext(ensimpl_file)[0]}.log'
+                LOG.warning(f'Generating {ensimpl_file}, log: {log_file}')
+                futures.append(executor.submit(build_job, ensembl_ref,
+                                               ensimpl_file, workers,
+                                               log_file, LOG.level,
+                                               dump_directory,
+                                               cache_directory, reuse_cache,
+                                               bulk_load,
+                                               bool(profile_report),
+                                               compact))
+            results = [future.result() for future in futures]
+
+    failed = [result for result in results if result.error]
+
+    if profile_report:
+        profiling.write(profile_report, [result.profile for result in results])
+        LOG.warning(f'Profile report written to: {profile_report}')
+
+    LOG.warning(f'Built {len(results) - len(failed)} of {len(results)} '
+                f'database(s) in {utils.format_time(start, time.time())}')
+
+    for result in results:
+        status = f'FAILED ({result.error})' if result.error else 'OK'
+        LOG.warning(f'  {os.path.basename(result.ensimpl_file)}: {status} '
+                    f'in {utils.format_time(0, result.seconds)}')
+
+    if failed:
+        raise Exception('Unable to create databases: ' + ', '.join(
+            os.path.basename(result.ensimpl_file) for result in failed))
+
+    LOG.info('DONE')
 
+    return results
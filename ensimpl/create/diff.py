@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""Precompute the changes between two releases of an ensimpl database.
+
+The genes and transcripts of both databases are read in Ensembl ID order
+and merged, so neither release has to be held in memory.  Each difference
+becomes one row of a small SQLite file named
+"ensimpl. ``from`` . ``to`` . ``species`` .diff", next to the databases,
+which is served by :mod:`ensimpl.fetch.diff`.
+"""
+from collections import Counter
+from collections import OrderedDict
+
+import itertools
+import os
+import sqlite3
+import time
+
+import ensimpl.db_config as db_config
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+BATCH_SIZE = 10000
+
+CHANGES = ['added', 'removed', 'version', 'moved', 'renamed']
+'''The kinds of change, in the order they are listed for one identifier.'''
+
+TYPES = OrderedDict([('EG', 'gene'), ('ET', 'transcript')])
+'''The ``ensembl_gtpe`` type keys that are compared.'''
+
+SQL_SELECT_GENES = '''
+SELECT ensembl_id, ensembl_version, symbol, chromosome,
+       start_position, end_position, ensembl_id
+  FROM ensembl_genes
+ ORDER BY ensembl_id
+'''
+
+SQL_SELECT_TRANSCRIPTS = '''
+SELECT ensembl_id, ensembl_id_version, ensembl_symbol, seqid,
+       start, end, gene_id
+  FROM ensembl_gtpe
+ WHERE type_key = 'ET'
+ ORDER BY ensembl_id
+'''
+
+SQL_CREATE_TABLES = ['''
+    CREATE TABLE meta_info (
+        meta_key TEXT NOT NULL,
+        meta_value TEXT
+    )
+''', '''
+    CREATE TABLE changes (
+        change_key INTEGER,
+        ensembl_id TEXT NOT NULL,
+        type_key TEXT NOT NULL,
+        gene_id TEXT NOT NULL,
+        change TEXT NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        PRIMARY KEY (change_key)
+    )
+''']
+
+SQL_INDICES = [
+    'CREATE INDEX idx_changes_change ON changes (change, type_key)',
+    'CREATE INDEX idx_changes_type_key ON changes (type_key)',
+    'CREATE INDEX idx_changes_ensembl_id ON changes (ensembl_id)',
+]
+
+
+def get_diff_file(directory, release_from, release_to, species):
+    """Get the name of the diff file.
+
+    Args:
+        directory (str): The directory.
+        release_from (str): The older Ensembl release.
+        release_to (str): The newer Ensembl release.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        str: Such as ``ensimpl.96.102.Mm.diff``.
+    """
+    return os.path.join(directory,
+                        f'ensimpl.{release_from}.{release_to}.{species}.diff')
+
+
+def merge(old_rows, new_rows):
+    """Merge two iterables of rows ordered by their first element.
+
+    Args:
+        old_rows (iterable): The rows of the older release.
+        new_rows (iterable): The rows of the newer release.
+
+    Yields:
+        tuple: The old and new row with the same key, either is ``None`` when
+            the key is only in the other release.
+    """
+    old_rows = iter(old_rows)
+    new_rows = iter(new_rows)
+    old = next(old_rows, None)
+    new = next(new_rows, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield old, None
+            old = next(old_rows, None)
+        elif old is None or new[0] < old[0]:
+            yield None, new
+            new = next(new_rows, None)
+        else:
+            yield old, new
+            old = next(old_rows, None)
+            new = next(new_rows, None)
+
+
+def _location(row):
+    """Format the location of a selected row, 'chromosome:start-end'."""
+    return f'{row[3]}:{row[4]}-{row[5]}'
+
+
+def get_changes(type_key, old, new):
+    """Compare one identifier between releases.
+
+    Args:
+        type_key (str): A key of :data:`TYPES`.
+        old (tuple): The row in the older release or ``None``.
+        new (tuple): The row in the newer release or ``None``.
+
+    Returns:
+        list: A ``list`` of (ensembl_id, type_key, gene_id, change, old_value,
+            new_value), one per kind of change in :data:`CHANGES`.
+    """
+    if old is None:
+        return [(new[0], type_key, new[6], 'added', None, _location(new))]
+
+    if new is None:
+        return [(old[0], type_key, old[6], 'removed', _location(old), None)]
+
+    changes = []
+
+    if str(old[1]) != str(new[1]):
+        changes.append((new[0], type_key, new[6], 'version',
+                        str(old[1]), str(new[1])))
+
+    if old[3:6] != new[3:6]:
+        changes.append((new[0], type_key, new[6], 'moved',
+                        _location(old), _location(new)))
+
+    if old[2] != new[2]:
+        changes.append((new[0], type_key, new[6], 'renamed', old[2], new[2]))
+
+    return changes
+
+
+def create(from_file, to_file, diff_file, release_from, release_to, species):
+    """Create the diff file of two ensimpl databases.
+
+    The file is written under a temporary name and renamed when complete.
+
+    Args:
+        from_file (str): The database of the older release.
+        to_file (str): The database of the newer release.
+        diff_file (str): The diff file to create.
+        release_from (str): The older Ensembl release.
+        release_to (str): The newer Ensembl release.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        collections.Counter: The number of changes by (type_key, change).
+    """
+    LOG.info(f'Comparing {from_file} to {to_file}')
+
+    start = time.time()
+    tmp_file = f'{diff_file}.tmp'
+    utils.delete_file(tmp_file)
+
+    conn = sqlite3.connect(tmp_file)
+    counts = Counter()
+
+    try:
+        for sql in SQL_CREATE_TABLES:
+            conn.execute(sql)
+
+        sql_insert = ('INSERT INTO changes '
+                      'VALUES (null, ?, ?, ?, ?, ?, ?)')
+
+        for type_key, sql in [('EG', SQL_SELECT_GENES),
+                              ('ET', SQL_SELECT_TRANSCRIPTS)]:
+            LOG.info(f'Comparing {TYPES[type_key]}s...')
+
+            old_conn = sqlite3.connect(from_file)
+            new_conn = sqlite3.connect(to_file)
+
+            changes = (change
+                       for old, new in merge(old_conn.execute(sql),
+                                             new_conn.execute(sql))
+                       for change in get_changes(type_key, old, new))
+
+            while True:
+                batch = list(itertools.islice(changes, BATCH_SIZE))
+
+                if not batch:
+                    break
+
+                conn.executemany(sql_insert, batch)
+                counts.update((c[1], c[3]) for c in batch)
+
+            old_conn.close()
+            new_conn.close()
+
+        meta = [('release_from', str(release_from)),
+                ('release_to', str(release_to)),
+                ('species', species)]
+        meta.extend((f'{type_key}:{change}', str(count))
+                    for (type_key, change), count in sorted(counts.items()))
+
+        conn.executemany('INSERT INTO meta_info VALUES (?, ?)', meta)
+
+        for sql in SQL_INDICES:
+            conn.execute(sql)
+
+        conn.commit()
+        conn.close()
+    except BaseException:
+        conn.close()
+        utils.delete_file(tmp_file)
+        raise
+
+    os.replace(tmp_file, diff_file)
+
+    for (type_key, change), count in sorted(counts.items()):
+        LOG.info(f'{TYPES[type_key]}s {change}: {count:,}')
+
+    LOG.info(f'Diff created in: {utils.format_time(start, time.time())}')
+
+    return counts
+
+
+def create_release_diff(release_from, release_to, species='Mm'):
+    """Create the diff file of two releases in the configured database
+    directory, see :mod:`ensimpl.db_config`.
+
+    Args:
+        release_from (str): The older Ensembl release.
+        release_to (str): The newer Ensembl release.
+        species (str, optional): The Ensembl species identifier.
+
+    Returns:
+        str: The diff file.
+
+    Raises:
+        ValueError: If either database cannot be found or is served from a
+            store.
+    """
+    from_db = db_config.get_ensimpl_db(release_from, species)
+    to_db = db_config.get_ensimpl_db(release_to, species)
+
+    if from_db.get('store') or to_db.get('store'):
+        raise ValueError('Diffs are created from database files, not from '
+                         'a store')
+
+    from_file = from_db['db']
+    to_file = to_db['db']
+
+    diff_file = get_diff_file(os.path.dirname(to_file), release_from,
+                              release_to, species)
+
+    create(from_file, to_file, diff_file, release_from, release_to, species)
+
+    return diff_file
@@ -2,12 +2,16 @@
 """This module is specific to Ensembl db operations.
 """
 import pymysql
+import pymysql.cursors
 
 import ensimpl.utils as utils
 
 
 LOG = utils.get_logger()
 
+FETCH_SIZE = 10000
+'''Number of rows fetched at a time from the unbuffered cursors.'''
+
 SQL_ENSEMBL_65_SELECT_GENE = '''
 SELECT g.gene_id,
        s.name seq_id,
@@ -454,13 +458,42 @@ def _get_sql_select_gene_homologs(release):
         return SQL_ENSEMBL_COMPARA_86_SELECT_HOMOLOGS
 
 
-def connect_to_database(ref, db=None):
+def get_sql(ref, name):
+    """Get the SQL statement of an extraction.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        name (str): 'chromosomes', 'synonyms', 'genes', 'gtpe' or 'homologs'.
+
+    Returns:
+        str: The SQL statement.
+    """
+    if name == 'chromosomes':
+        return SQL_ENSEMBL_SELECT_CHROMOSOME
+    elif name == 'synonyms':
+        return SQL_ENSEMBL_SELECT_SYNONYMS
+    elif name == 'genes':
+        return _get_sql_select_gene(ref.release)
+    elif name == 'gtpe':
+        return _get_sql_select_gtpe(ref.release)
+    elif name == 'homologs':
+        sql = _get_sql_select_gene_homologs(ref.release)
+        if ref.species_id.lower() == 'hs':
+            return sql + SQL_ENSEMBL_COMPARA_SELECT_HOMOLOGS_HS_ORDER_BY
+        return sql + SQL_ENSEMBL_COMPARA_SELECT_HOMOLOGS_MM_ORDER_BY
+
+    raise ValueError(f'Unknown extraction: {name}')
+
+
+def connect_to_database(ref, db=None, cursorclass=pymysql.cursors.DictCursor):
     """Connect to Ensembl database.
 
     Args:
         ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
-        db:
+        db (str, optional): The database, ``None`` for ``ref.db``.
+        cursorclass (class, optional): The ``pymysql`` cursor class.
 
     Returns:
         :class:`pymysql.connections.Connection`: A connection to the database.
@@ -476,7 +509,7 @@ def connect_to_database(ref, db=None):
                                      user=ref.user_id,
                                      password=ref.password,
                                      db=db,
-                                     cursorclass=pymysql.cursors.DictCursor)
+                                     cursorclass=cursorclass)
 
         LOG.debug('Connected')
         return connection
@@ -485,6 +518,40 @@ def connect_to_database(ref, db=None):
         raise e
 
 
+def stream_rows(ref, sql, db=None, fetch_size=FETCH_SIZE):
+    """Execute `sql` with an unbuffered server-side cursor and yield the rows.
+
+    Rows are fetched `fetch_size` at a time so the result set is never held
+    in memory.  The connection is closed when the generator is exhausted or
+    closed.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        sql (str): The SQL statement.
+        db (str, optional): The database, ``None`` for ``ref.db``.
+        fetch_size (int, optional): Rows fetched at a time.
+
+    Yields:
+        dict: Each row.
+    """
+    conn = connect_to_database(ref, db, pymysql.cursors.SSDictCursor)
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+
+                if not rows:
+                    break
+
+                yield from rows
+    finally:
+        conn.close()
+
+
 def extract_chromosomes_karyotypes(ref):
     """Extract the chromosomes and karyotypes from Ensembl.
 
@@ -504,20 +571,10 @@ def extract_chromosomes_karyotypes(ref):
     Returns:
         list: A ``list`` of ``dicts``.
     """
-    chromosomes = []
-
     try:
-        conn = connect_to_database(ref)
-
         LOG.debug('Extracting chromosomes and karyotypes...')
-        with conn.cursor() as cursor:
-            num_rows = cursor.execute(SQL_ENSEMBL_SELECT_CHROMOSOME)
-            LOG.debug(f'{num_rows:,} records returned')
-
-            for row in cursor:
-                chromosomes.append(row)
-
-            LOG.debug(f'{num_rows:,} records extracted')
+        chromosomes = list(stream_rows(ref, SQL_ENSEMBL_SELECT_CHROMOSOME))
+        LOG.debug(f'{len(chromosomes):,} records extracted')
     except pymysql.Error as e:
         LOG.error(f'Unable to extract chromosomes from Ensembl: {e}')
         return None
@@ -525,6 +582,31 @@ def extract_chromosomes_karyotypes(ref):
     return chromosomes
 
 
+def group_synonyms(rows):
+    """Group synonym rows by xref_id.
+
+    Args:
+        rows (iterable): Rows of :data:`SQL_ENSEMBL_SELECT_SYNONYMS`.
+
+    Returns:
+        dict: The keys are the xref_id and the values are a ``list`` of
+            synonyms.
+    """
+    synonyms = {}
+    count = 0
+
+    for row in rows:
+        synonyms.setdefault(row['xref_id'], []).append(row['synonym'])
+
+        if count and count % 100000 == 0:
+            LOG.debug(f'{count:,} synonyms extracted')
+        count += 1
+
+    LOG.debug(f'{count:,} synonyms extracted')
+
+    return synonyms
+
+
 def extract_synonyms(ref):
     """Extract the synonyms from Ensembl.
 
@@ -536,37 +618,61 @@ def extract_synonyms(ref):
         dict: The keys are the xref_id and the values are a ``list`` of
             synonyms.
     """
-    synonyms = {}
-
     try:
-        conn = connect_to_database(ref)
-
         LOG.debug('Extracting synonyms...')
-        with conn.cursor() as cursor:
-            count = 0
-            num_rows = cursor.execute(SQL_ENSEMBL_SELECT_SYNONYMS)
-            LOG.debug(f'{num_rows:,} records returned')
+        return group_synonyms(stream_rows(ref, SQL_ENSEMBL_SELECT_SYNONYMS))
+    except pymysql.Error as e:
+        LOG.error(f'Unable to extract synonyms from Ensembl: {e}')
+        return None
+
+
+def iter_ensembl_genes(ref):
+    """Stream the gene information from Ensembl, ordered by Ensembl ID.
 
-            for row in cursor:
-                xref = synonyms.get(row['xref_id'], None)
+    The rows of a gene (one per external id) are consecutive, so only one
+    gene is held in memory at a time.  See :func:`extract_ensembl_genes` for
+    the keys of each gene.
 
-                if not xref:
-                    xref = []
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+
+    Yields:
+        dict: Gene information.
 
-                xref.append(row['synonym'])
+    Raises:
+        pymysql.Error: If the genes cannot be extracted.
+    """
+    gene_items = ['ensembl_id', 'ensembl_id_version', 'seq_id',
+                  'seq_region_start', 'seq_region_end', 'seq_region_strand',
+                  'symbol', 'description']
+    gene = None
+    count = 0
 
-                synonyms[row['xref_id']] = xref
+    LOG.debug('Extracting genes...')
 
-                if count and count % 10000 == 0:
-                    LOG.debug(f'{count:,} synonyms extracted')
+    for row in stream_rows(ref, _get_sql_select_gene(ref.release)):
+        if gene is None or gene['ensembl_id'] != row['ensembl_id']:
+            if gene is not None:
+                yield gene
                 count += 1
 
-            LOG.debug(f'{count:,} synonyms extracted')
-    except pymysql.Error as e:
-        LOG.error(f'Unable to extract synonyms from Ensembl: {e}')
-        return None
+                if count % 10000 == 0:
+                    LOG.debug(f'{count:,} genes extracted')
 
-    return synonyms
+            gene = {'ids': []}
+            for i in gene_items:
+                gene[i] = row[i]
+
+        gene['ids'].append({'xref_id': row['xref_id'],
+                            'external_id': row['external_id'],
+                            'db_name': row['db_name']})
+
+    if gene is not None:
+        yield gene
+        count += 1
+
+    LOG.debug(f'{count:,} genes extracted')
 
 
 def extract_ensembl_genes(ref):
@@ -594,43 +700,40 @@ def extract_ensembl_genes(ref):
     Returns:
         dict: Gene information with the Ensembl ID being the key.
     """
-    gene_items = ['ensembl_id', 'ensembl_id_version', 'seq_id',
-                  'seq_region_start', 'seq_region_end', 'seq_region_strand',
-                  'symbol', 'description']
-    genes = {}
-
     try:
-        conn = connect_to_database(ref)
-        sql = _get_sql_select_gene(ref.release)
+        return {gene['ensembl_id']: gene for gene in iter_ensembl_genes(ref)}
+    except pymysql.Error as e:
+        LOG.error(f'Unable to extract genes from Ensembl: {e}')
+        return None
 
-        LOG.debug('Extracting genes...')
-        with conn.cursor() as cursor:
-            num_rows = cursor.execute(sql)
-            LOG.debug(f'{num_rows:,} records returned')
 
-            for row in cursor:
-                gene = genes.get(row['ensembl_id'], None)
+def iter_ensembl_gtpe(ref):
+    """Stream the gene, transcript, protein, exon information from Ensembl.
 
-                if not gene:
-                    gene = {'ids': []}
-                    for i in gene_items:
-                        gene[i] = row[i]
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+
+    Yields:
+        dict: The gene, transcript, protein, exon information.  Look at
+           :data:`SQL_ENSEMBL_65_SELECT_GTPE` and
+           :data:`SQL_ENSEMBL_48_SELECT_GTPE` for the information extracted.
 
-                gene['ids'].append({'xref_id': row['xref_id'],
-                                    'external_id': row['external_id'],
-                                    'db_name': row['db_name']})
+    Raises:
+        pymysql.Error: If the information cannot be extracted.
+    """
+    count = 0
 
-                genes[row['ensembl_id']] = gene
+    LOG.debug('Extracting transcript, protein, exon information ...')
 
-                if len(genes) and len(genes) % 10000 == 0:
-                    LOG.debug(f'{len(genes):,} genes extracted')
+    for row in stream_rows(ref, _get_sql_select_gtpe(ref.release)):
+        yield row
+        count += 1
 
-            LOG.debug(f'{len(genes):,} genes extracted')
-    except pymysql.Error as e:
-        LOG.error(f'Unable to extract genes from Ensembl: {e}')
-        return None
+        if count % 100000 == 0:
+            LOG.debug(f'{count:,} records extracted')
 
-    return genes
+    LOG.debug(f'{count:,} records extracted')
 
 
 def extract_ensembl_gtpe(ref):
@@ -645,34 +748,54 @@ def extract_ensembl_gtpe(ref):
            Look at :data:`SQL_ENSEMBL_65_SELECT_GTPE` and
            :data:`SQL_ENSEMBL_48_SELECT_GTPE` for the information extracted.
     """
-    gtep = []
-    genes = {}
-
     try:
-        conn = connect_to_database(ref)
-        sql = _get_sql_select_gtpe(ref.release)
-
-        LOG.debug('Extracting transcript, protein, exon information ...')
-        with conn.cursor() as cursor:
-            count = 0
-            num_rows = cursor.execute(sql)
-            LOG.debug(f'{num_rows:,} records returned')
-
-            for row in cursor:
-                gtep.append(row)
-                genes[row['gene_id']] = 1
-
-                if len(gtep) and len(gtep) % 100000 == 0:
-                    LOG.debug(f'{len(gtep):,} records extracted')
-                count += 1
-
-            LOG.debug(f'{len(gtep):,} records extracted')
+        return list(iter_ensembl_gtpe(ref))
     except pymysql.Error as e:
         LOG.error('Unable to extract transcript, protein, exon from '
                   f'Ensembl: {e}')
         return None
 
-    return gtep
+
+def _get_homolog_id_field(ref):
+    """Get the field holding the Ensembl ID of the `ref` species.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+
+    Returns:
+        str: 'hs_id' or 'mm_id'.
+    """
+    return 'hs_id' if ref.species_id.lower() == 'hs' else 'mm_id'
+
+
+def iter_ensembl_homologs(ref):
+    """Stream the homologs from Ensembl, ordered by the Ensembl ID of the
+    `ref` species.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+
+    Yields:
+        dict: Each homolog.
+
+    Raises:
+        pymysql.Error: If the homologs cannot be extracted.
+    """
+    sql = get_sql(ref, 'homologs')
+    count = 0
+
+    LOG.debug('Extracting homologs ...')
+
+    for row in stream_rows(ref, sql, ref.compara_db):
+        yield row
+        count += 1
+
+        if count % 10000 == 0:
+            LOG.debug(f'{count:,} homologs extracted')
+
+    LOG.debug(f'{count:,} homologs extracted')
 
 
 def extract_ensembl_homologs(ref):
@@ -686,41 +809,13 @@ def extract_ensembl_homologs(ref):
         dict: A ``dict`` of genes and there homologs.
     """
     homologs = {}
+    e_id = _get_homolog_id_field(ref)
 
     try:
-        conn = connect_to_database(ref, ref.compara_db)
-        sql = _get_sql_select_gene_homologs(ref.release)
-
-        if ref.species_id.lower() == 'hs':
-            e_id = 'hs_id'
-            sql += SQL_ENSEMBL_COMPARA_SELECT_HOMOLOGS_HS_ORDER_BY
-        else:
-            e_id = 'mm_id'
-            sql += SQL_ENSEMBL_COMPARA_SELECT_HOMOLOGS_MM_ORDER_BY
-
-        LOG.debug('Extracting homologs ...')
-        with conn.cursor() as cursor:
-            count = 0
-            num_rows = cursor.execute(sql)
-            LOG.debug(f'{num_rows:,} records returned')
-
-            for row in cursor:
-                if row[e_id] not in homologs:
-                    homologs[row[e_id]] = [row]
-                else:
-                    homologs[row[e_id]].append(row)
-
-                if count and count % 10000 == 0:
-                    LOG.debug(f'{count:,} homologs extracted')
-                count += 1
-
-            LOG.debug(f'{count:,} homologs extracted')
-
+        for row in iter_ensembl_homologs(ref):
+            homologs.setdefault(row[e_id], []).append(row)
     except pymysql.Error as e:
         LOG.error(f'Unable to extract homologs from Ensembl: {e}')
         return None
 
     return homologs
-
-
-
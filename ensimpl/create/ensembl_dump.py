@@ -0,0 +1,679 @@
+# -*- coding: utf-8 -*-
+"""This module reads Ensembl MySQL dump files instead of a live server.
+
+Ensembl publishes every database as a directory holding the schema,
+``<database>.sql.gz``, and one tab separated ``<table>.txt.gz`` per table.
+With `dump_directory` holding those directories (named ``ref.db`` and
+``ref.compara_db``) the functions here stream the needed tables, join them in
+Python with hash maps and yield the same rows, in the same order, as their
+:mod:`ensimpl.create.ensembl_db` counterparts, except for the homologs, which
+are not sorted.
+
+Only the rows that can take part in a join are kept in memory, for example
+the ``xref`` table is filtered down to the cross references of the genes and
+``homology`` to the human/mouse orthologues.
+"""
+from collections import OrderedDict
+
+import glob
+import io
+import os
+import re
+
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+CHROMOSOMES = ('1', '2', '3', '4', '5', '6', '7', '8', '9', '10',
+               '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
+               '21', '22', 'X', 'Y', 'MT')
+'''The sequence regions extracted, as in the ``ensembl_db`` SQL.'''
+
+TAXON_HS = 9606
+TAXON_MM = 10090
+
+NULL = '\\N'
+
+ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+REGEX_CREATE_TABLE = re.compile(r'CREATE TABLE `(\w+)` \((.*?)\n\)', re.S)
+REGEX_COLUMN = re.compile(r'^\s*`(\w+)`\s+(\w+)', re.M)
+
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'integer',
+                 'bigint')
+REAL_TYPES = ('float', 'double', 'decimal', 'real')
+
+
+def get_directory(ref, dump_directory, compara=False):
+    """Get the dump directory of the core or compara database of `ref`.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+        compara (bool, optional): ``True`` for the compara database.
+
+    Returns:
+        str: The directory.
+    """
+    return os.path.join(dump_directory, ref.compara_db if compara else ref.db)
+
+
+def read_schema(directory):
+    """Read the column names and types of every table from the schema file.
+
+    Args:
+        directory (str): A database dump directory.
+
+    Returns:
+        dict: Table name to an ``OrderedDict`` of column name to converter
+            (``int``, ``float`` or ``str``).
+
+    Raises:
+        ValueError: If there is no schema file.
+    """
+    schema_files = sorted(glob.glob(os.path.join(directory, '*.sql*')))
+
+    if not schema_files:
+        raise ValueError(f'No schema (.sql.gz) file in {directory}')
+
+    with utils.open_resource(schema_files[0], 'rb') as fd:
+        sql = fd.read().decode('utf-8', 'replace')
+
+    schema = {}
+
+    for table, body in REGEX_CREATE_TABLE.findall(sql):
+        columns = OrderedDict()
+
+        for name, column_type in REGEX_COLUMN.findall(body):
+            column_type = column_type.lower()
+
+            if column_type in INTEGER_TYPES:
+                columns[name] = int
+            elif column_type in REAL_TYPES:
+                columns[name] = float
+            else:
+                columns[name] = str
+
+        schema[table] = columns
+
+    return schema
+
+
+def _split(line):
+    """Split a line that contains escapes into its fields.
+
+    Args:
+        line (str): The line, without the line terminator.
+
+    Returns:
+        list: The fields, ``None`` for NULL.
+    """
+    fields = []
+    field = []
+    null = False
+    chars = iter(line)
+
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            if escaped == 'N' and not field:
+                null = True
+            else:
+                field.append(ESCAPES.get(escaped, escaped))
+        elif char == '\t':
+            fields.append(None if null else ''.join(field))
+            field = []
+            null = False
+        else:
+            field.append(char)
+
+    fields.append(None if null else ''.join(field))
+
+    return fields
+
+
+def read_rows(file_name):
+    """Read the rows of a ``mysqldump --tab`` file.
+
+    Args:
+        file_name (str): The ``.txt`` or ``.txt.gz`` file.
+
+    Yields:
+        list: The fields of each row as strings, ``None`` for NULL.
+    """
+    with utils.open_resource(file_name, 'rb') as raw:
+        fd = io.TextIOWrapper(raw, encoding='utf-8', errors='replace',
+                              newline='\n')
+        pending = ''
+
+        for line in fd:
+            line = pending + line[:-1] if line.endswith('\n') else \
+                pending + line
+            pending = ''
+
+            if '\\' not in line:
+                yield line.split('\t')
+                continue
+
+            # an escaped line terminator means the field holds a new line
+            trailing = len(line) - len(line.rstrip('\\'))
+            if trailing % 2 == 1:
+                pending = line + '\n'
+                continue
+
+            yield _split(line)
+
+        if pending:
+            yield _split(pending)
+
+
+def stream_table(directory, schema, table, columns):
+    """Stream `columns` of `table`, converted to their types.
+
+    Args:
+        directory (str): A database dump directory.
+        schema (dict): The schema from :func:`read_schema`.
+        table (str): The table name.
+        columns (list): The column names.
+
+    Yields:
+        tuple: The values of `columns` for each row.
+
+    Raises:
+        ValueError: If the table file cannot be found.
+    """
+    file_name = None
+
+    for extension in ('.txt.gz', '.txt'):
+        candidate = os.path.join(directory, f'{table}{extension}')
+        if os.path.exists(candidate):
+            file_name = candidate
+            break
+
+    if not file_name:
+        raise ValueError(f'Unable to find {table}.txt.gz in {directory}')
+
+    table_columns = list(schema[table])
+    indices = [table_columns.index(column) for column in columns]
+    converters = [schema[table][column] for column in columns]
+    pairs = list(zip(indices, converters))
+
+    LOG.debug(f'Reading {file_name}...')
+
+    for fields in read_rows(file_name):
+        yield tuple(None if fields[i] is None else convert(fields[i])
+                    for i, convert in pairs)
+
+
+def _load_stable_ids(directory, schema, table, key):
+    """Get the stable id and version of the rows of `table`, which are in the
+    table itself since Ensembl 65 and in ``<table>_stable_id`` before.
+
+    Args:
+        directory (str): A database dump directory.
+        schema (dict): The schema from :func:`read_schema`.
+        table (str): 'gene', 'transcript', 'translation' or 'exon'.
+        key (str): The primary key column.
+
+    Returns:
+        dict: `key` value to (stable id, version).
+    """
+    if 'stable_id' not in schema[table]:
+        table = f'{table}_stable_id'
+
+    return {row[0]: row[1:] for row in
+            stream_table(directory, schema, table,
+                         [key, 'stable_id', 'version'])}
+
+
+def _load_seq_regions(directory, schema):
+    """Get the chromosome sequence regions.
+
+    Args:
+        directory (str): A database dump directory.
+        schema (dict): The schema from :func:`read_schema`.
+
+    Returns:
+        dict: seq_region_id to name, for names in :data:`CHROMOSOMES`.
+    """
+    return {row[0]: row[1] for row in
+            stream_table(directory, schema, 'seq_region',
+                         ['seq_region_id', 'name'])
+            if row[1] in CHROMOSOMES}
+
+
+def _load_xrefs(directory, schema, xref_ids):
+    """Get the cross references in `xref_ids` with a known external database.
+
+    Args:
+        directory (str): A database dump directory.
+        schema (dict): The schema from :func:`read_schema`.
+        xref_ids (set): The xref ids to keep.
+
+    Returns:
+        dict: xref_id to (dbprimary_acc, display_label, version, description,
+            db_name, db_display_name).
+    """
+    external_dbs = {row[0]: row[1:] for row in
+                    stream_table(directory, schema, 'external_db',
+                                 ['external_db_id', 'db_name',
+                                  'db_display_name'])}
+    xrefs = {}
+
+    for row in stream_table(directory, schema, 'xref',
+                            ['xref_id', 'external_db_id', 'dbprimary_acc',
+                             'display_label', 'version', 'description']):
+        if row[0] in xref_ids and row[1] in external_dbs:
+            xrefs[row[0]] = row[2:] + external_dbs[row[1]]
+
+    return xrefs
+
+
+def iter_chromosomes_karyotypes(ref, dump_directory):
+    """Stream the chromosomes and karyotypes, see
+    :func:`ensimpl.create.ensembl_db.extract_chromosomes_karyotypes`.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+
+    Yields:
+        dict: Each chromosome and karyotype band.
+    """
+    directory = get_directory(ref, dump_directory)
+    schema = read_schema(directory)
+
+    top_level = {row[0] for row in
+                 stream_table(directory, schema, 'coord_system',
+                              ['coord_system_id', 'rank'])
+                 if row[1] == 1}
+
+    regions = {}
+
+    for row in stream_table(directory, schema, 'seq_region',
+                            ['seq_region_id', 'name', 'coord_system_id',
+                             'length']):
+        if row[1] in CHROMOSOMES and row[2] in top_level:
+            regions[row[0]] = (row[1], row[3])
+
+    bands = {}
+
+    for row in stream_table(directory, schema, 'karyotype',
+                            ['seq_region_id', 'seq_region_start',
+                             'seq_region_end', 'band', 'stain']):
+        if row[0] in regions:
+            bands.setdefault(row[0], set()).add(row[1:])
+
+    def order(name):
+        return int({'X': '50', 'Y': '51', 'MT': '52'}.get(name, name))
+
+    rows = []
+
+    for seq_region_id, (name, length) in regions.items():
+        for band in bands.get(seq_region_id, {(None, None, None, None)}):
+            rows.append({'name': name,
+                         'length': length,
+                         'seq_region_start': band[0],
+                         'seq_region_end': band[1],
+                         'band': band[2],
+                         'stain': band[3]})
+
+    rows.sort(key=lambda r: (order(r['name']),
+                             r['seq_region_start'] is not None,
+                             r['seq_region_start'] or 0))
+
+    yield from rows
+
+
+def iter_synonyms(ref, dump_directory):
+    """Stream the synonyms, see
+    :func:`ensimpl.create.ensembl_db.extract_synonyms`.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+
+    Yields:
+        dict: Each synonym with the keys ``xref_id`` and ``synonym``.
+    """
+    directory = get_directory(ref, dump_directory)
+    schema = read_schema(directory)
+
+    for xref_id, synonym in stream_table(directory, schema,
+                                         'external_synonym',
+                                         ['xref_id', 'synonym']):
+        yield {'xref_id': xref_id, 'synonym': synonym}
+
+
+def iter_ensembl_genes(ref, dump_directory):
+    """Stream the genes ordered by Ensembl ID, see
+    :func:`ensimpl.create.ensembl_db.iter_ensembl_genes`.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+
+    Yields:
+        dict: Gene information.
+    """
+    directory = get_directory(ref, dump_directory)
+    schema = read_schema(directory)
+
+    LOG.debug('Extracting genes...')
+
+    regions = _load_seq_regions(directory, schema)
+    stable_ids = _load_stable_ids(directory, schema, 'gene', 'gene_id')
+
+    genes = {}
+
+    for row in stream_table(directory, schema, 'gene',
+                            ['gene_id', 'seq_region_id', 'seq_region_start',
+                             'seq_region_end', 'seq_region_strand',
+                             'display_xref_id']):
+        if row[1] in regions and row[0] in stable_ids:
+            genes[row[0]] = row
+
+    # like the SQL, object_xref is joined on ensembl_id only
+    object_xrefs = {}
+
+    for ensembl_id, xref_id in stream_table(directory, schema, 'object_xref',
+                                            ['ensembl_id', 'xref_id']):
+        if ensembl_id in genes:
+            object_xrefs.setdefault(ensembl_id, []).append(xref_id)
+
+    xref_ids = {gene[5] for gene in genes.values()}
+    xref_ids.update(x for ids in object_xrefs.values() for x in ids)
+    xrefs = _load_xrefs(directory, schema, xref_ids)
+
+    ordered = sorted(genes, key=lambda gene_id: stable_ids[gene_id][0])
+    count = 0
+
+    for gene_id in ordered:
+        _, seq_region_id, start, end, strand, display_xref_id = genes[gene_id]
+        display = xrefs.get(display_xref_id)
+
+        if display is None:
+            continue
+
+        ids = [{'xref_id': xref_id,
+                'external_id': xrefs[xref_id][0],
+                'db_name': xrefs[xref_id][4]}
+               for xref_id in object_xrefs.get(gene_id, [])
+               if xref_id in xrefs]
+
+        if not ids:
+            continue
+
+        yield {'ids': ids,
+               'ensembl_id': stable_ids[gene_id][0],
+               'ensembl_id_version': stable_ids[gene_id][1],
+               'seq_id': regions[seq_region_id],
+               'seq_region_start': start,
+               'seq_region_end': end,
+               'seq_region_strand': strand,
+               'symbol': display[1],
+               'description': display[3]}
+
+        count += 1
+
+    LOG.debug(f'{count:,} genes extracted')
+
+
+def iter_ensembl_gtpe(ref, dump_directory):
+    """Stream the gene, transcript, protein, exon information, see
+    :func:`ensimpl.create.ensembl_db.iter_ensembl_gtpe`.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+
+    Yields:
+        dict: The gene, transcript, protein, exon information ordered by
+            gene, transcript and exon rank.
+    """
+    directory = get_directory(ref, dump_directory)
+    schema = read_schema(directory)
+
+    LOG.debug('Extracting transcript, protein, exon information ...')
+
+    regions = _load_seq_regions(directory, schema)
+    gene_ids = _load_stable_ids(directory, schema, 'gene', 'gene_id')
+
+    genes = {}
+
+    for row in stream_table(directory, schema, 'gene',
+                            ['gene_id', 'seq_region_id', 'seq_region_start',
+                             'seq_region_end', 'seq_region_strand',
+                             'display_xref_id']):
+        if row[1] in regions and row[0] in gene_ids:
+            genes[row[0]] = row
+
+    transcript_ids = _load_stable_ids(directory, schema, 'transcript',
+                                      'transcript_id')
+    transcripts = {}
+
+    for row in stream_table(directory, schema, 'transcript',
+                            ['transcript_id', 'gene_id', 'seq_region_start',
+                             'seq_region_end', 'display_xref_id']):
+        if row[1] in genes and row[0] in transcript_ids:
+            transcripts[row[0]] = row
+
+    xref_ids = {gene[5] for gene in genes.values()}
+    xref_ids.update(t[4] for t in transcripts.values())
+    xrefs = _load_xrefs(directory, schema, xref_ids)
+
+    translation_ids = _load_stable_ids(directory, schema, 'translation',
+                                       'translation_id')
+    proteins = {}
+
+    for translation_id, transcript_id in stream_table(
+            directory, schema, 'translation',
+            ['translation_id', 'transcript_id']):
+        if transcript_id in transcripts:
+            proteins[transcript_id] = translation_ids.get(translation_id,
+                                                          (None, None))
+
+    exons_transcripts = {}
+    exon_ids = set()
+
+    for exon_id, transcript_id, rank in stream_table(
+            directory, schema, 'exon_transcript',
+            ['exon_id', 'transcript_id', 'rank']):
+        if transcript_id in transcripts:
+            exons_transcripts.setdefault(transcript_id, []).append(
+                (rank, exon_id))
+            exon_ids.add(exon_id)
+
+    exon_stable_ids = _load_stable_ids(directory, schema, 'exon', 'exon_id')
+    exons = {}
+
+    for exon_id, start, end in stream_table(
+            directory, schema, 'exon',
+            ['exon_id', 'seq_region_start', 'seq_region_end']):
+        if exon_id in exon_ids and exon_id in exon_stable_ids:
+            exons[exon_id] = exon_stable_ids[exon_id] + (start, end)
+
+    del exon_stable_ids, exon_ids
+
+    def order(transcript_id):
+        return (gene_ids[transcripts[transcript_id][1]][0],
+                transcript_ids[transcript_id][0])
+
+    count = 0
+
+    for transcript_id in sorted(transcripts, key=order):
+        _, gene_id, t_start, t_end, t_xref_id = transcripts[transcript_id]
+        _, seq_region_id, g_start, g_end, g_strand, g_xref_id = genes[gene_id]
+
+        if g_xref_id not in xrefs or t_xref_id not in xrefs:
+            continue
+
+        protein_id, protein_version = proteins.get(transcript_id,
+                                                   (None, None))
+
+        for rank, exon_id in sorted(exons_transcripts.get(transcript_id, [])):
+            if exon_id not in exons:
+                continue
+
+            exon = exons[exon_id]
+
+            yield {'gene_id': gene_ids[gene_id][0],
+                   'gene_version': gene_ids[gene_id][1],
+                   'gene_name': xrefs[g_xref_id][1],
+                   'gene_chrom': regions[seq_region_id],
+                   'gene_start': g_start,
+                   'gene_end': g_end,
+                   'gene_strand': g_strand,
+                   'transcript_id': transcript_ids[transcript_id][0],
+                   'transcript_version': transcript_ids[transcript_id][1],
+                   'transcript_name': xrefs[t_xref_id][1],
+                   'transcript_start': t_start,
+                   'transcript_end': t_end,
+                   'protein_id': protein_id,
+                   'protein_version': protein_version,
+                   'exon_id': exon[0],
+                   'exon_version': exon[1],
+                   'exon_start': exon[2],
+                   'exon_end': exon[3],
+                   'exon_number': rank}
+
+            count += 1
+
+    LOG.debug(f'{count:,} records extracted')
+
+
+def _get_orthologue_sets(directory, schema):
+    """Get the method_link_species_set ids of the human/mouse orthologues.
+
+    Args:
+        directory (str): The compara dump directory.
+        schema (dict): The schema from :func:`read_schema`.
+
+    Returns:
+        set: The method_link_species_set ids.
+    """
+    genome_taxa = {row[0]: row[1] for row in
+                   stream_table(directory, schema, 'genome_db',
+                                ['genome_db_id', 'taxon_id'])}
+
+    species_sets = {}
+
+    for species_set_id, genome_db_id in stream_table(
+            directory, schema, 'species_set',
+            ['species_set_id', 'genome_db_id']):
+        species_sets.setdefault(species_set_id, set()).add(
+            genome_taxa.get(genome_db_id))
+
+    both = {species_set_id for species_set_id, taxa in species_sets.items()
+            if TAXON_HS in taxa and TAXON_MM in taxa}
+
+    orthologues = {row[0] for row in
+                   stream_table(directory, schema, 'method_link',
+                                ['method_link_id', 'type'])
+                   if row[1] == 'ENSEMBL_ORTHOLOGUES'}
+
+    return {row[0] for row in
+            stream_table(directory, schema, 'method_link_species_set',
+                         ['method_link_species_set_id', 'method_link_id',
+                          'species_set_id', 'source'])
+            if row[1] in orthologues and row[2] in both
+            and row[3] is not None and row[3] != 'NULL'}
+
+
+def iter_ensembl_homologs(ref, dump_directory):
+    """Stream the human/mouse homologs, see
+    :func:`ensimpl.create.ensembl_db.iter_ensembl_homologs`.
+
+    The homologs are yielded in the order of the ``homology`` dump, not
+    sorted, so they are never all held in memory.  The merge join of
+    :func:`ensimpl.create.ensimpl_db.insert_genes` reads them back sorted.
+
+    Args:
+        ref (:class:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+        dump_directory (str): The directory holding the database dumps.
+
+    Yields:
+        dict: Each homolog.
+    """
+    directory = get_directory(ref, dump_directory, compara=True)
+    schema = read_schema(directory)
+
+    LOG.debug('Extracting homologs ...')
+
+    mlss_ids = _get_orthologue_sets(directory, schema)
+
+    # the goc and wga columns are only used from release 86, as in the SQL
+    scores = int(ref.release) >= 86
+    columns = ['homology_id', 'method_link_species_set_id', 'description',
+               'dn', 'ds']
+    if scores:
+        columns.extend(['goc_score', 'wga_coverage', 'is_high_confidence'])
+
+    homologies = {}
+
+    for row in stream_table(directory, schema, 'homology', columns):
+        if row[1] in mlss_ids:
+            homologies[row[0]] = row[2:] if scores else \
+                row[2:] + (None, None, None)
+
+    member_table = 'gene_member' if 'gene_member' in schema else 'member'
+    member_key = f'{member_table}_id'
+
+    homology_members = {}
+    member_ids = set()
+
+    for row in stream_table(directory, schema, 'homology_member',
+                            ['homology_id', member_key, 'perc_cov',
+                             'perc_id', 'perc_pos']):
+        if row[0] in homologies:
+            homology_members.setdefault(row[0], []).append(row[1:])
+            member_ids.add(row[1])
+
+    members = {}
+
+    for row in stream_table(directory, schema, member_table,
+                            [member_key, 'stable_id', 'version',
+                             'display_label', 'taxon_id']):
+        if row[0] in member_ids and row[4] in (TAXON_HS, TAXON_MM):
+            members[row[0]] = row[1:]
+
+    count = 0
+
+    for homology_id, homology in homologies.items():
+        by_taxon = {TAXON_HS: [], TAXON_MM: []}
+
+        for member_id, perc_cov, perc_id, perc_pos in \
+                homology_members.get(homology_id, []):
+            member = members.get(member_id)
+            if member:
+                by_taxon[member[3]].append(member[:3] +
+                                           (perc_cov, perc_id, perc_pos))
+
+        for mm in by_taxon[TAXON_MM]:
+            for hs in by_taxon[TAXON_HS]:
+                row = {'homology_id': homology_id,
+                       'description': homology[0],
+                       'dn': homology[1],
+                       'ds': homology[2],
+                       'goc_score': homology[3],
+                       'wga_coverage': homology[4],
+                       'is_high_confidence': homology[5]}
+
+                for prefix, member in (('hs', hs), ('mm', mm)):
+                    row[f'{prefix}_id'] = member[0]
+                    row[f'{prefix}_version'] = member[1]
+                    row[f'{prefix}_symbol'] = member[2]
+                    row[f'{prefix}_perc_cov'] = member[3]
+                    row[f'{prefix}_perc_id'] = member[4]
+                    row[f'{prefix}_perc_pos'] = member[5]
+
+                yield row
+                count += 1
+
+    LOG.debug(f'{count:,} homologs extracted')
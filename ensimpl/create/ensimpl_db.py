@@ -1,13 +1,45 @@
 # -*- coding: utf-8 -*-
 """This module is specific to ensimpl db operations.
 """
+import itertools
+import re
 import sqlite3
 import time
 
 import ensimpl.utils as utils
+import ensimpl.create.profiling as profiling
 
 LOG = utils.get_logger()
 
+REGEX_INDEX_TABLE = re.compile(r'\bON\s+(\w+)', re.IGNORECASE)
+
+BATCH_SIZE = 10000
+'''Number of rows inserted per batch.'''
+
+BULK_LOAD_PAGE_SIZE = 16384
+'''Page size of databases created in bulk load mode, in bytes.'''
+
+BULK_LOAD_CACHE_SIZE = 262144
+'''Page cache used in bulk load mode, in KiB.'''
+
+BULK_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode = MEMORY',
+    'PRAGMA synchronous = OFF',
+    f'PRAGMA cache_size = -{BULK_LOAD_CACHE_SIZE}',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA locking_mode = EXCLUSIVE',
+]
+'''Set by :func:`connect` in bulk load mode.'''
+
+DEFAULT_PRAGMAS = [
+    'PRAGMA journal_mode = DELETE',
+    'PRAGMA synchronous = FULL',
+    'PRAGMA cache_size = -2000',
+    'PRAGMA temp_store = DEFAULT',
+    'PRAGMA locking_mode = NORMAL',
+]
+'''Restore the SQLite defaults changed by :data:`BULK_LOAD_PRAGMAS`.'''
+
 
 EXTERNAL_DATABASES = {
     'EntrezGene': {'id': 'ZG', 'display': 'NCBI gene'},
@@ -17,16 +49,97 @@ EXTERNAL_DATABASES = {
 }
 
 
+def connect(db, bulk_load=False):
+    """Open one connection to use for a whole build.
+
+    The functions in this module take either a database file name, and open
+    and close a connection of their own, or a connection, which they commit
+    once per call and leave open.
+
+    In bulk load mode the rollback journal is kept in memory, writes are not
+    synced, the page cache is :data:`BULK_LOAD_CACHE_SIZE` and the database
+    is locked exclusively until :func:`finalize` restores the defaults.  A new
+    database gets pages of :data:`BULK_LOAD_PAGE_SIZE`.  A build that is
+    killed, rather than failing with an error, can leave the file corrupt and
+    has to be started again.
+
+    Args:
+        db (str): Full path to the database file.
+        bulk_load (bool, optional): ``True`` for bulk load mode.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(db)
+
+    if bulk_load:
+        LOG.debug(f'Bulk load mode: {db}')
+
+        # only has an effect before the first table is created
+        conn.execute(f'PRAGMA page_size = {BULK_LOAD_PAGE_SIZE}')
+
+        for sql in BULK_LOAD_PRAGMAS:
+            LOG.debug(sql)
+            conn.execute(sql)
+
+    return conn
+
+
+def end_bulk_load(conn):
+    """Restore the defaults changed by :func:`connect` in bulk load mode.
+
+    Args:
+        conn (sqlite3.Connection): The connection, not in a transaction.
+    """
+    for sql in DEFAULT_PRAGMAS:
+        LOG.debug(sql)
+        conn.execute(sql)
+
+
+def _connect(db):
+    """Get a connection to `db`.
+
+    Args:
+        db: Name of the database file or a :class:`sqlite3.Connection`.
+
+    Returns:
+        tuple: The connection and ``True`` if it was opened here, in which
+            case the caller commits as it goes and closes it.
+    """
+    if isinstance(db, sqlite3.Connection):
+        return db, False
+
+    return sqlite3.connect(db), True
+
+
+def _get_name(db):
+    """Get the file name of `db` for logging.
+
+    Args:
+        db: Name of the database file or a :class:`sqlite3.Connection`.
+
+    Returns:
+        str: The file name.
+    """
+    if isinstance(db, sqlite3.Connection):
+        for row in db.execute('PRAGMA database_list'):
+            if row[1] == 'main':
+                return row[2]
+
+    return db
+
+
 def initialize(db):
     """Initialize the ensimpl database.
 
     Args:
-        db (str): Full path to the database file.
+        db: Full path to the database file or a connection from
+            :func:`connect`.
     """
-    LOG.info('Initializing database: {}'.format(db))
+    LOG.info('Initializing database: {}'.format(_get_name(db)))
 
     start = time.time()
-    conn = sqlite3.connect(db)
+    conn, owned = _connect(db)
     cursor = conn.cursor()
 
     LOG.info('Generating tables...')
@@ -43,17 +156,40 @@ def initialize(db):
 
     cursor.close()
     conn.commit()
-    conn.close()
+
+    if owned:
+        conn.close()
 
     LOG.info('Database initialized in: '
              f'{utils.format_time(start, time.time())}')
 
 
+def clear_tables(db, tables):
+    """Delete all rows from `tables`, so an interrupted insert can be run
+    again.
+
+    Args:
+        db: Full path to the database file or a connection from
+            :func:`connect`.
+        tables (list): The table names.
+    """
+    conn, owned = _connect(db)
+
+    for table in tables:
+        LOG.debug(f'Clearing {table}')
+        conn.execute(f'DELETE FROM {table}')
+
+    conn.commit()
+
+    if owned:
+        conn.close()
+
+
 def insert_chromosomes_karyotypes(db, ref, chromosomes):
     """Insert chromosome and karyotype information into the database.
 
     Args:
-        db (str): Name of the database file.
+        db: Name of the database file or a connection from :func:`connect`.
 
         ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
@@ -62,11 +198,13 @@ def insert_chromosomes_karyotypes(db, ref, chromosomes):
             :func:`ensimpl.create.ensembl_db.extract_chromosomes_karyotypes`
             for more information.
 
+    Returns:
+        int: The number of karyotype bands inserted.
     """
-    LOG.info('Inserting chromosomes into database: {}'.format(db))
+    LOG.info('Inserting chromosomes into database: {}'.format(_get_name(db)))
 
     start = time.time()
-    conn = sqlite3.connect(db)
+    conn, owned = _connect(db)
 
     sql_chromosomes_insert = ('INSERT INTO chromosomes_tmp '
                               'VALUES (?, ?, ?, ?)')
@@ -108,37 +246,136 @@ def insert_chromosomes_karyotypes(db, ref, chromosomes):
 
     cursor.close()
     conn.commit()
-    conn.close()
+
+    if owned:
+        conn.close()
 
     LOG.info('Chromosomes and karyotpes inserted in: '
              f'{utils.format_time(start, time.time())}')
 
+    return len(karyotype_data)
+
+
+def _insert_batches(conn, sql, rows, batch_size=BATCH_SIZE, commit=True):
+    """Insert `rows` with ``executemany`` in batches of `batch_size`.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        sql (str): The INSERT statement.
+        rows (iterable): The rows, consumed lazily.
+        batch_size (int, optional): Rows per batch.
+        commit (bool, optional): ``True`` to commit after each batch.
+
+    Returns:
+        int: The number of rows inserted.
+    """
+    rows = iter(rows)
+    count = 0
+
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+
+        if not batch:
+            break
+
+        LOG.debug(f'Inserting {len(batch):,} rows...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql, batch)
+        cursor.close()
+
+        if commit:
+            conn.commit()
+
+        count += len(batch)
+
+    return count
+
+
+def _get_homolog_fields(ref):
+    """Get the homolog id, version and symbol fields for `ref`.
+
+    Args:
+        ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
+            Contains information about the Ensembl reference.
+
+    Returns:
+        tuple: The id, version and symbol field names of the other species.
+    """
+    if ref.species_id.lower() == 'hs':
+        return 'mm_id', 'mm_version', 'mm_symbol'
+
+    return 'hs_id', 'hs_version', 'hs_symbol'
 
-def insert_genes(db, ref, genes, synonyms, homologs):
+
+def _get_homolog_lookup(conn):
+    """Merge join the homologs already inserted into ``ensembl_homologs_tmp``
+    with genes visited in Ensembl ID order.
+
+    Only the homologs of one gene are held in memory at a time.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+
+    Returns:
+        function: Called with each Ensembl ID, in increasing order, returns
+            a ``list`` of (homolog id, homolog version, homolog symbol).
+    """
+    cursor = conn.cursor()
+    cursor.execute(SQL_SELECT_HOMOLOGS_TMP)
+
+    groups = itertools.groupby(cursor, key=lambda row: row[0])
+    current = next(groups, None)
+
+    def lookup(ensembl_id):
+        nonlocal current
+
+        while current is not None and current[0] < ensembl_id:
+            current = next(groups, None)
+
+        if current is not None and current[0] == ensembl_id:
+            return [row[1:] for row in current[1]]
+
+        return []
+
+    return lookup
+
+
+def insert_genes(db, ref, genes, synonyms, homologs=None):
     """Insert genes into the database.
 
+    Genes are consumed lazily and inserted in batches of :data:`BATCH_SIZE`,
+    so `genes` can be a generator such as
+    :func:`ensimpl.create.ensembl_db.iter_ensembl_genes`.
+
     Args:
-        db (str): Name of the database file.
+        db: Name of the database file or a connection from :func:`connect`.
 
         ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
 
-        genes (dict): Gene information with Ensembl ID being the key.  Values
-            were extracted via the following method:
-            :func:`ensimpl.create.ensembl_db.extract_ensembl_genes`.
+        genes (iterable): Gene information ordered by Ensembl ID, or a
+            ``dict`` with Ensembl ID being the key.  Values were extracted
+            via the following method:
+            :func:`ensimpl.create.ensembl_db.iter_ensembl_genes`.
 
         synonyms (dict): Synonym information with xref_id being the key. Values
             were extracted via the following method:
             :func:`ensimpl.create.ensembl_db.extract_synonyms`.
 
-        homologs (dict): Homolog ids Values were extracted via the following
-            method:
-            :func:`ensimpl.create.ensembl_db.extract_homologs`.
+        homologs (dict, optional): Homolog ids Values were extracted via the
+            following method:
+            :func:`ensimpl.create.ensembl_db.extract_ensembl_homologs`.
+            ``None`` to merge join the homologs already inserted with
+            :func:`insert_homologs`.
+
+    Returns:
+        int: The number of genes inserted.
     """
-    LOG.info('Inserting genes into database: {}'.format(db))
+    LOG.info('Inserting genes into database: {}'.format(_get_name(db)))
 
     start = time.time()
-    conn = sqlite3.connect(db)
+    conn, owned = _connect(db)
 
     sql_genes_insert = ('INSERT INTO ensembl_genes_tmp '
                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
@@ -159,17 +396,51 @@ def insert_genes(db, ref, genes, synonyms, homologs):
     local_external_dbs = EXTERNAL_DATABASES.copy()
 
     if species_id.lower() == 'hs':
-        h_id = 'mm_id'
-        h_ver = 'mm_version'
-        h_symbol = 'mm_symbol'
         del local_external_dbs['MGI']
     else:
-        h_id = 'hs_id'
-        h_ver = 'hs_version'
-        h_symbol = 'hs_symbol'
         del local_external_dbs['HGNC']
 
-    for gene_id, gene in sorted(genes.items()):
+    if isinstance(genes, dict):
+        genes = (gene for _, gene in sorted(genes.items()))
+
+    if homologs is None:
+        get_homologs = _get_homolog_lookup(conn)
+    else:
+        h_id, h_ver, h_symbol = _get_homolog_fields(ref)
+
+        def get_homologs(ensembl_id):
+            return [(h[h_id], h[h_ver], h[h_symbol])
+                    for h in homologs.get(ensembl_id, [])]
+
+    def flush():
+        LOG.debug(f'Inserting {len(gene_data):,} genes...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql_genes_insert, gene_data)
+        cursor.close()
+
+        LOG.debug(f'Inserting {len(gene_ids_data):,} gene id records...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql_gene_ids_insert, gene_ids_data)
+        cursor.close()
+
+        LOG.debug(f'Inserting {len(gene_lookup_data):,} lookup records...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql_genes_lookup_insert, gene_lookup_data)
+        cursor.close()
+
+        if owned:
+            conn.commit()
+
+        gene_data.clear()
+        gene_ids_data.clear()
+        gene_lookup_data.clear()
+
+    previous_id = None
+
+    for gene in genes:
 
         ensembl_id = gene.get('ensembl_id', None)
         ensembl_id_version = gene.get('ensembl_id_version', None)
@@ -180,6 +451,11 @@ def insert_genes(db, ref, genes, synonyms, homologs):
         seq_end = gene.get('seq_region_end', None)
         strand = gene.get('seq_region_strand', 0)
 
+        if homologs is None and previous_id and ensembl_id < previous_id:
+            LOG.warning(f'Genes are not ordered by Ensembl ID ({ensembl_id} '
+                        f'after {previous_id}), homologs may be missing')
+        previous_id = ensembl_id
+
         ids_text = None
         synonyms_text = None
         homolog_text = None
@@ -214,17 +490,16 @@ def insert_genes(db, ref, genes, synonyms, homologs):
             for s in synonyms_tmp:
                 gene_lookup_data.append((ensembl_id, s, 'GY', species_id))
 
-        hom_ids = homologs.get(ensembl_id, None)
+        hom_ids = get_homologs(ensembl_id)
 
         if hom_ids:
             hom_tmp = []
 
-            for h in hom_ids:
-                hom_id = f'{h[h_id]}.{h[h_ver]}'
-                hom_tmp.append(f'{hom_id}/{h[h_symbol]}')
-                gene_lookup_data.append((ensembl_id, h[h_id],
+            for hom_id, hom_version, hom_symbol in hom_ids:
+                hom_tmp.append(f'{hom_id}.{hom_version}/{hom_symbol}')
+                gene_lookup_data.append((ensembl_id, hom_id,
                                          'HG', species_id))
-                gene_ids_data.append((ensembl_id, h[h_id],
+                gene_ids_data.append((ensembl_id, hom_id,
                                       'Ensembl_homolog', species_id))
 
             if len(hom_tmp) > 0:
@@ -240,131 +515,210 @@ def insert_genes(db, ref, genes, synonyms, homologs):
         if description:
             gene_lookup_data.append((ensembl_id, description, 'GN', species_id))
 
-        if counter and counter % 10000 == 0:
-            LOG.debug(f'Inserting {len(gene_data):,} genes...')
+        counter += 1
 
-            cursor = conn.cursor()
-            cursor.executemany(sql_genes_insert, gene_data)
-            cursor.close()
-            conn.commit()
-            gene_data = []
+        if counter % BATCH_SIZE == 0:
+            flush()
 
-            LOG.debug(f'Inserting {len(gene_ids_data):,} gene id records...')
+    flush()
+    conn.commit()
 
-            cursor = conn.cursor()
-            cursor.executemany(sql_gene_ids_insert, gene_ids_data)
-            cursor.close()
-            conn.commit()
-            gene_ids_data = []
+    if owned:
+        conn.close()
 
-            LOG.debug(f'Inserting {len(gene_lookup_data):,} lookup records...')
+    LOG.info(f'{counter:,} genes inserted in: '
+             f'{utils.format_time(start, time.time())}')
 
-            cursor = conn.cursor()
-            cursor.executemany(sql_genes_lookup_insert, gene_lookup_data)
-            cursor.close()
-            conn.commit()
-            gene_lookup_data = []
+    return counter
 
-    LOG.debug(f'Inserting {len(gene_data):,} genes...')
 
-    cursor = conn.cursor()
-    cursor.executemany(sql_genes_insert, gene_data)
-    cursor.close()
-    conn.commit()
+def _get_gtpe_rows(species_id, gtpe):
+    """Get the distinct ``ensembl_gtpe`` and lookup rows of one gene.
 
-    LOG.debug(f'Inserting {len(gene_ids_data):,} gene id records...')
+    The rows are sorted by transcript, then the transcript row before its
+    protein and exons, and the exons by number, which is the order the
+    table had when it was built with a ``UNION`` and ``ORDER BY``.
 
-    cursor = conn.cursor()
-    cursor.executemany(sql_gene_ids_insert, gene_ids_data)
-    cursor.close()
-    conn.commit()
+    Args:
+        species_id (str): The species identifier.
+        gtpe (list): The gene, transcript, protein, exon information of one
+            gene.
 
-    LOG.debug(f'Inserting {len(gene_lookup_data):,} lookup records...')
+    Returns:
+        tuple: A ``list`` of ``ensembl_gtpe`` rows and a ``set`` of
+            ``ensembl_genes_lookup_tmp`` rows.
+    """
+    rows = set()
+    lookups = set()
 
-    cursor = conn.cursor()
-    cursor.executemany(sql_genes_lookup_insert, gene_lookup_data)
-    cursor.close()
-    conn.commit()
-    conn.close()
+    for g in gtpe:
+        gene_id = g['gene_id']
+        transcript_id = g['transcript_id']
+        chrom = g['gene_chrom']
+        strand = g['gene_strand']
 
-    LOG.info('Gene information inserted in: '
-             f'{utils.format_time(start, time.time())}')
+        rows.add((None, species_id, gene_id, None, gene_id,
+                  g['gene_version'], g['gene_name'], chrom, g['gene_start'],
+                  g['gene_end'], strand, None, 'EG'))
+
+        rows.add((None, species_id, gene_id, transcript_id, transcript_id,
+                  g['transcript_version'], g['transcript_name'], chrom,
+                  g['transcript_start'], g['transcript_end'], strand, None,
+                  'ET'))
+
+        lookups.add((gene_id, transcript_id, 'ET', species_id))
+
+        if g['transcript_name'] is not None:
+            lookups.add((gene_id, g['transcript_name'], 'TS', species_id))
+
+        if g['protein_id'] is not None:
+            rows.add((None, species_id, gene_id, transcript_id,
+                      g['protein_id'], g['protein_version'], None, chrom,
+                      g['transcript_start'], g['transcript_end'], strand,
+                      None, 'EP'))
+
+            lookups.add((gene_id, g['protein_id'], 'EP', species_id))
+
+        rows.add((None, species_id, gene_id, transcript_id, g['exon_id'],
+                  g['exon_version'], None, chrom, g['exon_start'],
+                  g['exon_end'], strand, g['exon_number'], 'EE'))
+
+        lookups.add((gene_id, g['exon_id'], 'EE', species_id))
+
+    # NULL sorts first, so the gene row comes before its transcripts and
+    # the transcript row (the only one with a symbol) before its exons
+    rows = sorted(rows, key=lambda r: (r[11] is not None, r[11] or 0))
+    rows.sort(key=lambda r: (r[6] is not None, r[6] or ''), reverse=True)
+    rows.sort(key=lambda r: (r[3] is not None, r[3] or ''))
+
+    return rows, lookups
 
 
 def insert_gtpe(db, ref, gtep):
     """Insert the gene, transcript, protein, exon information into the database.
 
+    The distinct gene, transcript, protein and exon rows of ``ensembl_gtpe``
+    and their lookup values are generated one gene at a time, so `gtep` has
+    to be ordered by gene, as from
+    :func:`ensimpl.create.ensembl_db.iter_ensembl_gtpe`.  Rows are consumed
+    lazily and inserted in batches of :data:`BATCH_SIZE`.
+
     Args:
-        db (str): Name of the database file.
+        db: Name of the database file or a connection from :func:`connect`.
 
         ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
 
-        gtep (list): A ``list`` of the gene, transcript, protein, exon
-            information. Values were extracted via the following method:
-            :func:`ensimpl.create.ensembl_db.extract_ensembl_gtpe`.
+        gtep (iterable): The gene, transcript, protein, exon information.
+            Values were extracted via the following method:
+            :func:`ensimpl.create.ensembl_db.iter_ensembl_gtpe`.
+
+    Returns:
+        int: The number of ``ensembl_gtpe`` rows inserted.
     """
     LOG.info('Inserting transcripts, proteins, exons '
-             'into database: {}'.format(db))
+             'into database: {}'.format(_get_name(db)))
     start = time.time()
 
-    sql_gtpe_insert = ('INSERT INTO ensembl_gtpe_tmp '
-                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
-                       '?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+    sql_gtpe_insert = ('INSERT INTO ensembl_gtpe '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
 
-    attributes = ['gene_id', 'gene_version', 'gene_name', 'gene_chrom',
-                  'gene_start', 'gene_end', 'gene_strand',
-                  'transcript_id', 'transcript_version', 'transcript_name',
-                  'transcript_start', 'transcript_end',
-                  'protein_id', 'protein_version',
-                  'exon_id', 'exon_version', 'exon_start', 'exon_end',
-                  'exon_number']
+    sql_genes_lookup_insert = ('INSERT INTO ensembl_genes_lookup_tmp '
+                               'VALUES (?, ?, ?, ?);')
 
     LOG.info('Generating transcript, protein, exon table...')
-    conn = sqlite3.connect(db)
+    conn, owned = _connect(db)
 
-    gtpe_data = []
     species_id = ref.species_id
 
-    for counter, g in enumerate(gtep):
-        row = [g[attr] for attr in attributes]
-        row.append(species_id)
-        gtpe_data.append(tuple(row))
+    gtpe_data = []
+    lookup_data = []
+    counter = 0
 
-        if counter and counter % 50000 == 0:
-            cursor = conn.cursor()
-            LOG.debug(f'Inserting {len(gtpe_data):,} rows...')
-            cursor.executemany(sql_gtpe_insert, gtpe_data)
-            cursor.close()
+    def flush():
+        LOG.debug(f'Inserting {len(gtpe_data):,} gtpe records...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql_gtpe_insert, gtpe_data)
+        cursor.close()
+
+        LOG.debug(f'Inserting {len(lookup_data):,} lookup records...')
+
+        cursor = conn.cursor()
+        cursor.executemany(sql_genes_lookup_insert, lookup_data)
+        cursor.close()
+
+        if owned:
             conn.commit()
-            gtpe_data = []
 
-    LOG.debug(f'Inserting {len(gtpe_data):,} rows...')
+        gtpe_data.clear()
+        lookup_data.clear()
 
-    cursor = conn.cursor()
-    cursor.executemany(sql_gtpe_insert, gtpe_data)
-    cursor.close()
+    previous_id = None
+
+    for gene_id, rows in itertools.groupby(gtep, lambda g: g['gene_id']):
+        if previous_id and gene_id <= previous_id:
+            LOG.warning(f'Transcripts are not ordered by gene ({gene_id} '
+                        f'after {previous_id}), rows may be duplicated')
+        previous_id = gene_id
+
+        gene_rows, lookups = _get_gtpe_rows(species_id, rows)
+
+        gtpe_data.extend(gene_rows)
+        lookup_data.extend(lookups)
+        counter += len(gene_rows)
+
+        if len(gtpe_data) >= BATCH_SIZE:
+            flush()
+
+    flush()
     conn.commit()
-    conn.close()
 
-    LOG.info('Transcripts, proteins, exons inserted in: '
+    if owned:
+        conn.close()
+
+    LOG.info(f'{counter:,} genes, transcripts, proteins, exons inserted in: '
              f'{utils.format_time(start, time.time())}')
 
+    return counter
+
+
+def clear_gtpe_lookups(db):
+    """Delete the lookup values inserted by :func:`insert_gtpe`, so it can be
+    run again.
+
+    Args:
+        db: Full path to the database file or a connection from
+            :func:`connect`.
+    """
+    conn, owned = _connect(db)
+    conn.execute(SQL_GTPE_LOOKUPS_DELETE)
+    conn.commit()
+
+    if owned:
+        conn.close()
+
 
 def insert_homologs(db, ref, homologs):
-    """Insert the gene, transcript, protein, exon information into the database.
+    """Insert the homologs into the database.
+
+    Rows are consumed lazily and inserted in batches of :data:`BATCH_SIZE`.
 
     Args:
-        db (str): Name of the database file.
+        db: Name of the database file or a connection from :func:`connect`.
 
         ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
 
-        homologs (dict): Homolog ids Values were extracted via the following
-            method:
-            :func:`ensimpl.create.ensembl_db.extract_homologs`.
+        homologs (iterable): The homologs, such as from
+            :func:`ensimpl.create.ensembl_db.iter_ensembl_homologs`, or a
+            ``dict`` of ``lists`` of homologs as from
+            :func:`ensimpl.create.ensembl_db.extract_ensembl_homologs`.
+
+    Returns:
+        int: The number of homologs inserted.
     """
-    LOG.info('Inserting homologs into database: {}'.format(db))
+    LOG.info('Inserting homologs into database: {}'.format(_get_name(db)))
     start = time.time()
 
     sql_homolog_insert = ('INSERT INTO ensembl_homologs_tmp '
@@ -388,154 +742,189 @@ def insert_homologs(db, ref, homologs):
 
     LOG.info('Generating homologs table...')
 
-    conn = sqlite3.connect(db)
-    homology_data = []
+    conn, owned = _connect(db)
     species_id = ref.species_id
-    counter = 0
-
-    for (_id, val) in homologs.items():
-        for h in val:
-            row = [h[attr] for attr in attributes]
-            row.append(homology_species_id)
-            row.extend([h[attr] for attr in attributes_2])
 
-            if h['wga_coverage']:
-                row.append(float(h['wga_coverage']))
-            else:
-                row.append(None)
+    if isinstance(homologs, dict):
+        homologs = itertools.chain.from_iterable(homologs.values())
 
-            row.append(h['is_high_confidence'])
-            row.append(species_id)
+    def get_row(h):
+        row = [h[attr] for attr in attributes]
+        row.append(homology_species_id)
+        row.extend([h[attr] for attr in attributes_2])
 
-            homology_data.append(tuple(row))
+        if h['wga_coverage']:
+            row.append(float(h['wga_coverage']))
+        else:
+            row.append(None)
 
-            if counter and counter % 5000 == 0:
-                LOG.debug(f'Inserting {len(homology_data):,} rows...')
-
-                cursor = conn.cursor()
-                cursor.executemany(sql_homolog_insert, homology_data)
-                cursor.close()
-                conn.commit()
-                homology_data = []
+        row.append(h['is_high_confidence'])
+        row.append(species_id)
 
-    LOG.debug(f'Inserting {len(homology_data):,} rows...')
+        return tuple(row)
 
-    cursor = conn.cursor()
-    cursor.executemany(sql_homolog_insert, homology_data)
-    cursor.close()
+    count = _insert_batches(conn, sql_homolog_insert,
+                            (get_row(h) for h in homologs), commit=owned)
     conn.commit()
-    conn.close()
 
-    LOG.info('Homology records inserted in: '
+    if owned:
+        conn.close()
+
+    LOG.info(f'{count:,} homology records inserted in: '
              f'{utils.format_time(start, time.time())}')
 
+    return count
+
 
-def finalize(db, ref):
-    """Finalize the database.  Move everything to where it needs to be and
-    create the necessary indices.
+def finalize(db, ref, profile=None, compact=False):
+    """Finalize the database.  Move everything to where it needs to be,
+    create the necessary indices and gather the statistics of the query
+    planner.
+
+    Everything up to dropping the temporary tables is one transaction, so if
+    finalizing is interrupted it can simply be run again.  Bulk load mode
+    ends before the database is vacuumed, see :func:`connect`.
 
      Args:
-        db (str): Name of the database file.
+        db: Name of the database file or a connection from :func:`connect`.
 
         ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`):
             Contains information about the Ensembl reference.
+
+        profile (:obj:`ensimpl.create.profiling.BuildProfile`, optional):
+            Time each statement.
+
+        compact (bool, optional): ``True`` to encode the database as
+            described in :func:`compact_db`.
      """
     start = time.time()
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
+    conn, owned = _connect(db)
 
-    LOG.info('Finalizing database...')
+    def execute(name, sql, params=None):
+        with profiling.phase(profile, f'finalize_{name}') as record:
+            LOG.debug(sql)
+            cursor = conn.cursor()
 
-    sql_meta_insert = 'INSERT INTO meta_info VALUES (null, ?, ?, ?)'
+            if params is None:
+                cursor.execute(sql)
+            else:
+                cursor.executemany(sql, params)
 
-    meta_data = []
-    meta_data.append(('release', ref.release, ref.species_id))
-    meta_data.append(('assembly', ref.assembly, ref.species_id))
-    meta_data.append(('assembly_patch', ref.assembly_patch, ref.species_id))
-    meta_data.append(('url', ref.url, ref.species_id))
+            if cursor.rowcount >= 0:
+                record['rows'] = cursor.rowcount
 
-    cursor.executemany(sql_meta_insert, meta_data)
-    conn.commit()
+            cursor.close()
 
-    LOG.info('Finalizing external databases table...')
+    try:
+        LOG.info('Finalizing database...')
 
-    sql_external_insert = 'INSERT INTO external_dbs VALUES (null, ?, ?, ?)'
+        sql_meta_insert = 'INSERT INTO meta_info VALUES (null, ?, ?, ?)'
 
-    external_db_data = []
+        meta_data = []
+        meta_data.append(('release', ref.release, ref.species_id))
+        meta_data.append(('assembly', ref.assembly, ref.species_id))
+        meta_data.append(('assembly_patch', ref.assembly_patch,
+                          ref.species_id))
+        meta_data.append(('url', ref.url, ref.species_id))
 
-    for (k, v) in EXTERNAL_DATABASES.items():
-        external_db_data.append((k, v['display'], v['id']))
+        execute('meta_info', sql_meta_insert, meta_data)
 
-    cursor.executemany(sql_external_insert, external_db_data)
-    conn.commit()
+        LOG.info('Finalizing external databases table...')
 
-    LOG.info('Finalizing chromosomes table...')
+        sql_external_insert = 'INSERT INTO external_dbs VALUES (null, ?, ?, ?)'
 
-    cursor.execute(SQL_INSERT_CHROMOSOMES)
-    conn.commit()
+        external_db_data = []
 
-    LOG.info('Finalizing karyotypes table...')
+        for (k, v) in EXTERNAL_DATABASES.items():
+            external_db_data.append((k, v['display'], v['id']))
 
-    cursor.execute(SQL_INSERT_KARYOTYPES)
-    conn.commit()
+        execute('external_dbs', sql_external_insert, external_db_data)
 
-    LOG.info('Finalizing genes table...')
+        LOG.info('Finalizing chromosomes table...')
 
-    cursor.execute(SQL_INSERT_GENES)
-    conn.commit()
+        execute('chromosomes', SQL_INSERT_CHROMOSOMES)
 
-    LOG.info('Finalizing gene ids table...')
+        LOG.info('Finalizing karyotypes table...')
 
-    cursor.execute(SQL_INSERT_GENE_IDS)
-    conn.commit()
+        execute('karyotypes', SQL_INSERT_KARYOTYPES)
 
-    LOG.info('Finalizing homologs table...')
+        LOG.info('Finalizing genes table...')
 
-    cursor.execute(SQL_INSERT_HOMOLOGS)
-    conn.commit()
+        execute('genes', SQL_INSERT_GENES)
 
-    LOG.info('Finalizing transcript, protein, exon table...')
+        LOG.info('Finalizing gene ids table...')
 
-    cursor.execute(SQL_INSERT_GTPE)
-    conn.commit()
+        execute('gene_ids', SQL_INSERT_GENE_IDS)
 
-    LOG.info('Updating genes lookup...')
+        LOG.info('Finalizing homologs table...')
 
-    cursor.execute(SQL_GENES_LOOKUP_TMP_INSERT)
-    cursor.execute(SQL_GENES_LOOKUP_INSERT)
-    conn.commit()
+        execute('homologs', SQL_INSERT_HOMOLOGS)
 
-    LOG.info('Creating search table...')
+        LOG.info('Updating genes lookup...')
 
-    cursor.execute(SQL_ENSEMBL_SEARCH_INSERT)
-    conn.commit()
+        execute('genes_lookup', SQL_GENES_LOOKUP_INSERT)
 
-    LOG.info('Creating indices...')
+        execute('lookup_stats', SQL_LOOKUP_STATS_INSERT)
 
-    for sql in SQL_INDICES:
-        LOG.debug(sql)
-        cursor.execute(sql)
+        LOG.info('Creating spatial indices...')
 
-    LOG.info('Cleaning up...')
+        execute('genes_rtree', SQL_GENES_RTREE_INSERT)
+        execute('gtpe_rtree', SQL_GTPE_RTREE_INSERT)
 
-    for sql in SQL_TABLES_DROP:
-        LOG.debug(sql)
-        cursor.execute(sql)
+        LOG.info('Creating search table...')
+
+        if compact:
+            compact_db(conn, profile, commit=False)
+        else:
+            execute('search', SQL_ENSEMBL_SEARCH_INSERT)
+            execute('search_optimize', SQL_ENSEMBL_SEARCH_OPTIMIZE)
+
+        LOG.info('Creating indices...')
+
+        for sql in SQL_INDICES:
+            # the compact tables have their own indices
+            if compact and get_index_table(sql) in COMPACT_TABLES:
+                continue
+
+            execute(f'index_{profiling.get_index_name(sql)}', sql)
+
+        LOG.info('Cleaning up...')
+
+        with profiling.phase(profile, 'finalize_drop_tables'):
+            for sql in SQL_TABLES_DROP:
+                LOG.debug(sql)
+                conn.execute(sql)
+
+        LOG.info('Analyzing...')
+
+        # the statistics in sqlite_stat1 let the query planner choose
+        # between the indices
+        execute('analyze', 'ANALYZE')
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+
+        if owned:
+            conn.close()
+
+        raise
 
     conn.row_factory = sqlite3.Row
 
     LOG.info('Checking...')
 
-    for sql in SQL_SELECT_CHECKS:
-        LOG.debug(sql)
-        cursor = conn.cursor()
+    with profiling.phase(profile, 'finalize_checks'):
+        for sql in SQL_SELECT_CHECKS:
+            LOG.debug(sql)
+            cursor = conn.cursor()
 
-        for row in cursor.execute(sql):
-            LOG.info('**** WARNING ****')
-            LOG.info(utils.dictify_row(cursor, row))
-            break
+            for row in cursor.execute(sql):
+                LOG.info('**** WARNING ****')
+                LOG.info(utils.dictify_row(cursor, row))
+                break
 
-        cursor.close()
+            cursor.close()
 
     LOG.info('Information')
 
@@ -548,14 +937,123 @@ def finalize(db, ref):
 
         cursor.close()
 
-    conn.execute('VACUUM')
-    conn.commit()
-    conn.close()
+    end_bulk_load(conn)
+
+    with profiling.phase(profile, 'finalize_vacuum'):
+        conn.execute('VACUUM')
+        conn.commit()
+
+    if owned:
+        conn.close()
+    else:
+        conn.row_factory = None
 
     LOG.info('Finalizing complete:: '
              f'{utils.format_time(start, time.time())}')
 
 
+def get_index_table(sql):
+    """Get the table indexed by `sql`.
+
+    Args:
+        sql (str): A ``CREATE INDEX`` statement.
+
+    Returns:
+        str: The table name or ``None``.
+    """
+    match = REGEX_INDEX_TABLE.search(sql)
+    return match.group(1) if match else None
+
+
+def compact_db(db, profile=None, commit=True):
+    """Encode the tables in :data:`COMPACT_TABLES` compactly.
+
+    Every Ensembl stable ID is stored once, in ``stable_ids``, and referred
+    to by its integer key.  The external database names, search ranking ids
+    and ``ensembl_gtpe`` type keys are stored once, in ``dictionary``, and
+    the species id, which is the same for every row, is not stored at all.
+    Each table is replaced by a view of the same name and columns that
+    decodes the compact table, so every query works as before.  Looking up
+    an ID goes through the unique index of ``stable_ids``.  The full text
+    index of ``ensembl_search`` is rebuilt from the compact lookup table.
+
+    Args:
+        db: Name of the database file or a connection from :func:`connect`.
+        profile (:obj:`ensimpl.create.profiling.BuildProfile`, optional):
+            Time each statement.
+        commit (bool, optional): ``False`` to leave the transaction open.
+    """
+    start = time.time()
+    conn, owned = _connect(db)
+
+    def execute(name, sql):
+        with profiling.phase(profile, f'compact_{name}') as record:
+            LOG.debug(sql)
+            cursor = conn.execute(sql)
+
+            if cursor.rowcount >= 0:
+                record['rows'] = cursor.rowcount
+
+    try:
+        LOG.info('Compacting database...')
+
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+
+        species_id = conn.execute('SELECT species_id '
+                                  'FROM meta_info').fetchone()[0]
+
+        for sql in SQL_CREATE_COMPACT_TABLES:
+            LOG.debug(sql)
+            conn.execute(sql)
+
+        execute('stable_ids', SQL_INSERT_STABLE_IDS)
+        execute('dictionary', SQL_INSERT_DICTIONARY)
+
+        # the values are looked up by the inserts below
+        for sql in SQL_COMPACT_INDICES[:2]:
+            execute(f'index_{profiling.get_index_name(sql)}', sql)
+
+        for table, sql in zip(COMPACT_TABLES, SQL_INSERT_COMPACT):
+            execute(table, sql)
+
+        for sql in SQL_COMPACT_DROP:
+            LOG.debug(sql)
+            conn.execute(sql)
+
+        species_id = species_id.replace("'", "''")
+
+        for sql in SQL_COMPACT_VIEWS:
+            sql = sql.format(species_id=species_id)
+            LOG.debug(sql)
+            conn.execute(sql)
+
+        for sql in SQL_COMPACT_INDICES[2:]:
+            execute(f'index_{profiling.get_index_name(sql)}', sql)
+
+        for sql in SQL_COMPACT_SEARCH:
+            LOG.debug(sql)
+            conn.execute(sql)
+
+        execute('search', SQL_ENSEMBL_SEARCH_REBUILD)
+        execute('search_optimize', SQL_ENSEMBL_SEARCH_OPTIMIZE)
+
+        if commit:
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+
+        if owned:
+            conn.close()
+
+        raise
+
+    if owned:
+        conn.close()
+
+    LOG.info(f'Compacting complete: {utils.format_time(start, time.time())}')
+
+
 SQL_CREATE_TABLES = ['''
     CREATE TABLE IF NOT EXISTS meta_info (
        meta_info_key INTEGER,
@@ -722,29 +1220,6 @@ SQL_CREATE_TABLES = ['''
        ranking_id TEXT,
        species_id TEXT
     );
-''', '''
-    CREATE TABLE IF NOT EXISTS ensembl_gtpe_tmp (
-       gene_id TEXT,
-       gene_version TEXT,
-       gene_symbol TEXT,
-       gene_chrom TEXT,
-       gene_start INTEGER,
-       gene_end INTEGER,
-       gene_strand TEXT,
-       transcript_id TEXT,
-       transcript_version TEXT,
-       transcript_symbol TEXT,
-       transcript_start INTEGER,
-       transcript_end INTEGER,
-       protein_id TEXT,
-       protein_version TEXT,       
-       exon_id TEXT,
-       exon_version TEXT,
-       exon_start INTEGER,
-       exon_end INTEGER,
-       exon_number INTEGER,
-       species_id TEXT
-    );
 ''', '''
     CREATE TABLE IF NOT EXISTS ensembl_gtpe (
         gtpe_key INTEGER,
@@ -772,11 +1247,30 @@ SQL_CREATE_TABLES = ['''
     )
 ''', '''
     CREATE VIRTUAL TABLE IF NOT EXISTS ensembl_search
-        USING fts4(ensembl_genes_lookup_key, lookup_value);
+        USING fts4(lookup_value, content="ensembl_genes_lookup",
+             matchinfo="fts3");
+''', '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ensembl_genes_rtree
+        USING rtree_i32(ensembl_genes_key, chromosome_min, chromosome_max,
+                        start_position, end_position);
+''', '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ensembl_gtpe_rtree
+        USING rtree_i32(gtpe_key, chromosome_min, chromosome_max,
+                        start, end);
 ''']
 
+# ensembl_search only holds the full text index, the lookup values are read
+# from ensembl_genes_lookup and the docid is the ensembl_genes_lookup_key,
+# matchinfo="fts3" skips the document sizes, which only matter for ranking
+
 # NOTE: as of this time (10/2019) FTS5 cannot do phrase queries
 
+# ensembl_genes_rtree and ensembl_gtpe_rtree are the spatial indices of
+# ensembl_genes and ensembl_gtpe, by key, the chromosome_num is the first
+# dimension (chromosome_min = chromosome_max), so every chromosome is a
+# separate part of the tree, and the position the second, rtree_i32 keeps
+# the coordinates as exact integers
+
 SQL_INSERT_CHROMOSOMES = '''
     INSERT
       INTO chromosomes
@@ -865,104 +1359,18 @@ SQL_INSERT_GENE_IDS = '''
      ORDER BY ensembl_id;
 '''
 
-SQL_INSERT_GTPE = '''
-    INSERT
-      INTO ensembl_gtpe
-    SELECT distinct null key,
-           species_id,
-           gene_id gene_id,
-           null transcript_id,
-           gene_id ensembl_id,
-           gene_version,
-           gene_symbol ensembl_symbol,
-           gene_chrom,
-           gene_start,
-           gene_end,
-           gene_strand,
-           null exon_number,
-           'EG' type_key
-      FROM ensembl_gtpe_tmp
-     UNION
-    SELECT distinct null,
-           species_id,
-           gene_id,
-           transcript_id,
-           transcript_id,
-           transcript_version,
-           transcript_symbol,
-           gene_chrom,
-           transcript_start,
-           transcript_end,
-           gene_strand,
-           null,
-           'ET'
-      FROM ensembl_gtpe_tmp
-     UNION
-    SELECT distinct null,
-           species_id,
-           gene_id,
-           transcript_id,
-           protein_id,
-           protein_version,
-           null,
-           gene_chrom,
-           transcript_start,
-           transcript_end,
-           gene_strand,
-           null,
-           'EP'
-      FROM ensembl_gtpe_tmp
-     WHERE protein_id IS NOT NULL
-     UNION
-    SELECT distinct null,
-           species_id,
-           gene_id,
-           transcript_id,
-           exon_id,
-           exon_version,
-           null,
-           gene_chrom,
-           exon_start,
-           exon_end,
-           gene_strand,
-           exon_number,
-           'EE'
-      FROM ensembl_gtpe_tmp
-     ORDER BY species_id, gene_id, transcript_id, 
-              ensembl_symbol desc, exon_number
+SQL_SELECT_HOMOLOGS_TMP = '''
+SELECT ensembl_id, homolog_id, homolog_version, homolog_symbol
+  FROM ensembl_homologs_tmp
+ ORDER BY ensembl_id, homolog_id, rowid
 '''
+'''The homologs are sorted here rather than when extracted, a dump is read
+in no particular order.'''
 
-SQL_GENES_LOOKUP_TMP_INSERT = '''
-    INSERT
-      INTO ensembl_genes_lookup_tmp
-    SELECT gene_id,
-           transcript_id,
-           type_key,
-           species_id
-      FROM ensembl_gtpe
-     WHERE type_key = 'ET' 
-     UNION
-    SELECT gene_id,
-           ensembl_symbol,
-           'TS',
-           species_id
-      FROM ensembl_gtpe
-     WHERE type_key = 'ET'
-       AND ensembl_symbol IS NOT NULL
-     UNION
-    SELECT gene_id,
-           ensembl_id,
-           type_key,
-           species_id
-      FROM ensembl_gtpe
-     WHERE type_key = 'EP' 
-     UNION
-    SELECT gene_id,
-           ensembl_id,
-           type_key,
-           species_id
-      FROM ensembl_gtpe
-     WHERE type_key = 'EE' 
+SQL_GTPE_LOOKUPS_DELETE = '''
+DELETE
+  FROM ensembl_genes_lookup_tmp
+ WHERE ranking_id IN ('ET', 'TS', 'EP', 'EE')
 '''
 
 SQL_GENES_LOOKUP_INSERT = '''
@@ -980,92 +1388,112 @@ SELECT distinct null,
 
 SQL_ENSEMBL_SEARCH_INSERT = '''
     INSERT
-      INTO ensembl_search
+      INTO ensembl_search (docid, lookup_value)
     SELECT ensembl_genes_lookup_key, lookup_value
       FROM ensembl_genes_lookup
 '''
 
+SQL_LOOKUP_STATS_INSERT = '''
+    INSERT
+      INTO meta_info
+    SELECT null,
+           'stats:' || sr.description,
+           count(egl.lookup_value),
+           egl.species_id
+      FROM ensembl_genes_lookup egl, search_ranking sr
+     WHERE egl.ranking_id = sr.ranking_id
+     GROUP BY sr.description, egl.species_id
+     ORDER BY sr.score desc
+'''
+'''The lookup counts of :func:`ensimpl.fetch.get.stats`, stored as meta
+information keyed by 'stats:' and the search ranking description.'''
+
+SQL_LOOKUP_STATS_DELETE = '''
+    DELETE
+      FROM meta_info
+     WHERE meta_key LIKE 'stats:%'
+'''
+
+SQL_GENES_RTREE_INSERT = '''
+    INSERT
+      INTO ensembl_genes_rtree
+    SELECT g.ensembl_genes_key,
+           c.chromosome_num,
+           c.chromosome_num,
+           g.start_position,
+           g.end_position
+      FROM ensembl_genes g,
+           chromosomes c
+     WHERE c.chromosome = g.chromosome
+     ORDER BY c.chromosome_num, g.start_position
+'''
+
+SQL_GTPE_RTREE_INSERT = '''
+    INSERT
+      INTO ensembl_gtpe_rtree
+    SELECT r.gtpe_key,
+           c.chromosome_num,
+           c.chromosome_num,
+           r.start,
+           r.end
+      FROM ensembl_gtpe r,
+           chromosomes c
+     WHERE c.chromosome = r.seqid
+       AND r.start IS NOT NULL
+       AND r.end IS NOT NULL
+     ORDER BY c.chromosome_num, r.start
+'''
+'''Rows are inserted in the order of their position, so neighbouring rows
+share the nodes of the tree.'''
+
+SQL_ENSEMBL_SEARCH_OPTIMIZE = '''
+    INSERT
+      INTO ensembl_search (ensembl_search)
+    VALUES ('optimize')
+'''
+
 SQL_INDICES = [
     '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_species_id 
-    ON ensembl_gtpe(species_id ASC)
-    ''', '''
     CREATE INDEX IF NOT EXISTS idx_gtpe_gene_id 
     ON ensembl_gtpe(gene_id ASC)
     ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_transcript_id 
-    ON ensembl_gtpe(transcript_id ASC)
-    ''', '''
     CREATE INDEX IF NOT EXISTS idx_gtpe_ensembl_id 
-    ON ensembl_gtpe(ensembl_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_ensembl_id_version 
-    ON ensembl_gtpe(ensembl_id_version ASC)
+    ON ensembl_gtpe(ensembl_id ASC, gene_id ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_gtpe_seqid 
-    ON ensembl_gtpe(seqid ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_start
-     ON ensembl_gtpe(start ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_end 
-    ON ensembl_gtpe(end ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_exon_number 
-    ON ensembl_gtpe(exon_number ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_gtpe_type_key 
-    ON ensembl_gtpe(type_key ASC)
+    ON ensembl_gtpe(seqid ASC, start ASC, end ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_homolog_ensembl_id 
-    ON ensembl_homologs (ensembl_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_homolog_homolog_id 
-    ON ensembl_homologs (homolog_id ASC)
+    ON ensembl_homologs (ensembl_id ASC, homolog_id ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_ensembl_gene_id 
     ON ensembl_genes (ensembl_id ASC)
     ''', '''
+    CREATE INDEX IF NOT EXISTS idx_ensembl_genes_position 
+    ON ensembl_genes (chromosome ASC, start_position ASC, end_position ASC)
+    ''', '''
     CREATE INDEX IF NOT EXISTS idx_ensembl_gene_ids_ensembl_id 
-    ON ensembl_gene_ids (ensembl_id ASC)
+    ON ensembl_gene_ids (ensembl_id ASC, external_db ASC, external_id ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_ensembl_gene_ids_external_id 
-    ON ensembl_gene_ids (external_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_lookup_ensembl_gene_id 
-    ON ensembl_genes_lookup (ensembl_gene_id ASC)
+    ON ensembl_gene_ids (external_id ASC, external_db ASC, ensembl_id ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_lookup_value 
-    ON ensembl_genes_lookup (lookup_value ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_lookup_id 
-    ON ensembl_genes_lookup (ranking_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_lookup_species_id 
-    ON ensembl_genes_lookup (species_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_chromosomes_cnum 
-    ON chromosomes (chromosome_num ASC);
+    ON ensembl_genes_lookup (lookup_value ASC, ranking_id ASC,
+                             ensembl_gene_id ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_chromosomes_chrom 
     ON chromosomes (chromosome ASC)
     ''', '''
-    CREATE INDEX IF NOT EXISTS idx_chromosomes_species 
-    ON chromosomes (species_id ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_karyotypes_knum 
-    ON karyotypes (karyotype_num ASC)
-    ''', '''
     CREATE INDEX IF NOT EXISTS idx_karyotypes_chrom 
-    ON karyotypes (chromosome ASC)
-    ''', '''
-    CREATE INDEX IF NOT EXISTS idx_karyotypes_species 
-    ON karyotypes (species_id ASC)
+    ON karyotypes (chromosome ASC, seq_region_start ASC)
     ''', '''
     CREATE INDEX IF NOT EXISTS idx_search_ranking_id 
-    ON search_ranking (ranking_id ASC)
+    ON search_ranking (ranking_id ASC, score ASC, description ASC)
     '''
 ]
+'''The indices follow the queries in :mod:`ensimpl.fetch`.  Most cover every
+column the query reads, so the rows are not looked up in the table.'''
 
 SQL_TABLES_DROP = [
     'DROP TABLE chromosomes_tmp',
@@ -1073,8 +1501,7 @@ SQL_TABLES_DROP = [
     'DROP TABLE ensembl_genes_tmp',
     'DROP TABLE ensembl_gene_ids_tmp',
     'DROP TABLE ensembl_homologs_tmp',
-    'DROP TABLE ensembl_genes_lookup_tmp',
-    'DROP TABLE ensembl_gtpe_tmp'
+    'DROP TABLE ensembl_genes_lookup_tmp'
 ]
 
 
@@ -1153,3 +1580,276 @@ SELECT distinct gene_id
   FROM ensembl_gtpe
    '''
 ]
+
+COMPACT_TABLES = ['ensembl_genes', 'ensembl_gene_ids', 'ensembl_genes_lookup',
+                  'ensembl_gtpe']
+'''The tables replaced by views of their compact encoding, see
+:func:`compact_db`.'''
+
+SQL_CREATE_COMPACT_TABLES = ['''
+    CREATE TABLE stable_ids (
+       stable_id_key INTEGER,
+       stable_id TEXT NOT NULL,
+       PRIMARY KEY (stable_id_key)
+    )
+''', '''
+    CREATE TABLE dictionary (
+       dictionary_key INTEGER,
+       value TEXT NOT NULL,
+       PRIMARY KEY (dictionary_key)
+    )
+''', '''
+    CREATE TABLE ensembl_genes_compact (
+       ensembl_genes_key INTEGER,
+       ensembl_id_key INTEGER NOT NULL,
+       ensembl_version TEXT,
+       symbol TEXT,
+       name TEXT,
+       synonyms TEXT,
+       external_ids TEXT,
+       chromosome TEXT NOT NULL,
+       start_position INTEGER NOT NULL,
+       end_position INTEGER NOT NULL,
+       strand INTEGER NOT NULL,
+       homolog_ids TEXT,
+       PRIMARY KEY (ensembl_genes_key)
+    )
+''', '''
+    CREATE TABLE ensembl_gene_ids_compact (
+       ensembl_gene_ids_key INTEGER,
+       ensembl_id_key INTEGER NOT NULL,
+       external_id TEXT NOT NULL,
+       external_db_code INTEGER NOT NULL,
+       PRIMARY KEY (ensembl_gene_ids_key)
+    )
+''', '''
+    CREATE TABLE ensembl_genes_lookup_compact (
+       ensembl_genes_lookup_key INTEGER,
+       ensembl_gene_id_key INTEGER NOT NULL,
+       lookup_value TEXT COLLATE NOCASE,
+       ranking_id_code INTEGER,
+       PRIMARY KEY (ensembl_genes_lookup_key)
+    )
+''', '''
+    CREATE TABLE ensembl_gtpe_compact (
+        gtpe_key INTEGER,
+        gene_id_key INTEGER NOT NULL,
+        transcript_id_key INTEGER,
+        ensembl_id_key INTEGER NOT NULL,
+        ensembl_id_version INTEGER,
+        ensembl_symbol TEXT,
+        seqid TEXT NOT NULL,
+        start INTEGER,
+        end INTEGER,
+        strand INTEGER,
+        exon_number INTEGER,
+        type_key_code INTEGER NOT NULL,
+        PRIMARY KEY (gtpe_key)
+    )
+''']
+
+SQL_INSERT_STABLE_IDS = '''
+    INSERT
+      INTO stable_ids (stable_id)
+    SELECT ensembl_id FROM ensembl_genes
+     UNION
+    SELECT ensembl_id FROM ensembl_gene_ids
+     UNION
+    SELECT ensembl_gene_id FROM ensembl_genes_lookup
+     UNION
+    SELECT gene_id FROM ensembl_gtpe
+     UNION
+    SELECT transcript_id FROM ensembl_gtpe WHERE transcript_id IS NOT NULL
+     UNION
+    SELECT ensembl_id FROM ensembl_gtpe
+'''
+
+SQL_INSERT_DICTIONARY = '''
+    INSERT
+      INTO dictionary (value)
+    SELECT external_db FROM ensembl_gene_ids
+     UNION
+    SELECT ranking_id FROM ensembl_genes_lookup WHERE ranking_id IS NOT NULL
+     UNION
+    SELECT type_key FROM ensembl_gtpe
+'''
+
+SQL_INSERT_COMPACT = ['''
+    INSERT
+      INTO ensembl_genes_compact
+    SELECT g.ensembl_genes_key, s.stable_id_key, g.ensembl_version,
+           g.symbol, g.name, g.synonyms, g.external_ids, g.chromosome,
+           g.start_position, g.end_position, g.strand, g.homolog_ids
+      FROM ensembl_genes g,
+           stable_ids s
+     WHERE s.stable_id = g.ensembl_id
+     ORDER BY g.ensembl_genes_key
+''', '''
+    INSERT
+      INTO ensembl_gene_ids_compact
+    SELECT i.ensembl_gene_ids_key, s.stable_id_key, i.external_id,
+           d.dictionary_key
+      FROM ensembl_gene_ids i,
+           stable_ids s,
+           dictionary d
+     WHERE s.stable_id = i.ensembl_id
+       AND d.value = i.external_db
+     ORDER BY i.ensembl_gene_ids_key
+''', '''
+    INSERT
+      INTO ensembl_genes_lookup_compact
+    SELECT l.ensembl_genes_lookup_key, s.stable_id_key, l.lookup_value,
+           (SELECT d.dictionary_key
+              FROM dictionary d
+             WHERE d.value = l.ranking_id)
+      FROM ensembl_genes_lookup l,
+           stable_ids s
+     WHERE s.stable_id = l.ensembl_gene_id
+     ORDER BY l.ensembl_genes_lookup_key
+''', '''
+    INSERT
+      INTO ensembl_gtpe_compact
+    SELECT r.gtpe_key, sg.stable_id_key,
+           (SELECT st.stable_id_key
+              FROM stable_ids st
+             WHERE st.stable_id = r.transcript_id),
+           se.stable_id_key, r.ensembl_id_version, r.ensembl_symbol,
+           r.seqid, r.start, r.end, r.strand, r.exon_number,
+           d.dictionary_key
+      FROM ensembl_gtpe r,
+           stable_ids sg,
+           stable_ids se,
+           dictionary d
+     WHERE sg.stable_id = r.gene_id
+       AND se.stable_id = r.ensembl_id
+       AND d.value = r.type_key
+     ORDER BY r.gtpe_key
+''']
+
+SQL_COMPACT_DROP = [
+    'DROP TABLE ensembl_genes',
+    'DROP TABLE ensembl_gene_ids',
+    'DROP TABLE ensembl_genes_lookup',
+    'DROP TABLE ensembl_gtpe',
+]
+
+SQL_COMPACT_VIEWS = ['''
+    CREATE VIEW ensembl_genes AS
+    SELECT g.ensembl_genes_key,
+           s.stable_id ensembl_id,
+           g.ensembl_version,
+           '{species_id}' species_id,
+           g.symbol,
+           g.name,
+           g.synonyms,
+           g.external_ids,
+           g.chromosome,
+           g.start_position,
+           g.end_position,
+           g.strand,
+           g.homolog_ids
+      FROM ensembl_genes_compact g,
+           stable_ids s
+     WHERE s.stable_id_key = g.ensembl_id_key
+''', '''
+    CREATE VIEW ensembl_gene_ids AS
+    SELECT i.ensembl_gene_ids_key,
+           s.stable_id ensembl_id,
+           i.external_id,
+           (SELECT d.value
+              FROM dictionary d
+             WHERE d.dictionary_key = i.external_db_code) external_db,
+           '{species_id}' species_id
+      FROM ensembl_gene_ids_compact i,
+           stable_ids s
+     WHERE s.stable_id_key = i.ensembl_id_key
+''', '''
+    CREATE VIEW ensembl_genes_lookup AS
+    SELECT l.ensembl_genes_lookup_key,
+           s.stable_id ensembl_gene_id,
+           l.lookup_value,
+           (SELECT d.value
+              FROM dictionary d
+             WHERE d.dictionary_key = l.ranking_id_code) ranking_id,
+           '{species_id}' species_id
+      FROM ensembl_genes_lookup_compact l,
+           stable_ids s
+     WHERE s.stable_id_key = l.ensembl_gene_id_key
+''', '''
+    CREATE VIEW ensembl_gtpe AS
+    SELECT r.gtpe_key,
+           '{species_id}' species_id,
+           sg.stable_id gene_id,
+           (SELECT st.stable_id
+              FROM stable_ids st
+             WHERE st.stable_id_key = r.transcript_id_key) transcript_id,
+           se.stable_id ensembl_id,
+           r.ensembl_id_version,
+           r.ensembl_symbol,
+           r.seqid,
+           r.start,
+           r.end,
+           r.strand,
+           r.exon_number,
+           (SELECT d.value
+              FROM dictionary d
+             WHERE d.dictionary_key = r.type_key_code) type_key
+      FROM ensembl_gtpe_compact r,
+           stable_ids sg,
+           stable_ids se
+     WHERE sg.stable_id_key = r.gene_id_key
+       AND se.stable_id_key = r.ensembl_id_key
+''']
+
+SQL_COMPACT_SEARCH = [
+    'DROP TABLE ensembl_search',
+    '''
+    CREATE VIRTUAL TABLE ensembl_search
+        USING fts4(lookup_value, content="ensembl_genes_lookup_compact",
+             matchinfo="fts3")
+    '''
+]
+
+SQL_ENSEMBL_SEARCH_REBUILD = '''
+    INSERT
+      INTO ensembl_search (ensembl_search)
+    VALUES ('rebuild')
+'''
+
+SQL_COMPACT_INDICES = [
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_stable_ids_stable_id
+    ON stable_ids(stable_id ASC)
+    ''', '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_dictionary_value
+    ON dictionary(value ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_gtpe_gene_id_key
+    ON ensembl_gtpe_compact(gene_id_key ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_gtpe_ensembl_id_key
+    ON ensembl_gtpe_compact(ensembl_id_key ASC, gene_id_key ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_gtpe_seqid
+    ON ensembl_gtpe_compact(seqid ASC, start ASC, end ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_ensembl_gene_id_key
+    ON ensembl_genes_compact(ensembl_id_key ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_ensembl_genes_position
+    ON ensembl_genes_compact(chromosome ASC, start_position ASC,
+                             end_position ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_ensembl_gene_ids_ensembl_id_key
+    ON ensembl_gene_ids_compact(ensembl_id_key ASC, external_db_code ASC,
+                                external_id ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_ensembl_gene_ids_external_id
+    ON ensembl_gene_ids_compact(external_id ASC, external_db_code ASC,
+                                ensembl_id_key ASC)
+    ''', '''
+    CREATE INDEX IF NOT EXISTS idx_lookup_value
+    ON ensembl_genes_lookup_compact(lookup_value ASC, ranking_id_code ASC,
+                                    ensembl_gene_id_key ASC)
+    '''
+]
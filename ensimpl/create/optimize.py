@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""Upgrade existing ensimpl databases without extracting them again.
+
+A database built by an older version gets everything the current version
+builds for reading: the indices of :mod:`ensimpl.create.ensimpl_db`, an
+external content and optimized ``ensembl_search``, the spatial indices of
+the genes and features, the stored lookup counts and the statistics of the
+query planner.
+
+The original is not modified.  It is copied with ``VACUUM INTO``, with the
+requested page size, the copy is upgraded and then renamed over the
+original (or written to another file), so a database can be optimized
+while it is being served.  The size of the database and the latency of the
+main fetch queries, run on the same sampled inputs, are measured before and
+after.
+"""
+from collections import OrderedDict
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import os
+import random
+import re
+import sqlite3
+import time
+
+import ensimpl.create.ensimpl_db as ensimpl_db
+import ensimpl.create.profiling as profiling
+import ensimpl.utils as utils
+
+from ensimpl.bench import DEFAULT_SEED
+from ensimpl.fetch import features as fetch_features
+from ensimpl.fetch import genes as fetch_genes
+from ensimpl.fetch import get as fetch_get
+from ensimpl.fetch import search as fetch_search
+from ensimpl.fetch import utils as fetch_utils
+
+OptimizeResult = namedtuple('OptimizeResult', ['ensimpl_file', 'seconds',
+                                               'error', 'changes',
+                                               'size_before', 'size_after',
+                                               'latency_before',
+                                               'latency_after'])
+
+LOG = utils.get_logger()
+
+DEFAULT_PAGE_SIZE = 4096
+'''Page size of optimized databases, in bytes.'''
+
+DEFAULT_SAMPLE_SIZE = 50
+'''Number of genes sampled for the latency measurements.'''
+
+REPEAT = 5
+'''Times the queries that do not depend on a gene are run.'''
+
+REGEX_IF_NOT_EXISTS = re.compile(r'\s+IF\s+NOT\s+EXISTS\b', re.IGNORECASE)
+
+SQL_SELECT_TABLES = '''
+SELECT name
+  FROM sqlite_master
+ WHERE type = 'table'
+'''
+
+SQL_SELECT_INDICES = '''
+SELECT name, sql
+  FROM sqlite_master
+ WHERE type = 'index'
+   AND sql IS NOT NULL
+'''
+
+SQL_SELECT_SEARCH = '''
+SELECT sql
+  FROM sqlite_master
+ WHERE name = 'ensembl_search'
+'''
+
+SQL_SAMPLE_GENES = '''
+SELECT ensembl_id, symbol, chromosome, start_position, end_position
+  FROM ensembl_genes
+ ORDER BY ensembl_id
+'''
+
+SQL_CREATE_SEARCH = [sql for sql in ensimpl_db.SQL_CREATE_TABLES
+                     if 'ensembl_search' in sql][0]
+
+SQL_CREATE_RTREE = [sql for sql in ensimpl_db.SQL_CREATE_TABLES
+                    if 'USING rtree' in sql]
+
+
+def _connect_read_only(ensimpl_file):
+    """Open `ensimpl_file` read only."""
+    return sqlite3.connect(f'file:{ensimpl_file}?mode=ro', uri=True)
+
+
+def _normalize(sql):
+    """Normalize a ``CREATE INDEX`` statement, as SQLite keeps it in
+    ``sqlite_master``, for comparison."""
+    return ' '.join(REGEX_IF_NOT_EXISTS.sub('', sql).replace(';', '').split())
+
+
+def get_indices(compact=False):
+    """Get the indices the current version creates.
+
+    Args:
+        compact (bool, optional): ``True`` for a compact database, see
+            :func:`ensimpl.create.ensimpl_db.compact_db`.
+
+    Returns:
+        list: The ``CREATE INDEX`` statements.
+    """
+    if not compact:
+        return list(ensimpl_db.SQL_INDICES)
+
+    return ([sql for sql in ensimpl_db.SQL_INDICES
+             if ensimpl_db.get_index_table(sql) not in
+             ensimpl_db.COMPACT_TABLES] + ensimpl_db.SQL_COMPACT_INDICES)
+
+
+def is_legacy_search(conn):
+    """Check if ``ensembl_search`` keeps a copy of the lookup values, as
+    built before it was an external content table.
+
+    Args:
+        conn (sqlite3.Connection): The database.
+
+    Returns:
+        bool: ``True`` for the old layout.
+    """
+    row = conn.execute(SQL_SELECT_SEARCH).fetchone()
+    return row is not None and 'content=' not in row[0]
+
+
+def upgrade(conn):
+    """Upgrade the database of `conn` to the current version, in one
+    transaction.
+
+    Indices that the current version does not create are dropped and the
+    missing ones are created, ``ensembl_search`` is rebuilt as an external
+    content table if needed and optimized, the missing spatial indices are
+    built, the lookup counts are stored and ``ANALYZE`` is run.
+
+    Args:
+        conn (sqlite3.Connection): The database.
+
+    Returns:
+        list: A description of each change.
+
+    Raises:
+        ValueError: If the database is a consolidated store.
+    """
+    tables = {row[0] for row in conn.execute(SQL_SELECT_TABLES)}
+
+    if 'releases' in tables:
+        raise ValueError('A store cannot be optimized')
+
+    compact = 'stable_ids' in tables
+    changes = []
+
+    try:
+        conn.execute('BEGIN')
+
+        indices = OrderedDict((_normalize(sql), sql)
+                              for sql in get_indices(compact))
+        existing = {}
+
+        for name, sql in conn.execute(SQL_SELECT_INDICES).fetchall():
+            if _normalize(sql) in indices:
+                existing[_normalize(sql)] = name
+            else:
+                LOG.debug(f'DROP INDEX {name}')
+                conn.execute(f'DROP INDEX {name}')
+                changes.append(f'dropped index {name}')
+
+        for key, sql in indices.items():
+            if key not in existing:
+                LOG.debug(sql)
+                conn.execute(sql)
+                changes.append('created index '
+                               f'{profiling.get_index_name(sql)}')
+
+        if is_legacy_search(conn):
+            LOG.info('Rebuilding ensembl_search...')
+            conn.execute('DROP TABLE ensembl_search')
+            conn.execute(ensimpl_db.SQL_COMPACT_SEARCH[1] if compact
+                         else SQL_CREATE_SEARCH)
+            conn.execute(ensimpl_db.SQL_ENSEMBL_SEARCH_REBUILD)
+            changes.append('rebuilt ensembl_search as external content')
+
+        conn.execute(ensimpl_db.SQL_ENSEMBL_SEARCH_OPTIMIZE)
+
+        if 'ensembl_genes_rtree' not in tables:
+            LOG.info('Creating spatial indices...')
+
+            for sql in SQL_CREATE_RTREE:
+                conn.execute(sql)
+
+            conn.execute(ensimpl_db.SQL_GENES_RTREE_INSERT)
+            conn.execute(ensimpl_db.SQL_GTPE_RTREE_INSERT)
+            changes.append('created the spatial indices')
+
+        if conn.execute(fetch_get.SQL_LOOKUP_STATS).fetchone() is None:
+            changes.append('stored the lookup counts')
+
+        conn.execute(ensimpl_db.SQL_LOOKUP_STATS_DELETE)
+        conn.execute(ensimpl_db.SQL_LOOKUP_STATS_INSERT)
+
+        LOG.info('Analyzing...')
+        conn.execute('ANALYZE')
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return changes
+
+
+def get_sample(ensimpl_file, size=DEFAULT_SAMPLE_SIZE, seed=DEFAULT_SEED):
+    """Sample the genes used as inputs by :func:`measure`.
+
+    Args:
+        ensimpl_file (str): The database.
+        size (int, optional): The number of genes.
+        seed (int, optional): The random seed.
+
+    Returns:
+        list: A ``list`` of (ensembl_id, symbol, chromosome, start_position,
+            end_position).
+    """
+    conn = _connect_read_only(ensimpl_file)
+
+    try:
+        rows = conn.execute(SQL_SAMPLE_GENES).fetchall()
+    finally:
+        conn.close()
+
+    random.Random(seed).shuffle(rows)
+
+    return rows[:size]
+
+
+def measure(ensimpl_file, sample):
+    """Measure the latency of the main fetch queries.
+
+    Each query is run once untimed, then once per sampled gene, the queries
+    that do not depend on a gene :data:`REPEAT` times.
+
+    Args:
+        ensimpl_file (str): The database.
+        sample (list): The genes from :func:`get_sample`.
+
+    Returns:
+        collections.OrderedDict: The mean latency in milliseconds by query.
+    """
+    conn = _connect_read_only(ensimpl_file)
+
+    try:
+        conn.execute('CREATE TEMP TABLE optimize_ids (ensembl_id TEXT, '
+                     'PRIMARY KEY (ensembl_id))')
+        conn.executemany('INSERT OR IGNORE INTO optimize_ids VALUES (?)',
+                         [(row[0],) for row in sample])
+        conn.commit()
+
+        def search_sql(sql):
+            if is_legacy_search(conn):
+                return sql.replace(fetch_search.SQL_SEARCH_JOIN,
+                                   fetch_search.SQL_SEARCH_JOIN_LEGACY)
+            return sql
+
+        spatial = conn.execute(
+            fetch_utils.SQL_SELECT_RTREE).fetchone()[0] == 2
+
+        if spatial:
+            sql_region = fetch_search.SQL_REGION
+            sql_features = fetch_features.SQL_FEATURES
+        else:
+            sql_region = fetch_search.SQL_REGION_LEGACY
+            sql_features = fetch_features.SQL_FEATURES_LEGACY
+
+        sql_features = sql_features.format(
+            ','.join('?' * len(fetch_features.FEATURE_TYPES)))
+
+        if conn.execute(fetch_get.SQL_LOOKUP_STATS).fetchone() is None:
+            sql_stats = fetch_get.SQL_LOOKUP_STATS_COUNT
+        else:
+            sql_stats = fetch_get.SQL_LOOKUP_STATS
+
+        symbols = [row[1] for row in sample if row[1]]
+        ids = [(row[0],) for row in sample]
+
+        queries = [
+            ('search_exact', fetch_search.SQL_TERM_EXACT,
+             [{'term': symbol} for symbol in symbols]),
+            ('search_prefix', search_sql(fetch_search.SQL_TERM_LIKE),
+             [{'term': f'{symbol[:3]}*'} for symbol in symbols]),
+            ('search_id', search_sql(fetch_search.SQL_ID),
+             [{'term': row[0]} for row in sample]),
+            ('search_region', sql_region,
+             [{'chromosome': row[2], 'start_position': row[3],
+               'end_position': row[4] + 100000} for row in sample]),
+            ('features', sql_features,
+             [[row[2], row[4] + 100000, row[3]] +
+              fetch_features.FEATURE_TYPES for row in sample]),
+            ('genes_details',
+             fetch_genes.SQL_GENES_FULL_FILTERED.format('temp.optimize_ids') +
+             fetch_genes.SQL_GENES_ORDER_BY_ID, [{}] * REPEAT),
+            ('ids', fetch_genes.SQL_IDS_FILTERED_ENSEMBL.format('?'), ids),
+            ('homology', fetch_genes.SQL_HOMOLOGY_FILTERED.format('?'), ids),
+            ('stats', sql_stats, [{}] * REPEAT),
+        ]
+
+        latency = OrderedDict()
+
+        for name, sql, params in queries:
+            if not params:
+                continue
+
+            conn.execute(sql, params[0]).fetchall()
+
+            start = time.perf_counter()
+
+            for param in params:
+                conn.execute(sql, param).fetchall()
+
+            seconds = time.perf_counter() - start
+            latency[name] = seconds * 1000.0 / len(params)
+
+        return latency
+    finally:
+        conn.close()
+
+
+def optimize(ensimpl_file, output_file=None, page_size=DEFAULT_PAGE_SIZE,
+             sample_size=DEFAULT_SAMPLE_SIZE):
+    """Optimize an ensimpl database.
+
+    The optimized database is written under a temporary name and renamed
+    when complete.
+
+    Args:
+        ensimpl_file (str): The database.
+        output_file (str, optional): The optimized database, ``None`` to
+            replace `ensimpl_file`.
+        page_size (int, optional): The page size, in bytes, a power of two
+            between 512 and 65536.
+        sample_size (int, optional): The number of genes the latency is
+            measured with, 0 to not measure it.
+
+    Returns:
+        OptimizeResult: The changes, sizes and latencies.
+
+    Raises:
+        ValueError: If the database does not exist or is a store.
+    """
+    start = time.time()
+    output_file = output_file or ensimpl_file
+    tmp_file = f'{output_file}.tmp'
+
+    if not os.path.exists(ensimpl_file):
+        raise ValueError(f'{ensimpl_file} does not exist')
+
+    LOG.info(f'Optimizing {ensimpl_file}')
+
+    size_before = os.path.getsize(ensimpl_file)
+    sample = None
+    latency_before = None
+
+    if sample_size:
+        sample = get_sample(ensimpl_file, sample_size)
+        latency_before = measure(ensimpl_file, sample)
+
+    utils.delete_file(tmp_file)
+
+    try:
+        conn = _connect_read_only(ensimpl_file)
+
+        try:
+            # the page size of the copy
+            conn.execute(f'PRAGMA page_size = {int(page_size)}')
+            conn.execute('VACUUM INTO ?', (tmp_file,))
+        finally:
+            conn.close()
+
+        conn = sqlite3.connect(tmp_file)
+
+        try:
+            changes = upgrade(conn)
+
+            # the pages of the dropped indices and search index
+            if conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                conn.execute('VACUUM')
+        finally:
+            conn.close()
+    except BaseException:
+        utils.delete_file(tmp_file)
+        raise
+
+    os.replace(tmp_file, output_file)
+
+    latency_after = measure(output_file, sample) if sample_size else None
+
+    return OptimizeResult(ensimpl_file, time.time() - start, None, changes,
+                          size_before, os.path.getsize(output_file),
+                          latency_before, latency_after)
+
+
+def optimize_job(ensimpl_file, output_file=None, page_size=DEFAULT_PAGE_SIZE,
+                 sample_size=DEFAULT_SAMPLE_SIZE, level=None):
+    """Optimize one ensimpl database and report how it went instead of
+    raising.
+
+    Used for each file of :func:`optimize_files`, possibly in another
+    process.
+
+    Args:
+        ensimpl_file (str): The database.
+        output_file (str, optional): The optimized database, ``None`` to
+            replace `ensimpl_file`.
+        page_size (int, optional): The page size, in bytes.
+        sample_size (int, optional): The number of genes the latency is
+            measured with, 0 to not measure it.
+        level (int, optional): The logging level, ``None`` to leave as is.
+
+    Returns:
+        OptimizeResult: With the error, ``None`` on success.
+    """
+    if level is not None:
+        LOG.setLevel(level)
+
+    start = time.time()
+
+    try:
+        return optimize(ensimpl_file, output_file, page_size, sample_size)
+    except Exception as e:
+        LOG.exception(f'Unable to optimize {ensimpl_file}')
+        return OptimizeResult(ensimpl_file, time.time() - start,
+                              f'{type(e).__name__}: {e}', None, None, None,
+                              None, None)
+
+
+def optimize_files(ensimpl_files, output_directory=None,
+                   page_size=DEFAULT_PAGE_SIZE,
+                   sample_size=DEFAULT_SAMPLE_SIZE, jobs=1):
+    """Optimize ensimpl databases, `jobs` at a time.
+
+    Args:
+        ensimpl_files (list): The databases.
+        output_directory (str, optional): Write the optimized databases to
+            this directory, ``None`` to replace the originals.
+        page_size (int, optional): The page size, in bytes.
+        sample_size (int, optional): The number of genes the latency is
+            measured with, 0 to not measure it.
+        jobs (int, optional): Maximum databases optimized at once.
+
+    Returns:
+        list: A ``list`` of :obj:`OptimizeResult`, in the order of
+            `ensimpl_files`.
+    """
+    jobs = max(1, min(jobs, len(ensimpl_files)))
+    output_files = [os.path.join(output_directory, os.path.basename(f))
+                    if output_directory else None for f in ensimpl_files]
+
+    LOG.info(f'Optimizing {len(ensimpl_files)} database(s) with {jobs} '
+             'job(s)')
+
+    if jobs == 1:
+        return [optimize_job(ensimpl_file, output_file, page_size,
+                             sample_size)
+                for ensimpl_file, output_file in zip(ensimpl_files,
+                                                     output_files)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(optimize_job, ensimpl_file, output_file,
+                                   page_size, sample_size, LOG.level)
+                   for ensimpl_file, output_file in zip(ensimpl_files,
+                                                        output_files)]
+
+        return [future.result() for future in futures]
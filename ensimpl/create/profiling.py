@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Per-phase profiling of database builds.
+
+Every extraction, insert and finalize statement of a build is timed with
+:func:`phase`.  A report holds, for each phase, the wall and CPU time, the
+rows processed and the peak RSS of the process when the phase ended, and
+for the built database the size of every table and index.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextlib import nullcontext
+
+import json
+import os
+import platform
+import re
+import resource
+import sqlite3
+import sys
+import threading
+import time
+
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+REGEX_INDEX_NAME = re.compile(r'INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)',
+                              re.IGNORECASE)
+
+SQL_OBJECT_SIZES = '''
+SELECT name, sum(pgsize)
+  FROM dbstat
+ GROUP BY name
+ ORDER BY name
+'''
+
+SQL_OBJECT_TYPES = '''
+SELECT name, type
+  FROM sqlite_master
+'''
+
+
+def get_peak_rss():
+    """Get the peak resident set size of the process.
+
+    Returns:
+        float: The peak RSS in KiB.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024.0 if sys.platform == 'darwin' else float(max_rss)
+
+
+def get_index_name(sql):
+    """Get the name of the index created by `sql`.
+
+    Args:
+        sql (str): A ``CREATE INDEX`` statement.
+
+    Returns:
+        str: The index name or ``None``.
+    """
+    match = REGEX_INDEX_NAME.search(sql)
+    return match.group(1) if match else None
+
+
+class BuildProfile:
+    """The profile of one database build.
+
+    Phases can be timed from several threads at once.  CPU time is that of
+    the thread running the phase.
+
+    Attributes:
+        phases (list): An ``OrderedDict`` per completed phase.
+    """
+    def __init__(self):
+        """Initialization."""
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the phase `name`.
+
+        Args:
+            name (str): The phase name, such as 'extract_genes'.
+
+        Yields:
+            collections.OrderedDict: The phase record, set ``'rows'`` in it to
+                record the number of rows processed.
+        """
+        record = OrderedDict([('name', name), ('rows', None)])
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            record['wall_seconds'] = round(wall, 6)
+            record['cpu_seconds'] = round(time.thread_time() - cpu_start, 6)
+
+            if record['rows'] is not None and wall > 0:
+                record['rows_per_second'] = round(record['rows'] / wall, 1)
+            else:
+                record['rows_per_second'] = None
+
+            record['peak_rss_kb'] = get_peak_rss()
+
+            with self._lock:
+                self.phases.append(record)
+
+    def get_report(self, ensembl_ref, ensimpl_file):
+        """Get the report of the build of `ensimpl_file`.
+
+        Args:
+            ensembl_ref (:obj:`EnsemblReference`): The Ensembl reference, see
+                :mod:`ensimpl.create.create_ensimpl`.
+            ensimpl_file (str): The built database, ``None`` if the build
+                failed.
+
+        Returns:
+            collections.OrderedDict: The ``meta``, ``phases`` and ``sizes``.
+        """
+        meta = OrderedDict([
+            ('release', ensembl_ref.release),
+            ('species', ensembl_ref.species_id),
+            ('assembly', ensembl_ref.assembly),
+            ('python', platform.python_version()),
+            ('sqlite', sqlite3.sqlite_version),
+            ('platform', platform.platform()),
+            ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('peak_rss_kb', get_peak_rss()),
+        ])
+
+        sizes = None
+
+        if ensimpl_file and os.path.exists(ensimpl_file):
+            meta['file_size'] = os.path.getsize(ensimpl_file)
+            sizes = get_sizes(ensimpl_file)
+
+        with self._lock:
+            phases = list(self.phases)
+
+        return OrderedDict([('meta', meta), ('phases', phases),
+                            ('sizes', sizes)])
+
+
+def phase(profile, name):
+    """Time the phase `name` when profiling.
+
+    Args:
+        profile (BuildProfile): The profile, ``None`` when not profiling.
+        name (str): The phase name.
+
+    Returns:
+        A context manager yielding the phase record.
+    """
+    if profile is None:
+        return nullcontext(OrderedDict())
+
+    return profile.phase(name)
+
+
+def get_sizes(ensimpl_file):
+    """Get the size of each table and index of `ensimpl_file`.
+
+    Needs SQLite built with the ``dbstat`` virtual table.
+
+    Args:
+        ensimpl_file (str): The database file.
+
+    Returns:
+        collections.OrderedDict: Keyed by table or index name, each value
+            having the ``type`` and the ``bytes`` used, or ``None`` if
+            ``dbstat`` is not available.
+    """
+    conn = sqlite3.connect(ensimpl_file)
+
+    try:
+        types = dict(conn.execute(SQL_OBJECT_TYPES).fetchall())
+        sizes = OrderedDict()
+
+        for name, num_bytes in conn.execute(SQL_OBJECT_SIZES):
+            sizes[name] = OrderedDict([('type', types.get(name, 'internal')),
+                                       ('bytes', num_bytes)])
+
+        return sizes
+    except sqlite3.OperationalError as e:
+        LOG.debug(f'Unable to determine table sizes: {e}')
+        return None
+    finally:
+        conn.close()
+
+
+def write(file_name, reports):
+    """Write the build reports to `file_name`.
+
+    Args:
+        file_name (str): The JSON file.
+        reports (list): The reports from :meth:`BuildProfile.get_report`.
+    """
+    with open(file_name, 'w') as fd:
+        json.dump({'builds': reports}, fd, indent=2)
+
+
+def load(file_name):
+    """Load saved build reports.
+
+    Args:
+        file_name (str): The JSON file.
+
+    Returns:
+        list: The reports.
+    """
+    with open(file_name) as fd:
+        return json.load(fd)['builds']
+
+
+def compare(current, baseline):
+    """Compare two sets of build reports.
+
+    Builds are matched by species, so reports of different releases can be
+    compared, and phases and sizes by name.
+
+    Args:
+        current (list): Reports from :func:`load`.
+        baseline (list): Reports from :func:`load`.
+
+    Returns:
+        list: A ``list`` of rows, each a ``list`` of the species, the phase
+            or table name, the baseline and current wall seconds (or bytes)
+            and the ratio of current to baseline.
+    """
+    base_builds = {b['meta']['species']: b for b in baseline}
+    rows = []
+
+    def ratio(value, base_value):
+        if value is None or not base_value:
+            return None
+        return round(value / base_value, 3)
+
+    for build in current:
+        species = build['meta']['species']
+        base = base_builds.get(species)
+
+        if not base:
+            continue
+
+        base_phases = {p['name']: p for p in base['phases']}
+
+        for p in build['phases']:
+            base_wall = base_phases.get(p['name'], {}).get('wall_seconds')
+            rows.append([species, p['name'], base_wall, p['wall_seconds'],
+                         ratio(p['wall_seconds'], base_wall)])
+
+        base_sizes = base.get('sizes') or {}
+
+        for name, size in (build.get('sizes') or {}).items():
+            base_bytes = base_sizes.get(name, {}).get('bytes')
+            rows.append([species, f'{size["type"]} {name}', base_bytes,
+                         size['bytes'], ratio(size['bytes'], base_bytes)])
+
+    return rows
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Spool extracted rows to local files.
+
+Rows are pickled in batches so a spool file can be written while a query is
+streaming and read back later without holding the whole result in memory.
+Spool files ending in ``.gz`` are gzip compressed, which is how extractions
+are kept in the build cache.
+"""
+import gzip
+import itertools
+import os
+import pickle
+
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+BATCH_SIZE = 10000
+'''Number of rows pickled together.'''
+
+COMPRESS_LEVEL = 6
+
+
+def _open(file_name, mode, compress):
+    """Open a spool file.
+
+    Args:
+        file_name (str): The file.
+        mode (str): 'rb' or 'wb'.
+        compress (bool): ``True`` for a gzip compressed file.
+
+    Returns:
+        A binary file object.
+    """
+    if compress:
+        return gzip.open(file_name, mode, compresslevel=COMPRESS_LEVEL)
+
+    return open(file_name, mode)
+
+
+def write(file_name, rows, batch_size=BATCH_SIZE):
+    """Write `rows` to `file_name`.
+
+    The file is written under a temporary name and renamed when complete, so
+    a spool file that exists is always complete.
+
+    Args:
+        file_name (str): The spool file.
+        rows (iterable): The rows, consumed lazily.
+        batch_size (int, optional): Rows pickled together.
+
+    Returns:
+        int: The number of rows written.
+    """
+    tmp_file_name = f'{file_name}.tmp'
+    rows = iter(rows)
+    count = 0
+
+    try:
+        with _open(tmp_file_name, 'wb', file_name.endswith('.gz')) as fd:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+
+                if not batch:
+                    break
+
+                pickle.dump(batch, fd, pickle.HIGHEST_PROTOCOL)
+                count += len(batch)
+    except BaseException:
+        utils.delete_file(tmp_file_name)
+        raise
+
+    os.replace(tmp_file_name, file_name)
+
+    return count
+
+
+def read(file_name):
+    """Read the rows written to `file_name` by :func:`write`.
+
+    Args:
+        file_name (str): The spool file.
+
+    Yields:
+        The rows, in the order they were written.
+    """
+    with _open(file_name, 'rb', file_name.endswith('.gz')) as fd:
+        while True:
+            try:
+                batch = pickle.load(fd)
+            except EOFError:
+                break
+
+            yield from batch
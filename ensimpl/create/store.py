@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+"""Consolidate the databases of many releases into one versioned store.
+
+A store, "ensimpl. ``species`` .store", has the tables of an ensimpl
+database plus a ``release_from`` and ``release_to`` column.  A row that is
+identical in consecutive releases is kept once and its ``release_to`` is
+extended, so the store grows with the number of changes rather than with
+the number of releases.
+
+Releases are added in increasing order.  The rows of the latest release in
+the store and the rows of the new release are both read in the order of a
+digest of their values and merged, so neither release has to be held in
+memory.  :func:`ensimpl.fetch.utils.connect_to_database` serves a release
+from the store through temporary views of the rows valid in that release.
+
+The surrogate keys, such as ``ensembl_genes_key``, are those of the store
+and not of the original databases.
+"""
+from collections import Counter
+from collections import OrderedDict
+
+import hashlib
+import itertools
+import os
+import sqlite3
+import time
+
+import ensimpl.db_config as db_config
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+BATCH_SIZE = 10000
+
+VERSION_COLUMNS = ['release_from', 'release_to']
+
+SQL_CREATE_RELEASES = '''
+    CREATE TABLE IF NOT EXISTS releases (
+        release INTEGER,
+        file_name TEXT,
+        PRIMARY KEY (release)
+    )
+'''
+
+SQL_SELECT_TABLES = '''
+SELECT name, sql
+  FROM {schema}.sqlite_master
+ WHERE type = 'table'
+   AND name NOT LIKE 'sqlite_%'
+ ORDER BY name
+'''
+
+SQL_SELECT_INDICES = '''
+SELECT name, tbl_name, sql
+  FROM {schema}.sqlite_master
+ WHERE type = 'index'
+   AND sql IS NOT NULL
+ ORDER BY name
+'''
+
+SQL_SELECT_RELEASE = '''
+SELECT meta_value
+  FROM {schema}.meta_info
+ WHERE meta_key = 'release'
+'''
+
+SQL_ENSEMBL_SEARCH_INSERT = '''
+    INSERT
+      INTO ensembl_search (docid, lookup_value)
+    SELECT ensembl_genes_lookup_key, lookup_value
+      FROM ensembl_genes_lookup
+     WHERE release_from = :release
+'''
+
+SQL_ENSEMBL_SEARCH_INSERT_LEGACY = '''
+    INSERT
+      INTO ensembl_search
+    SELECT ensembl_genes_lookup_key, lookup_value
+      FROM ensembl_genes_lookup
+     WHERE release_from = :release
+'''
+
+SQL_RTREE_INSERT = ['''
+    INSERT
+      INTO ensembl_genes_rtree
+    SELECT g.ensembl_genes_key, c.chromosome_num, c.chromosome_num,
+           g.start_position, g.end_position
+      FROM ensembl_genes g,
+           chromosomes c
+     WHERE g.release_from = :release
+       AND c.chromosome = g.chromosome
+       AND c.release_to = :release
+     ORDER BY c.chromosome_num, g.start_position
+''', '''
+    INSERT
+      INTO ensembl_gtpe_rtree
+    SELECT r.gtpe_key, c.chromosome_num, c.chromosome_num, r.start, r.end
+      FROM ensembl_gtpe r,
+           chromosomes c
+     WHERE r.release_from = :release
+       AND c.chromosome = r.seqid
+       AND c.release_to = :release
+       AND r.start IS NOT NULL
+       AND r.end IS NOT NULL
+     ORDER BY c.chromosome_num, r.start
+''']
+'''The spatial indices hold every row of the store, the views of a release
+filter what they find.'''
+
+
+def get_store_file(directory, species):
+    """Get the name of the store file.
+
+    Args:
+        directory (str): The directory.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        str: Such as ``ensimpl.Mm.store``.
+    """
+    return os.path.join(directory, f'ensimpl.{species}.store')
+
+
+def get_tables(conn, schema='main'):
+    """Get the tables of a database.
+
+    The full text search tables, and the tables they keep their index in,
+    are returned separately as they are not versioned.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        schema (str, optional): The schema name of the database.
+
+    Returns:
+        tuple: An ``OrderedDict`` of the ``CREATE`` statement by table name
+            and an ``OrderedDict`` of the ``CREATE`` statement by virtual
+            table name.
+    """
+    tables = OrderedDict()
+    virtual_tables = OrderedDict()
+
+    rows = conn.execute(SQL_SELECT_TABLES.format(schema=schema)).fetchall()
+
+    for name, sql in rows:
+        if sql.upper().startswith('CREATE VIRTUAL'):
+            virtual_tables[name] = sql
+
+    for name, sql in rows:
+        if name in virtual_tables:
+            continue
+
+        if any(name.startswith(f'{v}_') for v in virtual_tables):
+            continue
+
+        tables[name] = sql
+
+    return tables, virtual_tables
+
+
+def get_columns(conn, table, schema='main'):
+    """Get the columns of `table` that hold data.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        table (str): The table name.
+        schema (str, optional): The schema name of the database.
+
+    Returns:
+        tuple: The key column, the name of the ``INTEGER PRIMARY KEY`` or
+            ``None``, and a ``list`` of the other column names, without
+            :data:`VERSION_COLUMNS`.
+    """
+    key = None
+    columns = []
+
+    for row in conn.execute(f'PRAGMA {schema}.table_info({table})'):
+        name, col_type, pk = row[1], row[2], row[5]
+
+        if pk == 1 and col_type.upper() == 'INTEGER':
+            key = name
+        elif name not in VERSION_COLUMNS:
+            columns.append(name)
+
+    return key, columns
+
+
+def get_release(conn, schema='main'):
+    """Get the Ensembl release of an ensimpl database.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        schema (str, optional): The schema name of the database.
+
+    Returns:
+        int: The release.
+    """
+    return int(conn.execute(
+        SQL_SELECT_RELEASE.format(schema=schema)).fetchone()[0])
+
+
+def _digest(*values):
+    """Digest the values of a row, the order rows are merged in."""
+    return hashlib.blake2b(repr(values).encode('utf-8'),
+                           digest_size=8).hexdigest()
+
+
+def merge(old_rows, new_rows):
+    """Match the rows of the latest release in the store with the rows of
+    a new release.
+
+    Both are ordered by digest and each row is a ``tuple`` of the digest,
+    the rowid and the values.  Identical rows are matched one to one.
+
+    Args:
+        old_rows (iterable): The rows valid in the latest release.
+        new_rows (iterable): The rows of the new release.
+
+    Yields:
+        tuple: ('keep', rowid) for a row of the store that is also in the
+            new release, ('add', rowid) for a row of the new release that
+            is not in the store.
+    """
+    old_groups = itertools.groupby(old_rows, key=lambda row: row[0])
+    new_groups = itertools.groupby(new_rows, key=lambda row: row[0])
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+
+    while new is not None:
+        if old is not None and old[0] < new[0]:
+            old = next(old_groups, None)
+            continue
+
+        old_rowids = {}
+
+        if old is not None and old[0] == new[0]:
+            for row in old[1]:
+                old_rowids.setdefault(row[2:], []).append(row[1])
+
+            old = next(old_groups, None)
+
+        for row in new[1]:
+            rowids = old_rowids.get(row[2:])
+
+            if rowids:
+                yield 'keep', rowids.pop()
+            else:
+                yield 'add', row[1]
+
+        new = next(new_groups, None)
+
+
+def _create_table(conn, table, sql, indices):
+    """Create the versioned `table` in the store with its indices."""
+    LOG.info(f'Creating table {table}...')
+    conn.execute(sql)
+
+    for column in VERSION_COLUMNS:
+        conn.execute(f'ALTER TABLE main.{table} ADD COLUMN {column} INTEGER')
+
+    for sql_index in indices:
+        conn.execute(sql_index)
+
+    conn.execute(f'CREATE INDEX idx_{table}_release_to '
+                 f'ON {table} (release_to)')
+
+
+def _add_table(conn, table, release, previous):
+    """Merge `table` of the attached database into the store.
+
+    Args:
+        conn (sqlite3.Connection): The store, with the new release attached
+            as ``release_db``.
+        table (str): The table name.
+        release (int): The new release.
+        previous (int): The latest release in the store or ``None``.
+
+    Returns:
+        tuple: The number of rows kept and added.
+    """
+    key, columns = get_columns(conn, table)
+    _, new_columns = get_columns(conn, table, 'release_db')
+
+    if columns != new_columns:
+        raise ValueError(f'The columns of {table} differ from the store')
+
+    cols = ', '.join(columns)
+
+    conn.execute('CREATE TEMP TABLE store_keep (rid INTEGER PRIMARY KEY)')
+    conn.execute('CREATE TEMP TABLE store_add (rid INTEGER PRIMARY KEY)')
+
+    old_rows = conn.cursor()
+    old_rows.execute(f'''
+        SELECT row_digest({cols}) d, rowid, {cols}
+          FROM main.{table}
+         WHERE release_to = :previous
+         ORDER BY d
+    ''', {'previous': previous})
+
+    new_rows = conn.cursor()
+    new_rows.execute(f'''
+        SELECT row_digest({cols}) d, rowid, {cols}
+          FROM release_db.{table}
+         ORDER BY d
+    ''')
+
+    counts = Counter()
+    pairs = merge(old_rows, new_rows)
+
+    while True:
+        batch = list(itertools.islice(pairs, BATCH_SIZE))
+
+        if not batch:
+            break
+
+        for action in ('keep', 'add'):
+            rowids = [(rowid,) for a, rowid in batch if a == action]
+            conn.executemany(f'INSERT INTO store_{action} VALUES (?)',
+                             rowids)
+            counts[action] += len(rowids)
+
+    old_rows.close()
+    new_rows.close()
+
+    conn.execute(f'''
+        UPDATE main.{table}
+           SET release_to = :release
+         WHERE rowid IN (SELECT rid FROM store_keep)
+    ''', {'release': release})
+
+    # new rows are added in their original order, so the store keys follow
+    # the order of the original keys
+    conn.execute(f'''
+        INSERT
+          INTO main.{table} ({cols}, release_from, release_to)
+        SELECT {cols}, :release, :release
+          FROM release_db.{table}
+         WHERE rowid IN (SELECT rid FROM store_add)
+         ORDER BY {key or 'rowid'}
+    ''', {'release': release})
+
+    conn.execute('DROP TABLE store_keep')
+    conn.execute('DROP TABLE store_add')
+
+    return counts['keep'], counts['add']
+
+
+def add_release(store_file, ensimpl_file):
+    """Add the release of an ensimpl database to the store, which is
+    created if it does not exist.
+
+    Args:
+        store_file (str): The store file.
+        ensimpl_file (str): The ensimpl database.
+
+    Returns:
+        collections.OrderedDict: The number of rows kept and added by table.
+
+    Raises:
+        ValueError: If the release is not newer than the latest release in
+            the store, the tables differ from those of the store or the
+            database is compact.
+    """
+    start = time.time()
+
+    conn = sqlite3.connect(store_file)
+    conn.create_function('row_digest', -1, _digest)
+    conn.execute('ATTACH DATABASE ? AS release_db', (ensimpl_file,))
+
+    counts = OrderedDict()
+
+    try:
+        # the tables are created in the same transaction as the rows
+        conn.execute('BEGIN')
+        conn.execute(SQL_CREATE_RELEASES)
+
+        release = get_release(conn, 'release_db')
+        previous = conn.execute('SELECT max(release) '
+                                'FROM releases').fetchone()[0]
+
+        if previous is not None and release <= previous:
+            raise ValueError(f'Release {release} is not newer than release '
+                             f'{previous} in {store_file}')
+
+        LOG.info(f'Adding release {release} from {ensimpl_file}')
+
+        tables, virtual_tables = get_tables(conn, 'release_db')
+
+        if 'stable_ids' in tables:
+            raise ValueError(f'{ensimpl_file} is compact and cannot be '
+                             'added to a store')
+        store_tables, store_virtual_tables = get_tables(conn)
+        store_tables.pop('releases')
+
+        if previous is not None and (list(tables) != list(store_tables) or
+                                     list(virtual_tables) !=
+                                     list(store_virtual_tables)):
+            raise ValueError(f'The tables of {ensimpl_file} differ from '
+                             f'those of {store_file}')
+
+        if previous is None:
+            indices = conn.execute(
+                SQL_SELECT_INDICES.format(schema='release_db')).fetchall()
+
+            for table, sql in tables.items():
+                _create_table(conn, table, sql,
+                              [i[2] for i in indices if i[1] == table])
+
+            for sql in virtual_tables.values():
+                conn.execute(sql)
+
+        for table in tables:
+            kept, added = _add_table(conn, table, release, previous)
+            counts[table] = OrderedDict([('kept', kept), ('added', added)])
+            LOG.info(f'{table}: {kept:,} kept, {added:,} added')
+
+        if 'ensembl_search' in virtual_tables:
+            # databases built before ensembl_search was external content
+            # keep the key as a column
+            if 'content=' in store_virtual_tables.get(
+                    'ensembl_search', virtual_tables['ensembl_search']):
+                sql = SQL_ENSEMBL_SEARCH_INSERT
+            else:
+                sql = SQL_ENSEMBL_SEARCH_INSERT_LEGACY
+
+            conn.execute(sql, {'release': release})
+
+        if 'ensembl_genes_rtree' in virtual_tables:
+            # only the rows added by this release are new to the indices
+            for sql in SQL_RTREE_INSERT:
+                conn.execute(sql, {'release': release})
+
+        conn.execute('INSERT INTO releases VALUES (?, ?)',
+                     (release, os.path.basename(ensimpl_file)))
+
+        conn.execute('ANALYZE main')
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    LOG.info(f'Release {release} added in: '
+             f'{utils.format_time(start, time.time())}')
+
+    return counts
+
+
+def create_species_store(species='Mm', releases=None):
+    """Add the databases of a species in the configured database directory
+    to its store, see :mod:`ensimpl.db_config`.
+
+    Releases already in the store are skipped.
+
+    Args:
+        species (str, optional): The Ensembl species identifier.
+        releases (list, optional): The releases to add, ``None`` for all.
+
+    Returns:
+        tuple: The store file and a ``list`` of the releases added.
+
+    Raises:
+        ValueError: If a database cannot be found or a release is older than
+            the latest release in the store.
+    """
+    if releases is None:
+        releases = [db['release'] for db in db_config.ENSIMPL_DBS
+                    if db['species'] == species and not db.get('store')]
+
+    ensimpl_files = []
+
+    for release in sorted(int(r) for r in releases):
+        ensimpl_db = db_config.get_ensimpl_db(release, species)
+
+        if ensimpl_db.get('store'):
+            raise ValueError(f'Unable to find a database of release '
+                             f'"{release}" and species "{species}"')
+
+        ensimpl_files.append((release, ensimpl_db['db']))
+
+    if not ensimpl_files:
+        raise ValueError(f'Unable to find a database of species "{species}"')
+
+    store_file = get_store_file(os.path.dirname(ensimpl_files[0][1]),
+                                species)
+    in_store = []
+
+    if os.path.exists(store_file):
+        in_store = db_config.get_store_releases(store_file)
+
+    added = []
+
+    for release, ensimpl_file in ensimpl_files:
+        if release in in_store:
+            LOG.info(f'Release {release} is already in {store_file}')
+            continue
+
+        add_release(store_file, ensimpl_file)
+        added.append(release)
+
+    return store_file, added
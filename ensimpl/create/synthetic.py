@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""Generate synthetic ensimpl databases.
+
+The data is fabricated, but it is loaded through exactly the same
+:mod:`ensimpl.create.ensimpl_db` functions as a real build, so the resulting
+file has the same tables, indices and search table as one created by
+``ensimpl create``.  This allows benchmarks and load tests to run without
+access to an Ensembl MySQL server.
+"""
+import os
+import random
+import time
+
+from collections import namedtuple
+
+import ensimpl.utils as utils
+import ensimpl.create.ensimpl_db as ensimpl_db
+
+from ensimpl.create.create_ensimpl import EnsemblReference
+
+LOG = utils.get_logger()
+
+SYNTHETIC_RELEASE = '999'
+
+CHUNK_SIZE = 10000
+
+SPECIES = {
+    'Mm': {
+        'name': 'Mus Musculus',
+        'assembly': 'GRCm38',
+        'prefix': 'ENSMUS',
+        'homolog_prefix': 'ENS',
+        'num_genes': 55000,
+        'id_db': 'MGI',
+        'chromosomes': [
+            ('1', 195471971), ('2', 182113224), ('3', 160039680),
+            ('4', 156508116), ('5', 151834684), ('6', 149736546),
+            ('7', 145441459), ('8', 129401213), ('9', 124595110),
+            ('10', 130694993), ('11', 122082543), ('12', 120129022),
+            ('13', 120421639), ('14', 124902244), ('15', 104043685),
+            ('16', 98207768), ('17', 94987271), ('18', 90702639),
+            ('19', 61431566), ('X', 171031299), ('Y', 91744698),
+            ('MT', 16299)
+        ]
+    },
+    'Hs': {
+        'name': 'Homo Sapiens',
+        'assembly': 'GRCh38',
+        'prefix': 'ENS',
+        'homolog_prefix': 'ENSMUS',
+        'num_genes': 60000,
+        'id_db': 'HGNC',
+        'chromosomes': [
+            ('1', 248956422), ('2', 242193529), ('3', 198295559),
+            ('4', 190214555), ('5', 181538259), ('6', 170805979),
+            ('7', 159345973), ('8', 145138636), ('9', 138394717),
+            ('10', 133797422), ('11', 135086622), ('12', 133275309),
+            ('13', 114364328), ('14', 107043718), ('15', 101991189),
+            ('16', 90338345), ('17', 83257441), ('18', 80373285),
+            ('19', 58617616), ('20', 64444167), ('21', 46709983),
+            ('22', 50818468), ('X', 156040895), ('Y', 57227415),
+            ('MT', 16569)
+        ]
+    }
+}
+
+SYMBOL_STEMS = ['Abc', 'Adam', 'Akr', 'Ank', 'Arhgap', 'Atp', 'Cacn', 'Ccdc',
+                'Cd', 'Cdh', 'Cyp', 'Dnah', 'Fam', 'Fbxo', 'Gpr', 'Gm',
+                'Hox', 'Kcn', 'Klf', 'Krt', 'Lrrc', 'Mir', 'Myo', 'Olfr',
+                'Pcdh', 'Ppp', 'Rab', 'Rps', 'Slc', 'Snord', 'Tmem', 'Trim',
+                'Ugt', 'Vmn', 'Wdr', 'Zfp']
+
+STAINS = ['gneg', 'gpos25', 'gpos50', 'gpos75', 'gpos100', 'acen']
+
+SyntheticSpec = namedtuple('SyntheticSpec', [
+    'num_genes', 'transcripts_per_gene', 'exons_per_transcript',
+    'synonyms_per_gene', 'external_ids_per_gene', 'homologs_per_gene',
+    'coding_fraction'
+])
+
+
+def get_spec(species='Mm', scale=1.0, num_genes=None,
+             transcripts_per_gene=2.6, exons_per_transcript=7.0,
+             synonyms_per_gene=1.2, external_ids_per_gene=3.0,
+             homologs_per_gene=0.8, coding_fraction=0.6):
+    """Get the generation parameters.
+
+    All ``*_per_*`` values are means; the actual counts are drawn from a
+    skewed distribution so a few genes have many transcripts, exons, etc.
+
+    Args:
+        species (str, optional): 'Mm' or 'Hs'.
+        scale (float, optional): Genome scale, 1.0 is the size of the real
+            genome annotation.
+        num_genes (int, optional): Number of genes, overrides `scale`.
+        transcripts_per_gene (float, optional): Mean transcripts per gene.
+        exons_per_transcript (float, optional): Mean exons per transcript.
+        synonyms_per_gene (float, optional): Mean synonyms per gene.
+        external_ids_per_gene (float, optional): Mean external ids per gene.
+        homologs_per_gene (float, optional): Mean homologs per gene.
+        coding_fraction (float, optional): Fraction of transcripts with a
+            protein.
+
+    Returns:
+        SyntheticSpec: The generation parameters.
+    """
+    if not num_genes:
+        num_genes = int(SPECIES[species]['num_genes'] * scale)
+
+    return SyntheticSpec(num_genes, transcripts_per_gene, exons_per_transcript,
+                         synonyms_per_gene, external_ids_per_gene,
+                         homologs_per_gene, coding_fraction)
+
+
+def get_reference(release=SYNTHETIC_RELEASE, species='Mm'):
+    """Get an :obj:`EnsemblReference` describing the synthetic release.
+
+    Args:
+        release (str, optional): The release number to use.
+        species (str, optional): 'Mm' or 'Hs'.
+
+    Returns:
+        :obj:`ensimpl.create.create_ensimpl.EnsemblReference`: The reference.
+    """
+    info = SPECIES[species]
+
+    return EnsemblReference(str(release), time.strftime('%Y-%b'),
+                            info['assembly'], f'{info["assembly"]}.synthetic',
+                            species, info['name'], '', 'synthetic',
+                            'synthetic', None, None, None, None)
+
+
+def _count(rnd, mean, minimum=0):
+    """Draw a count from a geometric-like distribution with `mean`."""
+    if mean <= minimum:
+        return minimum
+    return minimum + int(rnd.expovariate(1.0 / (mean - minimum)))
+
+
+def _symbol(rnd, species, number):
+    """Create a gene symbol, sharing stems so prefix searches have hits."""
+    stem = SYMBOL_STEMS[number % len(SYMBOL_STEMS)]
+    symbol = f'{stem}{rnd.randint(1, 999)}{chr(97 + number % 26)}{number}'
+    return symbol.upper() if species == 'Hs' else symbol
+
+
+def generate_chromosomes(species, rnd):
+    """Generate chromosomes and karyotype bands.
+
+    Args:
+        species (str): 'Mm' or 'Hs'.
+        rnd (random.Random): The random generator.
+
+    Returns:
+        list: A ``list`` of ``dicts`` like
+            :func:`ensimpl.create.ensembl_db.extract_chromosomes_karyotypes`.
+    """
+    chromosomes = []
+
+    for name, length in SPECIES[species]['chromosomes']:
+        start = 1
+        band = 1
+
+        while start < length:
+            end = min(length, start + rnd.randint(2000000, 8000000))
+            chromosomes.append({'name': name,
+                                'length': length,
+                                'seq_region_start': start,
+                                'seq_region_end': end,
+                                'band': f'{chr(64 + min(band, 26))}{band}',
+                                'stain': rnd.choice(STAINS)})
+            start = end + 1
+            band += 1
+
+    return chromosomes
+
+
+def generate_chunk(spec, ref, rnd, first, last, counters):
+    """Generate the genes numbered [`first`, `last`).
+
+    Args:
+        spec (SyntheticSpec): The generation parameters.
+        ref (:obj:`ensimpl.create.create_ensimpl.EnsemblReference`): The
+            synthetic reference.
+        rnd (random.Random): The random generator.
+        first (int): The first gene number.
+        last (int): One past the last gene number.
+        counters (dict): Running transcript, protein, exon and xref counters.
+
+    Returns:
+        tuple: (genes, synonyms, gtpe, homologs) in the same shapes as returned
+            by the :mod:`ensimpl.create.ensembl_db` extract functions.
+    """
+    info = SPECIES[ref.species_id]
+    prefix = info['prefix']
+    chroms = info['chromosomes']
+    weights = [length for _, length in chroms]
+
+    if ref.species_id.lower() == 'hs':
+        own, other = 'hs', 'mm'
+    else:
+        own, other = 'mm', 'hs'
+
+    genes = {}
+    synonyms = {}
+    gtpe = []
+    homologs = {}
+
+    for number in range(first, last):
+        gene_id = f'{prefix}G{number + 1:011d}'
+        symbol = _symbol(rnd, ref.species_id, number)
+        chrom, chrom_length = rnd.choices(chroms, weights)[0]
+
+        # gene lengths are roughly log-normal with a median of ~20kb
+        gene_length = min(int(rnd.lognormvariate(10, 1.4)) + 200,
+                          chrom_length // 2)
+        gene_start = rnd.randint(1, chrom_length - gene_length)
+        gene_end = gene_start + gene_length
+        strand = rnd.choice([1, -1])
+        version = rnd.randint(1, 20)
+
+        ids = []
+        num_ext = _count(rnd, spec.external_ids_per_gene, 1)
+        dbs = [info['id_db'], 'EntrezGene', 'Uniprot_gn']
+
+        for i in range(num_ext):
+            counters['xref'] += 1
+            db_name = dbs[i % len(dbs)]
+            if db_name in ('MGI', 'HGNC'):
+                external_id = f'{db_name}:{counters["xref"]}'
+            elif db_name == 'EntrezGene':
+                external_id = str(100000 + counters['xref'])
+            else:
+                external_id = f'Q{counters["xref"]:05d}'
+
+            ids.append({'xref_id': counters['xref'],
+                        'external_id': external_id,
+                        'db_name': db_name})
+
+            if i == 0:
+                num_syn = _count(rnd, spec.synonyms_per_gene)
+                if num_syn:
+                    synonyms[counters['xref']] = [
+                        f'{symbol[:4]}{rnd.randint(1, 99999)}'
+                        for _ in range(num_syn)
+                    ]
+
+        genes[gene_id] = {'ensembl_id': gene_id,
+                          'ensembl_id_version': version,
+                          'seq_id': chrom,
+                          'seq_region_start': gene_start,
+                          'seq_region_end': gene_end,
+                          'seq_region_strand': strand,
+                          'symbol': symbol,
+                          'description': f'{symbol} synthetic gene '
+                                         f'{rnd.choice(SYMBOL_STEMS)} family',
+                          'ids': ids}
+
+        # shared pool of exons, each transcript uses an ordered subset
+        num_exons = _count(rnd, spec.exons_per_transcript * 1.3, 1)
+        exon_pool = []
+        step = max(gene_length // num_exons, 2)
+
+        for i in range(num_exons):
+            counters['exon'] += 1
+            exon_start = gene_start + i * step
+            exon_pool.append((f'{prefix}E{counters["exon"]:011d}',
+                              rnd.randint(1, 10),
+                              exon_start,
+                              min(exon_start + rnd.randint(50, 400),
+                                  gene_end)))
+
+        for t in range(_count(rnd, spec.transcripts_per_gene, 1)):
+            counters['transcript'] += 1
+            transcript_id = f'{prefix}T{counters["transcript"]:011d}'
+            transcript_version = rnd.randint(1, 10)
+
+            num = min(len(exon_pool),
+                      _count(rnd, spec.exons_per_transcript, 1))
+            exons = sorted(rnd.sample(exon_pool, num), key=lambda e: e[2])
+
+            protein_id = None
+            protein_version = None
+            if rnd.random() < spec.coding_fraction:
+                counters['protein'] += 1
+                protein_id = f'{prefix}P{counters["protein"]:011d}'
+                protein_version = rnd.randint(1, 10)
+
+            for rank, exon in enumerate(exons, 1):
+                gtpe.append({'gene_id': gene_id,
+                             'gene_version': version,
+                             'gene_name': symbol,
+                             'gene_chrom': chrom,
+                             'gene_start': gene_start,
+                             'gene_end': gene_end,
+                             'gene_strand': strand,
+                             'transcript_id': transcript_id,
+                             'transcript_version': transcript_version,
+                             'transcript_name': f'{symbol}-{201 + t}',
+                             'transcript_start': exons[0][2],
+                             'transcript_end': exons[-1][3],
+                             'protein_id': protein_id,
+                             'protein_version': protein_version,
+                             'exon_id': exon[0],
+                             'exon_version': exon[1],
+                             'exon_start': exon[2],
+                             'exon_end': exon[3],
+                             'exon_number': rank})
+
+        num_hom = _count(rnd, spec.homologs_per_gene)
+        if num_hom:
+            homologs[gene_id] = []
+
+        for h in range(num_hom):
+            other_number = rnd.randint(1, spec.num_genes * 2)
+            homologs[gene_id].append({
+                'homology_id': number * 10 + h,
+                'description': 'ortholog_one2one' if num_hom == 1
+                               else 'ortholog_one2many',
+                'dn': None,
+                'ds': None,
+                'goc_score': rnd.choice([0, 25, 50, 75, 100]),
+                'wga_coverage': round(rnd.uniform(0, 100), 2),
+                'is_high_confidence': rnd.choice([0, 1]),
+                f'{own}_id': gene_id,
+                f'{own}_version': version,
+                f'{own}_symbol': symbol,
+                f'{own}_perc_cov': round(rnd.uniform(30, 100), 2),
+                f'{own}_perc_id': round(rnd.uniform(30, 100), 2),
+                f'{own}_perc_pos': round(rnd.uniform(30, 100), 2),
+                f'{other}_id': f'{info["homolog_prefix"]}G{other_number:011d}',
+                f'{other}_version': rnd.randint(1, 20),
+                f'{other}_symbol': symbol.upper() if other == 'hs'
+                                   else symbol.capitalize(),
+                f'{other}_perc_cov': round(rnd.uniform(30, 100), 2),
+                f'{other}_perc_id': round(rnd.uniform(30, 100), 2),
+                f'{other}_perc_pos': round(rnd.uniform(30, 100), 2),
+            })
+
+    return genes, synonyms, gtpe, homologs
+
+
+def generate(directory, release=SYNTHETIC_RELEASE, species='Mm', spec=None,
+             seed=1):
+    """Generate a synthetic ensimpl database.  Output database name will be:
+
+    "ensimpl. ``release`` . ``species`` .db3"
+
+    Genes are generated and inserted in chunks of :data:`CHUNK_SIZE` so memory
+    use does not grow with the size of the genome being simulated.
+
+    Args:
+        directory (str): Output directory.
+        release (str, optional): The release number to use.
+        species (str, optional): 'Mm' or 'Hs'.
+        spec (SyntheticSpec, optional): Generation parameters, ``None`` for
+            the defaults at 1x scale.
+        seed (int, optional): The random seed.
+
+    Returns:
+        str: The database file name.
+    """
+    start = time.time()
+    spec = spec or get_spec(species)
+    ref = get_reference(release, species)
+    rnd = random.Random(seed)
+
+    ensimpl_file = os.path.join(directory, f'ensimpl.{release}.{species}.db3')
+    utils.delete_file(ensimpl_file)
+
+    LOG.info(f'Generating synthetic database: {ensimpl_file}')
+    LOG.info(f'Parameters: {dict(spec._asdict())}')
+
+    ensimpl_db.initialize(ensimpl_file)
+
+    ensimpl_db.insert_chromosomes_karyotypes(ensimpl_file, ref,
+                                             generate_chromosomes(species, rnd))
+
+    counters = {'transcript': 0, 'protein': 0, 'exon': 0, 'xref': 0}
+
+    for first in range(0, spec.num_genes, CHUNK_SIZE):
+        last = min(first + CHUNK_SIZE, spec.num_genes)
+        LOG.info(f'Generating genes {first:,} to {last:,}...')
+
+        genes, synonyms, gtpe, homologs = \
+            generate_chunk(spec, ref, rnd, first, last, counters)
+
+        ensimpl_db.insert_genes(ensimpl_file, ref, genes, synonyms, homologs)
+        ensimpl_db.insert_gtpe(ensimpl_file, ref, gtpe)
+        ensimpl_db.insert_homologs(ensimpl_file, ref, homologs)
+
+    ensimpl_db.finalize(ensimpl_file, ref)
+
+    LOG.info('Synthetic database generated in: '
+             f'{utils.format_time(start, time.time())}')
+
+    return ensimpl_file
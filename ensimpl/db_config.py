@@ -1,18 +1,26 @@
 # -*- coding: utf-8 -*-
 import glob
 import os
+import sqlite3
 import sys
 
 from ensimpl.utils import multikeysort
 
 ENSIMPL_DB_NAME = 'ensimpl.*.db3'
 
+ENSIMPL_DIFF_NAME = 'ensimpl.*.*.*.diff'
+
+ENSIMPL_STORE_NAME = 'ensimpl.*.store'
+
 ENSIMPL_DBS = None
 '''`list` of all the databases.'''
 
 ENSIMPL_DBS_DICT = None
 '''`dict` of all the databases.'''
 
+ENSIMPL_DIFFS_DICT = None
+'''`dict` of all the release diffs, see :mod:`ensimpl.create.diff`.'''
+
 
 def get_ensimpl_db(release, species):
     """Get the database based upon the `version` and `species` values which
@@ -23,13 +31,15 @@ def get_ensimpl_db(release, species):
         species (str): The short identifier of a species.
 
     Returns:
-        str: The database file.
+        dict: With the ``release``, ``species`` and ``db`` file, and
+            ``store`` set to ``True`` when the release is served from a
+            consolidated store, see :mod:`ensimpl.create.store`.
 
     Raises:
         ValueError: If unable to find the `version` and `species` combination.
 
     Examples:
-            >>> get_ensimpl_db(91, 'Mm')
+            >>> get_ensimpl_db(91, 'Mm')['db']
             'ensimpl.91.Mm.db3'
     """
     try:
@@ -39,9 +49,55 @@ def get_ensimpl_db(release, species):
         raise ValueError(error)
 
 
+def get_ensimpl_diff(release_from, release_to, species):
+    """Get the diff of releases `release_from` and `release_to`.
+
+    Args:
+        release_from (str): The older Ensembl version.
+        release_to (str): The newer Ensembl version.
+        species (str): The short identifier of a species.
+
+    Returns:
+        dict: With the ``release_from``, ``release_to``, ``species`` and
+            ``diff`` file.
+
+    Raises:
+        ValueError: If there is no diff of the releases.
+    """
+    try:
+        return ENSIMPL_DIFFS_DICT[f'{release_from}:{release_to}:{species}']
+    except (KeyError, TypeError):
+        error = (f'Unable to find a diff of release "{release_from}" to '
+                 f'"{release_to}" and species "{species}"')
+        raise ValueError(error)
+
+
+def get_store_releases(store):
+    """Get the releases in a consolidated store.
+
+    Args:
+        store (str): The store file.
+
+    Returns:
+        list: The releases, an empty ``list`` if `store` is not a store.
+    """
+    conn = sqlite3.connect(store)
+
+    try:
+        return [row[0] for row in conn.execute('SELECT release FROM releases')]
+    except sqlite3.DatabaseError:
+        return []
+    finally:
+        conn.close()
+
+
 def get_all_ensimpl_dbs(directory):
     """Configure the list of ensimpl db files in `directory`.  This will set
-    values for :data:`ENSIMPL_DBS` and :data:`ENSIMPL_DBS_DICT`.
+    values for :data:`ENSIMPL_DBS`, :data:`ENSIMPL_DBS_DICT` and
+    :data:`ENSIMPL_DIFFS_DICT`.
+
+    The releases in a store that have no database file of their own are
+    served from the store.
 
     Args:
         directory (str): The directory path.
@@ -65,14 +121,48 @@ def get_all_ensimpl_dbs(directory):
         combined_key = f'{val["release"]}:{val["species"]}'
         db_dict[combined_key] = val
 
+    # stores are named 'ensimpl', species, 'store'
+    for store in glob.glob(os.path.join(directory, ENSIMPL_STORE_NAME)):
+        species = os.path.basename(store).split('.')[1]
+
+        for release in get_store_releases(store):
+            combined_key = f'{release}:{species}'
+
+            if combined_key in db_dict:
+                continue
+
+            val = {
+                'release': release,
+                'species': species,
+                'db': store,
+                'store': True
+            }
+            db_list.append(val)
+            db_dict[combined_key] = val
+
     # sort the databases in descending order by version and than species for
     # readability in the API
     all_sorted_dbs = multikeysort(db_list, ['-release', 'species'])
 
+    # diffs are named 'ensimpl', from version, to version, species, 'diff'
+    diff_dict = {}
+
+    for diff in glob.glob(os.path.join(directory, ENSIMPL_DIFF_NAME)):
+        parts = os.path.basename(diff).split('.')
+        val = {
+            'release_from': int(parts[1]),
+            'release_to': int(parts[2]),
+            'species': parts[3],
+            'diff': diff
+        }
+        diff_dict[f'{parts[1]}:{parts[2]}:{parts[3]}'] = val
+
     global ENSIMPL_DBS
     ENSIMPL_DBS = all_sorted_dbs
     global ENSIMPL_DBS_DICT
     ENSIMPL_DBS_DICT = db_dict
+    global ENSIMPL_DIFFS_DICT
+    ENSIMPL_DIFFS_DICT = diff_dict
 
 
 def init(directory=None):
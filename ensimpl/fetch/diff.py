@@ -0,0 +1,133 @@
+# -*- coding: utf_8 -*-
+"""Read the precomputed release diffs created by :mod:`ensimpl.create.diff`.
+
+Changes are returned a page at a time, ordered by when they were found,
+and the next page starts after the ``next`` key of the previous one.
+"""
+from collections import OrderedDict
+
+import sqlite3
+
+import ensimpl.db_config as db_config
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+DEFAULT_LIMIT = 1000
+
+MAX_LIMIT = 10000
+
+CHANGES = ['added', 'removed', 'version', 'moved', 'renamed']
+
+TYPES = {'gene': 'EG', 'transcript': 'ET'}
+
+SQL_SELECT_CHANGES = '''
+SELECT change_key, ensembl_id, type_key, gene_id, change,
+       old_value, new_value
+  FROM changes
+ WHERE change_key > :after
+'''
+
+SQL_SELECT_META = '''
+SELECT meta_key, meta_value
+  FROM meta_info
+'''
+
+
+def get_diff(release_from, release_to, species=None, change=None,
+             change_type=None, after=None, limit=DEFAULT_LIMIT):
+    """Get a page of the changes between two releases.
+
+    Args:
+        release_from (str): The older Ensembl release.
+        release_to (str): The newer Ensembl release.
+        species (str): The Ensembl species identifier, ``None`` for 'Mm'.
+        change (str, optional): Only this kind of change: 'added',
+            'removed', 'version', 'moved' or 'renamed'.
+        change_type (str, optional): Only 'gene' or 'transcript' changes.
+        after (int, optional): The ``next`` key of the previous page.
+        limit (int, optional): The maximum number of changes, at least 1 and
+            at most :data:`MAX_LIMIT`.
+
+    Returns:
+        collections.OrderedDict: With ``num_results``, the number of changes
+            matching, ``changes``, a ``list`` of ``dicts``, and ``next``, the
+            key to get the following page with or ``None`` on the last page.
+
+    Raises:
+        ValueError: If the diff does not exist or a parameter is invalid.
+    """
+    species = 'Mm' if species is None else species
+    diff_file = db_config.get_ensimpl_diff(release_from, release_to,
+                                           species)['diff']
+
+    if change and change not in CHANGES:
+        raise ValueError(f'Invalid change: {change}')
+
+    type_key = None
+    if change_type:
+        try:
+            type_key = TYPES[change_type]
+        except KeyError:
+            raise ValueError(f'Invalid type: {change_type}')
+
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError(f'Invalid limit: {limit}')
+
+    limit = min(limit, MAX_LIMIT)
+
+    sql = SQL_SELECT_CHANGES
+    params = {'after': int(after or 0), 'limit': limit}
+
+    if change:
+        sql += '   AND change = :change\n'
+        params['change'] = change
+
+    if type_key:
+        sql += '   AND type_key = :type_key\n'
+        params['type_key'] = type_key
+
+    sql += ' ORDER BY change_key\n LIMIT :limit'
+
+    # read only, connecting would create an empty file at a stale path
+    try:
+        conn = sqlite3.connect(f'file:{diff_file}?mode=ro', uri=True)
+    except sqlite3.OperationalError:
+        raise ValueError(f'Unable to open the diff of release '
+                         f'"{release_from}" to "{release_to}" and species '
+                         f'"{species}"')
+
+    try:
+        counts = {}
+
+        for meta_key, meta_value in conn.execute(SQL_SELECT_META):
+            if ':' in meta_key:
+                counts[tuple(meta_key.split(':'))] = int(meta_value)
+
+        num_results = sum(count for (t, c), count in counts.items()
+                          if (not type_key or t == type_key) and
+                          (not change or c == change))
+
+        changes = []
+        next_key = None
+
+        for row in conn.execute(sql, params):
+            next_key = row[0]
+            changes.append(OrderedDict([
+                ('ensembl_id', row[1]),
+                ('type', 'gene' if row[2] == 'EG' else 'transcript'),
+                ('gene_id', row[3]),
+                ('change', row[4]),
+                ('old_value', row[5]),
+                ('new_value', row[6]),
+            ]))
+    finally:
+        conn.close()
+
+    if len(changes) < limit:
+        next_key = None
+
+    return OrderedDict([('num_results', num_results),
+                        ('changes', changes),
+                        ('next', next_key)])
@@ -0,0 +1,268 @@
+# -*- coding: utf_8 -*-
+"""Export ensimpl tables to columnar Parquet or Arrow IPC files.
+
+Requires ``pyarrow`` which is an optional dependency::
+
+    pip install ensimpl[export]
+
+Rows are read from SQLite in batches of ``row_group_size`` and written as
+one row group (record batch) at a time, so memory does not depend on the
+size of the table.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+import time
+
+import ensimpl.db_config as db_config
+import ensimpl.utils as utils
+import ensimpl.fetch.utils as fetch_utils
+
+LOG = utils.get_logger()
+
+DEFAULT_ROW_GROUP_SIZE = 100000
+
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+'''File extension by format.'''
+
+TABLES = OrderedDict([
+    ('ensembl_genes', 'chromosome = :chromosome'),
+    ('ensembl_gtpe', 'seqid = :chromosome'),
+    ('ensembl_gene_ids', 'ensembl_id IN (SELECT ensembl_id '
+                         'FROM ensembl_genes WHERE chromosome = :chromosome)'),
+    ('ensembl_homologs', 'ensembl_id IN (SELECT ensembl_id '
+                         'FROM ensembl_genes WHERE chromosome = :chromosome)'),
+])
+'''The tables that can be exported with the filter used to split a table by
+chromosome.'''
+
+SQLITE_TYPES = {
+    'INTEGER': 'int64',
+    'REAL': 'float64',
+    'TEXT': 'string',
+}
+
+
+def _import_pyarrow():
+    """Import pyarrow.
+
+    Returns:
+        module: ``pyarrow``
+
+    Raises:
+        ImportError: With instructions if pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is needed to export, install it with: '
+                          'pip install ensimpl[export]')
+
+
+def get_schema(conn, table):
+    """Get the Arrow schema of `table` from the SQLite declared types.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        table (str): The table name.
+
+    Returns:
+        pyarrow.Schema: The schema.
+    """
+    pa = _import_pyarrow()
+    fields = []
+
+    for row in conn.execute(f'PRAGMA table_info({table})'):
+        arrow_type = SQLITE_TYPES.get(row[2].upper(), 'string')
+        fields.append(pa.field(row[1], getattr(pa, arrow_type)()))
+
+    return pa.schema(fields)
+
+
+def get_chromosomes(release=None, species=None):
+    """Get the chromosomes that have genes.
+
+    Args:
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        list: The chromosome names.
+    """
+    conn = fetch_utils.connect_to_database(release, species)
+    chromosomes = [row[0] for row in conn.execute(
+        'SELECT DISTINCT chromosome FROM ensembl_genes ORDER BY chromosome')]
+    conn.close()
+
+    return chromosomes
+
+
+def get_file_name(directory, release, species, table, file_format,
+                  chromosome=None):
+    """Get the name of an export file.
+
+    Args:
+        directory (str): The output directory.
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        table (str): The table name.
+        file_format (str): 'parquet' or 'arrow'.
+        chromosome (str, optional): The chromosome.
+
+    Returns:
+        str: Such as ``ensimpl.96.Mm.ensembl_genes.chr1.parquet``.
+    """
+    parts = ['ensimpl', str(release), species, table]
+
+    if chromosome is not None:
+        parts.append(f'chr{chromosome}')
+
+    parts.append(FORMATS[file_format])
+
+    return os.path.join(directory, '.'.join(parts))
+
+
+def export_table(file_name, table, release=None, species=None,
+                 file_format='parquet', chromosome=None,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Export one table (or the rows of one chromosome) to `file_name`.
+
+    The file is written under a temporary name and renamed when complete.
+
+    Args:
+        file_name (str): The output file.
+        table (str): The table, see :data:`TABLES`.
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+        file_format (str, optional): 'parquet' or 'arrow'.
+        chromosome (str, optional): Only export rows of this chromosome.
+        row_group_size (int, optional): Rows per row group.
+
+    Returns:
+        int: The number of rows written.
+    """
+    pa = _import_pyarrow()
+
+    if table not in TABLES:
+        raise ValueError(f'Unknown table: {table}')
+
+    conn = fetch_utils.connect_to_database(release, species)
+    schema = get_schema(conn, table)
+
+    sql = f'SELECT * FROM {table}'
+    params = {}
+
+    if chromosome is not None:
+        sql = f'{sql} WHERE {TABLES[table]}'
+        params['chromosome'] = chromosome
+
+    # the first column is the key, views of a store have no rowid
+    sql = f'{sql} ORDER BY 1'
+
+    tmp_file_name = f'{file_name}.tmp'
+
+    if file_format == 'parquet':
+        writer = pa.parquet.ParquetWriter(tmp_file_name, schema)
+    else:
+        writer = pa.ipc.new_file(tmp_file_name, schema)
+
+    num_rows = 0
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+
+        while True:
+            rows = cursor.fetchmany(row_group_size)
+
+            if not rows:
+                break
+
+            columns = [pa.array([row[i] for row in rows], type=field.type)
+                       for i, field in enumerate(schema)]
+            batch = pa.RecordBatch.from_arrays(columns, schema=schema)
+
+            if file_format == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+
+            num_rows += len(rows)
+
+        cursor.close()
+    except Exception:
+        writer.close()
+        utils.delete_file(tmp_file_name)
+        raise
+    finally:
+        conn.close()
+
+    writer.close()
+    os.replace(tmp_file_name, file_name)
+
+    return num_rows
+
+
+def export(directory, release=None, species=None, tables=None,
+           file_format='parquet', by_chromosome=False,
+           row_group_size=DEFAULT_ROW_GROUP_SIZE, workers=1):
+    """Export tables of an ensimpl database.
+
+    Args:
+        directory (str): The output directory.
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+        tables (list, optional): Tables to export, ``None`` for all of
+            :data:`TABLES`.
+        file_format (str, optional): 'parquet' or 'arrow'.
+        by_chromosome (bool, optional): ``True`` to write one file per table
+            and chromosome.
+        row_group_size (int, optional): Rows per row group.
+        workers (int, optional): Number of files written in parallel.
+
+    Returns:
+        collections.OrderedDict: Number of rows by file name.
+    """
+    _import_pyarrow()
+
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown format: {file_format}')
+
+    species = 'Mm' if species is None else species
+    if release is None:
+        release = max(db['release'] for db in db_config.ENSIMPL_DBS)
+
+    tables = tables or list(TABLES)
+    chromosomes = [None]
+
+    if by_chromosome:
+        chromosomes = get_chromosomes(release, species)
+
+    tasks = []
+
+    for table in tables:
+        for chromosome in chromosomes:
+            file_name = get_file_name(directory, release, species, table,
+                                      file_format, chromosome)
+            tasks.append((file_name, table, chromosome))
+
+    LOG.info(f'Exporting {len(tasks):,} files to {directory}')
+    start = time.time()
+
+    def run(task):
+        file_name, table, chromosome = task
+        num_rows = export_table(file_name, table, release, species,
+                                file_format, chromosome, row_group_size)
+        LOG.debug(f'{file_name}: {num_rows:,} rows')
+        return num_rows
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        counts = list(executor.map(run, tasks))
+
+    LOG.info(f'Export done in {utils.format_time(start, time.time())}')
+
+    return OrderedDict((task[0], count) for task, count in zip(tasks, counts))
@@ -0,0 +1,123 @@
+# -*- coding: utf_8 -*-
+import sqlite3
+
+import ensimpl.utils as utils
+import ensimpl.fetch.timing as timing
+import ensimpl.fetch.utils as fetch_utils
+
+LOG = utils.get_logger()
+
+FEATURE_TYPES = ['EG', 'ET', 'EE', 'EP']
+'''The ``ensembl_gtpe`` type keys: gene, transcript, exon and protein.'''
+
+SQL_FEATURES = '''
+SELECT f.*
+  FROM chromosomes c,
+       ensembl_gtpe_rtree r,
+       ensembl_gtpe f
+ WHERE c.chromosome = ?
+   AND r.chromosome_min <= c.chromosome_num
+   AND r.chromosome_max >= c.chromosome_num
+   AND r.start <= ?
+   AND r.end >= ?
+   AND f.gtpe_key = r.gtpe_key
+   AND f.type_key IN ({})
+ ORDER BY f.start, f.end, f.gtpe_key
+'''
+
+SQL_FEATURES_LEGACY = '''
+SELECT f.*
+  FROM ensembl_gtpe f
+ WHERE f.seqid = ?
+   AND f.start <= ?
+   AND f.end >= ?
+   AND f.type_key IN ({})
+ ORDER BY f.start, f.end, f.gtpe_key
+'''
+'''Databases built before ``ensembl_gtpe_rtree`` only have the index on the
+position, which narrows the scan on the start of the region alone.'''
+
+
+def get_features(region, release=None, species=None, feature_types=None,
+                 limit=None):
+    """Get the genes, transcripts, exons and proteins overlapping a region.
+
+    Args:
+        region: The region, a :class:`ensimpl.fetch.utils.Region` or a
+            ``str`` such as '1:10000000-12000000'.
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+        feature_types (list, optional): The types to get, some of
+            :data:`FEATURE_TYPES`, ``None`` for all.
+        limit (int, optional): Maximum number to return, ``None`` for all.
+
+    Returns:
+        list: A ``list`` of ``dicts`` ordered by position with the following
+            keys:
+            * id
+            * version
+            * type
+            * gene_id
+            * transcript_id
+            * symbol
+            * chromosome
+            * start
+            * end
+            * strand
+            * exon_number
+
+    Raises:
+        ValueError: When `region` or `feature_types` are invalid.
+    """
+    if not isinstance(region, fetch_utils.Region):
+        region = fetch_utils.str_to_region(region)
+
+    feature_types = feature_types or FEATURE_TYPES
+
+    for feature_type in feature_types:
+        if feature_type not in FEATURE_TYPES:
+            raise ValueError(f'Invalid feature type: {feature_type}')
+
+    LOG.debug(f'region={region}, feature_types={feature_types}')
+
+    conn = fetch_utils.connect_to_database(release, species)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    if fetch_utils.has_spatial_index(conn, release, species):
+        sql = SQL_FEATURES
+    else:
+        sql = SQL_FEATURES_LEGACY
+
+    sql = sql.format(','.join('?' * len(feature_types)))
+
+    if limit:
+        sql = f'{sql} LIMIT {int(limit)}'
+
+    params = [region.chromosome, region.end_position,
+              region.start_position] + list(feature_types)
+
+    features = []
+
+    with timing.stage('features_sql'):
+        cursor.execute(sql, params)
+
+    for row in timing.rows('features_rows', cursor):
+        features.append({
+            'id': row['ensembl_id'],
+            'version': row['ensembl_id_version'],
+            'type': row['type_key'],
+            'gene_id': row['gene_id'],
+            'transcript_id': row['transcript_id'],
+            'symbol': row['ensembl_symbol'],
+            'chromosome': row['seqid'],
+            'start': row['start'],
+            'end': row['end'],
+            'strand': '+' if row['strand'] > 0 else '-',
+            'exon_number': row['exon_number']
+        })
+
+    cursor.close()
+    conn.close()
+
+    return features
@@ -4,11 +4,15 @@ import sqlite3
 from collections import OrderedDict
 
 import ensimpl.fetch.get as fetch_get
+import ensimpl.fetch.timing as timing
 import ensimpl.fetch.utils as fetch_utils
 import ensimpl.utils as utils
 
 LOG = utils.get_logger()
 
+HOMOLOG_BATCH_SIZE = 1000
+'''Number of genes to get the homologs for at once in :func:`iter_genes`.'''
+
 EXTERNAL_DBS = [
     'Ensembl',
     'EntrezGene',
@@ -107,12 +111,12 @@ SELECT t.ensembl_id match_id,
 '''
 
 
-SQL_GENES_ORDER_BY_ID = ' ORDER BY g.ensembl_id'
+SQL_GENES_ORDER_BY_ID = ' ORDER BY g.ensembl_id, match_id'
 
 SQL_GENES_ORDER_BY_POSITION = '''
  ORDER BY cast(
        replace(replace(replace(g.chromosome,'X','50'),'Y','51'),'MT','51') 
-       AS int), g.start_position, g.end_position
+       AS int), g.start_position, g.end_position, g.ensembl_id, match_id
 '''
 
 SQL_HOMOLOGY = '''
@@ -152,45 +156,54 @@ SELECT eh.ensembl_id,
  ORDER BY eh.ensembl_id, eh.homolog_id
 '''
 
+# the matching ids are selected first so only their rows of
+# ensembl_gene_ids and ensembl_homologs are read, through the indices
 SQL_IDS_FILTERED = '''
+  WITH matches AS (
+       SELECT distinct ensembl_id, external_id match_id
+         FROM ensembl_gene_ids
+        WHERE external_id in ({})
+          AND external_db = "{}"
+       )
 SELECT all_ids.ensembl_id,
        all_ids.external_id,
        all_ids.external_db,
        matches.match_id
   FROM (SELECT ensembl_id, external_id, external_db
           FROM ensembl_gene_ids        
+         WHERE ensembl_id in (SELECT ensembl_id FROM matches)
          UNION        
         SELECT ensembl_id, homolog_id external_id, 'Ensembl_homolog' external_db
           FROM ensembl_homologs
+         WHERE ensembl_id in (SELECT ensembl_id FROM matches)
        ) all_ids,
-       (SELECT distinct ensembl_id, external_id match_id
-          FROM ensembl_gene_ids
-         WHERE external_id in ({})
-           AND external_db = "{}"
-       ) matches
+       matches
  WHERE matches.ensembl_id = all_ids.ensembl_id       
  ORDER BY all_ids.ensembl_id, all_ids.external_db, all_ids.external_id
 '''
 
 SQL_IDS_FILTERED_ENSEMBL = '''
+  WITH matches AS (
+       SELECT distinct ensembl_id, ensembl_id match_id
+         FROM ensembl_gene_ids
+        WHERE ensembl_id in ({})
+       )
 SELECT all_ids.ensembl_id,
        all_ids.external_id,
        all_ids.external_db,
        matches.match_id
   FROM (SELECT ensembl_id, external_id, external_db
           FROM ensembl_gene_ids        
+         WHERE ensembl_id in (SELECT ensembl_id FROM matches)
          UNION        
         SELECT ensembl_id, homolog_id external_id, 'Ensembl_homolog' external_db
           FROM ensembl_homologs
+         WHERE ensembl_id in (SELECT ensembl_id FROM matches)
        ) all_ids,
-       (SELECT distinct ensembl_id, ensembl_id match_id
-          FROM ensembl_gene_ids
-         WHERE ensembl_id in ({})
-       ) matches
+       matches
  WHERE matches.ensembl_id = all_ids.ensembl_id       
  ORDER BY all_ids.ensembl_id, all_ids.external_db, all_ids.external_id
 '''
-
 SQL_IDS_ALL = '''
 SELECT all_ids.ensembl_id,
        all_ids.external_id,
@@ -276,7 +289,10 @@ def get_ids(ids=None, release=None, species=None, source_db='Ensembl'):
         # execute the query
         #
 
-        for row in cursor.execute(sql_query, {}):
+        with timing.stage('ids_sql'):
+            cursor.execute(sql_query, {})
+
+        for row in timing.rows('ids_rows', cursor):
 
             match_id = row['match_id']
 
@@ -290,19 +306,23 @@ def get_ids(ids=None, release=None, species=None, source_db='Ensembl'):
 
             results[match_id] = match
 
+        cursor.close()
+        conn.close()
     except sqlite3.Error as e:
         raise Exception(e)
 
     return results
 
 
-def get_homology(ids=None, release=None, species=None):
+def get_homology(ids=None, release=None, species=None, conn=None):
     """Get homology information.
 
     Args:
         ids (list): A ``list`` of ``str`` which are Ensembl identifiers.
         release (str): The Ensembl release.
         species (str): The Ensembl species identifier.
+        conn (sqlite3.Connection, optional): A connection to reuse, it is
+            left open.
 
     Returns:
         list: A ``list`` of ``dicts`` representing homology data.
@@ -312,10 +332,14 @@ def get_homology(ids=None, release=None, species=None):
     """
     results = OrderedDict()
 
+    close = conn is None
+
     try:
-        conn = fetch_utils.connect_to_database(release, species)
-        conn.row_factory = sqlite3.Row
+        if close:
+            conn = fetch_utils.connect_to_database(release, species)
+
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
 
         #
         # build the query
@@ -336,7 +360,10 @@ def get_homology(ids=None, release=None, species=None):
         # execute the query
         #
 
-        for row in cursor.execute(sql_query, {}):
+        with timing.stage('homologs_sql'):
+            cursor.execute(sql_query, {})
+
+        for row in timing.rows('homologs_rows', cursor):
             gene_id = row['ensembl_id']
 
             gene = results.get(gene_id)
@@ -348,6 +375,10 @@ def get_homology(ids=None, release=None, species=None):
 
             results[gene_id] = gene
 
+        cursor.close()
+
+        if close:
+            conn.close()
     except sqlite3.Error as e:
         raise Exception(e)
 
@@ -408,7 +439,34 @@ def get(ids=None, release=None, species=None, order='id', details=False):
     Raises:
         Exception: When sqlite error or other error occurs.
     """
-    results = OrderedDict()
+    return OrderedDict(iter_genes(ids, release, species, order, details))
+
+
+def iter_genes(ids=None, release=None, species=None, order='id',
+               details=False):
+    """Generate the genes matching the ids one at a time, see :func:`get` for
+    the elements of each gene.
+
+    Rows are read from the cursor as they are needed, so only one gene (and
+    the homologs of :data:`HOMOLOG_BATCH_SIZE` genes when `details` is
+    ``True``) is held in memory at a time.
+
+    Args:
+        ids (list): A ``list`` of ``str`` which are Ensembl identifiers.
+        release (str): The Ensembl release or None for latest.
+        species (str): The Ensembl species identifier.
+        order (str): Order by 'id' or 'position'.
+        details (bool): True to retrieve all information including transcripts,
+            exons, proteins.  False will only retrieve the top level gene
+            information.
+
+    Yields:
+        tuple: (match id, gene ``dict``)
+
+    Raises:
+        Exception: When sqlite error or other error occurs.
+    """
+    conn = None
 
     try:
         conn = fetch_utils.connect_to_database(release, species)
@@ -434,11 +492,13 @@ def get(ids=None, release=None, species=None, order='id', details=False):
                         'ensembl_id TEXT, '
                         'PRIMARY KEY (ensembl_id) );')
 
-            cursor.execute(sql_temp)
+            with timing.stage('genes_temp_table') as stage:
+                cursor.execute(sql_temp)
 
-            sql_temp = f'INSERT INTO {temp_table} VALUES (?);'
-            _ids = [(_,) for _ in ids]
-            cursor.executemany(sql_temp, _ids)
+                sql_temp = f'INSERT OR IGNORE INTO {temp_table} VALUES (?);'
+                _ids = [(_,) for _ in ids]
+                cursor.executemany(sql_temp, _ids)
+                stage.rows = len(_ids)
 
             # make sure we add the temp table name to the query
             sql_query = sql_query.format(temp_table)
@@ -453,152 +513,207 @@ def get(ids=None, release=None, species=None, order='id', details=False):
         else:
             sql_query = f'{sql_query} {SQL_GENES_ORDER_BY_ID}'
 
-
         #
         # execute the query
         #
 
-        for row in cursor.execute(sql_query, {}):
-            gene_id = row['gene_id']
-            ensembl_id = row['ensembl_id']
-            match_id = row['match_id']
+        with timing.stage('genes_sql'):
+            cursor.execute(sql_query, {})
 
-            gene = results.get(match_id)
+        genes = _group_genes(timing.rows('genes_rows', cursor))
 
-            if not gene:
-                gene = {'id': gene_id, 'transcripts': {}}
-
-            if row['type_key'] == 'EG':
-                gene['species_id'] = row['gene_species_id']
-                gene['chromosome'] = row['gene_chromosome']
-                gene['start'] = row['gene_start']
-                gene['end'] = row['gene_end']
-                gene['strand'] = '+' if row['gene_strand'] > 0 else '-'
-
-                if row['gene_version']:
-                    gene['ensembl_version'] = row['gene_version']
-
-                if row['gene_symbol']:
-                    gene['symbol'] = row['gene_symbol']
-
-                if row['gene_name']:
-                    gene['name'] = row['gene_name']
-
-                if row['gene_synonyms']:
-                    row_synonyms = row['gene_synonyms']
-                    gene['synonyms'] = row_synonyms.split('||')
-
-                if row['gene_external_ids']:
-                    row_external_ids = row['gene_external_ids']
-                    external_ids = []
-                    if row_external_ids:
-                        tmp_external_ids = row_external_ids.split('||')
-                        for e in tmp_external_ids:
-                            elem = e.split('/')
-                            external_ids.append({'db': elem[0], 'db_id': elem[1]})
-                    gene['external_ids'] = external_ids
-
-                if row['homolog_ids']:
-                    row_homolog_ids = row['homolog_ids']
-                    homolog_ids = []
-                    if row_homolog_ids:
-                        tmp_homolog_ids = row_homolog_ids.split('||')
-                        for e in tmp_homolog_ids:
-                            elem = e.split('/')
-                            homolog_ids.append({'id': elem[0],
-                                                'symbol': elem[1]})
-                    gene['homolog_ids'] = homolog_ids
-
-            elif row['type_key'] == 'ET':
-                transcript_id = row['transcript_id']
-                transcript = {'id': transcript_id, 'exons': {}}
-
-                if row['ensembl_id_version']:
-                    transcript['version'] = row['ensembl_id_version']
-
-                if row['ensembl_symbol']:
-                    transcript['symbol'] = row['ensembl_symbol']
-
-                transcript['start'] = row['start']
-                transcript['end'] = row['end']
-
-                gene['transcripts'][transcript_id] = transcript
-
-            elif row['type_key'] == 'EE':
-                transcript_id = row['transcript_id']
-                transcript = gene['transcripts'].get(transcript_id,
-                                                     {'id': transcript_id,
-                                                      'exons': {}})
-
-                exon = {'id': ensembl_id,
-                        'start': row['start'],
-                        'end': row['end'],
-                        'number': row['exon_number']}
-
-                if row['ensembl_id_version']:
-                    exon['version'] = row['ensembl_id_version']
-
-                transcript['exons'][ensembl_id] = exon
-
-                gene['transcripts'][transcript_id] = transcript
-
-            elif row['type_key'] == 'EP':
-                transcript_id = row['transcript_id']
-                transcript = gene['transcripts'].get(transcript_id,
-                                                     {'id': transcript_id,
-                                                      'exons': {}})
-
-                transcript['protein'] = {'id': ensembl_id,
-                                         'start': row['start'],
-                                         'end': row['end']}
-
-                if row['ensembl_id_version']:
-                    transcript['protein']['version'] = row['ensembl_id_version']
-
-                gene['transcripts'][transcript_id] = transcript
-            else:
-                LOG.error('Unknown')
+        if details:
+            batch = []
 
-            results[match_id] = gene
+            for match_id, gene in genes:
+                batch.append((match_id, gene))
 
-        cursor.close()
+                if len(batch) >= HOMOLOG_BATCH_SIZE:
+                    yield from _assemble(batch, release, species, conn)
+                    batch = []
 
-        if details:
-            homologs = get_homology(ids, species, release)
-
-            # convert transcripts, etc to sorted list rather than dict
-            ret = OrderedDict()
-            for (gene_id, gene) in results.items():
-                if gene:
-                    t = []
-                    for (transcript_id, transcript) in gene['transcripts'].items():
-                        e = []
-                        for (exon_id, exon) in transcript['exons'].items():
-                            e.append(exon)
-                        transcript['exons'] = sorted(e, key=lambda ex: ex['number'])
-                        t.append(transcript)
-                    gene['transcripts'] = sorted(t, key=lambda tr: tr['start'])
-
-                gene['homologs'] = homologs.get(gene_id, None)
-
-                ret[gene_id] = gene
-            results = ret
+            yield from _assemble(batch, release, species, conn)
         else:
-            ret = OrderedDict()
-            for (gene_id, gene) in results.items():
-                if gene:
-                    del gene['transcripts']
-                ret[gene_id] = gene
-
-            results = ret
+            for match_id, gene in genes:
+                del gene['transcripts']
+                yield match_id, gene
 
         cursor.close()
-        conn.close()
 
     except sqlite3.Error as e:
         raise Exception(e)
+    finally:
+        if conn:
+            conn.close()
 
-    return results
+
+def _group_genes(rows):
+    """Build the genes from the rows of the genes query, which are ordered so
+    the rows of a match are next to each other.
+
+    Args:
+        rows: The rows of the query.
+
+    Yields:
+        tuple: (match id, gene ``dict``) with transcripts and exons in
+            ``dicts``.
+    """
+    gene = None
+    current_id = None
+
+    for row in rows:
+        match_id = row['match_id']
+
+        if match_id != current_id:
+            if gene is not None:
+                yield current_id, gene
+
+            current_id = match_id
+            gene = {'id': row['gene_id'], 'transcripts': {}}
+
+        _add_row(gene, row)
+
+    if gene is not None:
+        yield current_id, gene
+
+
+def _add_row(gene, row):
+    """Add a row of the genes query to `gene`.
+
+    Args:
+        gene (dict): The gene.
+        row (sqlite3.Row): The row.
+    """
+    ensembl_id = row['ensembl_id']
+
+    if row['type_key'] == 'EG':
+        gene['species_id'] = row['gene_species_id']
+        gene['chromosome'] = row['gene_chromosome']
+        gene['start'] = row['gene_start']
+        gene['end'] = row['gene_end']
+        gene['strand'] = '+' if row['gene_strand'] > 0 else '-'
+
+        if row['gene_version']:
+            gene['ensembl_version'] = row['gene_version']
+
+        if row['gene_symbol']:
+            gene['symbol'] = row['gene_symbol']
+
+        if row['gene_name']:
+            gene['name'] = row['gene_name']
+
+        if row['gene_synonyms']:
+            row_synonyms = row['gene_synonyms']
+            gene['synonyms'] = row_synonyms.split('||')
+
+        if row['gene_external_ids']:
+            row_external_ids = row['gene_external_ids']
+            external_ids = []
+            if row_external_ids:
+                tmp_external_ids = row_external_ids.split('||')
+                for e in tmp_external_ids:
+                    elem = e.split('/')
+                    external_ids.append({'db': elem[0], 'db_id': elem[1]})
+            gene['external_ids'] = external_ids
+
+        if row['homolog_ids']:
+            row_homolog_ids = row['homolog_ids']
+            homolog_ids = []
+            if row_homolog_ids:
+                tmp_homolog_ids = row_homolog_ids.split('||')
+                for e in tmp_homolog_ids:
+                    elem = e.split('/')
+                    homolog_ids.append({'id': elem[0],
+                                        'symbol': elem[1]})
+            gene['homolog_ids'] = homolog_ids
+
+    elif row['type_key'] == 'ET':
+        transcript_id = row['transcript_id']
+        transcript = gene['transcripts'].get(transcript_id,
+                                             {'id': transcript_id,
+                                              'exons': {}})
+
+        if row['ensembl_id_version']:
+            transcript['version'] = row['ensembl_id_version']
+
+        if row['ensembl_symbol']:
+            transcript['symbol'] = row['ensembl_symbol']
+
+        transcript['start'] = row['start']
+        transcript['end'] = row['end']
+
+        gene['transcripts'][transcript_id] = transcript
+
+    elif row['type_key'] == 'EE':
+        transcript_id = row['transcript_id']
+        transcript = gene['transcripts'].get(transcript_id,
+                                             {'id': transcript_id,
+                                              'exons': {}})
+
+        exon = {'id': ensembl_id,
+                'start': row['start'],
+                'end': row['end'],
+                'number': row['exon_number']}
+
+        if row['ensembl_id_version']:
+            exon['version'] = row['ensembl_id_version']
+
+        transcript['exons'][ensembl_id] = exon
+
+        gene['transcripts'][transcript_id] = transcript
+
+    elif row['type_key'] == 'EP':
+        transcript_id = row['transcript_id']
+        transcript = gene['transcripts'].get(transcript_id,
+                                             {'id': transcript_id,
+                                              'exons': {}})
+
+        transcript['protein'] = {'id': ensembl_id,
+                                 'start': row['start'],
+                                 'end': row['end']}
+
+        if row['ensembl_id_version']:
+            transcript['protein']['version'] = row['ensembl_id_version']
+
+        gene['transcripts'][transcript_id] = transcript
+    else:
+        LOG.error('Unknown')
+
+
+
+def _assemble(batch, release, species, conn):
+    """Convert transcripts, etc to sorted lists rather than dicts and add the
+    homologs.
+
+    Args:
+        batch (list): (match id, gene ``dict``) tuples.
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        conn (sqlite3.Connection): The connection to use.
+
+    Yields:
+        tuple: (match id, gene ``dict``)
+    """
+    if not batch:
+        return
+
+    homologs = get_homology([match_id for match_id, _ in batch], release,
+                            species, conn)
+
+    with timing.stage('genes_assemble'):
+        for match_id, gene in batch:
+            t = []
+            for (transcript_id, transcript) in gene['transcripts'].items():
+                e = []
+                for (exon_id, exon) in transcript['exons'].items():
+                    e.append(exon)
+                transcript['exons'] = sorted(e, key=lambda ex: ex['number'])
+                t.append(transcript)
+            gene['transcripts'] = sorted(t, key=lambda tr: tr['start'])
+
+            gene['homologs'] = homologs.get(match_id, None)
+
+    yield from batch
 
 
 def random_ids(source_db='Ensembl', limit=10, release=None, species=None):
@@ -643,4 +758,7 @@ def random_ids(source_db='Ensembl', limit=10, release=None, species=None):
     for row in cursor.execute(sql_statement, params):
         ids.append(row['random_id'])
 
+    cursor.close()
+    conn.close()
+
     return ids
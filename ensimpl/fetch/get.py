@@ -1,12 +1,34 @@
 # -*- coding: utf_8 -*-
 from collections import OrderedDict
+import os
 import sqlite3
+import threading
 
+import ensimpl.metrics as metrics
 import ensimpl.utils as utils
+import ensimpl.fetch.timing as timing
 import ensimpl.fetch.utils as fetch_utils
 
 LOG = utils.get_logger()
 
+SQL_LOOKUP_STATS = '''
+SELECT sr.description, m.meta_value num
+  FROM meta_info m, search_ranking sr
+ WHERE m.meta_key = 'stats:' || sr.description
+ ORDER BY sr.score desc
+'''
+
+SQL_LOOKUP_STATS_COUNT = '''
+SELECT count(egl.lookup_value) num, sr.description 
+  FROM ensembl_genes_lookup egl, search_ranking sr
+ WHERE egl.ranking_id = sr.ranking_id
+ GROUP BY sr.description, egl.species_id 
+ ORDER BY sr.score desc
+'''
+
+_meta_cache = {}
+_meta_cache_lock = threading.Lock()
+
 
 def chromosomes(release=None, species=None):
     """Get the chromosomes.
@@ -37,6 +59,9 @@ def chromosomes(release=None, species=None):
             'order': row['chromosome_num']
         })
 
+    cursor.close()
+    conn.close()
+
     return chroms
 
 
@@ -87,12 +112,16 @@ def karyotypes(release=None, species=None):
 
         karyotype_data[row['chromosome']] = chrom_data
 
+    cursor.close()
+    conn.close()
+
     # turn into a list
     return list(karyotype_data.values())
 
 
 def db_meta(release=None, species=None):
-    """Get the database meta information..
+    """Get the database meta information.  The information is cached until
+    the database file changes.
 
     Args:
         release (str): The Ensembl release or None for latest.
@@ -112,13 +141,27 @@ def db_meta(release=None, species=None):
          ORDER BY meta_key
     '''
 
+    database = fetch_utils.get_database_file(release, species)
+    key = (database, str(release), species, os.path.getmtime(database))
+
+    meta_data = _meta_cache.get(key)
+
+    if meta_data is not None:
+        metrics.CACHE_REQUESTS.inc(('db_meta', 'hit'))
+        return dict(meta_data)
+
+    metrics.CACHE_REQUESTS.inc(('db_meta', 'miss'))
+
     conn = fetch_utils.connect_to_database(release, species)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
     meta_data = {}
 
-    for row in cursor.execute(sql_meta):
+    with timing.stage('meta_sql'):
+        cursor.execute(sql_meta)
+
+    for row in cursor:
         meta_data['species'] = row['species_id']
 
         for val in ['release', 'assembly', 'assembly_patch', 'url']:
@@ -126,12 +169,18 @@ def db_meta(release=None, species=None):
                 meta_data[val] = row['meta_value']
 
     cursor.close()
+    conn.close()
+
+    with _meta_cache_lock:
+        _meta_cache[key] = meta_data
 
-    return meta_data
+    return dict(meta_data)
 
 
 def stats(release=None, species=None):
-    """Get information for the version.
+    """Get information for the version.  The lookup counts are stored in
+    the meta information when the database is built or optimized, they are
+    counted for older databases.
 
     Args:
         release (str): The Ensembl release or None for latest.
@@ -145,22 +194,19 @@ def stats(release=None, species=None):
             * stats - informational counts about the database
             * version
     """
-    sql_lookup_stats = '''
-        SELECT count(egl.lookup_value) num, sr.description 
-          FROM ensembl_genes_lookup egl, search_ranking sr
-         WHERE egl.ranking_id = sr.ranking_id
-         GROUP BY sr.description, egl.species_id 
-         ORDER BY sr.score desc
-    '''
-
     conn = fetch_utils.connect_to_database(release, species)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
     stats = {}
 
-    for row in cursor.execute(sql_lookup_stats):
-        stats[row['description']] = row['num']
+    for row in cursor.execute(SQL_LOOKUP_STATS):
+        stats[row['description']] = int(row['num'])
+
+    # databases built before the counts were stored
+    if not stats:
+        for row in cursor.execute(SQL_LOOKUP_STATS_COUNT):
+            stats[row['description']] = row['num']
 
     cursor.close()
     conn.close()
@@ -205,4 +251,7 @@ def external_dbs(release=None, species=None):
             'ranking_id': row['ranking_id']
         })
 
+    cursor.close()
+    conn.close()
+
     return ext_dbs
@@ -38,15 +38,14 @@ def get_history(ensembl_id, release_start=None, release_end=None,
         release_start = int(release_start)
         release_end = int(release_end)
 
-        print(release_start, type(release_start), release_end, type(release_end))
+        LOG.debug(f'release_start={release_start}, release_end={release_end}')
 
         gene_history = {}
 
         for release in range(release_start, release_end + 1):
-            print(release)
             try:
                 gene_history[release] = genes.get([ensembl_id], str(release),
-                                                  species, details)
+                                                  species, details=details)
             except ValueError as ve:
                 LOG.debug(ve)
 
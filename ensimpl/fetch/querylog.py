@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""Slow query log for the fetch layer.
+
+When enabled with :func:`configure`,
+:func:`ensimpl.fetch.utils.connect_to_database` returns a :class:`ProfiledConnection`.  Every statement executed through one
+of its cursors is timed (execution plus fetching of the rows) and statements
+slower than the threshold are kept in a bounded ring buffer together with
+the normalized SQL, the shape of the parameters, the number of rows and the
+``EXPLAIN QUERY PLAN`` output.
+
+Listeners added with :func:`add_listener` are told about every statement and
+every connection opened or closed, see :mod:`ensimpl.metrics`.
+"""
+from collections import OrderedDict
+from collections import deque
+
+import datetime
+import re
+import sqlite3
+import threading
+import time
+
+import ensimpl.utils as utils
+
+LOG = utils.get_logger()
+
+DEFAULT_SIZE = 100
+
+REGEX_WHITESPACE = re.compile(r'\s+')
+REGEX_STRING = re.compile(r"'(?:[^']|'')*'")
+REGEX_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+REGEX_IN_LIST = re.compile(
+    r'\bIN\s*\(\s*(?:\?|"[^"]*")(?:\s*,\s*(?:\?|"[^"]*"))*\s*\)', re.IGNORECASE)
+REGEX_TEMP_TABLE = re.compile(r'\b(lookup_ids)_\w+')
+
+_lock = threading.Lock()
+_threshold = None
+_entries = deque(maxlen=DEFAULT_SIZE)
+_statement_listeners = []
+_connection_listeners = []
+
+
+def configure(threshold_ms=None, size=DEFAULT_SIZE):
+    """Enable or disable the slow query log.
+
+    Args:
+        threshold_ms (float, optional): Statements taking at least this many
+            milliseconds are logged, ``None`` disables the log.
+        size (int, optional): The maximum number of statements kept.
+    """
+    global _threshold, _entries
+
+    with _lock:
+        _threshold = None if threshold_ms is None else threshold_ms / 1000.0
+        if size != _entries.maxlen:
+            _entries = deque(_entries, maxlen=size)
+
+
+def add_listener(statement=None, connection=None):
+    """Add listeners, which enables profiled connections.
+
+    Args:
+        statement (function, optional): Called with the SQL, the duration in
+            seconds and the number of rows of every statement.
+        connection (function, optional): Called with 1 when a connection is
+            opened and -1 when it is closed.
+    """
+    if statement and statement not in _statement_listeners:
+        _statement_listeners.append(statement)
+
+    if connection and connection not in _connection_listeners:
+        _connection_listeners.append(connection)
+
+
+def enabled():
+    """Check if the slow query log is enabled or there are listeners.
+
+    Returns:
+        bool: ``True`` if enabled.
+    """
+    return (_threshold is not None or bool(_statement_listeners)
+            or bool(_connection_listeners))
+
+
+def get_entries():
+    """Get the slow statements, most recent first.
+
+    Returns:
+        list: A ``list`` of ``dict``.
+    """
+    with _lock:
+        return list(reversed(_entries))
+
+
+def clear():
+    """Remove all slow statements."""
+    with _lock:
+        _entries.clear()
+
+
+def normalize_sql(sql):
+    """Normalize `sql` so statements that only differ in literals, the length
+    of an ``IN`` list or a temporary table name look the same.
+
+    Args:
+        sql (str): The SQL statement.
+
+    Returns:
+        str: The normalized SQL.
+    """
+    sql = REGEX_STRING.sub('?', sql)
+    sql = REGEX_NUMBER.sub('?', sql)
+    sql = REGEX_IN_LIST.sub('IN (?, ...)', sql)
+    sql = REGEX_TEMP_TABLE.sub(r'\1_?', sql)
+    return REGEX_WHITESPACE.sub(' ', sql).strip()
+
+
+def get_parameters_shape(parameters, many=False):
+    """Describe `parameters` without their values.
+
+    Args:
+        parameters: The parameters passed to ``execute`` or ``executemany``.
+        many (bool, optional): ``True`` for ``executemany``.
+
+    Returns:
+        str: Such as ``{term}``, ``[2]`` or ``1000 x [1]``.
+    """
+    if many:
+        if isinstance(parameters, CountedParameters):
+            count, first = parameters.count, parameters.first
+        else:
+            try:
+                count = len(parameters)
+                first = parameters[0] if count else None
+            except (TypeError, KeyError, IndexError):
+                return '?'
+        if not count:
+            return '0 x []'
+        return f'{count} x {get_parameters_shape(first)}'
+
+    if parameters is None:
+        return '[]'
+
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(sorted(parameters)) + '}'
+
+    try:
+        return f'[{len(parameters)}]'
+    except TypeError:
+        return '?'
+
+
+def explain(connection, sql, parameters):
+    """Get the query plan of `sql`.
+
+    Args:
+        connection (sqlite3.Connection): The connection.
+        sql (str): The SQL statement.
+        parameters: The statement parameters.
+
+    Returns:
+        list: The plan lines, indented by depth.
+    """
+    try:
+        cursor = sqlite3.Cursor(connection)
+        cursor.row_factory = None
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters or ())
+
+        depth = {0: -1}
+        plan = []
+
+        for row in cursor:
+            node_id, parent_id, detail = row[0], row[1], row[-1]
+            depth[node_id] = depth.get(parent_id, -1) + 1
+            plan.append('  ' * depth[node_id] + str(detail))
+
+        cursor.close()
+        return plan
+    except Exception as e:
+        return [f'EXPLAIN QUERY PLAN failed: {e}']
+
+
+def record(connection, sql, parameters, duration, rows, many=False):
+    """Add a statement to the log if it was slow.
+
+    Args:
+        connection (sqlite3.Connection): The connection.
+        sql (str): The SQL statement.
+        parameters: The statement parameters.
+        duration (float): Seconds.
+        rows (int): The number of rows fetched or affected.
+        many (bool, optional): ``True`` for ``executemany``.
+    """
+    for listener in _statement_listeners:
+        listener(sql, duration, rows)
+
+    threshold = _threshold
+
+    if threshold is None or duration < threshold:
+        return
+
+    plan = []
+    keyword = sql.lstrip()[:6].upper()
+    if not many and (keyword == 'SELECT' or keyword.startswith('WITH')):
+        plan = explain(connection, sql, parameters)
+
+    entry = OrderedDict([
+        ('time', datetime.datetime.now().isoformat(timespec='seconds')),
+        ('duration_ms', round(duration * 1000.0, 3)),
+        ('rows', rows),
+        ('sql', normalize_sql(sql)),
+        ('parameters', get_parameters_shape(parameters, many)),
+        ('plan', plan),
+        ('database', getattr(connection, 'database', None)),
+    ])
+
+    with _lock:
+        _entries.append(entry)
+
+    LOG.warning(f'Slow query ({entry["duration_ms"]}ms, {rows} rows): '
+                f'{entry["sql"]} {entry["parameters"]} '
+                f'PLAN: {" | ".join(p.strip() for p in plan)}')
+
+
+class CountedParameters:
+    """Iterate over the parameters of ``executemany``, counting them and
+    keeping the first, so their shape can be logged without holding them
+    all in memory."""
+    def __init__(self, parameters):
+        self._iterator = iter(parameters)
+        self.count = 0
+        self.first = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        if self.count == 0:
+            self.first = item
+        self.count += 1
+        return item
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times each statement until its rows are exhausted, the
+    cursor is closed or another statement is executed."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._statement = None
+
+    def _begin(self, sql, parameters, many=False):
+        self._finish()
+        self._statement = [sql, parameters, 0.0, 0, many]
+
+    def _add(self, duration, rows=0):
+        if self._statement is not None:
+            self._statement[2] += duration
+            self._statement[3] += rows
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+
+        sql, parameters, duration, rows, many = statement
+        if many or rows == 0:
+            rows = max(rows, self.rowcount)
+
+        record(self.connection, sql, parameters, duration, rows, many)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = CountedParameters(seq_of_parameters)
+        self._begin(sql, seq_of_parameters, True)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(time.perf_counter() - start)
+            self._finish()
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start)
+            self._finish()
+            raise
+        self._add(time.perf_counter() - start, 1)
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        if size is None:
+            rows = super().fetchmany()
+        else:
+            rows = super().fetchmany(size)
+        self._add(time.perf_counter() - start, len(rows))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start, len(rows))
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class ExecuteCursor(sqlite3.Cursor):
+    """Cursor that only times ``execute`` and ``executemany``, used when the
+    slow query log is off and only listeners need to know about statements,
+    so fetching rows has no overhead."""
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record(self.connection, sql, parameters,
+                   time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = CountedParameters(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record(self.connection, sql, seq_of_parameters,
+                   time.perf_counter() - start, self.rowcount, True)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors are :class:`ProfiledCursor` instances, or
+    :class:`ExecuteCursor` instances when the slow query log is off."""
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.database = str(database)
+        self._open = True
+
+        for listener in _connection_listeners:
+            listener(1)
+
+    def close(self):
+        super().close()
+
+        if self._open:
+            self._open = False
+            for listener in _connection_listeners:
+                listener(-1)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = ExecuteCursor if _threshold is None else ProfiledCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
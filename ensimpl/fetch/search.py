@@ -1,8 +1,14 @@
 # -*- coding: utf_8 -*-
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import os
 import sqlite3
 import re
+import threading
 
 import ensimpl.utils as utils
+import ensimpl.fetch.timing as timing
 import ensimpl.fetch.utils as fetch_utils
 
 LOG = utils.get_logger()
@@ -34,7 +40,7 @@ SELECT MAX(s.score||'||'||s.description||'||'||l.lookup_value) AS match_descript
        search_ranking s
 WHERE g.ensembl_id = l.ensembl_gene_id
   AND l.ranking_id = s.ranking_id
-  AND es.ensembl_genes_lookup_key = l.ensembl_genes_lookup_key
+  AND es.docid = l.ensembl_genes_lookup_key
   AND es.lookup_value MATCH :term
 GROUP BY l.ensembl_gene_id
 ORDER BY match_description - length(match_description) DESC, g.symbol ASC
@@ -49,7 +55,7 @@ SELECT MAX(s.score||'||'||s.description||'||'||l.lookup_value) AS match_descript
        search_ranking s
 WHERE g.ensembl_id = l.ensembl_gene_id
   AND l.ranking_id = s.ranking_id
-  AND es.ensembl_genes_lookup_key = l.ensembl_genes_lookup_key
+  AND es.docid = l.ensembl_genes_lookup_key
   AND l.ranking_id in ('EG', 'ET', 'EE', 'EP', 'ZG', 'MI', 'UG', 'HG')
   AND es.lookup_value MATCH :term
 GROUP BY l.ensembl_gene_id
@@ -57,15 +63,41 @@ ORDER BY match_description - length(match_description) DESC, g.symbol ASC
 '''
 
 SQL_REGION = '''
+SELECT e.*
+  FROM chromosomes c,
+       ensembl_genes_rtree r,
+       ensembl_genes e
+ WHERE c.chromosome = :chromosome
+   AND r.chromosome_min <= c.chromosome_num
+   AND r.chromosome_max >= c.chromosome_num
+   AND r.start_position <= :end_position
+   AND r.end_position >= :start_position
+   AND e.ensembl_genes_key = r.ensembl_genes_key
+ ORDER BY e.start_position, e.end_position, e.ensembl_genes_key
+'''
+
+SQL_REGION_LEGACY = '''
 SELECT *
   FROM ensembl_genes e
  WHERE e.chromosome = :chromosome
    AND e.start_position <= :end_position
    AND e.end_position >= :start_position
  ORDER BY cast(
-       replace(replace(replace(e.chromosome,'X','50'),'Y','51'),'MT','51') 
+       replace(replace(replace(e.chromosome,'X','50'),'Y','51'),'MT','51')
        AS int), e.start_position, e.end_position
 '''
+'''Databases built before ``ensembl_genes_rtree`` only have the index on the
+position, which narrows the scan on the start of the region alone.'''
+
+SQL_SEARCH_JOIN = 'es.docid = l.ensembl_genes_lookup_key'
+
+SQL_SEARCH_JOIN_LEGACY = ('es.ensembl_genes_lookup_key = '
+                          'l.ensembl_genes_lookup_key')
+'''Databases built before ``ensembl_search`` was an external content table
+keep the key as a column of the full text index.'''
+
+_legacy_search = {}
+_legacy_search_lock = threading.Lock()
 
 QUERIES = {}
 QUERIES['SQL_TERM_EXACT'] = SQL_TERM_EXACT
@@ -234,7 +266,36 @@ def get_query(term, exact=True):
     return query
 
 
-def execute_query(query, release=None, species=None, limit=None):
+def is_legacy_search(conn, release=None, species=None):
+    """Check if ``ensembl_search`` keeps the key as a column instead of
+    being an external content table of ``ensembl_genes_lookup``.  The answer
+    is cached until the database file changes.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        bool: ``True`` for the legacy full text index.
+    """
+    database = fetch_utils.get_database_file(release, species)
+    key = (database, os.path.getmtime(database))
+
+    legacy = _legacy_search.get(key)
+
+    if legacy is None:
+        sql = conn.execute("SELECT sql FROM sqlite_master "
+                           "WHERE name = 'ensembl_search'").fetchone()[0]
+        legacy = 'content=' not in sql.replace(' ', '')
+
+        with _legacy_search_lock:
+            _legacy_search[key] = legacy
+
+    return legacy
+
+
+def execute_query(query, release=None, species=None, limit=None, conn=None):
     """Execute the SQL query.
 
     Args:
@@ -242,6 +303,8 @@ def execute_query(query, release=None, species=None, limit=None):
         release (str): The Ensembl release or ``None`` for latest.
         species (str): The Ensembl species identifier.
         limit (int, optional): Maximum number to return, ``None`` for all.
+        conn (sqlite3.Connection, optional): A connection to reuse, it is
+            left open.  ``None`` to open (and close) a new one.
 
     Returns:
         :obj:`Result`: The resulting object.
@@ -255,16 +318,32 @@ def execute_query(query, release=None, species=None, limit=None):
     matches = []
     ilimit = fetch_utils.nvli(limit, -1)
 
+    close = conn is None
+
     try:
-        conn = fetch_utils.connect_to_database(release, species)
-        conn.row_factory = sqlite3.Row
+        if close:
+            conn = fetch_utils.connect_to_database(release, species)
+
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
 
         gene_id = 'ensembl_gene_id'
         if query.region:
             gene_id = 'ensembl_id'
 
-        for row in cursor.execute(query.query, query.get_parameters()):
+        sql = query.query
+
+        if SQL_SEARCH_JOIN in sql and is_legacy_search(conn, release, species):
+            sql = sql.replace(SQL_SEARCH_JOIN, SQL_SEARCH_JOIN_LEGACY)
+
+        if sql == SQL_REGION and not fetch_utils.has_spatial_index(
+                conn, release, species):
+            sql = SQL_REGION_LEGACY
+
+        with timing.stage('search_sql'):
+            cursor.execute(sql, query.get_parameters())
+
+        for row in timing.rows('search_rows', cursor):
             match = Match()
 
             match.ensembl_gene_id = row[gene_id]
@@ -319,7 +398,9 @@ def execute_query(query, release=None, species=None, limit=None):
             matches.append(match)
 
         cursor.close()
-        conn.close()
+
+        if close:
+            conn.close()
     except sqlite3.Error as e:
         LOG.error('Database Error: {}'.format(e))
         raise SearchException(e)
@@ -335,7 +416,8 @@ def execute_query(query, release=None, species=None, limit=None):
     return Result(query, matches, num_matches)
 
 
-def search(term, release=None, species=None, exact=True, limit=None):
+def search(term, release=None, species=None, exact=True, limit=None,
+           conn=None):
     """Perform the search.
 
     Args:
@@ -344,6 +426,7 @@ def search(term, release=None, species=None, exact=True, limit=None):
         species (str): The Ensembl species identifier.
         exact (bool, optional): ``True`` for exact match of `term`.
         limit (int, optional): Maximum number to return, ``None`` for all.
+        conn (sqlite3.Connection, optional): A connection to reuse.
 
     Returns:
         :obj:`Result`: The result of the query.
@@ -359,7 +442,7 @@ def search(term, release=None, species=None, exact=True, limit=None):
 
         LOG.debug('QUERY={}'.format(query))
 
-        result = execute_query(query, release, species, limit)
+        result = execute_query(query, release, species, limit, conn)
 
         LOG.debug('# matches: {}'.format(len(result.matches)))
 
@@ -368,3 +451,72 @@ def search(term, release=None, species=None, exact=True, limit=None):
         LOG.error('Error: {}'.format(se))
         return None
 
+
+def search_batch(terms, release=None, species=None, exact=True, limit=None,
+                 workers=1):
+    """Search for each term in `terms`, reusing the database connection.
+
+    `terms` is consumed lazily and only a few terms per worker are searched
+    ahead of the caller, so memory does not grow with the number of terms.
+
+    Args:
+        terms (iterable): The search terms.
+        release (str): The Ensembl release.
+        species (str): The Ensembl species identifier.
+        exact (bool, optional): ``True`` for exact match of a term.
+        limit (int, optional): Maximum number to return per term, ``None``
+            for all.
+        workers (int, optional): Number of threads, each with its own
+            connection.
+
+    Yields:
+        tuple: (term, :obj:`Result`) in the order of `terms`, the
+            :obj:`Result` is ``None`` when the term is invalid or the search
+            failed.
+    """
+    connections = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def search_term(term):
+        conn = getattr(local, 'conn', None)
+
+        if conn is None:
+            conn = fetch_utils.connect_to_database(release, species,
+                                                   check_same_thread=False)
+            local.conn = conn
+            with lock:
+                connections.append(conn)
+
+        try:
+            return search(term, release, species, exact, limit, conn)
+        except ValueError as ve:
+            LOG.debug(f'Invalid term "{term}": {ve}')
+            return None
+
+    try:
+        if workers <= 1:
+            for term in terms:
+                yield term, search_term(term)
+            return
+
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for term in terms:
+                    pending.append((term, executor.submit(search_term, term)))
+
+                    if len(pending) >= workers * 4:
+                        term, future = pending.popleft()
+                        yield term, future.result()
+
+                while pending:
+                    term, future = pending.popleft()
+                    yield term, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+    finally:
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""Lightweight, per-request stage timing.
+
+A :class:`Timer` is bound to the current thread with :func:`start`.  The
+fetch layer wraps its work in :func:`stage` and :func:`rows`; when no timer
+is bound these return immediately (a no-op context manager and the original
+iterable), so the disabled path costs a thread-local lookup.
+
+Example:
+    >>> timer = start()
+    >>> with stage('sql'):
+    ...     cursor.execute(sql)
+    >>> for row in rows('rows', cursor):
+    ...     pass
+    >>> stop()
+    >>> timer.server_timing()
+    'sql;dur=0.210, rows;dur=1.402;desc="rows=12"'
+"""
+from collections import OrderedDict
+
+import threading
+import time
+
+_local = threading.local()
+
+
+class Stage:
+    """Accumulated timing for one stage.
+
+    Attributes:
+        name (str): The stage name.
+        duration (float): Total seconds spent in the stage.
+        calls (int): The number of times the stage was entered.
+        rows (int): Rows processed in the stage, ``None`` if not counted.
+    """
+    def __init__(self, name):
+        """Initialization."""
+        self.name = name
+        self.duration = 0.0
+        self.calls = 0
+        self.rows = None
+
+    def add(self, duration, rows=None):
+        """Add a measurement.
+
+        Args:
+            duration (float): Seconds.
+            rows (int, optional): Rows processed.
+        """
+        self.duration += duration
+        self.calls += 1
+
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+
+    def dict(self):
+        """For JSON representation.
+
+        Returns:
+            dict: With keys ``ms``, ``calls`` and ``rows`` (if counted).
+        """
+        ret = OrderedDict([('ms', round(self.duration * 1000.0, 3)),
+                           ('calls', self.calls)])
+        if self.rows is not None:
+            ret['rows'] = self.rows
+        return ret
+
+
+class _StageContext:
+    """Context manager timing one entry into a :class:`Stage`."""
+    __slots__ = ('stage', 'start', 'rows')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+        self.rows = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stage.add(time.perf_counter() - self.start, self.rows)
+        return False
+
+
+class _NullContext:
+    """No-op context manager used when timing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class Timer:
+    """Collects the stages of one request."""
+    def __init__(self):
+        """Initialization."""
+        self.start = time.perf_counter()
+        self.stages = OrderedDict()
+
+    def get_stage(self, name):
+        """Get (or create) the stage called `name`.
+
+        Args:
+            name (str): The stage name.
+
+        Returns:
+            Stage: The stage.
+        """
+        stage = self.stages.get(name)
+
+        if stage is None:
+            stage = Stage(name)
+            self.stages[name] = stage
+
+        return stage
+
+    def elapsed(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total=True):
+        """Format the stages as a ``Server-Timing`` header value.
+
+        Args:
+            total (bool, optional): ``True`` to add a ``total`` metric.
+
+        Returns:
+            str: The header value.
+        """
+        metrics = []
+
+        for stage in self.stages.values():
+            metric = f'{stage.name};dur={stage.duration * 1000.0:.3f}'
+            if stage.rows is not None:
+                metric += f';desc="rows={stage.rows}"'
+            metrics.append(metric)
+
+        if total:
+            metrics.append(f'total;dur={self.elapsed() * 1000.0:.3f}')
+
+        return ', '.join(metrics)
+
+    def dict(self):
+        """For JSON representation.
+
+        Returns:
+            dict: Stage name to :meth:`Stage.dict`, plus ``total_ms``.
+        """
+        ret = OrderedDict((name, stage.dict())
+                          for name, stage in self.stages.items())
+        ret['total_ms'] = round(self.elapsed() * 1000.0, 3)
+        return ret
+
+
+def start():
+    """Bind a new :class:`Timer` to the current thread.
+
+    Returns:
+        Timer: The timer.
+    """
+    timer = Timer()
+    _local.timer = timer
+    return timer
+
+
+def stop():
+    """Unbind the current thread's timer.
+
+    Returns:
+        Timer: The timer that was bound, or ``None``.
+    """
+    timer = getattr(_local, 'timer', None)
+    _local.timer = None
+    return timer
+
+
+def current():
+    """Get the current thread's timer.
+
+    Returns:
+        Timer: The timer, ``None`` when timing is disabled.
+    """
+    return getattr(_local, 'timer', None)
+
+
+def stage(name):
+    """Time a block of code as stage `name`.
+
+    Set ``rows`` on the returned context to record a row count.
+
+    Args:
+        name (str): The stage name.
+
+    Returns:
+        A context manager.
+    """
+    timer = getattr(_local, 'timer', None)
+
+    if timer is None:
+        return NULL_CONTEXT
+
+    return _StageContext(timer.get_stage(name))
+
+
+def rows(name, iterable):
+    """Time the iteration of `iterable` (including the work done by the
+    caller on each item) as stage `name` and count the items.
+
+    Args:
+        name (str): The stage name.
+        iterable: Typically a database cursor.
+
+    Returns:
+        `iterable` itself when timing is disabled, otherwise a generator.
+    """
+    timer = getattr(_local, 'timer', None)
+
+    if timer is None:
+        return iterable
+
+    return _timed_rows(timer.get_stage(name), iterable)
+
+
+def _timed_rows(stage, iterable):
+    """Generator backing :func:`rows`."""
+    count = 0
+    start_time = time.perf_counter()
+
+    try:
+        for item in iterable:
+            count += 1
+            yield item
+    finally:
+        stage.add(time.perf_counter() - start_time, count)
@@ -1,9 +1,13 @@
 # -*- coding: utf_8 -*-
+import os
 import re
 import sqlite3
+import threading
 
 import ensimpl.utils as utils
 import ensimpl.db_config as db_config
+import ensimpl.fetch.querylog as querylog
+import ensimpl.fetch.timing as timing
 
 LOG = utils.get_logger()
 
@@ -12,6 +16,26 @@ REGEX_ENSEMBL_HUMAN_ID = re.compile('ENS([EGTP])[0-9]{11}', re.IGNORECASE)
 REGEX_MGI_ID = re.compile('MGI:[0-9]{1,}', re.IGNORECASE)
 REGEX_REGION = re.compile('(CHR|)*\s*([0-9]{1,2}|X|Y|MT)\s*(-|:)?\s*(\d+)\s*(MB|M|K|)?\s*(-|:|)?\s*(\d+|)\s*(MB|M|K|)?', re.IGNORECASE)
 
+SQL_CREATE_RELEASE_VIEW = '''
+CREATE TEMP VIEW {table} AS
+SELECT {columns}
+  FROM main.{table}
+ WHERE release_from <= {release}
+   AND release_to >= {release}
+'''
+
+SQL_SELECT_RTREE = '''
+SELECT count(1)
+  FROM sqlite_master
+ WHERE name IN ('ensembl_genes_rtree', 'ensembl_gtpe_rtree')
+'''
+
+_store_views = {}
+_store_views_lock = threading.Lock()
+
+_spatial_index = {}
+_spatial_index_lock = threading.Lock()
+
 
 class Region:
     """Encapsulates a genomic region.
@@ -45,25 +69,143 @@ class Region:
                 f'{self.start_position}-{self.end_position})')
 
 
-def connect_to_database(release=None, species=None):
-    """Connect to the Ensimpl database.
+def get_database(release=None, species=None):
+    """Get the Ensimpl database configuration.
 
     Args:
         release (str): The Ensembl release, None defaults to latest.
         species (str): The Ensembl species identifier, None defaults to 'Mm'.
 
     Returns:
-        a connection to the database
+        dict: The database, see :func:`ensimpl.db_config.get_ensimpl_db`.
     """
-    try:
-        species = 'Mm' if species is None else species
+    species = 'Mm' if species is None else species
+
+    if release is None:
+        release = max(db['release'] for db in db_config.ENSIMPL_DBS)
+
+    return db_config.get_ensimpl_db(release, species)
+
+
+def get_database_file(release=None, species=None):
+    """Get the Ensimpl database file.
+
+    Args:
+        release (str): The Ensembl release, None defaults to latest.
+        species (str): The Ensembl species identifier, None defaults to 'Mm'.
+
+    Returns:
+        str: The database file.
+    """
+    return get_database(release, species)['db']
+
+
+def get_release_views(conn, release):
+    """Get the statements creating the views of one release of a store.
+
+    Each versioned table of the store, one with a ``release_from`` and
+    ``release_to`` column, gets a temporary view of the same name and
+    columns with only the rows valid in `release`.  Temporary views hide
+    the tables of the store, so the same SQL runs against a store as
+    against a database file.  The views are cached until the store changes.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the store.
+        release (int): The Ensembl release.
+
+    Returns:
+        list: The ``CREATE TEMP VIEW`` statements.
+    """
+    database = conn.execute('PRAGMA database_list').fetchone()[2]
+    key = (database, os.path.getmtime(database), int(release))
+
+    views = _store_views.get(key)
+
+    if views is not None:
+        return views
 
-        if release is None:
-            release = max(db['release'] for db in db_config.ENSIMPL_DBS)
+    views = []
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
 
-        database = db_config.get_ensimpl_db(release, species)['db']
+    for table in tables:
+        columns = [row[1] for row in
+                   conn.execute(f'PRAGMA main.table_info({table})')]
 
-        return sqlite3.connect(database)
+        if 'release_from' not in columns or 'release_to' not in columns:
+            continue
+
+        columns = [c for c in columns if c not in ('release_from',
+                                                   'release_to')]
+        views.append(SQL_CREATE_RELEASE_VIEW.format(
+            table=table, columns=', '.join(columns), release=int(release)))
+
+    with _store_views_lock:
+        _store_views[key] = views
+
+    return views
+
+
+def has_spatial_index(conn, release=None, species=None):
+    """Check if the database has the spatial indices ``ensembl_genes_rtree``
+    and ``ensembl_gtpe_rtree``, which databases built before them do not
+    have.  The answer is cached until the database file changes.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        release (str): The Ensembl release or ``None`` for latest.
+        species (str): The Ensembl species identifier.
+
+    Returns:
+        bool: ``True`` if the spatial indices exist.
+    """
+    database = get_database_file(release, species)
+    key = (database, os.path.getmtime(database))
+
+    spatial = _spatial_index.get(key)
+
+    if spatial is None:
+        spatial = conn.execute(SQL_SELECT_RTREE).fetchone()[0] == 2
+
+        with _spatial_index_lock:
+            _spatial_index[key] = spatial
+
+    return spatial
+
+
+def connect_to_database(release=None, species=None, check_same_thread=True):
+    """Connect to the Ensimpl database.
+
+    Args:
+        release (str): The Ensembl release, None defaults to latest.
+        species (str): The Ensembl species identifier, None defaults to 'Mm'.
+        check_same_thread (bool, optional): ``False`` to allow the
+            connection to be used (or closed) by another thread.
+
+    A release served from a consolidated store is filtered through the
+    views from :func:`get_release_views`.
+
+    Returns:
+        a connection to the database
+    """
+    try:
+        ensimpl_db = get_database(release, species)
+        database = ensimpl_db['db']
+
+        with timing.stage('db_open'):
+            if querylog.enabled():
+                conn = sqlite3.connect(database,
+                                       check_same_thread=check_same_thread,
+                                       factory=querylog.ProfiledConnection)
+            else:
+                conn = sqlite3.connect(database,
+                                       check_same_thread=check_same_thread)
+
+            if ensimpl_db.get('store'):
+                for sql in get_release_views(conn, ensimpl_db['release']):
+                    conn.execute(sql)
+
+            return conn
     except Exception as e:
         LOG.error(f'Error connecting to database: {e}')
         raise e
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""Prometheus style metrics that can be shared by several worker processes.
+
+By default values are kept in memory.  When :func:`configure` is given a
+directory every process writes its values to its own memory-mapped file in
+that directory and :func:`generate` adds up the files of all processes, so
+one scrape of any gunicorn worker reports the whole server.  Counters and
+histograms of exited workers are kept, gauges are removed by
+:func:`mark_process_dead` (see ``config/gunicorn.py``).
+"""
+from collections import OrderedDict
+
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+
+import ensimpl.fetch.querylog as querylog
+
+INITIAL_MMAP_SIZE = 1 << 16
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_lock = threading.RLock()
+_directory = None
+_stores = {}
+
+REGISTRY = OrderedDict()
+'''All metrics by name.'''
+
+
+class MmapStore:
+    """A ``dict`` of ``float`` values backed by a memory-mapped file.
+
+    The file starts with the number of bytes used followed by entries of a
+    key length, the UTF-8 key padded to 8 bytes and a double.  The used size
+    is written after an entry is complete so other processes can read the
+    file at any time.
+    """
+    def __init__(self, file_name):
+        """Initialization.
+
+        Args:
+            file_name (str): The file, created if it does not exist.
+        """
+        self.file_name = file_name
+        self.fd = open(file_name, 'a+b')
+
+        if os.fstat(self.fd.fileno()).st_size == 0:
+            self.fd.truncate(INITIAL_MMAP_SIZE)
+
+        self.capacity = os.fstat(self.fd.fileno()).st_size
+        self.mm = mmap.mmap(self.fd.fileno(), self.capacity)
+        self.positions = {}
+
+        self.used = struct.unpack_from('i', self.mm, 0)[0]
+        if self.used == 0:
+            self.used = 8
+            struct.pack_into('i', self.mm, 0, self.used)
+
+        for key, _, pos in _read_entries(self.mm, self.used):
+            self.positions[key] = pos
+
+    def _add_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+
+        if self.used + len(entry) > self.capacity:
+            while self.used + len(entry) > self.capacity:
+                self.capacity *= 2
+            self.mm.close()
+            self.fd.truncate(self.capacity)
+            self.mm = mmap.mmap(self.fd.fileno(), self.capacity)
+
+        self.mm[self.used:self.used + len(entry)] = entry
+        self.used += len(entry)
+        struct.pack_into('i', self.mm, 0, self.used)
+
+        pos = self.used - 8
+        self.positions[key] = pos
+        return pos
+
+    def add(self, key, amount):
+        """Add `amount` to the value of `key`."""
+        pos = self.positions.get(key)
+        if pos is None:
+            pos = self._add_key(key)
+        value = struct.unpack_from('d', self.mm, pos)[0]
+        struct.pack_into('d', self.mm, pos, value + amount)
+
+    def set(self, key, value):
+        """Set the value of `key`."""
+        pos = self.positions.get(key)
+        if pos is None:
+            pos = self._add_key(key)
+        struct.pack_into('d', self.mm, pos, value)
+
+    def items(self):
+        """Get the (key, value) pairs."""
+        return [(k, v) for k, v, _ in _read_entries(self.mm, self.used)]
+
+
+class MemoryStore:
+    """A ``dict`` of ``float`` values for a single process."""
+    def __init__(self):
+        """Initialization."""
+        self.values = {}
+
+    def add(self, key, amount):
+        """Add `amount` to the value of `key`."""
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        """Set the value of `key`."""
+        self.values[key] = value
+
+    def items(self):
+        """Get the (key, value) pairs."""
+        return list(self.values.items())
+
+
+def _read_entries(data, used):
+    """Parse the entries of a :class:`MmapStore` file.
+
+    Args:
+        data (bytes): The file contents.
+        used (int): Number of bytes used.
+
+    Yields:
+        tuple: (key, value, position of the value)
+    """
+    pos = 8
+    while pos < used:
+        length = struct.unpack_from('i', data, pos)[0]
+        key = bytes(data[pos + 4:pos + 4 + length]).decode('utf-8')
+        pos += 4 + length + (8 - (length + 4) % 8)
+        yield key, struct.unpack_from('d', data, pos)[0], pos
+        pos += 8
+
+
+def configure(directory=None):
+    """Configure where the values are kept and start counting the SQL
+    statements and connections of the fetch layer.
+
+    Args:
+        directory (str, optional): A directory shared by all the worker
+            processes, ``None`` to keep the values in memory.
+    """
+    global _directory
+
+    with _lock:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _directory = directory
+        _stores.clear()
+
+    querylog.add_listener(_on_statement, _on_connection)
+
+
+def _on_statement(sql, duration, rows):
+    """Count a statement, see :func:`querylog.add_listener`."""
+    SQLITE_STATEMENTS.inc()
+    SQLITE_STATEMENT_SECONDS.inc(amount=duration)
+
+
+def _on_connection(delta):
+    """Count a connection, see :func:`querylog.add_listener`."""
+    if delta > 0:
+        SQLITE_CONNECTIONS.inc()
+    SQLITE_CONNECTIONS_OPEN.inc(amount=delta)
+
+
+def clear_directory(directory):
+    """Remove all metric files, call before the workers are started.
+
+    Args:
+        directory (str): The metrics directory.
+    """
+    for file_name in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(file_name)
+
+
+def mark_process_dead(pid, directory):
+    """Remove the gauges of an exited worker process.
+
+    Args:
+        pid (int): The process id.
+        directory (str): The metrics directory.
+    """
+    file_name = os.path.join(directory, f'gauge_{pid}.db')
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+
+def _get_store(kind):
+    """Get the store of this process for `kind` ('counter' or 'gauge')."""
+    pid = os.getpid()
+    store = _stores.get(kind)
+
+    if store is None or store[0] != pid:
+        with _lock:
+            if _directory:
+                file_name = os.path.join(_directory, f'{kind}_{pid}.db')
+                store = (pid, MmapStore(file_name))
+            else:
+                store = (pid, MemoryStore())
+            _stores[kind] = store
+
+    return store[1]
+
+
+def _get_values(kind):
+    """Get the values of `kind` added up over all processes.
+
+    Returns:
+        dict: Values by key.
+    """
+    if not _directory:
+        return dict(_get_store(kind).items())
+
+    values = {}
+
+    for file_name in glob.glob(os.path.join(_directory, f'{kind}_*.db')):
+        try:
+            with open(file_name, 'rb') as fd:
+                data = fd.read()
+        except FileNotFoundError:
+            continue
+
+        if len(data) < 8:
+            continue
+
+        used = struct.unpack_from('i', data, 0)[0]
+        for key, value, _ in _read_entries(data, used):
+            values[key] = values.get(key, 0.0) + value
+
+    return values
+
+
+class Metric:
+    """Base class of the metrics.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The help text.
+        labelnames (tuple): The label names.
+    """
+    kind = 'counter'
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Initialization."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _key(self, suffix, labels, extra=None):
+        values = [[n, str(v)] for n, v in zip(self.labelnames, labels)]
+        if extra:
+            values.append(extra)
+        return json.dumps([self.name, suffix, values])
+
+    def _add(self, suffix, labels, amount, extra=None):
+        with _lock:
+            _get_store(self.kind).add(self._key(suffix, labels, extra), amount)
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+    def inc(self, labels=(), amount=1.0):
+        """Increment.
+
+        Args:
+            labels (tuple): The label values.
+            amount (float, optional): The amount.
+        """
+        self._add('_total', labels, amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, added up over the live processes."""
+    kind = 'gauge'
+    type_name = 'gauge'
+
+    def inc(self, labels=(), amount=1.0):
+        """Increment.
+
+        Args:
+            labels (tuple): The label values.
+            amount (float, optional): The amount.
+        """
+        self._add('', labels, amount)
+
+    def dec(self, labels=(), amount=1.0):
+        """Decrement.
+
+        Args:
+            labels (tuple): The label values.
+            amount (float, optional): The amount.
+        """
+        self._add('', labels, -amount)
+
+
+class Histogram(Metric):
+    """Counts observations in buckets."""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        """Initialization."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, labels, value):
+        """Record an observation.
+
+        Args:
+            labels (tuple): The label values.
+            value (float): The observed value.
+        """
+        for bound in self.buckets:
+            if value <= bound:
+                break
+
+        with _lock:
+            store = _get_store(self.kind)
+            store.add(self._key('_bucket', labels, ['le', _format(bound)]), 1)
+            store.add(self._key('_sum', labels), value)
+            store.add(self._key('_count', labels), 1)
+
+
+def _format(value):
+    """Format a value for the text exposition format."""
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    """Format label (name, value) pairs."""
+    if not labels:
+        return ''
+    escaped = (n + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') + '"' for n, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def generate():
+    """Generate the Prometheus text exposition of all metrics.
+
+    Returns:
+        str: The metrics.
+    """
+    samples = {}
+
+    for kind in ('counter', 'gauge'):
+        for key, value in _get_values(kind).items():
+            name, suffix, labels = json.loads(key)
+            samples.setdefault(name, []).append((suffix, labels, value))
+
+    lines = []
+
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type_name}')
+
+        metric_samples = samples.get(name, [])
+
+        if isinstance(metric, Histogram):
+            lines.extend(_histogram_lines(metric, metric_samples))
+            continue
+
+        for suffix, labels, value in sorted(metric_samples,
+                                            key=lambda s: s[1]):
+            lines.append(f'{name}{suffix}{_format_labels(labels)} '
+                         f'{_format(value)}')
+
+    lines.extend(_cache_ratio_lines(samples.get(CACHE_REQUESTS.name, [])))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _cache_ratio_lines(samples):
+    """Derive the hit ratio of each cache from :data:`CACHE_REQUESTS`."""
+    caches = OrderedDict()
+
+    for _, labels, value in samples:
+        labels = dict(labels)
+        counts = caches.setdefault(labels['cache'], {'hit': 0.0, 'miss': 0.0})
+        counts[labels['result']] = counts.get(labels['result'], 0.0) + value
+
+    name = 'ensimpl_cache_hit_ratio'
+    lines = [f'# HELP {name} Cache hits divided by lookups.',
+             f'# TYPE {name} gauge']
+
+    for cache in sorted(caches):
+        total = caches[cache]['hit'] + caches[cache]['miss']
+        ratio = caches[cache]['hit'] / total if total else 0.0
+        lines.append(f'{name}{_format_labels([["cache", cache]])} '
+                     f'{_format(ratio)}')
+
+    return lines
+
+
+def _histogram_lines(metric, samples):
+    """Format histogram samples with cumulative buckets."""
+    series = OrderedDict()
+
+    for suffix, labels, value in samples:
+        if suffix == '_bucket':
+            labels, le = labels[:-1], labels[-1][1]
+        else:
+            le = None
+        entry = series.setdefault(json.dumps(labels),
+                                  {'buckets': {}, '_sum': 0.0, '_count': 0.0})
+        if le is None:
+            entry[suffix] = value
+        else:
+            entry['buckets'][le] = value
+
+    lines = []
+
+    for labels_key in sorted(series):
+        labels = json.loads(labels_key)
+        entry = series[labels_key]
+        cumulative = 0.0
+
+        for bound in metric.buckets:
+            le = _format(bound)
+            cumulative += entry['buckets'].get(le, 0.0)
+            lines.append(f'{metric.name}_bucket'
+                         f'{_format_labels(labels + [["le", le]])} '
+                         f'{_format(cumulative)}')
+
+        lines.append(f'{metric.name}_sum{_format_labels(labels)} '
+                     f'{_format(entry["_sum"])}')
+        lines.append(f'{metric.name}_count{_format_labels(labels)} '
+                     f'{_format(entry["_count"])}')
+
+    return lines
+
+
+HTTP_REQUESTS = Counter(
+    'ensimpl_http_requests', 'Number of HTTP requests.',
+    ['method', 'route', 'status'])
+
+HTTP_REQUEST_DURATION = Histogram(
+    'ensimpl_http_request_duration_seconds', 'HTTP request latency.',
+    ['route'])
+
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'ensimpl_http_requests_in_progress', 'HTTP requests being handled.',
+    ['route'])
+
+HTTP_RESPONSE_SIZE = Histogram(
+    'ensimpl_http_response_size_bytes', 'HTTP response size.',
+    ['route'], SIZE_BUCKETS)
+
+SQLITE_STATEMENTS = Counter(
+    'ensimpl_sqlite_statements', 'Number of SQL statements executed.')
+
+SQLITE_STATEMENT_SECONDS = Counter(
+    'ensimpl_sqlite_statement_seconds',
+    'Time spent executing SQL statements, including fetching the rows when '
+    'the slow query log is on.')
+
+SQLITE_CONNECTIONS_OPEN = Gauge(
+    'ensimpl_sqlite_connections_open', 'Open database connections.')
+
+SQLITE_CONNECTIONS = Counter(
+    'ensimpl_sqlite_connections', 'Number of database connections opened.')
+
+CACHE_REQUESTS = Counter(
+    'ensimpl_cache_requests', 'Cache lookups, the hit ratio is '
+    'hit / (hit + miss).', ['cache', 'result'])
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from functools import wraps
 
+import hmac
+
 from flask import Blueprint
 from flask import current_app
+from flask import g
+from flask import json
 from flask import jsonify
 from flask import render_template
 from flask import request
@@ -10,15 +14,69 @@ from flask import request
 import ensimpl.db_config as db_config
 import ensimpl.utils as ensimpl_utils
 
+from ensimpl.fetch import diff as diff_ensimpl
+from ensimpl.fetch import features as features_ensimpl
 from ensimpl.fetch import get
 from ensimpl.fetch import genes as genes_ensimpl
 from ensimpl.fetch import history as genes_history
+from ensimpl.fetch import querylog
 from ensimpl.fetch import search as search_ensimpl
+from ensimpl.fetch import timing
 from ensimpl.fetch import utils as fetch_utils
 
 api = Blueprint('api', __name__, template_folder='templates', url_prefix='/api')
 
 
+@api.before_request
+def start_timing():
+    """Start timing the request stages when the ``SERVER_TIMING`` setting is
+    on or ``debug=1`` is passed."""
+    debug = request.values.get('debug', None)
+
+    if debug is None and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            debug = body.get('debug', None)
+
+    g.timing_debug = ensimpl_utils.str2bool(debug)
+
+    if g.timing_debug or current_app.config.get('SERVER_TIMING', False):
+        timing.start()
+
+
+@api.after_request
+def add_timing(response):
+    """Add the ``Server-Timing`` header and, for ``debug=1``, a ``_timing``
+    element to a JSON response.
+
+    Args:
+        response (:class:`flask.Response`): The response.
+
+    Returns:
+        :class:`flask.Response`: The response.
+    """
+    timer = timing.stop()
+
+    if timer is None:
+        return response
+
+    if g.get('timing_debug') and response.is_json:
+        data = response.get_json()
+        if isinstance(data, dict):
+            data['_timing'] = timer.dict()
+            response.set_data(json.dumps(data))
+
+    response.headers['Server-Timing'] = timer.server_timing()
+
+    return response
+
+
+@api.teardown_request
+def stop_timing(exception=None):
+    """Make sure the timer is unbound even if the request failed."""
+    timing.stop()
+
+
 def support_jsonp(func):
     """Wraps JSONified output for JSONP requests."""
 
@@ -76,6 +134,9 @@ GET /api/gene_history/<ensembl_id:string>?release=<:string>&species=<:string>&de
 
 GET /api/search/gene?q=<:string>&limit=<:number>&release=<:string>&species=<:string>&details=<:string>
 
+-- get the features overlapping a region
+GET /api/features?region=<:string>&types=<:string>&limit=<:number>&release=<:string>&species=<:string>
+
 -- get single gene history information 
 GET /api/random_ids/<source_db:string>?release=<:string>&species=<:string>&details=<:string>
 
@@ -429,7 +490,8 @@ def gene(ensembl_id):
         response.status_code = 500
         return response
 
-    return jsonify(ret)
+    with timing.stage('jsonify'):
+        return jsonify(ret)
 
 
 @api.route("/genes", methods=['GET', 'POST'])
@@ -545,7 +607,8 @@ def genes():
         response.status_code = 500
         return response
 
-    return jsonify(ret)
+    with timing.stage('jsonify'):
+        return jsonify(ret)
 
 
 @api.route("/external_ids", methods=['GET', 'POST'])
@@ -742,7 +805,105 @@ def search():
         response.status_code = 500
         return response
 
-    return jsonify(ret)
+    with timing.stage('jsonify'):
+        return jsonify(ret)
+
+
+@api.route("/features", methods=['GET'])
+@support_jsonp
+def features():
+    """Get the genes, transcripts, exons and proteins overlapping a region.
+
+    The following is a list of the valid parameters:
+
+    =======  =======  ===================================================
+    Param    Type     Description
+    =======  =======  ===================================================
+    region   string   the region (example '1:10000000-12000000')
+    release  string   the Ensembl release
+    species  string   the species identifier (example 'Hs', 'Mm')
+    types    string   comma separated feature types: 'EG' (gene),
+                      'ET' (transcript), 'EE' (exon), 'EP' (protein),
+                      defaults to all
+    limit    string   max number of items to return, defaults to 100,000
+    =======  =======  ===================================================
+
+    If sucessful, a JSON response will be returned with the following elements:
+
+    ========  =======  ===================================================
+    Element   Type     Description
+    ========  =======  ===================================================
+    meta      dict     the database meta information
+    request   dict     the request parameters
+    features  list     a list of feature objects, ordered by position
+    ========  =======  ===================================================
+
+    Each feature object will contain:
+
+    ================  =======  ===============================================
+    Element           Type     Description
+    ================  =======  ===============================================
+    id                string   Ensembl identifier
+    version           integer  version of the identifier
+    type              string   'EG', 'ET', 'EE' or 'EP'
+    gene_id           string   Ensembl gene identifier
+    transcript_id     string   Ensembl transcript identifier, if any
+    symbol            string   gene or transcript symbol
+    chromosome        string   the chromosome
+    start             integer  start position in base pairs
+    end               integer  end position in base pairs
+    strand            string   '+' or '-'
+    exon_number       integer  the number of an exon in its transcript
+    ================  =======  ===============================================
+
+    If an error occurs, a JSON response will be sent back with just one
+    element called ``message`` along with a status code of 500.
+
+    Returns:
+        :class:`flask.Response`: The response which is a JSON response.
+    """
+    current_app.logger.debug(f'Call for: {request.method} {request.url}')
+
+    region = request.values.get('region', None)
+    release = request.values.get('release', None)
+    species = request.values.get('species', None)
+    types = request.values.get('types', None)
+    limit = request.values.get('limit', '100000')
+
+    try:
+        limit = int(limit)
+    except ValueError as ve:
+        limit = 100000
+        current_app.logger.info(ve)
+
+    feature_types = None
+
+    if types:
+        feature_types = [t.strip().upper() for t in types.split(',')
+                         if t.strip()]
+
+    request_params = {'region': region, 'species': species,
+                      'types': feature_types, 'limit': limit,
+                      'release': release}
+
+    current_app.logger.debug(f'PARAMS: {request_params}')
+
+    try:
+        ret = {'meta': get.db_meta(release, species),
+               'request': request_params,
+               'features': None}
+
+        ret['features'] = features_ensimpl.get_features(
+            region=region, release=release, species=species,
+            feature_types=feature_types, limit=limit)
+    except Exception as e:
+        current_app.logger.error(str(e))
+        response = jsonify(message=str(e))
+        response.status_code = 500
+        return response
+
+    with timing.stage('jsonify'):
+        return jsonify(ret)
 
 
 @api.route("/history", methods=['GET'])
@@ -823,6 +984,100 @@ def history():
     return jsonify(ret)
 
 
+@api.route("/diff", methods=['GET'])
+@support_jsonp
+def diff():
+    """Get the genes and transcripts that changed between two releases.
+
+    The changes are precomputed with ``ensimpl diff``.  The following is a
+    list of the valid parameters:
+
+    =======  =======  ===================================================
+    Param    Type     Description
+    =======  =======  ===================================================
+    from     string   the older Ensembl release
+    to       string   the newer Ensembl release
+    species  string   the species identifier (example 'Hs', 'Mm')
+    change   string   only 'added', 'removed', 'version', 'moved' or
+                      'renamed' changes
+    type     string   only 'gene' or 'transcript' changes
+    next     integer  the ``next`` value of the previous page
+    limit    integer  max number of changes to return, defaults to 1,000
+    =======  =======  ===================================================
+
+    If sucessful, a JSON response will be returned with the following elements:
+
+    =======  =======  ===================================================
+    Element  Type     Description
+    =======  =======  ===================================================
+    request  dict     the request parameters
+    result   dict     the results
+    =======  =======  ===================================================
+
+    The ``result`` dictionary will have the following elements:
+
+    ============  =======  ===================================================
+    Element       Type     Description
+    ============  =======  ===================================================
+    num_results   int      the total number of changes
+    changes       list     a list of change objects
+    next          int      pass as ``next`` for the following page, null on
+                           the last page
+    ============  =======  ===================================================
+
+    Each change object will contain:
+
+    ===========  =======  ===============================================
+    Element      Type     Description
+    ===========  =======  ===============================================
+    ensembl_id   string   Ensembl gene or transcript identifier
+    type         string   'gene' or 'transcript'
+    gene_id      string   Ensembl gene identifier
+    change       string   'added', 'removed', 'version', 'moved', 'renamed'
+    old_value    string   version, 'chromosome:start-end' or symbol before
+    new_value    string   version, 'chromosome:start-end' or symbol after
+    ===========  =======  ===============================================
+
+    If an error occurs, a JSON response will be sent back with just one
+    element called ``message`` along with a status code of 500.
+
+    Returns:
+        :class:`flask.Response`: The response which is a JSON response.
+    """
+    current_app.logger.debug(f'Call for: {request.method} {request.url}')
+
+    release_from = request.values.get('from', None)
+    release_to = request.values.get('to', None)
+    species = request.values.get('species', None)
+    change = request.values.get('change', None)
+    change_type = request.values.get('type', None)
+    after = fetch_utils.nvli(request.values.get('next', None), None)
+    limit = fetch_utils.nvli(request.values.get('limit', None),
+                             diff_ensimpl.DEFAULT_LIMIT)
+
+    request_params = {'from': release_from, 'to': release_to,
+                      'species': species, 'change': change,
+                      'type': change_type, 'next': after, 'limit': limit}
+
+    current_app.logger.debug(f'PARAMS: {request_params}')
+
+    ret = {'request': request_params,
+           'result': None}
+
+    try:
+        ret['result'] = diff_ensimpl.get_diff(release_from, release_to,
+                                              species, change, change_type,
+                                              after, limit)
+    except Exception as e:
+        current_app.logger.error(str(e))
+        response = jsonify(message=str(e))
+        response.status_code = 500
+        return response
+
+    with timing.stage('jsonify'):
+        return jsonify(ret)
+
+
 @api.route("/randomids")
 @support_jsonp
 def random_ids():
@@ -874,3 +1129,69 @@ def random_ids():
     return jsonify(ret)
 
 
+def check_debug_token():
+    """Check the ``token`` parameter (or ``X-Ensimpl-Token`` header) against
+    the ``DEBUG_TOKEN`` setting.
+
+    Returns:
+        :class:`flask.Response`: An error response, ``None`` if authorized.
+    """
+    expected = current_app.config.get('DEBUG_TOKEN')
+
+    if not expected:
+        response = jsonify(message='Not Found')
+        response.status_code = 404
+        return response
+
+    token = request.headers.get('X-Ensimpl-Token',
+                                request.values.get('token', ''))
+
+    if not hmac.compare_digest(str(token), str(expected)):
+        response = jsonify(message='Forbidden')
+        response.status_code = 403
+        return response
+
+    return None
+
+
+@api.route("/_debug/slow_queries", methods=['GET', 'DELETE'])
+def slow_queries():
+    """Get the slow query log, most recent statement first.  A ``DELETE``
+    clears the log.
+
+    The endpoint is only available when the ``DEBUG_TOKEN`` setting is set
+    and the token is passed.
+
+    ========  =======  ===================================================
+    Param     Type     Description
+    ========  =======  ===================================================
+    token     string   the ``DEBUG_TOKEN`` (or use ``X-Ensimpl-Token``)
+    ========  =======  ===================================================
+
+    If successful, a JSON response will be returned with a ``queries``
+    element, each query having the following elements:
+
+    * ``time`` - when the statement finished
+    * ``duration_ms`` - execution and fetch time in milliseconds
+    * ``rows`` - the number of rows
+    * ``sql`` - the normalized SQL
+    * ``parameters`` - the shape of the parameters
+    * ``plan`` - the ``EXPLAIN QUERY PLAN`` output
+    * ``database`` - the database file
+
+    Returns:
+        :class:`flask.Response`: The response which is a JSON response.
+    """
+    error = check_debug_token()
+
+    if error:
+        return error
+
+    if request.method == 'DELETE':
+        querylog.clear()
+
+    threshold_ms = current_app.config.get('SLOW_QUERY_MS')
+
+    return jsonify({'enabled': querylog.enabled(),
+                    'threshold_ms': threshold_ms,
+                    'queries': querylog.get_entries()})
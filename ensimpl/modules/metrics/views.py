@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import time
+
+from flask import Blueprint
+from flask import Response
+from flask import g
+from flask import request
+
+import ensimpl.metrics as ensimpl_metrics
+
+metrics = Blueprint('metrics', __name__)
+
+
+def get_route():
+    """Get the route of the current request, such as
+    ``/api/gene/<ensembl_id>``, so identifiers do not create new series.
+
+    Returns:
+        str: The route or ``unmatched``.
+    """
+    if request.url_rule is None:
+        return 'unmatched'
+    return request.url_rule.rule
+
+
+@metrics.before_app_request
+def start_request():
+    """Record the start of a request."""
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = get_route()
+    ensimpl_metrics.HTTP_REQUESTS_IN_PROGRESS.inc((g.metrics_route,))
+
+
+@metrics.after_app_request
+def record_request(response):
+    """Record the count, latency and size of a request.
+
+    Args:
+        response (:class:`flask.Response`): The response.
+
+    Returns:
+        :class:`flask.Response`: The response.
+    """
+    start = g.get('metrics_start')
+
+    if start is None:
+        return response
+
+    route = g.metrics_route
+    elapsed = time.perf_counter() - start
+
+    ensimpl_metrics.HTTP_REQUESTS.inc((request.method, route,
+                                       response.status_code))
+    ensimpl_metrics.HTTP_REQUEST_DURATION.observe((route,), elapsed)
+
+    if not response.is_streamed:
+        size = response.calculate_content_length()
+        if size is not None:
+            ensimpl_metrics.HTTP_RESPONSE_SIZE.observe((route,), size)
+
+    return response
+
+
+@metrics.teardown_app_request
+def finish_request(exception=None):
+    """Record the end of a request."""
+    route = g.pop('metrics_route', None)
+
+    if route is not None:
+        ensimpl_metrics.HTTP_REQUESTS_IN_PROGRESS.dec((route,))
+
+
+@metrics.route('/metrics')
+def metrics_text():
+    """Get the metrics of all the worker processes in the Prometheus text
+    format.
+
+    Returns:
+        :class:`flask.Response`: The response.
+    """
+    return Response(ensimpl_metrics.generate(),
+                    mimetype=ensimpl_metrics.CONTENT_TYPE)
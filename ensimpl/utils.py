@@ -4,7 +4,6 @@
 from collections import OrderedDict
 from functools import cmp_to_key
 from operator import itemgetter as ig
-from urllib.request import urlopen
 
 import bz2
 import gzip
@@ -14,8 +13,10 @@ import random
 import string
 
 
-logging.basicConfig(format='[ENsimpl] [%(asctime)s] %(message)s',
-                    datefmt='%m/%d/%Y %I:%M:%S %p')
+LOG_FORMAT = '[ENsimpl] [%(asctime)s] %(message)s'
+LOG_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
 
 class ReverseProxied(object):
@@ -322,6 +323,8 @@ def open_resource(resource, mode='rb'):
     elif resource.endswith(('.bz', '.bz2', '.bzip2')):
         return bz2.BZ2File(resource, mode)
     elif resource.startswith(('http://', 'https://', 'ftp://')):
+        # imported here, urllib.request is slow to import and rarely needed
+        from urllib.request import urlopen
         return urlopen(resource)
     else:
         return open(resource, mode)
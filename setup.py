@@ -11,7 +11,7 @@ with open('HISTORY.md') as history_file:
     history = history_file.read()
 
 requirements = []
-test_requirements = []
+test_requirements = ['pytest']
 
 
 on_rtd = os.environ.get('READTHEDOCS', None)
@@ -33,7 +33,7 @@ setup(
     author="Matthew Vincent",
     author_email='matt.vincent@jax.org',
     url='https://github.com/churchill-lab/ensimpl',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests']),
     entry_points='''
             [console_scripts]
             ensimpl=ensimpl.cli.cli:cli
@@ -44,6 +44,9 @@ setup(
     #scripts=glob("bin/*"),
     #setup_requires=requirements,
     install_requires=requirements,
+    extras_require={
+        'export': ['pyarrow'],
+    },
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords='ensimpl',
@@ -52,7 +55,7 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3.7',
-    ]
-    #test_suite='tests',
-    #tests_require=test_requirements
+    ],
+    test_suite='tests',
+    tests_require=test_requirements
 )
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Synthetic databases shared by the tests.
+
+Release 901 is generated by :mod:`ensimpl.create.synthetic` and release 902
+is a copy of it with a known set of changes, see :data:`CHANGED`.  Each
+layout is a directory that :func:`ensimpl.db_config.init` can serve:
+
+* ``plain``, the databases as built, and the diff of the releases
+* ``compact``, the databases encoded by
+  :func:`ensimpl.create.ensimpl_db.compact_db`
+* ``store``, both releases in a consolidated store and nothing else
+* ``legacy``, the databases without the spatial indices, the lookup
+  counts and an index, and with the old layout of ``ensembl_search``
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+# importing ensimpl configures the databases of ENSIMPL_DIR, the tests
+# configure their own
+os.environ['ENSIMPL_DIR'] = os.path.dirname(os.path.abspath(__file__))
+
+import ensimpl.db_config as db_config
+import ensimpl.fetch.querylog as querylog
+import ensimpl.create.diff as create_diff
+import ensimpl.create.ensimpl_db as ensimpl_db
+import ensimpl.create.store as store
+import ensimpl.create.synthetic as synthetic
+
+from ensimpl.fetch import features
+from ensimpl.fetch import genes
+from ensimpl.fetch import search
+
+RELEASES = ['901', '902']
+
+SPECIES = 'Mm'
+
+NUM_GENES = 300
+
+LAYOUTS = ['plain', 'compact', 'store', 'legacy']
+
+IDS = [f'ENSMUSG{number:011d}' for number in range(1, NUM_GENES + 1, 3)]
+'''Every third gene and, in release 902, a few that were removed.'''
+
+CHANGED = {
+    'version': 'ensembl_genes_key % 10 = 0',
+    'renamed': 'ensembl_genes_key % 25 = 0',
+    'removed': 'ensembl_genes_key % 97 = 0',
+}
+'''The genes of release 902 with a new version, a new symbol or removed.'''
+
+SQL_CHANGES = [
+    "UPDATE meta_info SET meta_value = '902' WHERE meta_key = 'release'",
+    f'''UPDATE ensembl_genes
+           SET ensembl_version = ensembl_version + 1
+         WHERE {CHANGED['version']}''',
+    f'''UPDATE ensembl_genes
+           SET symbol = symbol || 'r'
+         WHERE {CHANGED['renamed']}''',
+    f'''DELETE FROM ensembl_genes_rtree
+         WHERE ensembl_genes_key IN (SELECT ensembl_genes_key
+                                       FROM ensembl_genes
+                                      WHERE {CHANGED['removed']})''',
+    f'''DELETE FROM ensembl_genes
+         WHERE {CHANGED['removed']}''',
+]
+
+SQL_LEGACY = [
+    'DROP TABLE ensembl_genes_rtree',
+    'DROP TABLE ensembl_gtpe_rtree',
+    'DROP TABLE ensembl_search',
+    '''CREATE VIRTUAL TABLE ensembl_search
+           USING fts4(ensembl_genes_lookup_key, lookup_value)''',
+    '''INSERT INTO ensembl_search
+       SELECT ensembl_genes_lookup_key, lookup_value
+         FROM ensembl_genes_lookup''',
+    "DELETE FROM meta_info WHERE meta_key LIKE 'stats:%'",
+    'DROP INDEX idx_search_ranking_id',
+]
+'''Turn a database into one built before the spatial indices, the lookup
+counts and the external content ``ensembl_search``.'''
+
+
+def get_file(directory, release):
+    """Get the database file of `release` in `directory`."""
+    return os.path.join(directory, f'ensimpl.{release}.{SPECIES}.db3')
+
+
+def get_regions(found):
+    """Get the regions around the genes in `found`, each a few genes wide,
+    and the whole of a few chromosomes."""
+    regions = ['1:1-200000000', 'X:1-200000000', 'MT:1-20000']
+
+    for gene in list(found.values())[::5]:
+        regions.append(f'{gene["chromosome"]}:'
+                       f'{max(1, gene["start"] - 5000000)}-'
+                       f'{gene["end"] + 5000000}')
+
+    return regions
+
+
+def get_results(release):
+    """Get the results of the main fetch functions for `release` of the
+    layout being served.
+
+    Returns:
+        dict: The results by function and input.
+    """
+    results = {}
+
+    found = genes.get(IDS, release, SPECIES, details=True)
+    results['genes'] = found
+    results['genes_position'] = genes.get(IDS, release, SPECIES,
+                                          order='position')
+    results['homology'] = genes.get_homology(IDS, release, SPECIES)
+
+    terms = [gene['symbol'] for gene in found.values()][:30]
+    terms += IDS[:10] + ['Gm*', 'Dnah*', 'MGI:10', '100050']
+
+    for term in terms:
+        for exact in (True, False):
+            result = search.search(term, release, SPECIES, exact)
+            results[f'search {term} {exact}'] = [
+                match.__dict__ for match in result.matches]
+
+    for region in get_regions(found):
+        result = search.search(region, release, SPECIES)
+        results[f'search {region}'] = [
+            match.__dict__ for match in result.matches]
+        results[f'features {region}'] = features.get_features(
+            region, release, SPECIES)
+
+    return results
+
+
+def _execute(ensimpl_file, statements):
+    """Run `statements` on `ensimpl_file` and vacuum it."""
+    conn = sqlite3.connect(ensimpl_file)
+
+    for sql in statements:
+        conn.execute(sql)
+
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def create_layouts(tmp_path_factory, num_genes=NUM_GENES):
+    """Create the databases of every layout.
+
+    Args:
+        tmp_path_factory: The pytest ``tmp_path_factory``.
+        num_genes (int, optional): The number of genes of release 901.
+
+    Returns:
+        dict: The directory of each of :data:`LAYOUTS`.
+    """
+    dirs = {layout: str(tmp_path_factory.mktemp(layout))
+            for layout in LAYOUTS}
+
+    plain = dirs['plain']
+    spec = synthetic.get_spec(SPECIES, num_genes=num_genes)
+    synthetic.generate(plain, RELEASES[0], SPECIES, spec, seed=1)
+
+    shutil.copy(get_file(plain, RELEASES[0]), get_file(plain, RELEASES[1]))
+    _execute(get_file(plain, RELEASES[1]), SQL_CHANGES)
+
+    create_diff.create(get_file(plain, RELEASES[0]),
+                       get_file(plain, RELEASES[1]),
+                       create_diff.get_diff_file(plain, *RELEASES, SPECIES),
+                       *RELEASES, SPECIES)
+
+    store_file = store.get_store_file(dirs['store'], SPECIES)
+
+    for release in RELEASES:
+        store.add_release(store_file, get_file(plain, release))
+
+        compact_file = get_file(dirs['compact'], release)
+        shutil.copy(get_file(plain, release), compact_file)
+        ensimpl_db.compact_db(compact_file)
+        _execute(compact_file, ['ANALYZE'])
+
+        legacy_file = get_file(dirs['legacy'], release)
+        shutil.copy(get_file(plain, release), legacy_file)
+        _execute(legacy_file, SQL_LEGACY)
+
+    return dirs
+
+
+@pytest.fixture(scope='session')
+def layouts(tmp_path_factory):
+    """The databases of every layout, see :func:`create_layouts`."""
+    return create_layouts(tmp_path_factory)
+
+
+@pytest.fixture(params=LAYOUTS)
+def layout(request, layouts):
+    """Serve each layout in turn.
+
+    Returns:
+        str: The name of the layout.
+    """
+    db_config.init(layouts[request.param])
+    return request.param
+
+
+@pytest.fixture
+def use_layout(layouts):
+    """Serve a layout.
+
+    Returns:
+        function: Called with the name of the layout.
+    """
+    def use(name):
+        db_config.init(layouts[name])
+
+    return use
+
+
+@pytest.fixture
+def create_app(layouts):
+    """Create the application serving the ``plain`` layout.
+
+    Returns:
+        function: Called with the settings to override, returns the
+            application.
+    """
+    from ensimpl.app import create_app
+
+    def create(**settings):
+        app = create_app(dict({'LOG_LEVEL': 'ERROR', 'TESTING': True},
+                              **settings))
+        db_config.init(layouts['plain'])
+        return app
+
+    yield create
+
+    # the slow query log is configured by the application
+    querylog.configure(None, querylog.DEFAULT_SIZE)
+    querylog.clear()
@@ -0,0 +1,55 @@
+CREATE TABLE `genome_db` (
+  `genome_db_id` int(10) unsigned NOT NULL,
+  `taxon_id` int(10) unsigned DEFAULT NULL,
+  PRIMARY KEY (`genome_db_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `species_set` (
+  `species_set_id` int(10) unsigned NOT NULL,
+  `genome_db_id` int(10) unsigned NOT NULL,
+  PRIMARY KEY (`species_set_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `method_link` (
+  `method_link_id` int(10) unsigned NOT NULL,
+  `type` varchar(50) NOT NULL DEFAULT '',
+  PRIMARY KEY (`method_link_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `method_link_species_set` (
+  `method_link_species_set_id` int(10) unsigned NOT NULL,
+  `method_link_id` int(10) unsigned DEFAULT NULL,
+  `species_set_id` int(10) unsigned NOT NULL,
+  `source` varchar(255) NOT NULL DEFAULT 'ensembl',
+  PRIMARY KEY (`method_link_species_set_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `homology` (
+  `homology_id` int(10) unsigned NOT NULL,
+  `method_link_species_set_id` int(10) unsigned NOT NULL,
+  `description` enum('ortholog_one2one','ortholog_one2many','within_species_paralog') DEFAULT NULL,
+  `dn` float(10,5) DEFAULT NULL,
+  `ds` float(10,5) DEFAULT NULL,
+  `goc_score` tinyint(3) unsigned DEFAULT NULL,
+  `wga_coverage` decimal(5,2) DEFAULT NULL,
+  `is_high_confidence` tinyint(1) DEFAULT NULL,
+  PRIMARY KEY (`homology_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `homology_member` (
+  `homology_id` int(10) unsigned NOT NULL,
+  `gene_member_id` int(10) unsigned NOT NULL,
+  `perc_cov` float DEFAULT 0,
+  `perc_id` float DEFAULT 0,
+  `perc_pos` float DEFAULT 0,
+  PRIMARY KEY (`homology_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `gene_member` (
+  `gene_member_id` int(10) unsigned NOT NULL,
+  `stable_id` varchar(128) NOT NULL,
+  `version` int(10) DEFAULT 0,
+  `taxon_id` int(10) unsigned NOT NULL,
+  `display_label` varchar(128) DEFAULT NULL,
+  PRIMARY KEY (`gene_member_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
@@ -0,0 +1,103 @@
+CREATE TABLE `coord_system` (
+  `coord_system_id` int(10) unsigned NOT NULL,
+  `name` varchar(40) NOT NULL,
+  `rank` int(11) NOT NULL,
+  PRIMARY KEY (`coord_system_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `seq_region` (
+  `seq_region_id` int(10) unsigned NOT NULL,
+  `name` varchar(255) NOT NULL,
+  `coord_system_id` int(10) unsigned NOT NULL,
+  `length` int(10) unsigned NOT NULL,
+  PRIMARY KEY (`seq_region_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `karyotype` (
+  `karyotype_id` int(10) unsigned NOT NULL,
+  `seq_region_id` int(10) unsigned NOT NULL,
+  `seq_region_start` int(10) NOT NULL,
+  `seq_region_end` int(10) NOT NULL,
+  `band` varchar(40) DEFAULT NULL,
+  `stain` varchar(40) DEFAULT NULL,
+  PRIMARY KEY (`karyotype_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `external_db` (
+  `external_db_id` int(10) unsigned NOT NULL,
+  `db_name` varchar(100) NOT NULL,
+  `db_display_name` varchar(255) DEFAULT NULL,
+  PRIMARY KEY (`external_db_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `xref` (
+  `xref_id` int(10) unsigned NOT NULL,
+  `external_db_id` int(10) unsigned NOT NULL,
+  `dbprimary_acc` varchar(512) NOT NULL,
+  `display_label` varchar(512) NOT NULL,
+  `version` varchar(10) NOT NULL DEFAULT '0',
+  `description` text,
+  PRIMARY KEY (`xref_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `external_synonym` (
+  `xref_id` int(10) unsigned NOT NULL,
+  `synonym` varchar(100) NOT NULL,
+  PRIMARY KEY (`xref_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `gene` (
+  `gene_id` int(10) unsigned NOT NULL,
+  `biotype` varchar(40) NOT NULL,
+  `seq_region_id` int(10) unsigned NOT NULL,
+  `seq_region_start` int(10) unsigned NOT NULL,
+  `seq_region_end` int(10) unsigned NOT NULL,
+  `seq_region_strand` tinyint(2) NOT NULL,
+  `display_xref_id` int(10) unsigned DEFAULT NULL,
+  `stable_id` varchar(128) DEFAULT NULL,
+  `version` smallint(5) unsigned DEFAULT NULL,
+  PRIMARY KEY (`gene_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `transcript` (
+  `transcript_id` int(10) unsigned NOT NULL,
+  `gene_id` int(10) unsigned DEFAULT NULL,
+  `seq_region_start` int(10) unsigned NOT NULL,
+  `seq_region_end` int(10) unsigned NOT NULL,
+  `display_xref_id` int(10) unsigned DEFAULT NULL,
+  `stable_id` varchar(128) DEFAULT NULL,
+  `version` smallint(5) unsigned DEFAULT NULL,
+  PRIMARY KEY (`transcript_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `translation` (
+  `translation_id` int(10) unsigned NOT NULL,
+  `transcript_id` int(10) unsigned NOT NULL,
+  `stable_id` varchar(128) DEFAULT NULL,
+  `version` smallint(5) unsigned DEFAULT NULL,
+  PRIMARY KEY (`translation_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `exon` (
+  `exon_id` int(10) unsigned NOT NULL,
+  `seq_region_start` int(10) unsigned NOT NULL,
+  `seq_region_end` int(10) unsigned NOT NULL,
+  `stable_id` varchar(128) DEFAULT NULL,
+  `version` smallint(5) unsigned DEFAULT NULL,
+  PRIMARY KEY (`exon_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `object_xref` (
+  `object_xref_id` int(10) unsigned NOT NULL,
+  `ensembl_id` int(10) unsigned NOT NULL,
+  `ensembl_object_type` enum('Gene','Transcript') NOT NULL,
+  `xref_id` int(10) unsigned NOT NULL,
+  PRIMARY KEY (`object_xref_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
+
+CREATE TABLE `exon_transcript` (
+  `exon_id` int(10) unsigned NOT NULL,
+  `transcript_id` int(10) unsigned NOT NULL,
+  `rank` int(10) NOT NULL,
+  PRIMARY KEY (`exon_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;
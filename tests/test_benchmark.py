@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from ensimpl.bench import benchmark
+
+
+@pytest.mark.parametrize('values, pct, expected', [
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 11)), 51, 6),
+    (list(range(1, 11)), 100, 10),
+    (list(range(1, 11)), 0, 1),
+    (list(range(1, 101)), 7, 7),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 99, 99),
+    (list(range(1, 101)), 99.5, 100),
+    (list(range(1, 21)), 95, 19),
+    ([15, 20, 35, 40, 50], 30, 20),
+    ([15, 20, 35, 40, 50], 40, 20),
+    ([15, 20, 35, 40, 50], 50, 35),
+    ([3], 99, 3),
+])
+def test_percentile(values, pct, expected):
+    assert benchmark.percentile(values, pct) == expected
+
+
+def test_percentile_empty():
+    assert benchmark.percentile([], 50) is None
+
+
+def test_summarize():
+    summary = benchmark.summarize([i / 1000.0 for i in range(100, 0, -1)],
+                                  2.0)
+
+    assert summary['count'] == 100
+    assert summary['p50_ms'] == pytest.approx(50)
+    assert summary['p95_ms'] == pytest.approx(95)
+    assert summary['p99_ms'] == pytest.approx(99)
+    assert summary['max_ms'] == pytest.approx(100)
+    assert summary['throughput'] == 50
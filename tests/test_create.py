@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sqlite3
+
+import pytest
+
+import ensimpl.create.create_ensimpl as create_ensimpl
+import ensimpl.create.ensimpl_db as ensimpl_db
+
+from tests.test_ensembl_dump import DUMP_DIRECTORY, REFS
+
+
+def test_build_resumes_from_checkpoint(tmp_path, monkeypatch):
+    ref = REFS['100']._replace(user_id='builder', password='secret')
+    ensimpl_file = str(tmp_path / 'ensimpl.100.Mm.db3')
+    checkpoint_file = f'{ensimpl_file}.checkpoint'
+    cache_directory = str(tmp_path / 'cache')
+    os.makedirs(cache_directory)
+    finalize = ensimpl_db.finalize
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('interrupted')
+
+    monkeypatch.setattr(ensimpl_db, 'finalize', fail)
+
+    with pytest.raises(RuntimeError):
+        create_ensimpl.build(ref, ensimpl_file, 1, DUMP_DIRECTORY,
+                             cache_directory)
+
+    with open(checkpoint_file) as fd:
+        text = fd.read()
+
+    # the credentials are never written
+    assert 'secret' not in text and 'builder' not in text
+    assert 'initialize' in json.loads(text)['phases']
+
+    monkeypatch.setattr(ensimpl_db, 'finalize', finalize)
+    create_ensimpl.build(ref, ensimpl_file, 1, DUMP_DIRECTORY,
+                         cache_directory, reuse_cache=True)
+
+    assert not os.path.exists(checkpoint_file)
+
+    conn = sqlite3.connect(ensimpl_file)
+    assert conn.execute('SELECT count(*) '
+                        '  FROM ensembl_genes').fetchone()[0] == 2
+    conn.close()
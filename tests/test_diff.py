@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import ensimpl.create.diff as create_diff
+import ensimpl.db_config as db_config
+from ensimpl.fetch import diff
+
+from tests.conftest import CHANGED, RELEASES, SPECIES, get_file
+
+
+@pytest.fixture
+def expected(layouts, use_layout):
+    """The number of genes of each kind of change."""
+    use_layout('plain')
+
+    conn = sqlite3.connect(get_file(layouts['plain'], RELEASES[0]))
+    counts = {change: conn.execute(f'''
+        SELECT count(*)
+          FROM ensembl_genes
+         WHERE {where}
+           AND NOT {CHANGED['removed']}
+    ''').fetchone()[0] for change, where in CHANGED.items()}
+    counts['removed'] = conn.execute(f'''
+        SELECT count(*)
+          FROM ensembl_genes
+         WHERE {CHANGED['removed']}
+    ''').fetchone()[0]
+    conn.close()
+
+    return counts
+
+
+def test_get_diff(expected):
+    found = diff.get_diff(*RELEASES, SPECIES)
+
+    assert found['num_results'] == sum(expected.values())
+    assert found['next'] is None
+    assert len(found['changes']) == found['num_results']
+
+    for change, count in expected.items():
+        assert count
+        assert len([c for c in found['changes']
+                    if c['change'] == change]) == count
+
+
+def test_get_diff_filters(expected):
+    for change, count in expected.items():
+        found = diff.get_diff(*RELEASES, SPECIES, change=change)
+
+        assert found['num_results'] == count
+        assert {c['change'] for c in found['changes']} == {change}
+
+    assert diff.get_diff(*RELEASES, SPECIES, change_type='gene')[
+        'num_results'] == sum(expected.values())
+    assert diff.get_diff(*RELEASES, SPECIES, change_type='transcript')[
+        'num_results'] == 0
+
+
+def test_get_diff_pages(expected):
+    changes = []
+    after = None
+
+    while True:
+        page = diff.get_diff(*RELEASES, SPECIES, after=after, limit=7)
+        changes.extend(page['changes'])
+        after = page['next']
+
+        if after is None:
+            break
+
+        assert len(page['changes']) == 7
+
+    assert changes == diff.get_diff(*RELEASES, SPECIES)['changes']
+
+
+@pytest.mark.parametrize('params', [
+    {'limit': 0},
+    {'limit': -1},
+    {'change': 'deleted'},
+    {'change_type': 'exon'},
+])
+def test_get_diff_invalid(expected, params):
+    with pytest.raises(ValueError):
+        diff.get_diff(*RELEASES, SPECIES, **params)
+
+
+def test_get_diff_missing(use_layout):
+    use_layout('plain')
+
+    with pytest.raises(ValueError):
+        diff.get_diff(RELEASES[1], RELEASES[0], SPECIES)
+
+
+def test_get_diff_deleted(layouts, tmp_path):
+    for release in RELEASES:
+        shutil.copy(get_file(layouts['plain'], release), str(tmp_path))
+
+    diff_file = create_diff.get_diff_file(layouts['plain'], *RELEASES,
+                                          SPECIES)
+    shutil.copy(diff_file, str(tmp_path))
+    db_config.init(str(tmp_path))
+
+    diff_file = db_config.get_ensimpl_diff(*RELEASES, SPECIES)['diff']
+    os.remove(diff_file)
+
+    with pytest.raises(ValueError):
+        diff.get_diff(*RELEASES, SPECIES)
+
+    # not created empty
+    assert not os.path.exists(diff_file)
+
+
+def test_diff_route(create_app, caplog):
+    client = create_app().test_client(use_cookies=False)
+    params = {'from': RELEASES[0], 'to': RELEASES[1], 'species': SPECIES,
+              'limit': 5}
+
+    response = client.get('/api/diff', query_string=params)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert len(data['result']['changes']) == 5
+    assert data['result']['next'] is not None
+
+    response = client.get('/api/diff', query_string=dict(params, limit=0))
+
+    assert response.status_code == 500
+    assert response.get_json()['message'] == 'Invalid limit: 0'
+    assert 'Invalid limit: 0' in [record.getMessage()
+                                  for record in caplog.records]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Check the extractions from the MySQL dump files of ``tests/data/dump``
+against the SQL extractions of :mod:`ensimpl.create.ensembl_db`, run on a
+SQLite copy of the same tables.
+
+The dumps are those of a release with the stable ids in their tables and
+``gene_member`` in compara, and those of a release from before both, with
+the ``*_stable_id`` tables and ``member``.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import ensimpl.create.ensembl_db as ensembl_db
+import ensimpl.create.ensembl_dump as ensembl_dump
+from ensimpl.create.create_ensimpl import DUMP_EXTRACTIONS, EXTRACTIONS
+from ensimpl.create.create_ensimpl import EnsemblReference
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'data')
+
+DUMP_DIRECTORY = os.path.join(DATA_DIRECTORY, 'dump')
+
+REFS = {
+    '100': EnsemblReference('100', '2020-04-29', 'GRCm38', 'p6', 'Mm',
+                            'Mus musculus', '', 'mus_musculus_core_100_38',
+                            'ensembl_compara_100', 'localhost', '3306',
+                            'anonymous', ''),
+    '64': EnsemblReference('64', '2011-09-20', 'NCBIM37', '', 'Mm',
+                           'Mus musculus', '', 'mus_musculus_core_64_37',
+                           'ensembl_compara_64', 'localhost', '3306',
+                           'anonymous', ''),
+}
+'''A release of each schema, the release chooses the SQL.'''
+
+ESCAPES = [
+    ['1', 'plain', None],
+    ['2', 'tab\there', '\t'],
+    ['3', 'new\nline', 'end'],
+    ['4', '\\N', None],
+    ['5', 'ends with\\', ''],
+    ['6', '\n\r\0\x1a\\\b'],
+    ['7', 'many\n\nlines\\\n'],
+    ['8', '', ''],
+]
+'''The rows of ``tests/data/escapes.txt``.'''
+
+TYPES = {int: 'INTEGER', float: 'REAL', str: 'TEXT'}
+
+
+@pytest.fixture
+def escapes_file():
+    return os.path.join(DATA_DIRECTORY, 'escapes.txt')
+
+
+def test_read_rows(escapes_file):
+    assert list(ensembl_dump.read_rows(escapes_file)) == ESCAPES
+
+
+def test_read_rows_gzip(escapes_file, tmp_path):
+    gzip_file = str(tmp_path / 'escapes.txt.gz')
+
+    with open(escapes_file, 'rb') as fd, gzip.open(gzip_file, 'wb') as out:
+        shutil.copyfileobj(fd, out)
+
+    assert list(ensembl_dump.read_rows(gzip_file)) == ESCAPES
+
+
+def test_read_schema():
+    directory = os.path.join(DUMP_DIRECTORY, 'mus_musculus_core_64_37')
+    schema = ensembl_dump.read_schema(directory)
+
+    assert 'stable_id' not in schema['gene']
+    assert list(schema['gene_stable_id']) == ['gene_id', 'stable_id',
+                                              'version', 'created_date']
+    assert schema['gene']['seq_region_strand'] is int
+    assert schema['xref']['version'] is str
+    assert schema['xref']['description'] is str
+
+    directory = os.path.join(DUMP_DIRECTORY, 'ensembl_compara_100')
+    schema = ensembl_dump.read_schema(directory)
+
+    assert schema['homology']['wga_coverage'] is float
+    assert schema['homology']['dn'] is float
+
+
+def test_read_schema_missing(tmp_path):
+    with pytest.raises(ValueError):
+        ensembl_dump.read_schema(str(tmp_path))
+
+
+def test_stream_table():
+    directory = os.path.join(DUMP_DIRECTORY, 'mus_musculus_core_100_38')
+    schema = ensembl_dump.read_schema(directory)
+
+    rows = list(ensembl_dump.stream_table(directory, schema, 'xref',
+                                          ['xref_id', 'description']))
+
+    assert rows[:3] == [(100, 'ATP\tbinding\ncassette \\ subfamily'),
+                        (101, None),
+                        (102, '\\N')]
+
+    with pytest.raises(ValueError):
+        list(ensembl_dump.stream_table(directory, schema, 'gene_stable_id',
+                                       ['gene_id']))
+
+
+def load_database(directory):
+    """Load every table of a dump `directory` into an in-memory database."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = lambda cursor, row: {
+        column[0]: value for column, value in zip(cursor.description, row)}
+    schema = ensembl_dump.read_schema(directory)
+
+    for table, columns in schema.items():
+        names = list(columns)
+        cols = ', '.join(f'"{name}" {TYPES[columns[name]]}'
+                         for name in names)
+        conn.execute(f'CREATE TABLE {table} ({cols})')
+        conn.executemany(f'INSERT INTO {table} '
+                         f'VALUES ({",".join("?" * len(names))})',
+                         ensembl_dump.stream_table(directory, schema, table,
+                                                   names))
+
+    return conn
+
+
+@pytest.fixture
+def ensembl_server(monkeypatch):
+    """Serve the SQL extractions of :mod:`ensimpl.create.ensembl_db` from
+    the dump tables."""
+    databases = {}
+
+    def stream_rows(ref, sql, db=None, fetch_size=None):
+        db = db or ref.db
+
+        if db not in databases:
+            databases[db] = load_database(os.path.join(DUMP_DIRECTORY, db))
+
+        yield from databases[db].execute(sql)
+
+    monkeypatch.setattr(ensembl_db, 'stream_rows', stream_rows)
+
+
+def normalize(name, rows):
+    """The SQL leaves the order of the ids of a gene, and the dumps the order
+    of the homologs, undefined."""
+    if name == 'genes':
+        for row in rows:
+            row['ids'].sort(key=lambda i: i['xref_id'])
+    elif name == 'homologs':
+        rows.sort(key=lambda r: (r['mm_id'], r['hs_id']))
+
+    return rows
+
+
+@pytest.mark.parametrize('release', sorted(REFS))
+@pytest.mark.parametrize('name', list(EXTRACTIONS))
+def test_extractions(ensembl_server, release, name):
+    ref = REFS[release]
+
+    expected = normalize(name, list(EXTRACTIONS[name](ref)))
+    rows = normalize(name, list(DUMP_EXTRACTIONS[name](ref, DUMP_DIRECTORY)))
+
+    assert rows == expected
+    assert rows
+
+
+def test_extractions_of_both_schemas():
+    """Both dumps hold the same data."""
+    for name in ('chromosomes', 'synonyms', 'genes', 'gtpe'):
+        assert list(DUMP_EXTRACTIONS[name](REFS['64'], DUMP_DIRECTORY)) == \
+            list(DUMP_EXTRACTIONS[name](REFS['100'], DUMP_DIRECTORY)), name
+
+
+def test_genes():
+    genes = list(ensembl_dump.iter_ensembl_genes(REFS['100'],
+                                                 DUMP_DIRECTORY))
+
+    # not on a chromosome, or a display xref of an unknown database
+    assert [gene['ensembl_id'] for gene in genes] == ['ENSMUSG00000000001',
+                                                      'ENSMUSG00000000002']
+    assert genes[0]['description'] == '\\N'
+    assert genes[1]['description'] == 'ATP\tbinding\ncassette \\ subfamily'
+
+
+def test_homologs_scores():
+    """The scores are only read from release 86."""
+    for release, goc_score in (('64', None), ('100', 75)):
+        homologs = {(h['mm_id'], h['hs_id']): h for h in
+                    ensembl_dump.iter_ensembl_homologs(REFS[release],
+                                                       DUMP_DIRECTORY)}
+
+        assert len(homologs) == 3
+        assert homologs['ENSMUSG00000000002',
+                        'ENSG00000000001']['goc_score'] == goc_score
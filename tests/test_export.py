@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import ensimpl.fetch.utils as fetch_utils
+from ensimpl.cli.commands import cmd_export
+from ensimpl.fetch import export
+
+from tests.conftest import RELEASES, SPECIES
+
+pa = pytest.importorskip('pyarrow')
+pytest.importorskip('pyarrow.parquet')
+
+KEYS = {
+    'ensembl_genes': ['ensembl_id', 'ensembl_version', 'chromosome',
+                      'start_position', 'end_position'],
+    'ensembl_gtpe': ['gene_id', 'transcript_id', 'ensembl_id', 'type_key',
+                     'seqid', 'start', 'end'],
+    'ensembl_gene_ids': ['ensembl_id', 'external_id', 'external_db'],
+    'ensembl_homologs': ['ensembl_id', 'homolog_id', 'perc_id'],
+}
+'''The columns of each table compared with the database.'''
+
+
+def read_file(file_name, file_format):
+    """Read an exported file back as a ``pyarrow.Table``."""
+    if file_format == 'parquet':
+        return pa.parquet.read_table(file_name)
+
+    with pa.ipc.open_file(file_name) as reader:
+        return reader.read_all()
+
+
+def get_rows(table, chromosome=None):
+    """Get the :data:`KEYS` columns of `table` from the database served."""
+    cols = ', '.join(KEYS[table])
+    sql = f'SELECT {cols} FROM {table}'
+    params = {}
+
+    if chromosome is not None:
+        sql = f'{sql} WHERE {export.TABLES[table]}'
+        params['chromosome'] = chromosome
+
+    conn = fetch_utils.connect_to_database(RELEASES[0], SPECIES)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+
+    return sorted(rows, key=repr)
+
+
+def get_file_rows(arrow_table, table):
+    """Get the :data:`KEYS` columns of an exported `arrow_table`."""
+    columns = [arrow_table.column(name).to_pylist() for name in KEYS[table]]
+    return sorted(zip(*columns), key=repr)
+
+
+@pytest.mark.parametrize('by_chromosome', [False, True])
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_export(layout, tmp_path, file_format, by_chromosome):
+    counts = export.export(str(tmp_path), RELEASES[0], SPECIES,
+                           file_format=file_format,
+                           by_chromosome=by_chromosome, row_group_size=100,
+                           workers=2)
+
+    assert sorted(counts) == sorted(str(path) for path in tmp_path.iterdir())
+
+    chromosomes = [None]
+    if by_chromosome:
+        chromosomes = export.get_chromosomes(RELEASES[0], SPECIES)
+        assert '1' in chromosomes and 'X' in chromosomes
+
+    for table in export.TABLES:
+        num_rows = 0
+
+        for chromosome in chromosomes:
+            file_name = export.get_file_name(str(tmp_path), RELEASES[0],
+                                             SPECIES, table, file_format,
+                                             chromosome)
+            arrow_table = read_file(file_name, file_format)
+            expected = get_rows(table, chromosome)
+
+            assert counts[file_name] == arrow_table.num_rows == len(expected)
+            assert get_file_rows(arrow_table, table) == expected, file_name
+
+            num_rows += arrow_table.num_rows
+
+        assert num_rows == len(get_rows(table))
+        assert num_rows > 0
+
+
+def test_export_types(use_layout, tmp_path):
+    use_layout('plain')
+    export.export(str(tmp_path), RELEASES[0], SPECIES, ['ensembl_genes'])
+
+    schema = read_file(export.get_file_name(str(tmp_path), RELEASES[0],
+                                            SPECIES, 'ensembl_genes',
+                                            'parquet'), 'parquet').schema
+
+    assert schema.field('start_position').type == pa.int64()
+    assert schema.field('ensembl_id').type == pa.string()
+
+
+def test_export_unknown(use_layout, tmp_path):
+    use_layout('plain')
+
+    with pytest.raises(ValueError):
+        export.export(str(tmp_path), RELEASES[0], SPECIES, file_format='csv')
+
+    with pytest.raises(ValueError):
+        export.export(str(tmp_path), RELEASES[0], SPECIES, ['chromosomes'])
+
+    assert not os.listdir(str(tmp_path))
+
+
+def test_export_command(use_layout, tmp_path):
+    use_layout('plain')
+    result = CliRunner().invoke(cmd_export.cli, [
+        '-d', str(tmp_path), '-f', 'arrow', '-t', 'ensembl_genes',
+        '--ver', RELEASES[0], '-s', SPECIES])
+
+    assert result.exit_code == 0, result.output
+    assert os.listdir(str(tmp_path)) == [os.path.basename(
+        export.get_file_name(str(tmp_path), RELEASES[0], SPECIES,
+                             'ensembl_genes', 'arrow'))]
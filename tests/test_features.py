@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+import ensimpl.fetch.utils as fetch_utils
+from ensimpl.fetch import features
+
+from tests.conftest import RELEASES, SPECIES
+
+REGION = '1:1-200000000'
+
+
+def test_get_features(layout):
+    region = fetch_utils.str_to_region(REGION)
+    found = features.get_features(region, RELEASES[0], SPECIES)
+
+    assert found
+    assert {feature['type'] for feature in found} == \
+        set(features.FEATURE_TYPES)
+
+    for feature in found:
+        assert feature['chromosome'] == region.chromosome
+        assert feature['start'] <= region.end_position
+        assert feature['end'] >= region.start_position
+
+    assert found == sorted(found, key=lambda f: (f['start'], f['end']))
+
+
+def test_get_features_types(layout):
+    found = features.get_features(REGION, RELEASES[0], SPECIES)
+
+    for types in (['EG'], ['ET', 'EP']):
+        assert features.get_features(REGION, RELEASES[0], SPECIES,
+                                     types) == \
+            [feature for feature in found if feature['type'] in types]
+
+
+def test_get_features_limit(layout):
+    found = features.get_features(REGION, RELEASES[0], SPECIES)
+
+    assert features.get_features(REGION, RELEASES[0], SPECIES,
+                                 limit=5) == found[:5]
+
+
+@pytest.mark.parametrize('region, feature_types', [
+    ('not a region', None),
+    (REGION, ['EG', 'XX']),
+])
+def test_get_features_invalid(layout, region, feature_types):
+    with pytest.raises(ValueError):
+        features.get_features(region, RELEASES[0], SPECIES, feature_types)
+
+
+def test_spatial_index(use_layout):
+    rnd = random.Random(1)
+    regions = []
+
+    for _ in range(100):
+        start = rnd.randint(1, 190000000)
+        end = start + rnd.choice([1, 10000, 1000000, 20000000])
+        regions.append(f'{rnd.choice(["1", "2", "X"])}:{start}-{end}')
+
+    use_layout('plain')
+    expected = [features.get_features(region, RELEASES[0], SPECIES)
+                for region in regions]
+
+    use_layout('legacy')
+    for region, found in zip(regions, expected):
+        assert features.get_features(region, RELEASES[0],
+                                     SPECIES) == found, region
+
+    assert sum(map(bool, expected)) > 10
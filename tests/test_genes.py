@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from ensimpl.fetch import genes
+
+from tests.conftest import CHANGED, IDS, RELEASES, SPECIES, get_file
+
+
+@pytest.mark.parametrize('details', [False, True])
+def test_iter_genes(layout, details):
+    found = list(genes.iter_genes(IDS, RELEASES[0], SPECIES,
+                                  details=details))
+
+    assert [match_id for match_id, gene in found] == sorted(IDS)
+    assert found == list(genes.get(IDS, RELEASES[0], SPECIES,
+                                   details=details).items())
+    assert all(('transcripts' in gene) == details for _, gene in found)
+
+
+def test_iter_genes_homolog_batches(use_layout, monkeypatch):
+    use_layout('plain')
+    expected = list(genes.iter_genes(IDS, RELEASES[0], SPECIES,
+                                     details=True))
+
+    monkeypatch.setattr(genes, 'HOMOLOG_BATCH_SIZE', 7)
+
+    assert list(genes.iter_genes(IDS, RELEASES[0], SPECIES,
+                                 details=True)) == expected
+
+
+def test_iter_genes_all(layouts, layout):
+    conn = sqlite3.connect(get_file(layouts['plain'], RELEASES[1]))
+    expected = [row[0] for row in conn.execute('SELECT ensembl_id '
+                                               '  FROM ensembl_genes '
+                                               ' ORDER BY ensembl_id')]
+    conn.close()
+
+    found = [match_id for match_id, _ in
+             genes.iter_genes(None, RELEASES[1], SPECIES)]
+
+    assert found == expected
+
+
+def test_iter_genes_removed(layouts, layout):
+    conn = sqlite3.connect(get_file(layouts['plain'], RELEASES[0]))
+    removed = {row[0] for row in conn.execute(f'''
+        SELECT ensembl_id
+          FROM ensembl_genes
+         WHERE {CHANGED['removed']}
+    ''')}
+    conn.close()
+
+    found = {match_id for match_id, _ in
+             genes.iter_genes(IDS, RELEASES[1], SPECIES)}
+
+    assert removed & set(IDS)
+    assert found == set(IDS) - removed
+
+
+def test_iter_genes_position(layout):
+    found = [gene for _, gene in
+             genes.iter_genes(IDS, RELEASES[0], SPECIES, order='position')]
+
+    for previous, gene in zip(found, found[1:]):
+        if previous['chromosome'] == gene['chromosome']:
+            assert previous['start'] <= gene['start']
+
+    assert sorted(gene['id'] for gene in found) == sorted(IDS)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_FACTOR = 3
+'''Import time of ``ensimpl --help`` relative to that of click alone on the
+same machine, as reported by ``python -X importtime``, so it does not
+depend on how fast or loaded the machine is.  It is less than twice, pymysql,
+pyarrow or flask would each take it over.'''
+
+NOT_IMPORTED = ['tabulate', 'pyarrow', 'pymysql', 'flask', 'ensimpl.fetch',
+                'ensimpl.create']
+'''Modules, and their submodules, that the commands import when they run.'''
+
+RUNS = 3
+
+REGEX_IMPORT_TIME = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)')
+
+SCRIPT = '''
+from ensimpl.cli.cli import cli
+cli(['--help'])
+'''
+'''Load every command, as listing them for the help does.'''
+
+SCRIPT_BASELINE = 'import click'
+
+
+def get_import_times(script=SCRIPT):
+    """Run `script` with ``-X importtime``.
+
+    Returns:
+        tuple: The total import time, in microseconds, and the names of the
+            modules imported.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT,
+               ENSIMPL_DIR=os.path.join(ROOT, 'tests'))
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                              script], env=env, cwd=ROOT,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+
+    assert process.returncode == 0, process.stderr
+
+    total = 0
+    modules = []
+
+    for line in process.stderr.splitlines():
+        match = REGEX_IMPORT_TIME.match(line)
+
+        if match:
+            cumulative, indent, module = match.groups()
+            modules.append(module)
+
+            # only the top level, the others are part of its cumulative time
+            if len(indent) == 1:
+                total += int(cumulative)
+
+    return total, modules
+
+
+def get_fastest(script):
+    """The fastest of :data:`RUNS` runs of :func:`get_import_times`."""
+    return min((get_import_times(script) for _ in range(RUNS)),
+               key=lambda times: times[0])
+
+
+@pytest.fixture(scope='module')
+def import_times():
+    return get_fastest(SCRIPT)
+
+
+def test_help_imports(import_times):
+    _, modules = import_times
+
+    assert 'ensimpl.cli.cli' in modules
+
+    for module in modules:
+        for name in NOT_IMPORTED:
+            assert not (module == name or module.startswith(f'{name}.')), \
+                module
+
+
+def test_help_import_time(import_times):
+    total, _ = import_times
+    baseline, _ = get_fastest(SCRIPT_BASELINE)
+
+    assert 0 < total < IMPORT_TIME_FACTOR * baseline, (total, baseline)
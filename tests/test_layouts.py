@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from tests.conftest import RELEASES, get_results
+
+
+@pytest.mark.parametrize('release', RELEASES)
+def test_layouts_agree(layout, use_layout, release):
+    """Every layout returns what the databases as built return."""
+    results = get_results(release)
+
+    use_layout('plain')
+    expected = get_results(release)
+
+    assert results.keys() == expected.keys()
+
+    for key in expected:
+        assert results[key] == expected[key], key
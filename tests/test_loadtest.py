@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import time
+
+from ensimpl.bench import loadtest
+
+DURATION = 0.05
+
+
+def slow_target(request):
+    """A target that takes :data:`DURATION` seconds per request."""
+    time.sleep(DURATION)
+    return 200, 10
+
+
+def get_requests(num):
+    return [loadtest.Request('GET', f'/api/gene/{i}', None, '/api/gene/<id>',
+                             None) for i in range(num)]
+
+
+def test_run_rate_counts_the_wait_for_a_worker():
+    # one worker and a request every 10ms, each waits for all before it
+    results = loadtest.run(get_requests(5), slow_target, concurrency=1,
+                           rate=100)
+    overall = results['overall']
+
+    assert overall['count'] == 5
+    assert overall['max_ms'] >= 5 * DURATION * 1000 - 40
+    assert overall['late_start_max_ms'] >= 4 * DURATION * 1000 - 40
+    assert overall['late_start_p50_ms'] <= overall['late_start_max_ms']
+
+
+def test_run_closed_loop():
+    results = loadtest.run(get_requests(4), slow_target, concurrency=2)
+    overall = results['overall']
+
+    assert overall['count'] == 4
+    assert overall['p50_ms'] >= DURATION * 1000
+    assert 'late_start_p50_ms' not in overall
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import ensimpl.create.optimize as optimize
+import ensimpl.create.store as store
+import ensimpl.db_config as db_config
+
+from tests.conftest import RELEASES, SPECIES, get_file, get_results
+
+
+def get_schema(ensimpl_file):
+    """Get the names and types of the tables and indices."""
+    conn = sqlite3.connect(ensimpl_file)
+    schema = conn.execute('SELECT type, name '
+                          '  FROM sqlite_master '
+                          " WHERE name NOT LIKE 'sqlite_%' "
+                          ' ORDER BY type, name').fetchall()
+    conn.close()
+
+    return schema
+
+
+def upgrade(ensimpl_file):
+    """Upgrade `ensimpl_file` in place."""
+    conn = sqlite3.connect(ensimpl_file)
+
+    try:
+        return optimize.upgrade(conn)
+    finally:
+        conn.close()
+
+
+def test_upgrade_legacy(layouts, tmp_path):
+    ensimpl_file = get_file(str(tmp_path), RELEASES[0])
+    shutil.copy(get_file(layouts['legacy'], RELEASES[0]), ensimpl_file)
+
+    changes = upgrade(ensimpl_file)
+
+    assert 'created index idx_search_ranking_id' in changes
+    assert 'rebuilt ensembl_search as external content' in changes
+    assert 'created the spatial indices' in changes
+    assert 'stored the lookup counts' in changes
+
+    assert upgrade(ensimpl_file) == []
+    assert (get_schema(ensimpl_file) ==
+            get_schema(get_file(layouts['plain'], RELEASES[0])))
+
+
+@pytest.mark.parametrize('name', ['plain', 'compact'])
+def test_upgrade_current(layouts, tmp_path, name):
+    ensimpl_file = get_file(str(tmp_path), RELEASES[0])
+    shutil.copy(get_file(layouts[name], RELEASES[0]), ensimpl_file)
+
+    assert upgrade(ensimpl_file) == []
+
+
+def test_upgrade_store(layouts):
+    store_file = store.get_store_file(layouts['store'], SPECIES)
+    conn = sqlite3.connect(store_file)
+
+    with pytest.raises(ValueError):
+        optimize.upgrade(conn)
+
+    conn.close()
+
+
+def test_optimize(layouts, use_layout, tmp_path):
+    for release in RELEASES:
+        result = optimize.optimize(get_file(layouts['legacy'], release),
+                                   get_file(str(tmp_path), release),
+                                   page_size=8192, sample_size=0)
+
+        assert result.changes
+        assert os.path.exists(result.ensimpl_file)
+
+    for release in RELEASES:
+        use_layout('legacy')
+        expected = get_results(release)
+
+        db_config.init(str(tmp_path))
+        results = get_results(release)
+
+        for key in expected:
+            assert results[key] == expected[key], key
+
+        conn = sqlite3.connect(get_file(str(tmp_path), release))
+        assert conn.execute('PRAGMA page_size').fetchone()[0] == 8192
+        conn.close()
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""Check the query plans of the ``SQL_*`` queries of :mod:`ensimpl.fetch`.
+
+Each query is explained on every layout the fetch functions serve, the
+databases as built, compact and the views of a store, and must use the
+indices it was written for without scanning a large table.  The legacy
+layout only runs the queries written for it.  :mod:`ensimpl.fetch.history`
+has no queries of its own, it reads through :func:`ensimpl.fetch.genes.get`.
+
+The planner chooses differently for tiny tables, so the databases are
+larger than those of the other tests.
+"""
+import re
+import sqlite3
+
+import pytest
+
+import ensimpl.create.diff as create_diff
+import ensimpl.db_config as db_config
+import ensimpl.fetch.utils as fetch_utils
+from ensimpl.fetch import diff
+from ensimpl.fetch import features
+from ensimpl.fetch import genes
+from ensimpl.fetch import get
+from ensimpl.fetch import search
+
+from tests.conftest import IDS, RELEASES, SPECIES, create_layouts
+
+NUM_GENES = 3000
+
+LARGE_TABLES = ['ensembl_genes', 'ensembl_gtpe', 'ensembl_homologs',
+                'ensembl_gene_ids', 'ensembl_genes_lookup', 'stable_ids']
+'''Tables, with their compact encoding, that must not be scanned.'''
+
+REGEX_SCAN = re.compile(r'^SCAN (\S+)( USING (COVERING )?INDEX \S+)?$')
+
+REGEX_ALIAS = re.compile(r'\b(?:FROM|,)\s*(?:main\.)?(\w+)\s+(\w+)\b',
+                         re.IGNORECASE)
+
+RTREE = 'VIRTUAL TABLE INDEX 2:B0D1B2D3'
+'''The R*Tree constrained on the chromosome and both ends of the region.'''
+
+FULL_TEXT = 'VIRTUAL TABLE INDEX'
+
+PRIMARY_KEY = 'USING INTEGER PRIMARY KEY'
+
+EXPECTED = {
+    'genes_filtered': {
+        'plain': ['idx_gtpe_ensembl_id', 'idx_ensembl_gene_id'],
+        'compact': ['idx_stable_ids_stable_id', 'idx_gtpe_ensembl_id_key',
+                    'idx_ensembl_gene_id_key'],
+    },
+    'genes_full_filtered': {
+        'plain': ['idx_gtpe_ensembl_id', 'idx_ensembl_gene_id',
+                  'idx_gtpe_gene_id'],
+        'compact': ['idx_stable_ids_stable_id', 'idx_gtpe_ensembl_id_key',
+                    'idx_ensembl_gene_id_key', 'idx_gtpe_gene_id_key'],
+    },
+    'homology_filtered': {
+        'plain': ['idx_homolog_ensembl_id'],
+    },
+    'ids_filtered': {
+        'plain': ['idx_ensembl_gene_ids_external_id',
+                  'idx_ensembl_gene_ids_ensembl_id',
+                  'idx_homolog_ensembl_id'],
+        'compact': ['idx_ensembl_gene_ids_external_id',
+                    'idx_ensembl_gene_ids_ensembl_id_key',
+                    'idx_homolog_ensembl_id'],
+    },
+    'ids_filtered_ensembl': {
+        'plain': ['idx_ensembl_gene_ids_ensembl_id',
+                  'idx_homolog_ensembl_id'],
+        'compact': ['idx_stable_ids_stable_id',
+                    'idx_ensembl_gene_ids_ensembl_id_key',
+                    'idx_homolog_ensembl_id'],
+    },
+    'term_exact': {
+        'plain': ['idx_lookup_value', 'idx_ensembl_gene_id'],
+        'compact': ['idx_lookup_value', 'idx_ensembl_gene_id_key'],
+    },
+    'term_like': {
+        'plain': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id'],
+        'compact': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id_key'],
+        'legacy': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id'],
+    },
+    'id': {
+        'plain': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id'],
+        'compact': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id_key'],
+        'legacy': [FULL_TEXT, PRIMARY_KEY, 'idx_ensembl_gene_id'],
+    },
+    'region': {
+        'plain': ['idx_chromosomes_chrom', RTREE, PRIMARY_KEY],
+        'legacy': ['idx_ensembl_genes_position'],
+    },
+    'features': {
+        'plain': ['idx_chromosomes_chrom', RTREE, PRIMARY_KEY],
+        'legacy': ['idx_gtpe_seqid'],
+    },
+}
+'''The indices each query must use by layout, those of ``plain`` on the
+layouts that are not listed.'''
+
+EXPECTED_ALL = {
+    'genes_full_all': {
+        'plain': ['idx_gtpe_gene_id'],
+        'compact': ['idx_ensembl_gene_id_key'],
+    },
+    'genes_all': {},
+    'homology': {},
+    'ids_all': {},
+    'ids_random': {},
+    'lookup_stats': {},
+    'lookup_stats_count': {},
+}
+'''The queries that read every row of a table by design, with the indices
+the rows they join are found with.'''
+
+
+@pytest.fixture(scope='module')
+def plan_layouts(tmp_path_factory):
+    """The databases of every layout, with :data:`NUM_GENES` genes."""
+    return create_layouts(tmp_path_factory, NUM_GENES)
+
+
+def get_queries(layout):
+    """Get the queries the fetch functions run on `layout`.
+
+    Returns:
+        dict: The SQL and the parameters by query name.
+    """
+    legacy = layout == 'legacy'
+    ids = IDS[:3]
+    in_values = ','.join('?' * len(ids))
+    region = {'chromosome': '1', 'start_position': 1000000,
+              'end_position': 3000000}
+
+    sql_region = search.SQL_REGION_LEGACY if legacy else search.SQL_REGION
+    sql_features = (features.SQL_FEATURES_LEGACY if legacy
+                    else features.SQL_FEATURES)
+    sql_join = search.SQL_SEARCH_JOIN_LEGACY if legacy \
+        else search.SQL_SEARCH_JOIN
+
+    return {
+        'genes_all': (genes.SQL_GENES_ALL + genes.SQL_GENES_ORDER_BY_ID, {}),
+        'genes_filtered': (genes.SQL_GENES_FILTERED.format('lookup_ids') +
+                           genes.SQL_GENES_ORDER_BY_POSITION, {}),
+        'genes_full_all': (genes.SQL_GENES_FULL_ALL +
+                           genes.SQL_GENES_ORDER_BY_ID, {}),
+        'genes_full_filtered': (
+            genes.SQL_GENES_FULL_FILTERED.format('lookup_ids') +
+            genes.SQL_GENES_ORDER_BY_ID, {}),
+        'homology': (genes.SQL_HOMOLOGY, {}),
+        'homology_filtered': (
+            genes.SQL_HOMOLOGY_FILTERED.format(in_values), ids),
+        'ids_filtered': (genes.SQL_IDS_FILTERED.format(in_values, 'MGI'),
+                         ['MGI:1', 'MGI:4', 'MGI:7']),
+        'ids_filtered_ensembl': (
+            genes.SQL_IDS_FILTERED_ENSEMBL.format(in_values), ids),
+        'ids_all': (genes.SQL_IDS_ALL, {}),
+        'ids_random': (genes.SQL_IDS_RANDOM, {'source_db': 'MGI',
+                                              'limit': 10}),
+        'term_exact': (search.SQL_TERM_EXACT, {'term': 'Gm1'}),
+        'term_like': (search.SQL_TERM_LIKE.replace(search.SQL_SEARCH_JOIN,
+                                                   sql_join),
+                      {'term': 'Gm*'}),
+        'id': (search.SQL_ID.replace(search.SQL_SEARCH_JOIN, sql_join),
+               {'term': ids[0]}),
+        'region': (sql_region, region),
+        'features': (sql_features.format('?,?'),
+                     ['1', 3000000, 1000000, 'EG', 'ET']),
+        'lookup_stats': (get.SQL_LOOKUP_STATS, {}),
+        'lookup_stats_count': (get.SQL_LOOKUP_STATS_COUNT, {}),
+    }
+
+
+def get_tables(sql):
+    """Get the table of each alias in the ``FROM`` clauses of `sql`."""
+    tables = {}
+
+    for table, alias in REGEX_ALIAS.findall(sql):
+        tables[alias] = table
+
+    return tables
+
+
+def get_plan(conn, sql, params):
+    """Get the details of the query plan of `sql`."""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}',
+                                           params)]
+
+
+def is_large(name, aliases):
+    """Check if `name`, a table or an alias, is one of
+    :data:`LARGE_TABLES` or its compact encoding."""
+    table = aliases.get(name, name).split('.')[-1]
+    return table.replace('_compact', '') in LARGE_TABLES
+
+
+def check_plan(plan, expected, aliases):
+    """Check that the `plan` uses every one of `expected` and does not
+    scan, or read by release, a large table."""
+    text = '\n'.join(plan)
+
+    for index in expected:
+        assert index in text, f'{index} not used:\n{text}'
+
+    for detail in plan:
+        match = REGEX_SCAN.match(detail)
+
+        assert not (match and is_large(match.group(1), aliases)), \
+            f'{detail}:\n{text}'
+        assert '_release_to' not in detail, f'{detail}:\n{text}'
+
+
+def connect(plan_layouts, layout):
+    """Connect to release 901 of `layout` as the fetch functions do, with
+    the temporary table of the ids :func:`ensimpl.fetch.genes.iter_genes`
+    creates."""
+    db_config.init(plan_layouts[layout])
+
+    conn = fetch_utils.connect_to_database(RELEASES[0], SPECIES)
+    conn.execute('CREATE TEMPORARY TABLE lookup_ids ( '
+                 'ensembl_id TEXT, '
+                 'PRIMARY KEY (ensembl_id) )')
+    conn.executemany('INSERT INTO lookup_ids VALUES (?)',
+                     [(ensembl_id,) for ensembl_id in IDS])
+
+    return conn
+
+
+def get_compact_tables(conn):
+    """Get the table of each alias in the views of a compact database."""
+    tables = {}
+
+    for (sql,) in conn.execute("SELECT sql "
+                               "  FROM sqlite_master "
+                               " WHERE type = 'view'"):
+        tables.update(get_tables(sql))
+
+    return tables
+
+
+@pytest.mark.parametrize('layout', ['plain', 'compact', 'store', 'legacy'])
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_query_plan(plan_layouts, layout, name):
+    if layout == 'legacy' and layout not in EXPECTED[name]:
+        pytest.skip('the query is the same as on the databases as built')
+
+    conn = connect(plan_layouts, layout)
+    sql, params = get_queries(layout)[name]
+
+    expected = EXPECTED[name].get(layout, EXPECTED[name]['plain'])
+    aliases = get_tables(sql)
+    aliases.update(get_compact_tables(conn))
+
+    check_plan(get_plan(conn, sql, params), expected, aliases)
+
+    conn.close()
+
+
+@pytest.mark.parametrize('layout', ['plain', 'compact', 'store'])
+@pytest.mark.parametrize('name', sorted(EXPECTED_ALL))
+def test_query_plan_all(plan_layouts, layout, name):
+    conn = connect(plan_layouts, layout)
+    sql, params = get_queries(layout)[name]
+
+    text = '\n'.join(get_plan(conn, sql, params))
+    expected = EXPECTED_ALL[name].get(layout,
+                                      EXPECTED_ALL[name].get('plain', []))
+
+    for index in expected:
+        assert index in text, f'{index} not used:\n{text}'
+
+    conn.close()
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'change': 'version'},
+    {'change_type': 'gene'},
+    {'change': 'version', 'change_type': 'gene'},
+])
+def test_query_plan_diff(plan_layouts, params):
+    diff_file = create_diff.get_diff_file(plan_layouts['plain'], *RELEASES,
+                                          SPECIES)
+
+    # the query as built by ensimpl.fetch.diff.get_diff
+    sql = diff.SQL_SELECT_CHANGES
+    values = {'after': 0, 'limit': 10}
+
+    if 'change' in params:
+        sql += '   AND change = :change\n'
+    if 'change_type' in params:
+        sql += '   AND type_key = :type_key\n'
+
+    sql += ' ORDER BY change_key\n LIMIT :limit'
+    values.update(change='version', type_key='EG')
+
+    conn = sqlite3.connect(diff_file)
+    plan = get_plan(conn, sql, values)
+    conn.close()
+
+    assert not any(REGEX_SCAN.match(detail) for detail in plan), plan
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+from ensimpl.fetch import querylog
+
+from tests.conftest import RELEASES, SPECIES
+
+
+@pytest.fixture
+def slow_log(monkeypatch):
+    """Log every statement, and restore the disabled log afterwards.
+
+    Returns:
+        function: Called with the threshold and size of the log, returns a
+            connection to an in-memory database with a table ``t``.
+    """
+    monkeypatch.setattr(querylog, '_statement_listeners', [])
+    monkeypatch.setattr(querylog, '_connection_listeners', [])
+
+    def configure(threshold_ms=0, size=querylog.DEFAULT_SIZE):
+        querylog.configure(threshold_ms, size)
+        querylog.clear()
+
+        conn = sqlite3.connect(':memory:',
+                               factory=querylog.ProfiledConnection)
+        conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.executemany('INSERT INTO t VALUES (?, ?)',
+                         [(i, f'n{i}') for i in range(10)])
+        querylog.clear()
+
+        return conn
+
+    yield configure
+
+    querylog.configure(None, querylog.DEFAULT_SIZE)
+    querylog.clear()
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM t WHERE name = 'a''b' AND id = 12",
+     'SELECT * FROM t WHERE name = ? AND id = ?'),
+    ('SELECT * FROM t WHERE x > -1.5 AND y = 2',
+     'SELECT * FROM t WHERE x > ? AND y = ?'),
+    ('SELECT * FROM t2 WHERE id IN (?,?, ?)',
+     'SELECT * FROM t2 WHERE id IN (?, ...)'),
+    ("SELECT * FROM t WHERE id in ('a', 'b', 'c')",
+     'SELECT * FROM t WHERE id IN (?, ...)'),
+    ('SELECT * FROM t WHERE id IN ("a", ?)',
+     'SELECT * FROM t WHERE id IN (?, ...)'),
+    ('SELECT * FROM lookup_ids_AbC123 l, ensembl_genes g',
+     'SELECT * FROM lookup_ids_? l, ensembl_genes g'),
+    ('SELECT *\n  FROM t\n WHERE id = :id',
+     'SELECT * FROM t WHERE id = :id'),
+    ('SELECT c1, t2.col FROM t2', 'SELECT c1, t2.col FROM t2'),
+])
+def test_normalize_sql(sql, expected):
+    assert querylog.normalize_sql(sql) == expected
+
+
+def test_normalize_sql_same_statement():
+    assert querylog.normalize_sql(
+        "SELECT * FROM lookup_ids_x1 WHERE id IN (?, ?) AND n = 'a'") == \
+        querylog.normalize_sql(
+            "SELECT * FROM lookup_ids_y2 WHERE id IN (?) AND n = 'bb'")
+
+
+@pytest.mark.parametrize('parameters, many, expected', [
+    (None, False, '[]'),
+    ((), False, '[0]'),
+    (('a', 1), False, '[2]'),
+    ({'term': 'a', 'limit': 1}, False, '{limit, term}'),
+    (1, False, '?'),
+    ([('a',), ('b',)], True, '2 x [1]'),
+    ([{'id': 1}], True, '1 x {id}'),
+    ([], True, '0 x []'),
+    (iter([('a',)]), True, '?'),
+])
+def test_get_parameters_shape(parameters, many, expected):
+    assert querylog.get_parameters_shape(parameters, many) == expected
+
+
+def test_get_parameters_shape_counted():
+    parameters = querylog.CountedParameters((i, i) for i in range(1000))
+
+    assert querylog.get_parameters_shape(parameters, True) == '0 x []'
+    assert len(list(parameters)) == 1000
+    assert parameters.first == (0, 0)
+    assert querylog.get_parameters_shape(parameters, True) == '1000 x [2]'
+
+
+def test_log(slow_log):
+    conn = slow_log()
+
+    assert isinstance(conn.cursor(), querylog.ProfiledCursor)
+
+    rows = conn.execute('SELECT * FROM t WHERE id < ?', (4,)).fetchall()
+    assert len(rows) == 4
+
+    conn.executemany('UPDATE t SET name = ? WHERE id = ?',
+                     [('a', 1), ('b', 2), ('c', 3)])
+
+    entries = querylog.get_entries()
+    assert [entry['sql'] for entry in entries] == [
+        'UPDATE t SET name = ? WHERE id = ?',
+        'SELECT * FROM t WHERE id < ?',
+    ]
+
+    update, select = entries
+    assert update['rows'] == 3
+    assert update['parameters'] == '3 x [2]'
+    assert update['plan'] == []
+
+    assert select['rows'] == 4
+    assert select['parameters'] == '[1]'
+    assert select['plan'] and 'USING INTEGER PRIMARY KEY' in select['plan'][0]
+    assert select['database'] == ':memory:'
+    assert select['duration_ms'] >= 0
+
+    conn.close()
+
+
+def test_log_counts_the_rows_fetched(slow_log):
+    conn = slow_log()
+
+    cursor = conn.execute('SELECT * FROM t')
+    assert len(cursor.fetchmany(3)) == 3
+    assert len(list(cursor)) == 7
+
+    cursor = conn.execute('SELECT * FROM t WHERE id > 7')
+    while cursor.fetchone():
+        pass
+
+    # a statement is logged when the next one starts
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM t WHERE id = 1').fetchone()
+    cursor.execute('SELECT * FROM t WHERE id = 2')
+    cursor.close()
+
+    assert [entry['rows'] for entry in querylog.get_entries()] == [0, 1, 2,
+                                                                  10]
+
+    conn.close()
+
+
+def test_log_threshold(slow_log):
+    conn = slow_log(threshold_ms=60000)
+
+    conn.execute('SELECT * FROM t').fetchall()
+    assert querylog.get_entries() == []
+
+    conn.close()
+
+
+def test_log_ring_buffer(slow_log):
+    conn = slow_log(size=3)
+
+    for i in range(5):
+        conn.execute(f'SELECT * FROM t WHERE id = {i}').fetchall()
+
+    entries = querylog.get_entries()
+    assert len(entries) == 3
+    assert [entry['rows'] for entry in entries] == [1, 1, 1]
+
+    querylog.clear()
+    assert querylog.get_entries() == []
+
+    # resizing keeps the most recent
+    for i in range(3):
+        conn.execute('SELECT * FROM t WHERE id < ?', (i + 1,)).fetchall()
+    querylog.configure(0, 2)
+
+    assert [entry['rows'] for entry in querylog.get_entries()] == [3, 2]
+
+    conn.close()
+
+
+def test_disabled(slow_log):
+    conn = slow_log(threshold_ms=None)
+
+    assert not querylog.enabled()
+    assert isinstance(conn.cursor(), querylog.ExecuteCursor)
+
+    conn.execute('SELECT * FROM t').fetchall()
+    assert querylog.get_entries() == []
+
+    conn.close()
+
+
+def test_listeners(slow_log):
+    conn = slow_log(threshold_ms=None)
+    statements = []
+    connections = []
+
+    querylog.add_listener(lambda sql, duration, rows: statements.append(
+        (sql, rows)), connections.append)
+
+    assert querylog.enabled()
+
+    other = sqlite3.connect(':memory:', factory=querylog.ProfiledConnection)
+    conn.executemany('INSERT INTO t VALUES (?, ?)', [(20, 'a'), (21, 'b')])
+    other.close()
+    other.close()
+
+    assert statements == [('INSERT INTO t VALUES (?, ?)', 2)]
+    assert connections == [1, -1]
+    assert querylog.get_entries() == []
+
+    conn.close()
+
+
+def test_slow_queries(create_app):
+    app = create_app(SLOW_QUERY_MS=0, DEBUG_TOKEN='secret')
+    client = app.test_client(use_cookies=False)
+    params = {'term': 'Gm1', 'release': RELEASES[0], 'species': SPECIES}
+
+    assert client.get('/api/search', query_string=params).status_code == 200
+
+    assert client.get('/api/_debug/slow_queries').status_code == 403
+
+    response = client.get('/api/_debug/slow_queries',
+                          headers={'X-Ensimpl-Token': 'secret'})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['enabled'] and data['threshold_ms'] == 0
+    assert any('ensembl_genes_lookup' in entry['sql'] and entry['plan']
+               for entry in data['queries'])
+
+    response = client.delete('/api/_debug/slow_queries',
+                             query_string={'token': 'secret'})
+    assert response.get_json()['queries'] == []
+
+
+def test_slow_queries_off(create_app):
+    client = create_app().test_client(use_cookies=False)
+
+    assert client.get('/api/_debug/slow_queries').status_code == 404
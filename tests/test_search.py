@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import pytest
+
+import ensimpl.fetch.utils as fetch_utils
+from ensimpl.fetch import genes
+from ensimpl.fetch import search
+
+from tests.conftest import IDS, RELEASES, SPECIES, get_regions
+
+
+def get_terms():
+    """Get symbols, ids, regions and an invalid term to search for."""
+    found = genes.get(IDS[:20], RELEASES[0], SPECIES)
+    symbols = [gene['symbol'] for gene in found.values()]
+
+    return symbols + IDS[:10] + get_regions(found)[:5] + ['', 'Gm*']
+
+
+def get_matches(result):
+    """Get the matches of a result as ``dicts``."""
+    if result is None:
+        return None
+
+    return [match.__dict__ for match in result.matches]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_search_batch(layout, workers):
+    terms = get_terms()
+
+    found = list(search.search_batch(iter(terms), RELEASES[0], SPECIES,
+                                     exact=True, limit=10, workers=workers))
+
+    assert [term for term, _ in found] == terms
+    assert found[-2][1] is None
+
+    for term, result in found:
+        if term:
+            expected = search.search(term, RELEASES[0], SPECIES, True, 10)
+            assert get_matches(result) == get_matches(expected), term
+
+
+def test_search_batch_lazy(use_layout):
+    use_layout('plain')
+    consumed = []
+
+    def terms():
+        for term in itertools.cycle(IDS):
+            consumed.append(term)
+            yield term
+
+    batch = search.search_batch(terms(), RELEASES[0], SPECIES, workers=2)
+    found = list(itertools.islice(batch, 3))
+    batch.close()
+
+    assert len(found) == 3
+    assert len(consumed) <= 2 * 4 + 3
+
+
+def test_region_spatial_index(use_layout):
+    use_layout('plain')
+    conn = fetch_utils.connect_to_database(RELEASES[0], SPECIES)
+    assert fetch_utils.has_spatial_index(conn, RELEASES[0], SPECIES)
+    conn.close()
+
+    found = genes.get(IDS, RELEASES[0], SPECIES)
+    regions = get_regions(found)
+    expected = [get_matches(search.search(region, RELEASES[0], SPECIES))
+                for region in regions]
+
+    use_layout('legacy')
+    conn = fetch_utils.connect_to_database(RELEASES[0], SPECIES)
+    assert not fetch_utils.has_spatial_index(conn, RELEASES[0], SPECIES)
+    conn.close()
+
+    for region, matches in zip(regions, expected):
+        assert get_matches(search.search(region, RELEASES[0],
+                                         SPECIES)) == matches, region
+
+    assert any(expected)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+import ensimpl.create.store as store
+import ensimpl.fetch.utils as fetch_utils
+
+from tests.conftest import CHANGED, RELEASES, SPECIES, get_file
+
+
+def test_merge_keeps_identical_rows():
+    old = [('a', 1, 'x'), ('b', 2, 'y'), ('b', 3, 'y'), ('d', 4, 'w')]
+    new = [('a', 10, 'x'), ('b', 11, 'y'), ('c', 12, 'z')]
+
+    assert list(store.merge(old, new)) == [('keep', 1), ('keep', 3),
+                                           ('add', 12)]
+
+
+def test_merge_adds_changed_rows_with_the_same_digest():
+    old = [('a', 1, 'x'), ('a', 2, 'y')]
+    new = [('a', 10, 'y'), ('a', 11, 'y'), ('a', 12, 'z')]
+
+    assert list(store.merge(old, new)) == [('keep', 2), ('add', 11),
+                                           ('add', 12)]
+
+
+def test_merge_empty_store():
+    new = [('a', 10, 'x'), ('b', 11, 'y')]
+
+    assert list(store.merge([], new)) == [('add', 10), ('add', 11)]
+    assert list(store.merge(new, [])) == []
+
+
+def test_add_release_counts(layouts, tmp_path):
+    store_file = store.get_store_file(str(tmp_path), SPECIES)
+
+    first = store.add_release(store_file, get_file(layouts['plain'],
+                                                   RELEASES[0]))
+    second = store.add_release(store_file, get_file(layouts['plain'],
+                                                    RELEASES[1]))
+
+    conn = sqlite3.connect(get_file(layouts['plain'], RELEASES[0]))
+    num_first = conn.execute('SELECT count(*) '
+                             'FROM ensembl_genes').fetchone()[0]
+    conn.close()
+
+    conn = sqlite3.connect(get_file(layouts['plain'], RELEASES[1]))
+    num_second = conn.execute('SELECT count(*) '
+                              'FROM ensembl_genes').fetchone()[0]
+    num_changed = conn.execute(f'''
+        SELECT count(*)
+          FROM ensembl_genes
+         WHERE {CHANGED['version']} OR {CHANGED['renamed']}
+    ''').fetchone()[0]
+    conn.close()
+
+    assert first['ensembl_genes'] == {'kept': 0, 'added': num_first}
+    assert second['ensembl_genes'] == {'kept': num_second - num_changed,
+                                       'added': num_changed}
+    assert second['chromosomes']['added'] == 0
+    assert second['ensembl_gtpe']['added'] == 0
+
+
+def test_add_release_in_order(layouts, tmp_path):
+    store_file = store.get_store_file(str(tmp_path), SPECIES)
+    store.add_release(store_file, get_file(layouts['plain'], RELEASES[1]))
+
+    with pytest.raises(ValueError):
+        store.add_release(store_file, get_file(layouts['plain'],
+                                               RELEASES[0]))
+
+
+def test_add_release_compact(layouts, tmp_path):
+    store_file = store.get_store_file(str(tmp_path), SPECIES)
+
+    with pytest.raises(ValueError):
+        store.add_release(store_file, get_file(layouts['compact'],
+                                               RELEASES[0]))
+
+
+@pytest.mark.parametrize('release', RELEASES)
+def test_release_views(layouts, use_layout, release):
+    use_layout('store')
+
+    conn = fetch_utils.connect_to_database(release, SPECIES)
+    conn.execute('ATTACH DATABASE ? AS release_db',
+                 (get_file(layouts['plain'], release),))
+
+    tables, _ = store.get_tables(conn, 'release_db')
+
+    for table in tables:
+        # the surrogate keys are those of the store
+        _, columns = store.get_columns(conn, table, 'release_db')
+        cols = ', '.join(columns)
+
+        rows = conn.execute(f'SELECT {cols} FROM {table}').fetchall()
+        expected = conn.execute(f'SELECT {cols} '
+                                f'FROM release_db.{table}').fetchall()
+
+        assert sorted(rows, key=repr) == sorted(expected, key=repr), table
+
+    conn.close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import re
+
+from ensimpl.fetch import timing
+
+from tests.conftest import IDS, RELEASES, SPECIES
+
+REGEX_METRIC = re.compile(r'^(\w+);dur=\d+\.\d{3}(?:;desc="rows=(\d+)")?$')
+
+
+def get_metrics(header):
+    """Get the row count, ``None`` if not counted, of each metric of a
+    ``Server-Timing`` header."""
+    metrics = {}
+
+    for metric in header.split(', '):
+        match = REGEX_METRIC.match(metric)
+        assert match, metric
+        rows = match.group(2)
+        metrics[match.group(1)] = None if rows is None else int(rows)
+
+    return metrics
+
+
+def test_disabled():
+    assert timing.current() is None
+    assert timing.stage('sql') is timing.NULL_CONTEXT
+
+    items = [1, 2, 3]
+    assert timing.rows('rows', items) is items
+
+
+def test_timer():
+    timer = timing.start()
+
+    try:
+        assert timing.current() is timer
+
+        for _ in range(2):
+            with timing.stage('sql'):
+                pass
+
+        with timing.stage('temp') as stage:
+            stage.rows = 5
+
+        assert list(timing.rows('rows', iter('abc'))) == ['a', 'b', 'c']
+    finally:
+        assert timing.stop() is timer
+
+    assert timing.current() is None
+    assert list(timer.stages) == ['sql', 'temp', 'rows']
+    assert timer.stages['sql'].calls == 2
+    assert timer.stages['sql'].rows is None
+    assert timer.stages['temp'].rows == 5
+    assert timer.stages['rows'].rows == 3
+
+    assert get_metrics(timer.server_timing()) == {'sql': None, 'temp': 5,
+                                                  'rows': 3, 'total': None}
+    assert 'total' not in get_metrics(timer.server_timing(False))
+
+    data = timer.dict()
+    assert list(data) == ['sql', 'temp', 'rows', 'total_ms']
+    assert data['sql']['calls'] == 2 and 'rows' not in data['sql']
+    assert data['rows'] == {'ms': data['rows']['ms'], 'calls': 1, 'rows': 3}
+
+
+def test_rows_counts_a_partial_iteration():
+    timer = timing.start()
+
+    try:
+        for item in timing.rows('rows', iter(range(10))):
+            if item == 3:
+                break
+    finally:
+        timing.stop()
+
+    assert timer.stages['rows'].rows == 4
+
+
+def test_server_timing_off(create_app):
+    client = create_app().test_client(use_cookies=False)
+    response = client.get(f'/api/gene/{IDS[0]}',
+                          query_string={'release': RELEASES[0],
+                                        'species': SPECIES})
+
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+    assert '_timing' not in response.get_json()
+
+
+def test_server_timing(create_app):
+    client = create_app(SERVER_TIMING=True).test_client(use_cookies=False)
+    response = client.get('/api/search',
+                          query_string={'term': 'Gm*', 'release': RELEASES[0],
+                                        'species': SPECIES})
+
+    assert response.status_code == 200
+    assert '_timing' not in response.get_json()
+
+    metrics = get_metrics(response.headers['Server-Timing'])
+    assert {'search_sql', 'search_rows', 'jsonify', 'total'} <= set(metrics)
+    assert metrics['search_rows'] > 0
+    assert timing.current() is None
+
+
+def test_debug(create_app):
+    client = create_app().test_client(use_cookies=False)
+    params = {'release': RELEASES[0], 'species': SPECIES, 'debug': '1'}
+    response = client.get(f'/api/gene/{IDS[0]}', query_string=params)
+
+    assert response.status_code == 200
+    assert 'Server-Timing' in response.headers
+
+    data = response.get_json()
+    assert IDS[0] in data['gene']
+    assert 'total_ms' in data['_timing']
+    assert set(data['_timing']) - {'total_ms'} == \
+        set(get_metrics(response.headers['Server-Timing'])) - {'total'}
+
+    # in the JSON body of a POST
+    response = client.post('/api/genes', json={'ids[]': IDS[:5],
+                                               'release': RELEASES[0],
+                                               'species': SPECIES,
+                                               'debug': True})
+
+    assert response.status_code == 200
+    assert response.get_json()['_timing']['genes_temp_table']['rows'] == 5